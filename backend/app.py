@@ -1,31 +1,61 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, Request, request, jsonify, session, g, send_from_directory
 from flask_cors import CORS
 import os
 import uuid
 import logging
+import time
+import atexit
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import tempfile
-from google_services.speech_service import SpeechService
 from google_services.text_service import TextService
-from google_services.sentiment_service import SentimentService
 from utils.session_manager import SessionManager
+from utils.sentiment_timeline import SentimentTimeline
+from utils.voice_catalog import VoiceCatalog
+from utils.upload import AudioUpload, UploadRejected, upload_limits
+from utils.logging_config import configure_logging, request_id_var, stop_logging
+from utils.tracing import configure_tracing, flush_tracing, span, start_trace, end_trace
+from utils.providers import ProviderRegistry, UnknownProvider
+from utils.provider_calls import ProviderCalls
+from utils import handlers
+from utils.handlers import RequestRejected
+from utils.tts_batch import TTSBatchRenderer
+from utils.audio_format import OutputFormat, format_kwargs
+from utils.lifecycle import Lifecycle, create_temp_dir, remove_temp_dir
 
-# Import open-source services
-from open_source_services.sentiment_service import OpenSourceSentimentService
+# Import open-source services; the speech and sentiment ones are imported below, unless in gateway mode
 from open_source_services.text_service import OpenSourceTextService
-from open_source_services.speech_service import OpenSourceSpeechService
 
 
-logging.getLogger('flask_cors').level = logging.DEBUG
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Structured logging through a queue, see utils/logging_config.py for LOG_* settings
+configure_logging()
 logger = logging.getLogger(__name__)
+# Per-request spans and a Server-Timing header when TRACING=true, see utils/tracing.py
+configure_tracing()
+
+# Gateway mode serves health, results and voices without importing Whisper, spaCy, NumPy or the
+# Google speech and language SDKs; every other endpoint answers 503
+GATEWAY_MODE = os.environ.get('GATEWAY_MODE', 'false').lower() == 'true'
+GATEWAY_ENDPOINTS = {
+    'test', 'liveness_check', 'readiness_check', 'provider_status', 'get_voices',
+    'get_results', 'get_results_stats', 'get_results_storage', 'get_result', 'clear_results'
+}
+
+# Upload caps, enforced while the upload streams in
+MAX_UPLOAD_BYTES, MAX_AUDIO_SECONDS = upload_limits()
+
+class UploadRequest(Request):
+    """Request whose file uploads stream through an AudioUpload instead of a spooled temp file"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return AudioUpload(TEMP_DIR, max_bytes=MAX_UPLOAD_BYTES, max_duration_seconds=MAX_AUDIO_SECONDS)
 
 # Initialize Flask app
 app = Flask(__name__)
+app.request_class = UploadRequest
+# Requests whose Content-Length is over the cap are refused before the body is read (allowing for form overhead)
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 64 * 1024
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_secret_key')
 app.config['SESSION_TYPE'] = 'filesystem'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=1)
@@ -33,165 +63,303 @@ app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=1)
 # Enable CORS for the frontend
 CORS(app, origins=["http://localhost:5173", "http://127.0.0.1:5173"], supports_credentials=True, allow_headers=["Content-Type", "Authorization"])
 
-# Initialize Google services
-google_speech_service = SpeechService()
+# Text-to-speech services import their SDKs on first use, so gateway mode has them for the voice lists
 google_text_service = TextService()
-google_sentiment_service = SentimentService()
-
-# Initialize open-source services
-os_sentiment_service = OpenSourceSentimentService()
 os_text_service = OpenSourceTextService()
-os_speech_service = OpenSourceSpeechService()
 
-# Initialize session manager
-session_manager = SessionManager()
+if GATEWAY_MODE:
+    logger.info("Gateway mode: serving health, results and voices only")
+else:
+    # Initialize Google services
+    from google_services.speech_service import SpeechService
+    from google_services.sentiment_service import SentimentService
+    google_speech_service = SpeechService()
+    google_sentiment_service = SentimentService()
+    
+    # Initialize open-source services
+    from open_source_services.fast_sentiment import FastSentimentService
+    from open_source_services.diarization import DiarizationService, diarize_transcript
+    if os.environ.get('MODEL_SERVER_ADDRESS'):
+        # Whisper and spaCy live in a shared model server process, see open_source_services/model_server.py
+        from open_source_services.model_server import RemoteSpeechService, RemoteSentimentService
+        os_sentiment_service = RemoteSentimentService()
+        os_speech_service = RemoteSpeechService()
+        logger.info("Using model server at %s", os.environ['MODEL_SERVER_ADDRESS'])
+    else:
+        from open_source_services.sentiment_service import OpenSourceSentimentService
+        from open_source_services.speech_service import OpenSourceSpeechService
+        os_sentiment_service = OpenSourceSentimentService()
+        os_speech_service = OpenSourceSpeechService()
+        if int(os.environ.get('WHISPER_BATCH_SIZE', '1')) > 1:
+            # Batch concurrent Whisper requests, see open_source_services/whisper_batching.py
+            from open_source_services.whisper_batching import BatchingSpeechService
+            os_speech_service = BatchingSpeechService(
+                os_speech_service,
+                max_batch_size=int(os.environ['WHISPER_BATCH_SIZE']),
+                max_wait_ms=float(os.environ.get('WHISPER_BATCH_WAIT_MS', '50'))
+            )
+    
+    # CPU-only speaker diarization, requested per transcription with diarize=true
+    diarization_service = DiarizationService()
+
+# Services by provider name; plugins (entry points or PROVIDER_PLUGINS) can add more, see utils/providers.py
+providers = ProviderRegistry()
+if GATEWAY_MODE:
+    providers.register_provider('google', {'text': google_text_service})
+    providers.register_provider('opensource', {'text': os_text_service})
+else:
+    providers.register_provider('google', {
+        'speech': google_speech_service,
+        'text': google_text_service,
+        'sentiment': google_sentiment_service
+    })
+    providers.register_provider('opensource', {
+        'speech': os_speech_service,
+        'text': os_text_service,
+        'sentiment': os_sentiment_service
+    })
+    # Lexicon sentiment scorer for high-volume scoring, selected per request as provider 'fast'
+    providers.register_provider('fast', {'sentiment': FastSentimentService()})
+    providers.load_plugins()
+
+# Each provider's service of each kind behind its own circuit breaker and adaptive concurrency limit,
+# with failover and coalescing of identical concurrent calls; asgi_app.py calls providers through the
+# same guards. COALESCE_LOCK_DIR extends coalescing across workers, see utils/provider_calls.py
+provider_calls = ProviderCalls(providers, lock_dir=os.environ.get('COALESCE_LOCK_DIR'))
+provider_service = provider_calls.service
+call_provider = provider_calls.call
+coalesced_call = provider_calls.coalesced
+call_provider_or_error = provider_calls.call_or_error
+
+# Compare endpoints call every requested provider at once
+compare_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('COMPARE_WORKERS', '8')),
+                                      thread_name_prefix='compare')
+
+def fan_out(fn, names):
+    """
+    Run fn(name) for every provider concurrently
+
+    Each call runs in a copy of the request's context, so log lines and
+    spans stay attached to the request.
+
+    Returns:
+        dict: Provider name -> fn's result
+    """
+    futures = {name: compare_executor.submit(contextvars.copy_context().run, fn, name) for name in names}
+    return {name: future.result() for name, future in futures.items()}
+
+# Voice lists, persisted to disk and refreshed in the background on a TTL
+voice_catalog = VoiceCatalog(
+    {name: providers.get(name, 'text') for name in providers.names('text')},
+    cache_path=os.environ.get('VOICE_CATALOG_PATH', os.path.join(tempfile.gettempdir(), 'speech_analysis_voices.json')),
+    ttl_seconds=int(os.environ.get('VOICE_CATALOG_TTL', '86400'))
+)
+
+# Batch TTS renders into a content-addressed directory, so repeat batches only synthesize new prompts.
+# The request waits for the whole batch: 50 uncached prompts at TTS_BATCH_CONCURRENCY calls of up to
+# a second or so finish well inside gunicorn's 30 s worker timeout; larger libraries go through bulk_tts
+TTS_BATCH_MAX_ITEMS = int(os.environ.get('TTS_BATCH_MAX_ITEMS', '50'))
+tts_batch = TTSBatchRenderer(
+    {name: providers.get(name, 'text') for name in providers.names('text')},
+    os.environ.get('TTS_BATCH_DIR', os.path.join(tempfile.gettempdir(), 'speech_analysis_tts')),
+    concurrency=int(os.environ.get('TTS_BATCH_CONCURRENCY', '4')),
+    synthesize=lambda provider, text, voice, output_format: call_provider(
+        provider, 'text', 'synthesize_speech', text, voice, failover=False, **format_kwargs(output_format)
+    )[0][1]
+)
+
+# Create temporary directory to store session files; directories left by killed workers are removed first
+TEMP_DIR = create_temp_dir(prefix="speech_analysis_")
+logger.info("Using temporary directory: %s", TEMP_DIR)
+
+# Readiness, in-flight requests and draining on SIGTERM, see utils/lifecycle.py
+lifecycle = Lifecycle()
+app.wsgi_app = lifecycle.wrap_wsgi(app.wsgi_app)
+lifecycle.add_check('temp_dir', lambda: None if os.access(TEMP_DIR, os.W_OK) else f"{TEMP_DIR} is not writable")
+
+# Initialize session manager; results are stored compressed, within SESSION_MAX_BYTES per session
+session_manager = SessionManager(audio_dir=TEMP_DIR)
+
+@app.before_request
+def assign_request_id():
+    # Correlate every log line of a request, reusing the caller's ID when given
+    request_id_var.set(request.headers.get('X-Request-ID') or uuid.uuid4().hex)
+    g.trace = start_trace(f"{request.method} {request.path}", request_id=request_id_var.get())
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def gateway_only():
+    # Unknown paths (no endpoint) still get their 404
+    if GATEWAY_MODE and request.endpoint and request.endpoint not in GATEWAY_ENDPOINTS:
+        return jsonify({"error": "Not available in gateway mode, send this request to a full worker"}), 503
 
-# Create temporary directory to store session files
-TEMP_DIR = tempfile.mkdtemp(prefix="speech_analysis_")
-logger.info(f"Using temporary directory: {TEMP_DIR}")
+@app.after_request
+def add_request_id(response):
+    response.headers['X-Request-ID'] = request_id_var.get()
+    trace = g.pop('trace', None)
+    if trace is not None:
+        trace.root.set('status_code', response.status_code)
+        end_trace(trace)
+        response.headers['Server-Timing'] = trace.server_timing()
+    return response
+
+@app.errorhandler(UploadRejected)
+def upload_rejected(e):
+    return jsonify({"error": str(e)}), e.status
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": f"Upload exceeds {MAX_UPLOAD_BYTES} bytes"}), 413
+
+@app.errorhandler(UnknownProvider)
+def unknown_provider_requested(e):
+    return jsonify({"error": str(e)}), 400
+
+@app.errorhandler(RequestRejected)
+def request_rejected(e):
+    return jsonify({"error": str(e)}), e.status
 
 @app.route('/test', methods=['GET'])
 def test():
     return jsonify({"message": "API is working"})
 
+@app.route('/api/health/live', methods=['GET'])
+def liveness_check():
+    """Liveness probe: the process is up, including while it drains"""
+    return jsonify(lifecycle.liveness())
+
 @app.route('/api/health', methods=['GET'])
-def health_check():
-    return jsonify({"status": "healthy", "timestamp": datetime.now().isoformat()})
+@app.route('/api/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 503 while starting, draining or failing a check, so no new requests are routed here"""
+    ready, details = lifecycle.readiness()
+    return jsonify(dict(details, timestamp=datetime.now().isoformat())), 200 if ready else 503
+
+@app.route('/api/providers/status', methods=['GET'])
+def provider_status():
+    """Circuit breaker and concurrency limit state for each provider's services"""
+    return jsonify(dict(provider_calls.status(), voice_catalog=voice_catalog.status()))
 
 @app.route('/api/speech-to-text', methods=['POST'])
 def speech_to_text():
     """Endpoint for speech-to-text conversion"""
-    if 'audio' not in request.files:
-        return jsonify({"error": "No audio file provided"}), 400
-    
-    file = request.files['audio']
-    if file.filename == '':
-        return jsonify({"error": "Empty filename"}), 400
-    
-    # Get the provider from request (default to 'google')
-    provider = request.form.get('provider', 'google')
+    # The upload is received (sniffed, capped, hashed) when the form is first parsed
+    with span('upload'):
+        file = handlers.audio_upload(request.files)
+    options = handlers.speech_to_text_options(request.form, provider_calls)
+    provider = options['provider']
     
     try:
         # Generate a unique ID for this conversion
         conversion_id = str(uuid.uuid4())
         
-        # Save the audio file temporarily
-        temp_path = os.path.join(TEMP_DIR, f"{conversion_id}.webm")
-        file.save(temp_path)
+        # The upload was validated and written to TEMP_DIR while it was received
+        upload = file.stream
+        temp_path = upload.path
         
-        logger.info(f"Processing audio file using {provider}: {temp_path}")
+        logger.info("Processing %s/%s audio file using %s: %s", upload.format['container'], upload.format['codec'], provider, temp_path)
         
-        # Choose the appropriate services based on provider
-        if provider == 'opensource':
-            results = os_speech_service.transcribe_audio(temp_path)  # Use open-source service
-            sentiment_service_to_use = os_sentiment_service
-        else:
-            results = google_speech_service.transcribe_audio(temp_path)
-            sentiment_service_to_use = google_sentiment_service
+        # Call the requested provider, failing over to open-source if it is unavailable
+        results, speech_failover = call_provider(provider, 'speech', 'transcribe_audio', temp_path,
+                                                 word_timestamps=options['word_timestamps'])
+        failovers = [speech_failover] if speech_failover else []
         
         # Process the text for sentiment if transcription was successful
         sentiment = None
+        sentiment_timeline = None
+        diarization = None
         if results['success'] and results['text']:
-            sentiment = sentiment_service_to_use.analyze_sentiment(results['text'])
+            sentiment, sentiment_failover = call_provider(options['sentiment_provider'], 'sentiment',
+                                                          'analyze_sentiment', results['text'])
+            if sentiment_failover:
+                failovers.append(sentiment_failover)
+            served_by = sentiment_failover['to'] if sentiment_failover else options['sentiment_provider']
+            if options['include_timeline'] and results.get('segments'):
+                timeline = SentimentTimeline(provider_calls.guarded_sentiment(served_by))
+                with span('sentiment_timeline', segments=len(results['segments'])):
+                    timeline.extend(results['segments'])
+                sentiment_timeline = timeline.to_dict(window=options['timeline_window'])
+            if options['diarize'] and results.get('segments'):
+                # Labels the segments in place, before they are stored
+                with span('diarization', segments=len(results['segments'])):
+                    diarization = diarize_transcript(diarization_service, temp_path, results['segments'],
+                                                     provider_calls.guarded_sentiment(served_by), options['num_speakers'])
         
         # Store result in session
-        session_data = {
-            'id': conversion_id,
-            'type': 'speech_to_text',
-            'provider': provider,
-            'timestamp': datetime.now().isoformat(),
-            'transcription': results,
-            'sentiment': sentiment
-        }
-        session_manager.add_result(session_data)
+        session_data, response = handlers.speech_to_text_result(
+            conversion_id, options, results, sentiment, sentiment_timeline, diarization, failovers, upload.sha256,
+            round(time.perf_counter() - g.request_started, 3)
+        )
+        with span('session_write'):
+            session_manager.add_result(session_data)
         
         # Clean up temporary file
         os.remove(temp_path)
         
-        return jsonify({
-            "id": conversion_id,
-            "provider": provider,
-            "results": results,
-            "sentiment": sentiment
-        })
+        return jsonify(response)
     
     except Exception as e:
-        logger.exception(f"Error in speech-to-text conversion using {provider}")
-        return jsonify({"error": str(e)}), 500
+        body, status = handlers.failure(e, 'speech-to-text conversion', provider)
+        return jsonify(body), status
 
 @app.route('/api/compare/speech-to-text', methods=['POST'])
 def compare_speech_to_text():
-    """Compare speech-to-text between Google and open-source"""
-    if 'audio' not in request.files:
-        return jsonify({"error": "No audio file provided"}), 400
-    
-    file = request.files['audio']
-    if file.filename == '':
-        return jsonify({"error": "Empty filename"}), 400
+    """Compare speech-to-text across providers (Google and open-source unless `providers` is given)"""
+    # The upload is received (sniffed, capped, hashed) when the form is first parsed
+    with span('upload'):
+        file = handlers.audio_upload(request.files)
+    word_timestamps, names = handlers.compare_speech_to_text_options(request.form, provider_calls)
     
     try:
         # Generate a unique ID for this comparison
         conversion_id = str(uuid.uuid4())
         
-        # Save the audio file temporarily with a WAV extension (more compatible with Whisper)
-        webm_path = os.path.join(TEMP_DIR, f"{conversion_id}.webm")
+        # The upload was validated and written to TEMP_DIR while it was received;
+        # providers that want WAV (Whisper) get a 16 kHz mono conversion of it
+        webm_path = file.stream.path
         wav_path = os.path.join(TEMP_DIR, f"{conversion_id}.wav")
-        
-        file.save(webm_path)
-        logger.info(f"Processing audio file for comparison. Original: {webm_path}, WAV: {wav_path}")
-        
-        # Try to convert WEBM to WAV using FFmpeg (needed for Whisper)
-        try:
-            import subprocess
-            # Make sure FFmpeg is installed and in your PATH
-            subprocess.run([
-                'ffmpeg', '-i', webm_path, '-ar', '16000', '-ac', '1', 
-                '-c:a', 'pcm_s16le', wav_path
-            ], check=True)
-            logger.info(f"Successfully converted audio to WAV format: {wav_path}")
-        except Exception as e:
-            logger.error(f"Error converting audio file: {str(e)}")
-            # Continue with original file if conversion fails
-            wav_path = webm_path
-        
-        # Process with Google first (using the original WEBM file)
-        google_results = google_speech_service.transcribe_audio(webm_path)
-        google_sentiment = None
-        if google_results['success'] and google_results['text']:
-            google_sentiment = google_sentiment_service.analyze_sentiment(google_results['text'])
-            
-        # For open-source, use the WAV file which is more compatible
-        os_results = {"success": False, "error": "Not processed", "text": None}
-        os_sentiment = None
-        
-        try:
-            logger.info(f"Processing with open-source using file: {wav_path}")
-            if os.path.exists(wav_path):
-                os_results = os_speech_service.transcribe_audio(wav_path)
-                if os_results['success'] and os_results['text']:
-                    os_sentiment = os_sentiment_service.analyze_sentiment(os_results['text'])
-            else:
-                logger.error(f"WAV file not found for open-source processing: {wav_path}")
-                os_results = {"success": False, "error": "Audio file not found", "text": None}
-        except Exception as e:
-            logger.exception(f"Error processing with open-source: {str(e)}")
-            os_results = {"success": False, "error": str(e), "text": None}
+        wants_wav = [name for name in names if getattr(provider_service(name, 'speech'), 'audio_format', None) == 'wav']
+        
+        logger.info("Processing audio file for comparison across %s. Original: %s", names, webm_path)
+        
+        if wants_wav:
+            # Try to convert WEBM to WAV using FFmpeg (needed for Whisper)
+            try:
+                import subprocess
+                # Make sure FFmpeg is installed and in your PATH
+                with span('ffmpeg'):
+                    subprocess.run([
+                        'ffmpeg', '-i', webm_path, '-ar', '16000', '-ac', '1', 
+                        '-c:a', 'pcm_s16le', wav_path
+                    ], check=True)
+                logger.info("Successfully converted audio to WAV format: %s", wav_path)
+            except Exception as e:
+                logger.error("Error converting audio file: %s", e)
+                # Continue with original file if conversion fails
+                wav_path = webm_path
+        
+        def transcribe_and_score(name):
+            path = wav_path if name in wants_wav else webm_path
+            try:
+                results = call_provider_or_error(name, 'speech', 'transcribe_audio', path,
+                                                 word_timestamps=word_timestamps)
+            except Exception as e:
+                logger.exception("Error processing with %s: %s", name, e)
+                results = {"success": False, "error": str(e), "text": None}
+            sentiment = None
+            if results['success'] and results['text'] and name in providers.names('sentiment'):
+                sentiment = call_provider_or_error(name, 'sentiment', 'analyze_sentiment', results['text'])
+            return {"results": results, "sentiment": sentiment}
+        
+        # All providers run concurrently
+        compared = fan_out(transcribe_and_score, names)
         
         # Store result in session
-        session_data = {
-            'id': conversion_id,
-            'type': 'speech_to_text_comparison',
-            'timestamp': datetime.now().isoformat(),
-            'google': {
-                'transcription': google_results,
-                'sentiment': google_sentiment
-            },
-            'opensource': {
-                'transcription': os_results,
-                'sentiment': os_sentiment
-            }
-        }
-        session_manager.add_result(session_data)
+        session_data, response = handlers.compare_speech_to_text_result(
+            conversion_id, names, compared, round(time.perf_counter() - g.request_started, 3)
+        )
+        with span('session_write'):
+            session_manager.add_result(session_data)
         
         # Clean up files before returning
         try:
@@ -200,23 +368,11 @@ def compare_speech_to_text():
             if os.path.exists(wav_path) and wav_path != webm_path:
                 os.remove(wav_path)
         except Exception as e:
-            logger.warning(f"Error removing temporary files: {str(e)}")
+            logger.warning("Error removing temporary files: %s", e)
         
-        # Format the response to match the expected structure in the frontend
-        return jsonify({
-            "id": conversion_id,
-            "google": {
-                "results": google_results,
-                "sentiment": google_sentiment
-            },
-            "opensource": {
-                "results": os_results,
-                "sentiment": os_sentiment
-            }
-        })
+        return jsonify(response)
     
     except Exception as e:
-        logger.exception("Error in speech-to-text comparison")
         # Clean up any temporary files
         try:
             if 'webm_path' in locals() and os.path.exists(webm_path):
@@ -225,117 +381,130 @@ def compare_speech_to_text():
                 os.remove(wav_path)
         except:
             pass
-        return jsonify({"error": str(e)}), 500
+        body, status = handlers.failure(e, 'speech-to-text comparison')
+        return jsonify(body), status
 
 @app.route('/api/text-to-speech', methods=['POST'])
 def text_to_speech():
     """Endpoint for text-to-speech conversion"""
     data = request.json
-    if not data or 'text' not in data:
-        return jsonify({"error": "No text provided"}), 400
-    
-    text = data.get('text', '').strip()
-    voice_type = data.get('voice', 'en-US-Neural2-F')  # Default voice
-    provider = data.get('provider', 'google')  # Default to Google
+    options = handlers.text_to_speech_options(data, provider_calls)
+    text, provider, output_format = options['text'], options['provider'], options['output_format']
     
-    if not text:
-        return jsonify({"error": "Empty text"}), 400
+    # Reject unknown voices before calling the provider
+    voice_error = 'voice' in data and voice_catalog.validate(provider, options['voice'])
+    if voice_error:
+        return jsonify({"error": voice_error}), 400
     
     try:
         # Generate a unique ID for this conversion
         conversion_id = str(uuid.uuid4())
         
-        # Choose the appropriate services based on provider
-        if provider == 'opensource':
-            audio_file, audio_content = os_text_service.synthesize_speech(text, voice_type)
-            sentiment_service_to_use = os_sentiment_service
-        else:
-            audio_file, audio_content = google_text_service.synthesize_speech(text, voice_type)
-            sentiment_service_to_use = google_sentiment_service
+        # Call the requested provider; on failover the Google voice is replaced by the open-source default
+        (audio_file, audio_content), tts_failover = coalesced_call(
+            provider, 'text', 'synthesize_speech', text, options['voice'], failover_args=(text, None),
+            **format_kwargs(output_format)
+        )
+        failovers = [tts_failover] if tts_failover else []
         
         # Store in temporary directory
-        temp_path = os.path.join(TEMP_DIR, f"{conversion_id}.mp3")
+        temp_path = os.path.join(TEMP_DIR, f"{conversion_id}{(output_format or OutputFormat()).extension}")
         with open(temp_path, 'wb') as f:
             f.write(audio_content)
         
         # Process the text for sentiment
-        sentiment = sentiment_service_to_use.analyze_sentiment(text)
-        
-        # Store result in session
-        session_data = {
-            'id': conversion_id,
-            'type': 'text_to_speech',
-            'provider': provider,
-            'timestamp': datetime.now().isoformat(),
-            'text': text,
-            'audio_path': temp_path,
-            'sentiment': sentiment
-        }
-        session_manager.add_result(session_data)
-        
-        # Return audio data as base64
-        import base64
-        audio_base64 = base64.b64encode(audio_content).decode('utf-8')
-        
-        return jsonify({
-            "id": conversion_id,
-            "provider": provider,
-            "audio": audio_base64,
-            "sentiment": sentiment
-        })
+        sentiment, sentiment_failover = coalesced_call(options['sentiment_provider'], 'sentiment',
+                                                       'analyze_sentiment', text)
+        if sentiment_failover:
+            failovers.append(sentiment_failover)
+        
+        # Store result in session; the response carries the audio as base64
+        session_data, response = handlers.text_to_speech_result(
+            conversion_id, options, temp_path, audio_content, sentiment, failovers,
+            round(time.perf_counter() - g.request_started, 3)
+        )
+        with span('session_write'):
+            session_manager.add_result(session_data)
+        
+        return jsonify(response)
     
     except Exception as e:
-        logger.exception(f"Error in text-to-speech conversion using {provider}")
-        return jsonify({"error": str(e)}), 500
+        body, status = handlers.failure(e, 'text-to-speech conversion', provider)
+        return jsonify(body), status
+
+@app.route('/api/text-to-speech/batch', methods=['POST'])
+def text_to_speech_batch():
+    """Render many prompts to files, skipping prompts already rendered; returns keys instead of audio"""
+    items = handlers.text_to_speech_batch_items(request.json, provider_calls, tts_batch, TTS_BATCH_MAX_ITEMS)
+    
+    # Reject unknown voices before calling any provider
+    voices = {(item['provider'], item['voice']) for item in items}
+    voice_error = next(filter(None, (voice_catalog.validate(name, voice) for name, voice in voices)), None)
+    if voice_error:
+        return jsonify({"error": voice_error}), 400
+    
+    try:
+        result = tts_batch.render(items)
+        result.pop('output_dir')
+        result.pop('manifest')
+        return jsonify(result), 200 if not result['failed'] else 207
+    
+    except Exception as e:
+        body, status = handlers.failure(e, 'batch text-to-speech')
+        return jsonify(body), status
+
+@app.route('/api/text-to-speech/batch/<key>', methods=['GET'])
+def text_to_speech_batch_audio(key):
+    """Audio of a batch-rendered prompt, by the key the batch endpoint returned"""
+    if len(key) != 64 or not all(c in '0123456789abcdef' for c in key):
+        return jsonify({"error": "Invalid key"}), 400
+    rendered = tts_batch.find_audio(key)
+    if not rendered:
+        return jsonify({"error": "Not rendered"}), 404
+    file_name, mimetype = rendered
+    response = send_from_directory(tts_batch.output_dir, file_name, mimetype=mimetype)
+    # Content-addressed, so the file behind a key never changes
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
 @app.route('/api/sentiment', methods=['POST'])
 def analyze_sentiment():
     """Endpoint for sentiment analysis"""
-    data = request.json
-    if not data or 'text' not in data:
-        return jsonify({"error": "No text provided"}), 400
-    
-    text = data.get('text', '').strip()
-    provider = data.get('provider', 'google')  # Default to Google
-    
-    if not text:
-        return jsonify({"error": "Empty text"}), 400
+    text, provider = handlers.sentiment_options(request.json, provider_calls)
     
     try:
-        # Choose the appropriate service based on provider
-        if provider == 'opensource':
-            sentiment = os_sentiment_service.analyze_sentiment(text)
-        else:
-            sentiment = google_sentiment_service.analyze_sentiment(text)
-        
-        return jsonify({
-            "text": text,
-            "provider": provider,
-            "sentiment": sentiment
-        })
+        # Call the requested provider, failing over to open-source if it is unavailable
+        sentiment, failover = coalesced_call(provider, 'sentiment', 'analyze_sentiment', text)
+        return jsonify(handlers.sentiment_response(text, provider, sentiment, failover))
     
     except Exception as e:
-        logger.exception(f"Error in sentiment analysis using {provider}")
-        return jsonify({"error": str(e)}), 500
+        body, status = handlers.failure(e, 'sentiment analysis', provider)
+        return jsonify(body), status
 
 @app.route('/api/voices', methods=['GET'])
 def get_voices():
-    """Get available voices for text-to-speech"""
+    """Get available voices for text-to-speech, optionally filtered by language and gender"""
     provider = request.args.get('provider', 'google')  # Default to Google
+    language = request.args.get('language')
+    gender = request.args.get('gender')
+    
+    provider_calls.check('text', provider)
     
     try:
-        # Choose the appropriate service based on provider
-        if provider == 'opensource':
-            voices = os_text_service.get_available_voices()
-        else:
-            voices = google_text_service.get_available_voices()
+        voices, etag = voice_catalog.voices(provider, language=language, gender=gender)
         
-        return jsonify({
+        response = jsonify({
             "provider": provider,
             "voices": voices
         })
+        if etag:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'public, max-age=300'
+            # Answers 304 Not Modified when If-None-Match matches
+            response = response.make_conditional(request)
+        return response
     except Exception as e:
-        logger.exception(f"Error retrieving voices for {provider}")
+        logger.exception("Error retrieving voices for %s", provider)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/results', methods=['GET'])
@@ -348,6 +517,16 @@ def get_results():
         logger.exception("Error retrieving results")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/results/stats', methods=['GET'])
+def get_results_stats():
+    """Aggregates over the session's results, kept up to date as results are added"""
+    return jsonify(session_manager.get_stats())
+
+@app.route('/api/results/storage', methods=['GET'])
+def get_results_storage():
+    """Size of the current session's stored results against its byte budget"""
+    return jsonify(session_manager.storage_stats())
+
 @app.route('/api/results/<result_id>', methods=['GET'])
 def get_result(result_id):
     """Get a specific result by ID"""
@@ -358,7 +537,7 @@ def get_result(result_id):
         else:
             return jsonify({"error": "Result not found"}), 404
     except Exception as e:
-        logger.exception(f"Error retrieving result {result_id}")
+        logger.exception("Error retrieving result %s", result_id)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/results', methods=['DELETE'])
@@ -374,127 +553,81 @@ def clear_results():
 # Additional routes for comparison
 @app.route('/api/compare/sentiment', methods=['POST'])
 def compare_sentiment():
-    """Compare sentiment analysis between Google and open-source"""
-    data = request.json
-    if not data or 'text' not in data:
-        return jsonify({"error": "No text provided"}), 400
-    
-    text = data.get('text', '').strip()
-    
-    if not text:
-        return jsonify({"error": "Empty text"}), 400
+    """Compare sentiment analysis across providers (Google and open-source unless `providers` is given)"""
+    text, names = handlers.compare_sentiment_options(request.json, provider_calls)
     
     try:
-        # Get sentiment from both providers
-        google_sentiment = google_sentiment_service.analyze_sentiment(text)
-        os_sentiment = os_sentiment_service.analyze_sentiment(text)
-        
-        return jsonify({
-            "text": text,
-            "google": {
-                "provider": "google",
-                "sentiment": google_sentiment
-            },
-            "opensource": {
-                "provider": "opensource",
-                "sentiment": os_sentiment
-            }
-        })
+        # Get sentiment from all providers at once
+        sentiments = fan_out(lambda name: call_provider_or_error(name, 'sentiment', 'analyze_sentiment', text), names)
+        return jsonify(handlers.compare_sentiment_response(text, names, sentiments))
     
     except Exception as e:
-        logger.exception("Error in sentiment comparison")
-        return jsonify({"error": str(e)}), 500
+        body, status = handlers.failure(e, 'sentiment comparison')
+        return jsonify(body), status
 
 @app.route('/api/compare/text-to-speech', methods=['POST'])
 def compare_text_to_speech():
-    """Compare text-to-speech between Google and open-source"""
-    data = request.json
-    if not data or 'text' not in data:
-        return jsonify({"error": "No text provided"}), 400
+    """Compare text-to-speech across providers (Google and open-source unless `providers` is given)"""
+    text, voices, output_format, names = handlers.compare_text_to_speech_options(request.json, provider_calls)
     
-    text = data.get('text', '').strip()
-    google_voice = data.get('google_voice', 'en-US-Neural2-F')
-    os_voice = data.get('os_voice', 'en-US-ChristopherNeural')
-    
-    if not text:
-        return jsonify({"error": "Empty text"}), 400
+    voice_error = next(filter(None, (voice_catalog.validate(name, voices.get(name)) for name in names)), None)
+    if voice_error:
+        return jsonify({"error": voice_error}), 400
     
     try:
         # Generate a unique ID for this conversion
         conversion_id = str(uuid.uuid4())
         
-        # Process with Google
-        google_file, google_audio = google_text_service.synthesize_speech(text, google_voice)
-        google_sentiment = google_sentiment_service.analyze_sentiment(text)
-        
-        # Process with open-source
-        os_file, os_audio = os_text_service.synthesize_speech(text, os_voice)
-        os_sentiment = os_sentiment_service.analyze_sentiment(text)
-        
-        # Store files
-        google_path = os.path.join(TEMP_DIR, f"{conversion_id}_google.mp3")
-        os_path = os.path.join(TEMP_DIR, f"{conversion_id}_os.mp3")
-        
-        with open(google_path, 'wb') as f:
-            f.write(google_audio)
-        
-        with open(os_path, 'wb') as f:
-            f.write(os_audio)
+        def synthesize_and_score(name):
+            voice = voices.get(name)
+            try:
+                _, audio = call_provider(name, 'text', 'synthesize_speech', text, voice, failover=False,
+                                         **format_kwargs(output_format))[0]
+            except Exception as e:
+                logger.warning("Text-to-speech comparison failed for %s: %s", name, e)
+                return handlers.compared_synthesis(voice, error=str(e))
+            sentiment = None
+            if name in providers.names('sentiment'):
+                sentiment = call_provider_or_error(name, 'sentiment', 'analyze_sentiment', text)
+            
+            # Store file
+            audio_path = os.path.join(TEMP_DIR, f"{conversion_id}_{name}{(output_format or OutputFormat()).extension}")
+            with open(audio_path, 'wb') as f:
+                f.write(audio)
+            return handlers.compared_synthesis(voice, audio, audio_path, sentiment)
         
-        # Convert to base64
-        import base64
-        google_base64 = base64.b64encode(google_audio).decode('utf-8')
-        os_base64 = base64.b64encode(os_audio).decode('utf-8')
+        # All providers run concurrently; one provider failing does not fail the others
+        compared = fan_out(synthesize_and_score, names)
         
         # Store result in session
-        session_data = {
-            'id': conversion_id,
-            'type': 'comparison',
-            'timestamp': datetime.now().isoformat(),
-            'text': text,
-            'google': {
-                'voice': google_voice,
-                'audio_path': google_path,
-                'sentiment': google_sentiment
-            },
-            'opensource': {
-                'voice': os_voice,
-                'audio_path': os_path,
-                'sentiment': os_sentiment
-            }
-        }
-        session_manager.add_result(session_data)
+        session_data, response = handlers.compare_text_to_speech_result(
+            conversion_id, text, names, compared, round(time.perf_counter() - g.request_started, 3)
+        )
+        with span('session_write'):
+            session_manager.add_result(session_data)
         
-        return jsonify({
-            "id": conversion_id,
-            "text": text,
-            "google": {
-                "voice": google_voice,
-                "audio": google_base64,
-                "sentiment": google_sentiment
-            },
-            "opensource": {
-                "voice": os_voice,
-                "audio": os_base64,
-                "sentiment": os_sentiment
-            }
-        })
+        return jsonify(response)
     
     except Exception as e:
-        logger.exception("Error in text-to-speech comparison")
-        return jsonify({"error": str(e)}), 500
+        body, status = handlers.failure(e, 'text-to-speech comparison')
+        return jsonify(body), status
 
-# Clean up temporary files when the app exits
-import atexit
-def cleanup():
-    import shutil
-    try:
-        shutil.rmtree(TEMP_DIR)
-        logger.info(f"Cleaned up temporary directory: {TEMP_DIR}")
-    except Exception as e:
-        logger.error(f"Error cleaning up temporary directory: {e}")
+# Run once requests have drained, in this order: queued work is cancelled before the files it
+# would use are removed, and logs are flushed last
+lifecycle.on_shutdown('compare pool', lambda: compare_executor.shutdown(wait=True, cancel_futures=True))
+lifecycle.on_shutdown('batch text-to-speech', tts_batch.close)
+if not GATEWAY_MODE and hasattr(os_speech_service, 'close'):
+    lifecycle.on_shutdown('whisper batcher', lambda: os_speech_service.close(cancel=True))
+lifecycle.on_shutdown('voice catalog', voice_catalog.close)
+lifecycle.on_shutdown('temporary directory', lambda: remove_temp_dir(TEMP_DIR))
+lifecycle.on_shutdown('traces', flush_tracing)
+lifecycle.on_shutdown('logs', stop_logging)
 
-atexit.register(cleanup)
+# SIGTERM drains before the server's own handler exits the worker; an exit without it
+# (e.g. Ctrl-C) still runs the hooks, and a killed worker's directory is removed by the next one
+lifecycle.install_signal_handlers()
+atexit.register(lifecycle.shutdown, drain=False)
+lifecycle.mark_ready()
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=8080)
\ No newline at end of file
@@ -0,0 +1,596 @@
+"""
+ASGI entry point with async route handlers
+
+Serves the same JSON API as app.py, with the same validation, responses,
+circuit breakers, concurrency limits and failover (utils/handlers.py and
+utils/provider_calls.py), but Google and Edge TTS calls are awaited on the
+event loop (via the services' *_async methods) instead of blocking a worker
+thread, and CPU-bound Whisper/spaCy work runs in a thread pool.
+
+Run with:
+    python -m asgi_app --bind 0.0.0.0:8080
+
+which drains on SIGTERM (see serve()), or with plain hypercorn:
+    hypercorn "asgi_app:create_app()" --bind 0.0.0.0:8080
+"""
+import argparse
+import asyncio
+import contextvars
+import logging
+import os
+import signal
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+
+from quart import Quart, request, jsonify, session, g, send_from_directory
+from quart_cors import cors
+
+from utils import handlers
+from utils.handlers import RequestRejected
+from utils.session_manager import SessionManager
+from utils.sentiment_timeline import SentimentTimeline
+from utils.voice_catalog import VoiceCatalog
+from utils.upload import UploadRejected, receive_upload, upload_limits
+from utils.logging_config import request_id_var
+from utils.tracing import span, start_trace, end_trace
+from utils.providers import ProviderRegistry, UnknownProvider
+from utils.provider_calls import ProviderCalls
+from utils.tts_batch import TTSBatchRenderer
+from utils.audio_format import OutputFormat, format_kwargs
+from utils.lifecycle import Lifecycle, create_temp_dir, remove_temp_dir
+from open_source_services.diarization import DiarizationService, diarize_transcript
+
+logger = logging.getLogger(__name__)
+
+
+def _load_services():
+    """Reuse the service wiring from app.py (model server, batching, credentials, provider guards)"""
+    import app as wsgi_app
+    # The ASGI server owns the signals; app.py's hooks run from this app's shutdown instead
+    wsgi_app.lifecycle.remove_signal_handlers()
+    return (wsgi_app.provider_calls, wsgi_app.TEMP_DIR, wsgi_app.voice_catalog, wsgi_app.tts_batch,
+            wsgi_app.lifecycle)
+
+
+def create_app(services=None, temp_dir=None, max_workers=None, voice_catalog=None, tts_batch=None, diarizer=None,
+               lifecycle=None, provider_calls=None):
+    """
+    Create the ASGI app
+
+    Args:
+        services: Dict of provider name -> {'speech', 'text', 'sentiment'}
+                  services; defaults to the services configured by app.py
+        temp_dir: Directory for temporary audio files
+        max_workers: Size of the thread pool for blocking provider calls
+        voice_catalog: VoiceCatalog for /api/voices and voice validation;
+                       defaults to an in-memory catalog over the services
+        tts_batch: TTSBatchRenderer for /api/text-to-speech/batch; defaults
+                   to one rendering into TTS_BATCH_DIR
+        diarizer: DiarizationService for speech-to-text with diarize=true
+        lifecycle: Lifecycle behind the health probes and shutdown, also
+                   available as app.extensions['lifecycle']
+        provider_calls: ProviderCalls to call the services through, e.g.
+                        with guards configured for a load test; defaults to
+                        one with the default guards over services
+
+    Returns:
+        Quart: The ASGI application
+    """
+    lifecycle = lifecycle or Lifecycle()
+    if services is None and provider_calls is None:
+        provider_calls, temp_dir, voice_catalog, tts_batch, services_lifecycle = _load_services()
+    else:
+        services_lifecycle = None
+    if provider_calls is None:
+        registry = ProviderRegistry()
+        for name, selected in services.items():
+            registry.register_provider(name, selected)
+        provider_calls = ProviderCalls(registry)
+    providers = provider_calls.providers
+    voice_catalog = voice_catalog or VoiceCatalog(
+        {name: providers.get(name, 'text') for name in providers.names('text')}
+    )
+    if temp_dir is None:
+        temp_dir = create_temp_dir(prefix="speech_analysis_")
+        lifecycle.on_shutdown('temporary directory', partial(remove_temp_dir, temp_dir))
+    tts_batch = tts_batch or TTSBatchRenderer(
+        {name: providers.get(name, 'text') for name in providers.names('text')},
+        os.environ.get('TTS_BATCH_DIR', os.path.join(tempfile.gettempdir(), 'speech_analysis_tts')),
+        concurrency=int(os.environ.get('TTS_BATCH_CONCURRENCY', '4')),
+        synthesize=lambda provider, text, voice, output_format: provider_calls.call(
+            provider, 'text', 'synthesize_speech', text, voice, failover=False, **format_kwargs(output_format)
+        )[0][1]
+    )
+    tts_batch_max_items = int(os.environ.get('TTS_BATCH_MAX_ITEMS', '50'))
+    diarizer = diarizer or DiarizationService()
+
+    app = Quart(__name__)
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_secret_key')
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=1)
+    max_upload_bytes, max_audio_seconds = upload_limits()
+    app.config['MAX_CONTENT_LENGTH'] = max_upload_bytes + 64 * 1024
+    app = cors(app, allow_origin=["http://localhost:5173", "http://127.0.0.1:5173"], allow_credentials=True,
+               allow_headers=["Content-Type", "Authorization"])
+
+    session_manager = SessionManager(session_store=session, audio_dir=temp_dir)
+    # Whisper/spaCy calls, services without async clients and other blocking work run here
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="provider")
+    call = partial(provider_calls.call_async, executor=executor)
+    call_or_error = partial(provider_calls.call_or_error_async, executor=executor)
+    coalesced = partial(provider_calls.coalesced_async, executor=executor)
+
+    app.extensions['lifecycle'] = lifecycle
+    app.asgi_app = lifecycle.wrap_asgi(app.asgi_app)
+    lifecycle.add_check('temp_dir', lambda: None if os.access(temp_dir, os.W_OK) else f"{temp_dir} is not writable")
+    # Run after the server has finished in-flight requests, in this order
+    lifecycle.on_shutdown('provider pool', lambda: executor.shutdown(wait=True, cancel_futures=True))
+    if services_lifecycle is not None:
+        # The services' own hooks from app.py: pools, batchers, voice catalog, temp dir, logs
+        lifecycle.on_shutdown('services', partial(services_lifecycle.shutdown, drain=False))
+    else:
+        lifecycle.on_shutdown('batch text-to-speech', tts_batch.close)
+
+    async def blocking(fn, *args, **kwargs):
+        # Off the event loop, in a copy of the request's context so log lines and spans stay attached to it
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(context.run, fn, *args, **kwargs))
+
+    async def receive(file):
+        # Sniff, cap and hash the upload off the event loop; raises UploadRejected
+        return await blocking(receive_upload, file.stream, temp_dir, max_bytes=max_upload_bytes,
+                              max_duration_seconds=max_audio_seconds)
+
+    async def from_catalog(method, *args, **kwargs):
+        # Usually an index lookup, but a cold catalog fetches from the provider
+        return await blocking(getattr(voice_catalog, method), *args, **kwargs)
+
+    def processing_time():
+        return round(time.perf_counter() - g.request_started, 3)
+
+    @app.before_request
+    async def assign_request_id():
+        request_id_var.set(request.headers.get('X-Request-ID') or uuid.uuid4().hex)
+        g.trace = start_trace(f"{request.method} {request.path}", request_id=request_id_var.get())
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    async def add_request_id(response):
+        response.headers['X-Request-ID'] = request_id_var.get() or ''
+        trace = g.pop('trace', None)
+        if trace is not None:
+            trace.root.set('status_code', response.status_code)
+            end_trace(trace)
+            response.headers['Server-Timing'] = trace.server_timing()
+        return response
+
+    @app.errorhandler(UploadRejected)
+    async def upload_rejected(e):
+        return jsonify({"error": str(e)}), e.status
+
+    @app.errorhandler(413)
+    async def upload_too_large(e):
+        return jsonify({"error": f"Upload exceeds {max_upload_bytes} bytes"}), 413
+
+    @app.errorhandler(UnknownProvider)
+    async def unknown_provider_requested(e):
+        return jsonify({"error": str(e)}), 400
+
+    @app.errorhandler(RequestRejected)
+    async def request_rejected(e):
+        return jsonify({"error": str(e)}), e.status
+
+    @app.route('/test', methods=['GET'])
+    async def test():
+        return jsonify({"message": "API is working"})
+
+    @app.before_serving
+    async def startup():
+        lifecycle.mark_ready()
+
+    @app.after_serving
+    async def shutdown():
+        # Off the event loop, hooks wait for pools to stop; the default executor, since the provider pool is one of them
+        await asyncio.get_running_loop().run_in_executor(None, partial(lifecycle.shutdown, drain=False))
+
+    @app.route('/api/health/live', methods=['GET'])
+    async def liveness_check():
+        """Liveness probe: the process is up, including while it drains"""
+        return jsonify(lifecycle.liveness())
+
+    @app.route('/api/health', methods=['GET'])
+    @app.route('/api/health/ready', methods=['GET'])
+    async def readiness_check():
+        """Readiness probe: 503 while starting, draining or failing a check"""
+        ready, details = lifecycle.readiness()
+        return jsonify(dict(details, timestamp=datetime.now().isoformat())), 200 if ready else 503
+
+    @app.route('/api/providers/status', methods=['GET'])
+    async def provider_status():
+        """Circuit breaker and concurrency limit state for each provider's services"""
+        return jsonify(dict(provider_calls.status(), voice_catalog=voice_catalog.status()))
+
+    @app.route('/api/speech-to-text', methods=['POST'])
+    async def speech_to_text():
+        """Endpoint for speech-to-text conversion"""
+        with span('upload'):
+            files = await request.files
+            form = await request.form
+        file = handlers.audio_upload(files)
+        options = handlers.speech_to_text_options(form, provider_calls)
+        provider = options['provider']
+        with span('upload_check'):
+            upload = await receive(file)
+
+        try:
+            conversion_id = str(uuid.uuid4())
+            temp_path = upload.path
+
+            logger.info("Processing %s/%s audio file using %s: %s", upload.format['container'], upload.format['codec'], provider, temp_path)
+            results, speech_failover = await call(provider, 'speech', 'transcribe_audio', temp_path,
+                                                  word_timestamps=options['word_timestamps'])
+            failovers = [speech_failover] if speech_failover else []
+
+            sentiment = None
+            sentiment_timeline = None
+            diarization = None
+            if results['success'] and results['text']:
+                sentiment, sentiment_failover = await call(options['sentiment_provider'], 'sentiment',
+                                                           'analyze_sentiment', results['text'])
+                if sentiment_failover:
+                    failovers.append(sentiment_failover)
+                served_by = sentiment_failover['to'] if sentiment_failover else options['sentiment_provider']
+                # Scored through the provider's guard, Google's one text per call in parallel
+                sentiment_service = provider_calls.guarded_sentiment(served_by)
+                if options['include_timeline'] and results.get('segments'):
+                    timeline = SentimentTimeline(sentiment_service)
+                    with span('sentiment_timeline', segments=len(results['segments'])):
+                        await blocking(timeline.extend, results['segments'])
+                    sentiment_timeline = timeline.to_dict(window=options['timeline_window'])
+                if options['diarize'] and results.get('segments'):
+                    # CPU-bound, off the event loop; labels the segments in place
+                    with span('diarization', segments=len(results['segments'])):
+                        diarization = await blocking(diarize_transcript, diarizer, temp_path, results['segments'],
+                                                     sentiment_service, options['num_speakers'])
+
+            session_data, response = handlers.speech_to_text_result(
+                conversion_id, options, results, sentiment, sentiment_timeline, diarization, failovers, upload.sha256,
+                processing_time()
+            )
+            with span('session_write'):
+                session_manager.add_result(session_data)
+
+            return jsonify(response)
+
+        except Exception as e:
+            body, status = handlers.failure(e, 'speech-to-text conversion', provider)
+            return jsonify(body), status
+
+        finally:
+            upload.close()
+
+    @app.route('/api/compare/speech-to-text', methods=['POST'])
+    async def compare_speech_to_text():
+        """Compare speech-to-text across providers (Google and open-source unless `providers` is given)"""
+        with span('upload'):
+            files = await request.files
+            form = await request.form
+        file = handlers.audio_upload(files)
+        word_timestamps, names = handlers.compare_speech_to_text_options(form, provider_calls)
+        conversion_id = str(uuid.uuid4())
+        with span('upload_check'):
+            upload = await receive(file)
+        webm_path = upload.path
+        wav_path = os.path.join(temp_dir, f"{conversion_id}.wav")
+        wants_wav = [name for name in names
+                     if getattr(provider_calls.service(name, 'speech'), 'audio_format', None) == 'wav']
+
+        try:
+
+            # Convert WEBM to WAV for Whisper without blocking the event loop
+            if wants_wav:
+                try:
+                    with span('ffmpeg'):
+                        process = await asyncio.create_subprocess_exec(
+                            'ffmpeg', '-i', webm_path, '-ar', '16000', '-ac', '1', '-c:a', 'pcm_s16le', wav_path,
+                            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+                        )
+                        returncode = await process.wait()
+                    if returncode != 0:
+                        raise RuntimeError(f"ffmpeg exited with code {process.returncode}")
+                except Exception as e:
+                    logger.error("Error converting audio file: %s", e)
+                    wav_path = webm_path
+
+            async def transcribe_and_score(name):
+                path = wav_path if name in wants_wav else webm_path
+                try:
+                    results = await call_or_error(name, 'speech', 'transcribe_audio', path,
+                                                  word_timestamps=word_timestamps)
+                except Exception as e:
+                    logger.exception("Error processing with %s: %s", name, e)
+                    results = {"success": False, "error": str(e), "text": None}
+                sentiment = None
+                if results['success'] and results['text'] and name in providers.names('sentiment'):
+                    sentiment = await call_or_error(name, 'sentiment', 'analyze_sentiment', results['text'])
+                return {"results": results, "sentiment": sentiment}
+
+            # All providers run concurrently
+            compared = dict(zip(names, await asyncio.gather(*(transcribe_and_score(name) for name in names))))
+
+            session_data, response = handlers.compare_speech_to_text_result(
+                conversion_id, names, compared, processing_time()
+            )
+            with span('session_write'):
+                session_manager.add_result(session_data)
+
+            return jsonify(response)
+
+        except Exception as e:
+            body, status = handlers.failure(e, 'speech-to-text comparison')
+            return jsonify(body), status
+
+        finally:
+            upload.close()
+            if os.path.exists(wav_path):
+                os.remove(wav_path)
+
+    @app.route('/api/text-to-speech', methods=['POST'])
+    async def text_to_speech():
+        """Endpoint for text-to-speech conversion"""
+        data = await request.get_json()
+        options = handlers.text_to_speech_options(data, provider_calls)
+        text, provider, output_format = options['text'], options['provider'], options['output_format']
+
+        # Reject unknown voices before calling the provider
+        voice_error = 'voice' in data and await from_catalog('validate', provider, options['voice'])
+        if voice_error:
+            return jsonify({"error": voice_error}), 400
+
+        try:
+            conversion_id = str(uuid.uuid4())
+            # Synthesis and sentiment are independent, so await them together; on failover the
+            # Google voice is replaced by the open-source default
+            ((audio_file, audio_content), tts_failover), (sentiment, sentiment_failover) = await asyncio.gather(
+                coalesced(provider, 'text', 'synthesize_speech', text, options['voice'], failover_args=(text, None),
+                          **format_kwargs(output_format)),
+                coalesced(options['sentiment_provider'], 'sentiment', 'analyze_sentiment', text)
+            )
+            failovers = [failover for failover in (tts_failover, sentiment_failover) if failover]
+
+            temp_path = os.path.join(temp_dir, f"{conversion_id}{(output_format or OutputFormat()).extension}")
+            await blocking(_write_file, temp_path, audio_content)
+
+            session_data, response = handlers.text_to_speech_result(
+                conversion_id, options, temp_path, audio_content, sentiment, failovers, processing_time()
+            )
+            with span('session_write'):
+                session_manager.add_result(session_data)
+
+            return jsonify(response)
+
+        except Exception as e:
+            body, status = handlers.failure(e, 'text-to-speech conversion', provider)
+            return jsonify(body), status
+
+    @app.route('/api/text-to-speech/batch', methods=['POST'])
+    async def text_to_speech_batch():
+        """Render many prompts to files, skipping prompts already rendered; returns keys instead of audio"""
+        items = handlers.text_to_speech_batch_items(await request.get_json(), provider_calls, tts_batch,
+                                                    tts_batch_max_items)
+
+        for name, voice in {(item['provider'], item['voice']) for item in items}:
+            voice_error = await from_catalog('validate', name, voice)
+            if voice_error:
+                return jsonify({"error": voice_error}), 400
+
+        try:
+            # The renderer bounds each provider's concurrency on its own threads; wait for it off the loop
+            result = await blocking(tts_batch.render, items)
+            result.pop('output_dir')
+            result.pop('manifest')
+            return jsonify(result), 200 if not result['failed'] else 207
+
+        except Exception as e:
+            body, status = handlers.failure(e, 'batch text-to-speech')
+            return jsonify(body), status
+
+    @app.route('/api/text-to-speech/batch/<key>', methods=['GET'])
+    async def text_to_speech_batch_audio(key):
+        """Audio of a batch-rendered prompt, by the key the batch endpoint returned"""
+        if len(key) != 64 or not all(c in '0123456789abcdef' for c in key):
+            return jsonify({"error": "Invalid key"}), 400
+        rendered = tts_batch.find_audio(key)
+        if not rendered:
+            return jsonify({"error": "Not rendered"}), 404
+        file_name, mimetype = rendered
+        response = await send_from_directory(tts_batch.output_dir, file_name, mimetype=mimetype)
+        # Content-addressed, so the file behind a key never changes
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
+    @app.route('/api/sentiment', methods=['POST'])
+    async def analyze_sentiment():
+        """Endpoint for sentiment analysis"""
+        text, provider = handlers.sentiment_options(await request.get_json(), provider_calls)
+
+        try:
+            sentiment, failover = await coalesced(provider, 'sentiment', 'analyze_sentiment', text)
+            return jsonify(handlers.sentiment_response(text, provider, sentiment, failover))
+
+        except Exception as e:
+            body, status = handlers.failure(e, 'sentiment analysis', provider)
+            return jsonify(body), status
+
+    @app.route('/api/voices', methods=['GET'])
+    async def get_voices():
+        """Get available voices for text-to-speech, optionally filtered by language and gender"""
+        provider = request.args.get('provider', 'google')
+        provider_calls.check('text', provider)
+
+        try:
+            voices, etag = await from_catalog(
+                'voices', provider, language=request.args.get('language'), gender=request.args.get('gender')
+            )
+            if etag and request.if_none_match.contains(etag):
+                return "", 304, {"ETag": f'"{etag}"'}
+            response = jsonify({"provider": provider, "voices": voices})
+            if etag:
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'public, max-age=300'
+            return response
+        except Exception as e:
+            logger.exception("Error retrieving voices for %s", provider)
+            return jsonify({"error": str(e)}), 500
+
+    @app.route('/api/results', methods=['GET'])
+    async def get_results():
+        """Get all results for the current session"""
+        try:
+            return jsonify({"results": session_manager.get_all_results()})
+        except Exception as e:
+            logger.exception("Error retrieving results")
+            return jsonify({"error": str(e)}), 500
+
+    @app.route('/api/results/stats', methods=['GET'])
+    async def get_results_stats():
+        """Aggregates over the session's results, kept up to date as results are added"""
+        return jsonify(session_manager.get_stats())
+
+    @app.route('/api/results/storage', methods=['GET'])
+    async def get_results_storage():
+        """Size of the current session's stored results against its byte budget"""
+        return jsonify(session_manager.storage_stats())
+
+    @app.route('/api/results/<result_id>', methods=['GET'])
+    async def get_result(result_id):
+        """Get a specific result by ID"""
+        try:
+            result = session_manager.get_result(result_id)
+            if result:
+                return jsonify(result)
+            return jsonify({"error": "Result not found"}), 404
+        except Exception as e:
+            logger.exception("Error retrieving result %s", result_id)
+            return jsonify({"error": str(e)}), 500
+
+    @app.route('/api/results', methods=['DELETE'])
+    async def clear_results():
+        """Clear all results from the current session"""
+        try:
+            session_manager.clear_results()
+            return jsonify({"status": "Session cleared"})
+        except Exception as e:
+            logger.exception("Error clearing session")
+            return jsonify({"error": str(e)}), 500
+
+    @app.route('/api/compare/sentiment', methods=['POST'])
+    async def compare_sentiment():
+        """Compare sentiment analysis across providers (Google and open-source unless `providers` is given)"""
+        text, names = handlers.compare_sentiment_options(await request.get_json(), provider_calls)
+
+        try:
+            sentiments = await asyncio.gather(
+                *(call_or_error(name, 'sentiment', 'analyze_sentiment', text) for name in names)
+            )
+            return jsonify(handlers.compare_sentiment_response(text, names, dict(zip(names, sentiments))))
+
+        except Exception as e:
+            body, status = handlers.failure(e, 'sentiment comparison')
+            return jsonify(body), status
+
+    @app.route('/api/compare/text-to-speech', methods=['POST'])
+    async def compare_text_to_speech():
+        """Compare text-to-speech across providers (Google and open-source unless `providers` is given)"""
+        text, voices, output_format, names = handlers.compare_text_to_speech_options(
+            await request.get_json(), provider_calls
+        )
+
+        for name in names:
+            voice_error = await from_catalog('validate', name, voices.get(name))
+            if voice_error:
+                return jsonify({"error": voice_error}), 400
+
+        try:
+            conversion_id = str(uuid.uuid4())
+
+            async def sentiment_of(name):
+                if name not in providers.names('sentiment'):
+                    return None
+                return await call_or_error(name, 'sentiment', 'analyze_sentiment', text)
+
+            async def synthesize_and_score(name):
+                voice = voices.get(name)
+                try:
+                    (_, audio), sentiment = await asyncio.gather(
+                        call(name, 'text', 'synthesize_speech', text, voice, failover=False,
+                             **format_kwargs(output_format)),
+                        sentiment_of(name)
+                    )
+                except Exception as e:
+                    logger.warning("Text-to-speech comparison failed for %s: %s", name, e)
+                    return handlers.compared_synthesis(voice, error=str(e))
+
+                audio_path = os.path.join(temp_dir, f"{conversion_id}_{name}{(output_format or OutputFormat()).extension}")
+                await blocking(_write_file, audio_path, audio)
+                return handlers.compared_synthesis(voice, audio, audio_path, sentiment)
+
+            # All providers run concurrently; one provider failing does not fail the others
+            compared = dict(zip(names, await asyncio.gather(*(synthesize_and_score(name) for name in names))))
+
+            session_data, response = handlers.compare_text_to_speech_result(
+                conversion_id, text, names, compared, processing_time()
+            )
+            with span('session_write'):
+                session_manager.add_result(session_data)
+
+            return jsonify(response)
+
+        except Exception as e:
+            body, status = handlers.failure(e, 'text-to-speech comparison')
+            return jsonify(body), status
+
+    return app
+
+
+def _write_file(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def serve(app, bind='0.0.0.0:8080'):
+    """
+    Serve the app with hypercorn, draining before it stops on SIGTERM or SIGINT
+
+    Readiness fails first and requests keep being served until they have
+    drained (see Lifecycle.drain); only then does hypercorn stop accepting
+    connections and run the shutdown hooks. Plain hypercorn stops accepting
+    as soon as the signal arrives.
+    """
+    from hypercorn.asyncio import serve as hypercorn_serve
+    from hypercorn.config import Config
+
+    lifecycle = app.extensions['lifecycle']
+    config = Config()
+    config.bind = [bind]
+    config.graceful_timeout = lifecycle.drain_timeout
+
+    async def drained():
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+        await stop.wait()
+        logger.info("Received shutdown signal")
+        await loop.run_in_executor(None, lifecycle.drain)
+
+    asyncio.run(hypercorn_serve(app, config, shutdown_trigger=drained))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the ASGI app, draining requests on SIGTERM")
+    parser.add_argument('--bind', default='0.0.0.0:8080')
+    serve(create_app(), parser.parse_args().bind)
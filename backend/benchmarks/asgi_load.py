@@ -0,0 +1,112 @@
+"""
+Load test the ASGI app against stub providers
+
+Every stub provider call sleeps for --latency-ms on the event loop, the way an
+awaited Google or Edge TTS call would. Calls go through the default provider
+guards, as in production: requests wait for a slot on the event loop while the
+adaptive limit grows from its initial value, so wall time is set by the limiter
+rather than by the worker. --unguarded lifts the limit to show the event loop
+alone, which should keep all requests in flight at once.
+
+Usage (from the backend directory):
+    python -m benchmarks.asgi_load --requests 300 --latency-ms 200 [--unguarded]
+"""
+import argparse
+import asyncio
+import time
+
+from asgi_app import create_app
+from utils.providers import ProviderRegistry
+from utils.provider_calls import ProviderCalls
+from utils.resilience import AdaptiveLimiter, ProviderGuard
+
+
+class InFlight:
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+
+    async def wait(self, seconds):
+        self.current += 1
+        self.peak = max(self.peak, self.current)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.current -= 1
+
+
+class StubSentimentService:
+    def __init__(self, in_flight, latency):
+        self.in_flight = in_flight
+        self.latency = latency
+
+    async def analyze_sentiment_async(self, text):
+        await self.in_flight.wait(self.latency)
+        return {"success": True, "score": 0.5, "magnitude": 0.5, "sentiment": "positive",
+                "confidence": 1.0, "sentences": []}
+
+
+class StubTextService:
+    def __init__(self, in_flight, latency):
+        self.in_flight = in_flight
+        self.latency = latency
+
+    async def synthesize_speech_async(self, text, voice_name=None):
+        await self.in_flight.wait(self.latency)
+        return "stub.mp3", b"\x00" * 1024
+
+    async def get_available_voices_async(self):
+        return []
+
+
+async def run(requests, latency_ms, path, unguarded=False):
+    in_flight = InFlight()
+    latency = latency_ms / 1000.0
+    provider = {
+        'text': StubTextService(in_flight, latency),
+        'sentiment': StubSentimentService(in_flight, latency)
+    }
+    registry = ProviderRegistry()
+    for name in ('google', 'opensource'):
+        registry.register_provider(name, provider)
+    guards = None
+    if unguarded:
+        guards = {
+            (name, kind): ProviderGuard(f"{name}.{kind}", kind=kind,
+                                        limiter=AdaptiveLimiter(initial_limit=requests, max_limit=requests))
+            for name in registry.names() for kind in provider
+        }
+    calls = ProviderCalls(registry, guards=guards)
+    app = create_app(provider_calls=calls)
+    client = app.test_client()
+
+    async def one(i):
+        response = await client.post(path, json={"text": f"request number {i} is great", "provider": "google"})
+        return response.status_code
+
+    start = time.perf_counter()
+    statuses = await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - start
+
+    ok = sum(1 for status in statuses if status == 200)
+    kind = 'sentiment' if path == '/api/sentiment' else 'text'
+    concurrency = calls.guards[('google', kind)].limiter.status()
+    print(f"{path} ({'unguarded' if unguarded else 'default guards'}): {ok}/{requests} OK in {wall:.2f}s "
+          f"({requests / wall:.0f} req/s, peak in-flight provider calls: {in_flight.peak}, "
+          f"final limit: {concurrency['limit']}, rejected: {concurrency['rejected']}, "
+          f"single call latency: {latency_ms:.0f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--latency-ms', type=float, default=200)
+    parser.add_argument('--unguarded', action='store_true', help="Admit every request at once")
+    args = parser.parse_args()
+
+    for path in ('/api/sentiment', '/api/text-to-speech'):
+        asyncio.run(run(args.requests, args.latency_ms, path, unguarded=args.unguarded))
+
+
+if __name__ == '__main__':
+    main()
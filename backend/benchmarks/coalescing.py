@@ -0,0 +1,88 @@
+"""
+Check single-flight coalescing of identical concurrent provider calls
+
+A slow fake provider counts its calls. Identical concurrent requests must
+produce one call per burst, across threads and (with a lock directory)
+across processes, and a failed call must not be reused by the next burst.
+
+Usage (from the backend directory):
+    python -m benchmarks.coalescing --threads 32 --processes 4
+"""
+import argparse
+import multiprocessing
+import tempfile
+import threading
+import time
+from concurrent import futures
+
+from utils.single_flight import SingleFlight
+
+
+class FakeProvider:
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+        self.fail = False
+        self._lock = threading.Lock()
+
+    def analyze_sentiment(self, text):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("provider failed")
+        return {"success": True, "text": text, "score": 0.5}
+
+
+def burst(flight, provider, threads, text="same prompt"):
+    with futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        jobs = [pool.submit(flight.do, ('sentiment', text), provider.analyze_sentiment, text) for _ in range(threads)]
+        return [job.exception() or job.result() for job in jobs]
+
+
+def worker(lock_dir, delay, counter, start_at):
+    provider = FakeProvider(delay)
+    flight = SingleFlight(lock_dir=lock_dir)
+    time.sleep(max(0.0, start_at - time.time()))
+    burst(flight, provider, 8)
+    with counter.get_lock():
+        counter.value += provider.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--delay-ms', type=float, default=200)
+    args = parser.parse_args()
+    delay = args.delay_ms / 1000
+
+    provider = FakeProvider(delay)
+    flight = SingleFlight()
+    results = burst(flight, provider, args.threads)
+    distinct = {id(r) for r in results}
+    print(f"threads: {args.threads} identical requests -> {provider.calls} provider call(s), "
+          f"{len(distinct)} independent result objects")
+
+    provider.calls = 0
+    provider.fail = True
+    errors = burst(flight, provider, args.threads)
+    provider.fail = False
+    after = burst(flight, provider, args.threads)
+    print(f"failure: {sum(isinstance(e, RuntimeError) for e in errors)} of {args.threads} waiters got the error, "
+          f"next burst succeeded: {all(r['success'] for r in after)}, provider calls: {provider.calls} (expect 2)")
+
+    with tempfile.TemporaryDirectory() as lock_dir:
+        counter = multiprocessing.Value('i', 0)
+        start_at = time.time() + 0.5
+        procs = [multiprocessing.Process(target=worker, args=(lock_dir, delay, counter, start_at))
+                 for _ in range(args.processes)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        print(f"processes: {args.processes} workers x 8 threads -> {counter.value} provider call(s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Benchmark speaker diarization on long recordings
+
+Streams a synthetic conversation of --hours hours through DiarizationService
+block by block, the way a long file is decoded, and reports throughput
+(seconds of audio per second), peak memory allocated while diarizing, and the
+diarization error rate: the share of speech attributed to the wrong speaker
+under the best mapping of found speakers to true ones, missed speech
+included. Speakers are harmonic voices with distinct pitch and formants,
+taking turns of 1-10 s with pauses, over low background noise; real voices
+are closer together, so the error here is a lower bound. With --file, a real
+recording is diarized instead (throughput and memory only).
+
+Usage (from the backend directory):
+    python -m benchmarks.diarization --hours 3 --speakers 3
+    python -m benchmarks.diarization --file meeting.wav --num-speakers 4
+"""
+import argparse
+import itertools
+import time
+import tracemalloc
+
+import numpy as np
+
+from open_source_services.diarization import DiarizationService, SAMPLE_RATE, stream_audio
+
+# (pitch in Hz, formant frequencies in Hz) per synthetic speaker
+VOICES = [
+    (110, (700, 1200, 2600)),
+    (210, (500, 1800, 2800)),
+    (150, (350, 900, 2400)),
+    (260, (800, 1400, 3000)),
+]
+TEXTURE_SECONDS = 20
+STEP = 0.1  # Resolution of the error rate, in seconds
+
+
+def voice_texture(rng, pitch, formants):
+    """TEXTURE_SECONDS of one speaker's voice, cut into turns by conversation()"""
+    t = np.arange(TEXTURE_SECONDS * SAMPLE_RATE) / SAMPLE_RATE
+    f0 = pitch * (1 + 0.05 * np.sin(2 * np.pi * 0.7 * t) + 0.03 * np.sin(2 * np.pi * rng.uniform(3, 5) * t))
+    phase = 2 * np.pi * np.cumsum(f0) / SAMPLE_RATE
+    signal = np.zeros_like(t)
+    for harmonic in range(1, int(3800 / pitch)):
+        gain = sum(np.exp(-((harmonic * pitch - formant) / 150.0) ** 2) for formant in formants) + 0.02
+        signal += gain * np.sin(harmonic * phase)
+    # Syllable-rate loudness changes
+    signal *= 0.5 + 0.5 * np.abs(np.sin(2 * np.pi * 3 * t))
+    return (0.1 * signal / np.abs(signal).max()).astype(np.float32)
+
+
+def conversation(hours, speakers, seed=0, block_seconds=30.0):
+    """
+    Synthetic conversation, generated block by block
+
+    Returns:
+        tuple: (iterator of sample blocks, list of (speaker, start, end) filled in as blocks are generated)
+    """
+    rng = np.random.default_rng(seed)
+    textures = [voice_texture(rng, *VOICES[i]) for i in range(speakers)]
+    total = int(hours * 3600 * SAMPLE_RATE)
+    block = int(block_seconds * SAMPLE_RATE)
+    truth = []
+
+    def blocks():
+        position = 0
+        pending = []
+        pending_length = 0
+        while position < total:
+            while pending_length < block:
+                speaker = int(rng.integers(speakers))
+                length = int(rng.uniform(1, 10) * SAMPLE_RATE)
+                offset = int(rng.integers(len(textures[speaker]) - length))
+                start = (position + pending_length) / SAMPLE_RATE
+                truth.append((speaker, start, start + length / SAMPLE_RATE))
+                pending.append(textures[speaker][offset:offset + length] * rng.uniform(0.5, 1.5))
+                pause = int(rng.uniform(0.1, 1.0) * SAMPLE_RATE)
+                pending.append(np.zeros(pause, dtype=np.float32))
+                pending_length += length + pause
+            samples = np.concatenate(pending)
+            out, rest = samples[:min(block, total - position)], samples[block:]
+            pending, pending_length = [rest], len(rest)
+            position += len(out)
+            yield out + (0.003 * rng.standard_normal(len(out))).astype(np.float32)
+
+    return blocks(), truth
+
+
+def error_rate(result, truth, seconds):
+    """Diarization error rate under the best one-to-one mapping of found speakers to true ones"""
+    steps = int(seconds / STEP)
+    reference = np.full(steps, -1)
+    for speaker, start, end in truth:
+        reference[int(start / STEP):int(end / STEP)] = speaker
+    names = {name: index for index, name in enumerate(result["speakers"])}
+    hypothesis = np.full(steps, -1)
+    for turn in result["turns"]:
+        hypothesis[int(turn["start"] / STEP):int(turn["end"] / STEP)] = names[turn["speaker"]]
+
+    speech = reference >= 0
+    true_count = int(reference.max()) + 1
+    found_count = max(len(names), 1)
+    # Overlap in steps of each (true, found) speaker pair
+    confusion = np.zeros((true_count, found_count), dtype=int)
+    attributed = speech & (hypothesis >= 0)
+    np.add.at(confusion, (reference[attributed], hypothesis[attributed]), 1)
+    size = max(true_count, found_count)
+    padded = np.zeros((size, size), dtype=int)
+    padded[:true_count, :found_count] = confusion
+    best = max(padded[np.arange(size), list(mapping)].sum() for mapping in itertools.permutations(range(size)))
+    return 1 - best / speech.sum()
+
+
+def run(blocks, service, num_speakers):
+    stream = service.stream(num_speakers)
+    busy = 0.0
+    tracemalloc.start()
+    for block in blocks:
+        start = time.perf_counter()
+        stream.feed(block)
+        busy += time.perf_counter() - start
+    start = time.perf_counter()
+    result = stream.finish()
+    busy += time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, busy, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=float, default=2.0)
+    parser.add_argument('--speakers', type=int, default=3, choices=range(1, len(VOICES) + 1))
+    parser.add_argument('--num-speakers', type=int, default=None, help="Tell the diarizer the speaker count")
+    parser.add_argument('--block-seconds', type=float, default=30.0)
+    parser.add_argument('--file', help="Diarize this recording instead of synthetic audio")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    service = DiarizationService()
+    if args.file:
+        blocks, truth = stream_audio(args.file, args.block_seconds), None
+    else:
+        blocks, truth = conversation(args.hours, args.speakers, args.seed, args.block_seconds)
+
+    result, busy, peak = run(blocks, service, args.num_speakers)
+    seconds = result["audio_seconds"]
+    # Peak includes the synthetic block being generated, a few MB at 30 s blocks
+    print(f"{seconds / 3600:.2f} h of audio in {busy:.1f} s of diarization ({seconds / busy:.0f}x realtime), "
+          f"peak memory {peak / 2 ** 20:.1f} MiB")
+    print(f"{len(result['speakers'])} speakers, {len(result['turns'])} turns: "
+          + ", ".join(f"{name} {time_spoken / 60:.1f} min" for name, time_spoken in result["speaking_time"].items()))
+    if truth is not None:
+        print(f"Diarization error rate: {error_rate(result, truth, seconds):.1%} "
+              f"({args.speakers} true speakers)")
+
+
+if __name__ == '__main__':
+    main()
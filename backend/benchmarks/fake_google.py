@@ -0,0 +1,131 @@
+"""Local stand-ins for the Google Cloud gRPC APIs used by the benchmarks"""
+import threading
+import time
+from concurrent import futures
+from datetime import timedelta
+
+import grpc
+from google.cloud import language, speech
+
+
+class _FakeServer:
+    def __init__(self, service_name, handlers):
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=64))
+        self.server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler(service_name, handlers),))
+        self.port = self.server.add_insecure_port('127.0.0.1:0')
+        self.endpoint = f"127.0.0.1:{self.port}"
+
+    def start(self):
+        self.server.start()
+
+    def stop(self):
+        self.server.stop(0)
+
+
+class FakeLanguageServer(_FakeServer):
+    """AnalyzeSentiment with a fixed delay, recording the peer of every call"""
+
+    def __init__(self, delay_ms=0):
+        self.delay = delay_ms / 1000.0
+        self.peers = set()
+        self._lock = threading.Lock()
+        super().__init__('google.cloud.language.v1.LanguageService', {
+            'AnalyzeSentiment': grpc.unary_unary_rpc_method_handler(
+                self.analyze_sentiment,
+                request_deserializer=language.AnalyzeSentimentRequest.deserialize,
+                response_serializer=language.AnalyzeSentimentResponse.serialize
+            )
+        })
+
+    def analyze_sentiment(self, request, context):
+        with self._lock:
+            self.peers.add(context.peer())
+        time.sleep(self.delay)
+        return language.AnalyzeSentimentResponse(
+            document_sentiment=language.Sentiment(score=0.5, magnitude=0.5)
+        )
+
+    def reset(self):
+        with self._lock:
+            self.peers = set()
+
+
+class FakeSpeechServer(_FakeServer):
+    """
+    Recognize and StreamingRecognize stand-in
+
+    The streaming handler emits one final result per `chunks_per_result`
+    audio messages, transcribed as "part N", and records the size of every
+    audio message it receives. With `bytes_per_second` set (LINEAR16 audio),
+    result end times follow the audio received, and a stream carrying more
+    than `max_stream_seconds` is aborted the way Google aborts one. Without
+    `final_at_end`, audio after the last full `chunks_per_result` gets no
+    result, like speech cut off when a stream ends. Recognize answers after
+    `recognize_delay_ms`.
+    """
+
+    def __init__(self, chunks_per_result=8, bytes_per_second=None, max_stream_seconds=305, final_at_end=True,
+                 recognize_delay_ms=0):
+        self.chunks_per_result = chunks_per_result
+        self.recognize_delay = recognize_delay_ms / 1000.0
+        self.final_at_end = final_at_end
+        self.bytes_per_second = bytes_per_second
+        self.max_stream_seconds = max_stream_seconds
+        self.recognize_calls = 0
+        self.audio_message_sizes = []
+        self.stream_seconds = []
+        super().__init__('google.cloud.speech.v1.Speech', {
+            'Recognize': grpc.unary_unary_rpc_method_handler(
+                self.recognize,
+                request_deserializer=speech.RecognizeRequest.deserialize,
+                response_serializer=speech.RecognizeResponse.serialize
+            ),
+            'StreamingRecognize': grpc.stream_stream_rpc_method_handler(
+                self.streaming_recognize,
+                request_deserializer=speech.StreamingRecognizeRequest.deserialize,
+                response_serializer=speech.StreamingRecognizeResponse.serialize
+            )
+        })
+
+    def _result(self, text, end_seconds):
+        return speech.StreamingRecognitionResult(
+            alternatives=[speech.SpeechRecognitionAlternative(transcript=text, confidence=0.9)],
+            is_final=True,
+            result_end_time=timedelta(seconds=end_seconds)
+        )
+
+    def recognize(self, request, context):
+        self.recognize_calls += 1
+        time.sleep(self.recognize_delay)
+        return speech.RecognizeResponse(results=[speech.SpeechRecognitionResult(
+            alternatives=[speech.SpeechRecognitionAlternative(transcript="short clip", confidence=0.9)],
+            result_end_time=timedelta(seconds=5)
+        )])
+
+    def _end_seconds(self, part, received):
+        return received / self.bytes_per_second if self.bytes_per_second else part * 10
+
+    def streaming_recognize(self, request_iterator, context):
+        chunks = 0
+        part = 0
+        received = 0
+        for request in request_iterator:
+            if not request.audio_content:
+                continue  # The first message carries the streaming config
+            self.audio_message_sizes.append(len(request.audio_content))
+            chunks += 1
+            received += len(request.audio_content)
+            if self.bytes_per_second and received > self.max_stream_seconds * self.bytes_per_second:
+                context.abort(grpc.StatusCode.OUT_OF_RANGE, "Exceeded maximum allowed stream duration")
+            if chunks % self.chunks_per_result == 0:
+                part += 1
+                yield speech.StreamingRecognizeResponse(results=[
+                    self._result(f"part {part}", self._end_seconds(part, received))
+                ])
+        if self.bytes_per_second:
+            self.stream_seconds.append(received / self.bytes_per_second)
+        if chunks % self.chunks_per_result and self.final_at_end:
+            part += 1
+            yield speech.StreamingRecognizeResponse(results=[
+                self._result(f"part {part}", self._end_seconds(part, received))
+            ])
@@ -0,0 +1,130 @@
+"""
+Benchmark the fast lexicon sentiment engine and report its agreement with spaCy/TextBlob
+
+Scores the same texts with OpenSourceSentimentService (or plain TextBlob,
+which computes the same polarity without spaCy's pipeline) and with
+FastSentimentService, one at a time and in batches. Texts come from a file
+(one per line) or are generated from review-like templates.
+
+Usage (from the backend directory):
+    python -m benchmarks.fast_sentiment --texts transcripts.txt --reference spacy
+    python -m benchmarks.fast_sentiment --count 5000 --reference textblob
+"""
+import argparse
+import random
+import statistics
+import time
+
+import numpy as np
+
+from open_source_services.fast_sentiment import FastSentimentService
+
+SUBJECTS = ["The service", "This movie", "Our meeting", "The food", "Your answer", "The new release", "It"]
+VERBS = ["was", "is", "seemed", "felt", "has been"]
+# Negated verbs as transcripts usually have them
+CONTRACTED = {"was": "wasn't", "is": "isn't", "seemed": "didn't seem", "felt": "didn't feel",
+              "has been": "hasn't been"}
+ADVERBS = ["", "", "very ", "really ", "extremely ", "somewhat ", "pretty ", "incredibly "]
+# "n't" contracts the verb instead
+NEGATIONS = ["", "", "", "not ", "never ", "n't", "n't"]
+ADJECTIVES = ["good", "bad", "great", "terrible", "fine", "awful", "amazing", "boring", "helpful", "slow",
+              "happy", "sad", "wonderful", "horrible", "interesting", "late", "clean", "rude", "quick", "okay"]
+FILLERS = ["", "", " to be honest", " for the price", " as usual", " today", " at all"]
+ENDINGS = [".", ".", "!", "!!", "?"]
+
+
+def generate(count, seed=0):
+    rng = random.Random(seed)
+
+    def sentence():
+        verb, negation = rng.choice(VERBS), rng.choice(NEGATIONS)
+        if negation == "n't":
+            verb, negation = CONTRACTED[verb], ""
+        return (f"{rng.choice(SUBJECTS)} {verb} {negation}{rng.choice(ADVERBS)}"
+                f"{rng.choice(ADJECTIVES)}{rng.choice(FILLERS)}{rng.choice(ENDINGS)}")
+
+    return [" ".join(sentence() for _ in range(rng.randint(1, 4))) for _ in range(count)]
+
+
+class TextBlobReference:
+    """TextBlob's pattern analyzer on its own, as spacytextblob computes the document polarity"""
+
+    def __init__(self):
+        from textblob import TextBlob
+        self.TextBlob = TextBlob
+
+    def analyze_sentiment(self, text):
+        polarity, subjectivity = self.TextBlob(text).sentiment
+        return {"success": True, "score": polarity, "magnitude": subjectivity}
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def label(score):
+    return "positive" if score >= 0.1 else "negative" if score <= -0.1 else "neutral"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--texts', help="File with one text per line (default: generated)")
+    parser.add_argument('--count', type=int, default=2000, help="Number of generated texts")
+    parser.add_argument('--reference', choices=['spacy', 'textblob'], default='spacy')
+    parser.add_argument('--batch-size', type=int, default=256)
+    args = parser.parse_args()
+
+    if args.texts:
+        with open(args.texts) as f:
+            texts = [line.strip() for line in f if len(line.strip()) >= 3]
+    else:
+        texts = generate(args.count)
+
+    if args.reference == 'spacy':
+        from open_source_services.sentiment_service import OpenSourceSentimentService
+        reference = OpenSourceSentimentService()
+    else:
+        reference = TextBlobReference()
+    fast = FastSentimentService()
+
+    expected, reference_seconds = timed(lambda: [reference.analyze_sentiment(text) for text in texts])
+    single, single_seconds = timed(lambda: [fast.analyze_sentiment(text) for text in texts])
+    batched, batch_seconds = timed(lambda: [
+        result
+        for i in range(0, len(texts), args.batch_size)
+        for result in fast.analyze_sentiment_batch(texts[i:i + args.batch_size])
+    ])
+
+    print(f"{len(texts)} texts, {statistics.mean(len(text) for text in texts):.0f} chars on average\n")
+    print(f"{'engine':<28}{'texts/s':>10}{'speedup':>10}")
+    for name, seconds in ((f"{args.reference} (reference)", reference_seconds),
+                          ("fast, one at a time", single_seconds),
+                          (f"fast, batches of {args.batch_size}", batch_seconds)):
+        print(f"{name:<28}{len(texts) / seconds:>10.0f}{reference_seconds / seconds:>9.1f}x")
+
+    ref_scores = np.array([r["score"] for r in expected])
+    fast_scores = np.array([r["score"] for r in batched])
+    ref_magnitudes = np.array([r["magnitude"] for r in expected])
+    fast_magnitudes = np.array([r["magnitude"] for r in batched])
+    assert [r["score"] for r in single] == fast_scores.tolist(), "batched and single scores differ"
+
+    difference = np.abs(ref_scores - fast_scores)
+    print("\nAgreement with the reference")
+    print(f"  score correlation           {np.corrcoef(ref_scores, fast_scores)[0, 1]:.4f}")
+    print(f"  score mean abs difference   {difference.mean():.4f} (max {difference.max():.4f})")
+    print(f"  identical scores (1e-9)     {(difference < 1e-9).mean():.1%}")
+    print(f"  same label                  "
+          f"{np.mean([label(a) == label(b) for a, b in zip(ref_scores, fast_scores)]):.1%}")
+    print(f"  magnitude mean abs diff     {np.abs(ref_magnitudes - fast_magnitudes).mean():.4f}")
+    worst = np.argsort(-difference)[:3]
+    if difference[worst[0]] > 1e-9:
+        print("\nLargest differences")
+        for i in worst:
+            if difference[i] > 1e-9:
+                print(f"  {ref_scores[i]:+.3f} vs {fast_scores[i]:+.3f}  {texts[i][:80]}")
+
+
+if __name__ == '__main__':
+    main()
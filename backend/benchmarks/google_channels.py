@@ -0,0 +1,98 @@
+"""
+Compare Google client channel strategies against a local fake gRPC server
+
+The fake server (benchmarks/fake_google.py) answers AnalyzeSentiment after
+a fixed delay and records the peer address of every call, so the number of
+distinct peers is the number of connections (handshakes) the client opened.
+
+Usage (from the backend directory):
+    python -m benchmarks.google_channels --requests 400 --concurrency 32
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+from concurrent import futures
+
+import grpc
+from google.cloud import language
+
+from benchmarks.fake_google import FakeLanguageServer
+from google_services.client_factory import GoogleClientFactory
+
+
+def analyze(client):
+    document = language.Document(content="fake server test", type_=language.Document.Type.PLAIN_TEXT)
+    client.analyze_sentiment(request={"document": document}, timeout=10)
+
+
+def run(label, get_client, requests, concurrency, server):
+    server.reset()
+    latencies = []
+    lock = threading.Lock()
+
+    def one(_):
+        start = time.perf_counter()
+        analyze(get_client())
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{label:>24} {len(server.peers):>12} {requests / wall:>8.0f} "
+          f"{statistics.median(latencies) * 1000:>8.1f} {p99 * 1000:>8.1f}")
+
+
+def check_fork(factory):
+    """A forked child must build its own channel and still get answers"""
+    analyze(factory.client('language'))
+    pid = os.fork()
+    if pid == 0:
+        try:
+            analyze(factory.client('language'))
+            os._exit(0)
+        except Exception:
+            os._exit(1)
+    _, status = os.waitpid(pid, 0)
+    print(f"call from forked child after parent warm-up: {'OK' if status == 0 else 'FAILED'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--delay-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    server = FakeLanguageServer(args.delay_ms)
+    server.start()
+    endpoint = server.endpoint
+
+    def factory(pool_size):
+        return GoogleClientFactory(pool_size=pool_size, endpoints={'language': endpoint}, insecure=True)
+
+    def fresh_client():
+        # What building a client per service instance/request costs
+        transport = language.LanguageServiceClient.get_transport_class('grpc')(
+            channel=grpc.insecure_channel(endpoint, options=[('grpc.use_local_subchannel_pool', 1)])
+        )
+        return language.LanguageServiceClient(transport=transport)
+
+    print(f"{'strategy':>24} {'connections':>12} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    run("client per call", fresh_client, args.requests, args.concurrency, server)
+    for pool_size in (1, 4):
+        shared = factory(pool_size)
+        run(f"factory pool_size={pool_size}", lambda: shared.client('language'), args.requests, args.concurrency, server)
+
+    check_fork(factory(1))
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
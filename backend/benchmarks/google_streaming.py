@@ -0,0 +1,80 @@
+"""
+Check long-audio routing of SpeechService against a local stand-in server
+
+A short file must go through Recognize. A long file must go through
+StreamingRecognize in messages of at most STREAM_CHUNK_BYTES, without being
+read into memory whole, restarting the stream before Google's limit, and
+the partial results must be merged in order. Needs ffmpeg, which decodes
+the long file as it is sent; the pytest version replaces it
+(tests/test_google_streaming.py).
+
+Usage (from the backend directory):
+    python -m benchmarks.google_streaming --minutes 12
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import wave
+
+import google_services.client_factory as client_factory
+from benchmarks.fake_google import FakeSpeechServer
+from google_services.speech_service import PCM_BYTES_PER_SECOND, PCM_SAMPLE_RATE, SpeechService, STREAM_CHUNK_BYTES
+
+
+def write_file(seconds):
+    """A 16 kHz mono WAV of noise"""
+    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
+        path = f.name
+    with wave.open(path, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(PCM_SAMPLE_RATE)
+        for _ in range(int(seconds)):
+            out.writeframes(os.urandom(PCM_SAMPLE_RATE * 2))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--minutes', type=float, default=12)
+    args = parser.parse_args()
+
+    server = FakeSpeechServer(bytes_per_second=PCM_BYTES_PER_SECOND)
+    server.start()
+    client_factory._factory = client_factory.GoogleClientFactory(endpoints={'speech': server.endpoint}, insecure=True)
+    service = SpeechService()
+
+    short_path = write_file(5)
+    long_seconds = int(args.minutes * 60)
+    long_path = write_file(long_seconds)
+    long_size = long_seconds * PCM_BYTES_PER_SECOND
+    try:
+        result = service.transcribe_audio(short_path)
+        print(f"short file: recognize calls={server.recognize_calls}, text={result['text']!r}")
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = service.transcribe_audio(long_path)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        ends = [segment['end'] for segment in result.get('segments', [])]
+        in_order = bool(ends) and ends == sorted(ends)
+        print(f"long file: {long_seconds} s ({long_size / 1e6:.1f} MB decoded) streamed in {elapsed:.2f}s, "
+              f"{len(server.audio_message_sizes)} messages, largest {max(server.audio_message_sizes)} bytes "
+              f"(limit {STREAM_CHUNK_BYTES}), {len(server.stream_seconds)} streams, "
+              f"longest {max(server.stream_seconds):.0f} s")
+        print(f"bytes received (restarts resend cut audio): {sum(server.audio_message_sizes)} of {long_size}, "
+              f"segments merged: {len(result.get('segments', []))}, in order: {in_order}, "
+              f"python heap peak: {peak / 1e6:.1f} MB")
+    finally:
+        os.remove(short_path)
+        os.remove(long_path)
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Measure what logging costs a request thread
+
+Each simulated request emits the log lines of a speech-to-text request:
+start, file info, a transcript, confidence, timing, sentiment and the
+session update. The old setup (synchronous handler, eager f-strings,
+transcript text in the log) is compared with utils/logging_config.py
+(queue + listener thread, lazy formatting, redacted text, JSON) at
+several sampling rates. Output goes to a file so disk writes are included.
+
+Usage (from the backend directory):
+    python -m benchmarks.logging_cost --requests 20000
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from utils import logging_config
+from utils.logging_config import configure_logging, log_text, request_id_var, stop_logging
+
+logger = logging.getLogger("benchmark.request")
+TRANSCRIPT = "the quick brown fox jumps over the lazy dog " * 40
+
+
+def request_before(i):
+    logger.info(f"Processing audio file using google: /tmp/{i}.webm")
+    logger.info(f"Transcribing audio file: /tmp/{i}.webm")
+    logger.info(f"File size: {48000 + i} bytes")
+    logger.info(f"API response time: {0.4213:.2f} seconds")
+    logger.info(f"Successful transcription with model 'latest_long': {TRANSCRIPT}")
+    logger.info(f"Average confidence: {0.9312}")
+    logger.info(f"Analyzing sentiment for text: '{TRANSCRIPT[:50]}{'...' if len(TRANSCRIPT) > 50 else ''}'")
+    logger.info(f"Added result {i} to session, total results: {i % 30}")
+
+
+def request_after(i):
+    request_id_var.set(f"req-{i}")
+    sample = {'sample': True}
+    logger.info("Processing audio file using %s: %s", "google", f"/tmp/{i}.webm")
+    logger.info("Transcribing audio file: %s", f"/tmp/{i}.webm")
+    logger.info("File size: %s bytes", 48000 + i)
+    logger.info("API response time: %.2f seconds", 0.4213, extra=sample)
+    logger.info("Successful transcription with model '%s': %s", "latest_long", log_text(TRANSCRIPT, 100), extra=sample)
+    logger.info("Average confidence: %s", 0.9312, extra=sample)
+    logger.info("Analyzing sentiment for text: '%s'", log_text(TRANSCRIPT), extra=sample)
+    logger.info("Added result %s to session, total results: %s", i, i % 30, extra=sample)
+
+
+def run(label, setup, request_fn, requests, path):
+    setup(path)
+    start = time.perf_counter()
+    # CPU time of the request thread itself, so waiting on the GIL while the listener works is not counted
+    cpu_start = time.thread_time()
+    for i in range(requests):
+        request_fn(i)
+    request_time = time.thread_time() - cpu_start
+    # Include the time to drain the queue, i.e. the work moved off the request thread
+    stop_logging()
+    for handler in list(logging.getLogger().handlers):
+        handler.close()
+        logging.getLogger().removeHandler(handler)
+    total_time = time.perf_counter() - start
+    size = os.path.getsize(path)
+    print(f"{label:>38} {request_time / requests * 1e6:>10.1f} {total_time / requests * 1e6:>10.1f} "
+          f"{size / requests:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    def before(path):
+        logging.basicConfig(level=logging.INFO, filename=path, force=True,
+                            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def after(sample_rate, level='INFO'):
+        def setup(path):
+            logging_config.LOG_TEXT = False
+            configure_logging(level=level, fmt='json', sample_rate=sample_rate, stream=open(path, 'w'))
+        return setup
+
+    print(f"{'setup':>38} {'req cpu us':>10} {'total us':>10} {'bytes/req':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        cases = [
+            ("sync text, eager, transcripts", before, request_before),
+            ("queue json, lazy, redacted", after(1.0), request_after),
+            ("queue json, lazy, 10% success sample", after(0.1), request_after),
+            ("queue json, level WARNING", after(1.0, 'WARNING'), request_after),
+        ]
+        for n, (label, setup, request_fn) in enumerate(cases):
+            run(label, setup, request_fn, args.requests, os.path.join(directory, f"{n}.log"))
+
+
+if __name__ == '__main__':
+    main()
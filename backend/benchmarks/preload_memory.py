@@ -0,0 +1,177 @@
+"""
+Measure per-worker unique memory (USS) with and without preloading models
+
+Forks --workers workers three ways and reports each worker's USS after it
+has served --requests requests, plus the total PSS of master and workers:
+
+- per-worker: every worker loads its own models, as with plain gunicorn;
+- preload: the master loads the models and workers are forked from it
+  with utils/prefork.py's hooks (GC disabled while loading, gc.freeze
+  before fork), as with PRELOAD_MODELS=true;
+- preload-no-freeze: forked from a loaded master without the hooks, so
+  the cyclic GC in the workers writes to the shared objects' headers and
+  the pages they sit on are copied.
+
+--models real loads Whisper and spaCy (the open-source services) plus
+the fast sentiment lexicon; --models synthetic stands in for them with
+--weights-mb of NumPy weights and a large dict of Python objects, so the
+effect can be measured without the model packages. Linux only.
+
+Usage (from the backend directory):
+    python -m benchmarks.preload_memory --workers 4 --models real --audio sample.wav
+    python -m benchmarks.preload_memory --workers 4 --models synthetic
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+
+import numpy as np
+
+from utils import prefork
+
+MODES = ('per-worker', 'preload', 'preload-no-freeze')
+TEXTS = [
+    "The support agent was friendly and solved my problem quickly.",
+    "I waited forty minutes and nobody ever called me back, terrible service.",
+    "The invoice arrived on time.",
+]
+
+
+class SyntheticModels:
+    """Stand-in with the shape of the real services: large read-only arrays and many small Python objects"""
+
+    def __init__(self, weights_mb, objects):
+        rng = np.random.default_rng(0)
+        self.weights = [rng.standard_normal((1024, 256), dtype=np.float32)
+                        for _ in range(max(1, weights_mb))]
+        # Like spaCy's vocab/string store or the sentiment lexicon; lists, since the GC tracks them
+        # (dicts and tuples holding only strings and numbers are untracked)
+        self.vocab = {f"word{i}": [i, f"word{i}", i / objects] for i in range(objects)}
+
+    def serve(self, index):
+        x = np.ones((4, 1024), dtype=np.float32)
+        for w in self.weights[:64]:
+            x[:, :256] = np.tanh(x @ w)
+        # Request-scoped garbage with cycles, so the GC runs as it would in a busy worker
+        scratch = [{"word": self.vocab[f"word{(index * 7919 + j) % len(self.vocab)}"], "self": None} for j in range(2000)]
+        for entry in scratch:
+            entry["self"] = entry
+        return float(x.sum())
+
+
+class RealModels:
+    def __init__(self, audio=None):
+        from open_source_services.speech_service import OpenSourceSpeechService
+        from open_source_services.sentiment_service import OpenSourceSentimentService
+        from open_source_services.fast_sentiment import FastSentimentService
+        self.speech = OpenSourceSpeechService()
+        self.sentiment = OpenSourceSentimentService()
+        self.fast = FastSentimentService()
+        self.audio = audio
+
+    def serve(self, index):
+        text = TEXTS[index % len(TEXTS)]
+        self.sentiment.analyze_sentiment(text)
+        self.fast.analyze_sentiment(text)
+        if self.audio and index % 10 == 0:
+            self.speech.transcribe_audio(self.audio)
+
+
+def load_models(args):
+    if args.models == 'real':
+        return RealModels(args.audio)
+    return SyntheticModels(args.weights_mb, args.objects)
+
+
+def worker(args, models, mode, done_fd, release_fd):
+    if mode == 'per-worker':
+        models = load_models(args)
+    elif mode == 'preload':
+        prefork.after_fork(args.torch_threads)
+    for index in range(args.requests):
+        models.serve(index)
+    gc.collect()
+    os.write(done_fd, b".")
+    # Stay alive until the parent has measured every worker, so shared pages are counted as shared
+    os.read(release_fd, 1)
+
+
+def run(args, mode):
+    models = None
+    if mode != 'per-worker':
+        if mode == 'preload':
+            prefork.prepare_master()
+        models = load_models(args)
+    done_r, done_w = os.pipe()
+    release_r, release_w = os.pipe()
+    pids = []
+    for _ in range(args.workers):
+        if mode == 'preload':
+            prefork.before_fork()
+        pid = os.fork()
+        if pid == 0:
+            os.close(done_r)
+            os.close(release_w)
+            code = 0
+            try:
+                worker(args, models, mode, done_w, release_r)
+            except Exception as e:
+                print(f"Worker failed: {e}", file=sys.stderr)
+                os.write(done_w, b"!")
+                code = 1
+            os._exit(code)
+        pids.append(pid)
+    os.close(done_w)
+    os.close(release_r)
+    reported = b""
+    while len(reported) < len(pids):
+        reported += os.read(done_r, len(pids))
+    usages = [prefork.memory_usage(pid) for pid in pids]
+    master = prefork.memory_usage()
+    os.close(release_w)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    if b"!" in reported:
+        raise RuntimeError("A worker failed")
+    return master, usages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200, help="Requests served by each worker before measuring")
+    parser.add_argument('--models', choices=('real', 'synthetic'), default='real')
+    parser.add_argument('--audio', help="Also transcribe this file every 10th request (real models)")
+    parser.add_argument('--weights-mb', type=int, default=256, help="Synthetic weights, MiB")
+    parser.add_argument('--objects', type=int, default=300000, help="Synthetic vocabulary entries")
+    parser.add_argument('--torch-threads', type=int, default=1)
+    parser.add_argument('--mode', choices=MODES, action='append', help="Modes to run (default: all)")
+    args = parser.parse_args()
+
+    print(f"{'mode':>18} {'USS/worker MiB':>15} {'total PSS MiB':>14}")
+    for mode in args.mode or MODES:
+        # Each mode in a fresh process, so models loaded by one do not count toward the next
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            master, usages = run(args, mode)
+            os.write(write_fd, json.dumps([master, usages]).encode())
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as f:
+            output = f.read()
+        os.waitpid(pid, 0)
+        if not output:
+            print(f"{mode:>18} failed")
+            continue
+        master, usages = json.loads(output)
+        uss = sum(u['uss'] for u in usages) / len(usages) / 2 ** 20
+        pss = (master['pss'] + sum(u['pss'] for u in usages)) / 2 ** 20
+        print(f"{mode:>18} {uss:>15.0f} {pss:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
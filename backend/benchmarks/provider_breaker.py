@@ -0,0 +1,91 @@
+"""
+Exercise the provider circuit breaker and AIMD limit with fault-injecting stubs
+
+A stub provider is driven through three phases: healthy, outage (errors
+or timeouts) and recovery. For each phase the script prints how many calls
+reached the provider, how many were short-circuited, the breaker state,
+the concurrency limit and how long callers waited on average.
+
+Usage (from the backend directory):
+    python -m benchmarks.provider_breaker --fault errors
+    python -m benchmarks.provider_breaker --fault slow
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.resilience import AdaptiveLimiter, CircuitBreaker, ProviderGuard, ProviderUnavailable
+
+
+class FaultInjectingSentimentService:
+    def __init__(self, latency=0.01):
+        self.latency = latency
+        self.mode = "healthy"
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def analyze_sentiment(self, text):
+        with self._lock:
+            self.calls += 1
+        if self.mode == "errors":
+            time.sleep(self.latency)
+            return {"success": False, "error": "503 Service Unavailable", "score": None, "magnitude": None}
+        if self.mode == "slow":
+            time.sleep(self.latency * 50)
+        else:
+            time.sleep(self.latency)
+        return {"success": True, "score": 0.5, "magnitude": 0.5}
+
+
+def run_phase(name, guard, service, requests, concurrency):
+    service.calls = 0
+    rejected = 0
+    waited = []
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal rejected
+        start = time.perf_counter()
+        try:
+            guard.call(service.analyze_sentiment, "stub text")
+        except ProviderUnavailable:
+            with lock:
+                rejected += 1
+        with lock:
+            waited.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+
+    status = guard.status()
+    print(f"{name:>10} {service.calls:>10} {rejected:>10} {status['circuit']['state']:>10} "
+          f"{status['concurrency']['limit']:>6} {sum(waited) / len(waited) * 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fault', choices=['errors', 'slow'], default='errors')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    service = FaultInjectingSentimentService()
+    guard = ProviderGuard(
+        "stub",
+        breaker=CircuitBreaker("stub", slow_call_seconds=0.25, open_seconds=0.5),
+        limiter=AdaptiveLimiter(initial_limit=8, latency_target_seconds=0.25, queue_timeout_seconds=1.0)
+    )
+
+    print(f"{'phase':>10} {'reached':>10} {'rejected':>10} {'circuit':>10} {'limit':>6} {'avg ms':>10}")
+    run_phase("healthy", guard, service, args.requests, args.concurrency)
+    service.mode = args.fault
+    run_phase("outage", guard, service, args.requests, args.concurrency)
+    service.mode = "healthy"
+    time.sleep(0.6)  # Let the breaker reach half-open
+    run_phase("recovery", guard, service, args.requests, args.concurrency)
+    run_phase("steady", guard, service, args.requests, args.concurrency)
+
+
+if __name__ == '__main__':
+    main()
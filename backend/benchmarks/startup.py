@@ -0,0 +1,98 @@
+"""
+Check how long `import app` takes and which modules it pulls in
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter (best of
+--runs), reports the total and the slowest imports, and exits non-zero when
+the import takes longer than --budget-ms or, in gateway mode, when any
+module of the ML stack or the Google and Edge TTS SDKs was imported. Meant
+to run in CI, so a module-level import that undoes the deferred imports in
+the services is caught before it ships.
+
+Gateway mode (GATEWAY_MODE=true) should only need Flask and the utils;
+full mode also loads the models, so give it a budget to match.
+
+Usage (from the backend directory):
+    python -m benchmarks.startup --mode gateway --budget-ms 1500
+    python -m benchmarks.startup --mode full --budget-ms 30000 --top 20
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Modules gateway mode must not import, by top-level package or dotted prefix
+GATEWAY_FORBIDDEN = ('torch', 'whisper', 'spacy', 'spacytextblob', 'textblob', 'numpy',
+                     'edge_tts', 'google.cloud', 'google.api_core', 'grpc')
+# app.py's directory, where `import app` resolves from whichever directory this is run in
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def measure(mode):
+    """
+    Import app in a fresh interpreter under -X importtime
+
+    Returns:
+        list: (module, self_us, cumulative_us, depth) in the order imports
+              finished, so app itself comes after everything it imported
+    """
+    env = dict(os.environ, GATEWAY_MODE='true' if mode == 'gateway' else 'false')
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                               env=env, cwd=BACKEND_DIR, capture_output=True, text=True)
+    if completed.returncode:
+        raise RuntimeError(f"import app failed in {mode} mode:\n{completed.stderr[-2000:]}")
+    imports = []
+    for line in completed.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            imports.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+    return imports
+
+
+def forbidden(imports):
+    names = {module for module, _, _, _ in imports}
+    return sorted(name for name in names if any(name == prefix or name.startswith(prefix + '.')
+                                                for prefix in GATEWAY_FORBIDDEN))
+
+
+def app_import_us(imports):
+    return next(cumulative_us for module, _, cumulative_us, depth in imports if module == 'app' and depth == 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('gateway', 'full'), default='gateway')
+    parser.add_argument('--budget-ms', type=float, default=1500.0, help="Fail above this total import time")
+    parser.add_argument('--runs', type=int, default=3, help="Report the fastest of this many imports")
+    parser.add_argument('--top', type=int, default=10, help="Slowest imports to list")
+    args = parser.parse_args()
+
+    # The fastest run is the one least disturbed by the machine; the budget applies to it
+    runs = [measure(args.mode) for _ in range(max(1, args.runs))]
+    imports = min(runs, key=app_import_us)
+    total_ms = app_import_us(imports) / 1000
+
+    # Everything app.py imported, leaving out the interpreter's own startup (site, encodings)
+    end = next(index for index, entry in enumerate(imports) if entry[0] == 'app' and entry[3] == 0)
+    start = max((index for index, entry in enumerate(imports[:end]) if entry[3] == 0), default=-1) + 1
+    direct = sorted((entry for entry in imports[start:end] if entry[3] == 1), key=lambda entry: entry[2], reverse=True)
+    print(f"import app ({args.mode} mode): {total_ms:.0f} ms over {end - start} modules, budget {args.budget_ms:.0f} ms")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module imported by app.py")
+    for module, self_us, cumulative_us, _ in direct[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {module}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import took {total_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+    if args.mode == 'gateway':
+        loaded = forbidden(imports)
+        if loaded:
+            failures.append(f"gateway mode imported {', '.join(loaded)}")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+"""
+Accuracy, latency and cost of speech-to-text configurations on a labeled corpus
+
+Runs every recording of the corpus through each system, scores the
+transcripts against the references (WER and CER, after lowercasing and
+dropping punctuation), and reports real-time factor, latency percentiles
+and a cost per audio hour. Systems on the Pareto frontier of WER,
+real-time factor and cost are marked: any other system is beaten on all
+three by one of them.
+
+The corpus is a JSONL manifest of {"path", "reference", "id"?} (paths
+relative to the manifest), or a directory of audio files, each with its
+reference transcript in a .txt file of the same name.
+
+Systems:
+    opensource, google, <plugin>       the provider as bulk_transcribe builds it
+    whisper:SIZE[:option=value,...]    a Whisper model with transcribe options,
+                                       e.g. whisper:small:beam_size=5,temperature=0
+    google:MODEL                       one Google recognition config, by name or
+                                       model, without falling back to the others
+
+Costs are proxies: Google requests are priced per audio minute rounded up to
+15 seconds (--google-usd-per-minute), local systems by the seconds they keep
+the machine busy (--local-usd-per-hour); --price overrides either per system.
+
+Usage (from the backend directory):
+    python -m benchmarks.stt_eval corpus.jsonl --system whisper:tiny --system whisper:base \\
+        --system whisper:base:beam_size=5 --system google:latest_short --output report.json
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+from bulk_transcribe import create_speech_service, directory_items, manifest_items
+from utils.wer import score_transcript
+
+# Google Speech-to-Text v1 bills each request in 15-second increments
+GOOGLE_BILLING_INCREMENT_SECONDS = 15
+
+
+def load_corpus(source):
+    """Recordings with their reference transcripts"""
+    if os.path.isdir(source):
+        items = []
+        for item in directory_items(source):
+            reference_path = os.path.splitext(item['path'])[0] + '.txt'
+            if os.path.exists(reference_path):
+                with open(reference_path, encoding='utf-8') as f:
+                    item['metadata']['reference'] = f.read().strip()
+            items.append(item)
+    else:
+        items = list(manifest_items(source))
+    labeled = [item for item in items if item['metadata'].get('reference') is not None]
+    if len(labeled) < len(items):
+        print(f"Skipping {len(items) - len(labeled)} recordings without a reference", file=sys.stderr)
+    return labeled
+
+
+def audio_seconds(path):
+    """Duration from the WAV header or ffprobe, or None if neither can tell"""
+    try:
+        with wave.open(path) as audio:
+            return audio.getnframes() / audio.getframerate()
+    except (wave.Error, EOFError, OSError):
+        pass
+    try:
+        output = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+            capture_output=True, text=True, timeout=10, check=True
+        ).stdout.strip()
+        return float(output)
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def parse_options(spec):
+    """'beam_size=5,temperature=0' -> {'beam_size': 5, 'temperature': 0}"""
+    options = {}
+    for pair in filter(None, spec.split(',')):
+        key, _, value = pair.partition('=')
+        try:
+            options[key] = json.loads(value)
+        except ValueError:
+            options[key] = value
+    return options
+
+
+class System:
+    """A speech service under evaluation, with how its cost is estimated"""
+
+    def __init__(self, name, service, local, usd_per_minute=None):
+        self.name = name
+        self.service = service
+        self.local = local
+        self.usd_per_minute = usd_per_minute
+
+    def cost(self, seconds_of_audio, busy_seconds, local_usd_per_hour):
+        if self.usd_per_minute is not None:
+            billed = seconds_of_audio or 0
+            if not self.local:
+                billed = math.ceil(billed / GOOGLE_BILLING_INCREMENT_SECONDS) * GOOGLE_BILLING_INCREMENT_SECONDS
+            return billed / 60 * self.usd_per_minute
+        return busy_seconds / 3600 * local_usd_per_hour
+
+
+def create_system(spec, google_usd_per_minute):
+    kind, _, rest = spec.partition(':')
+    if kind == 'whisper':
+        from open_source_services.speech_service import OpenSourceSpeechService
+        model_name, _, options = rest.partition(':')
+        return System(spec, OpenSourceSpeechService(model_name or None, parse_options(options)), local=True)
+    if kind == 'google' and rest:
+        from google_services.speech_service import SpeechService
+        service = SpeechService()
+        service.models = [m for m in service.models if rest in (m['name'], m['config'].model)][:1]
+        if not service.models:
+            raise SystemExit(f"No Google recognition config named '{rest}'")
+        return System(spec, service, local=False, usd_per_minute=google_usd_per_minute)
+    if spec == 'google':
+        return System(spec, create_speech_service(spec), local=False, usd_per_minute=google_usd_per_minute)
+    return System(spec, create_speech_service(spec), local=True)
+
+
+def evaluate(systems, items, concurrency=None, local_parallelism=1, local_usd_per_hour=0.10, warmup=True):
+    """
+    Transcribe every item with every system and score the transcripts
+
+    All systems run at once. Local systems also share local_parallelism
+    slots, so CPU-bound models do not slow each other down and distort the
+    latencies; latency is measured inside the slot.
+
+    Returns:
+        list: One record per (system, item)
+    """
+    durations = {item['id']: audio_seconds(item['path']) for item in items}
+    local_slots = threading.BoundedSemaphore(local_parallelism)
+    records = []
+    lock = threading.Lock()
+
+    def transcribe(system, item):
+        slot = local_slots if system.local else None
+        if slot:
+            slot.acquire()
+        try:
+            start = time.perf_counter()
+            try:
+                result = system.service.transcribe_audio(item['path'])
+            except Exception as e:
+                result = {"success": False, "error": f"{type(e).__name__}: {e}", "text": None}
+            latency = time.perf_counter() - start
+        finally:
+            if slot:
+                slot.release()
+        return result, latency
+
+    def run_item(system, item):
+        result, latency = transcribe(system, item)
+        seconds = durations[item['id']]
+        record = {
+            "system": system.name,
+            "id": item['id'],
+            "success": bool(result.get('success')),
+            "error": result.get('error'),
+            "reference": item['metadata']['reference'],
+            "hypothesis": result.get('text') or '',
+            "audio_seconds": seconds,
+            "latency": latency,
+            "rtf": latency / seconds if seconds else None,
+            "cost_usd": system.cost(seconds, latency, local_usd_per_hour),
+            **score_transcript(item['metadata']['reference'], result.get('text') or '')
+        }
+        with lock:
+            records.append(record)
+            print(f"{system.name}: {len(records)}/{len(systems) * len(items)} done", file=sys.stderr, end='\r')
+
+    if warmup:
+        # Model loading and first-call overhead are not part of the latency
+        for system in systems:
+            transcribe(system, items[0])
+
+    pools = [ThreadPoolExecutor(max_workers=concurrency or (1 if system.local else 4),
+                                thread_name_prefix=f"eval-{system.name}") for system in systems]
+    futures = [pool.submit(run_item, system, item) for system, pool in zip(systems, pools) for item in items]
+    for future in futures:
+        future.result()
+    for pool in pools:
+        pool.shutdown()
+    print(file=sys.stderr)
+    return records
+
+
+def _percentile(values, percentile):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percentile / 100))] if values else None
+
+
+def summarize(records):
+    """Corpus-level metrics per system, from summed error counts rather than averaged rates"""
+    summaries = {}
+    for name in dict.fromkeys(record['system'] for record in records):
+        rows = [record for record in records if record['system'] == name]
+        ref_words = sum(row['ref_words'] for row in rows)
+        ref_chars = sum(row['ref_chars'] for row in rows)
+        timed = [row for row in rows if row['audio_seconds']]
+        audio_hours = sum(row['audio_seconds'] for row in timed) / 3600
+        summaries[name] = {
+            "utterances": len(rows),
+            "failures": sum(not row['success'] for row in rows),
+            "wer": sum(row['word_errors'] for row in rows) / ref_words if ref_words else None,
+            "substitution_rate": sum(row['substitutions'] for row in rows) / ref_words if ref_words else None,
+            "deletion_rate": sum(row['deletions'] for row in rows) / ref_words if ref_words else None,
+            "insertion_rate": sum(row['insertions'] for row in rows) / ref_words if ref_words else None,
+            "cer": sum(row['char_errors'] for row in rows) / ref_chars if ref_chars else None,
+            "rtf": sum(row['latency'] for row in timed) / (audio_hours * 3600) if audio_hours else None,
+            "latency_p50": _percentile([row['latency'] for row in rows], 50),
+            "latency_p90": _percentile([row['latency'] for row in rows], 90),
+            "usd_per_audio_hour": sum(row['cost_usd'] for row in timed) / audio_hours if audio_hours else None
+        }
+    return summaries
+
+
+def pareto_frontier(summaries, objectives=('wer', 'rtf', 'usd_per_audio_hour')):
+    """
+    Systems no other system matches or beats on every objective (lower is better) while beating on one
+
+    Systems with failed requests are left out: failures return quickly and
+    cheaply, which would make a broken configuration look efficient.
+    """
+    def values(name):
+        return [summaries[name][key] if summaries[name][key] is not None else math.inf for key in objectives]
+
+    candidates = [name for name, summary in summaries.items() if not summary['failures']]
+    frontier = []
+    for name in candidates:
+        mine = values(name)
+        dominated = any(
+            other != name and all(o <= m for o, m in zip(values(other), mine))
+            and any(o < m for o, m in zip(values(other), mine))
+            for other in candidates
+        )
+        if not dominated:
+            frontier.append(name)
+    return frontier
+
+
+def _format(value, spec):
+    return format(value, spec) if value is not None else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('corpus', help="JSONL manifest or directory of audio with .txt references")
+    parser.add_argument('--system', action='append', required=True, help="System to evaluate (repeatable)")
+    parser.add_argument('--concurrency', type=int,
+                        help="Recordings in flight per system (default: 1 for local systems, 4 for Google)")
+    parser.add_argument('--local-parallelism', type=int, default=1,
+                        help="Local systems transcribing at the same time")
+    parser.add_argument('--google-usd-per-minute', type=float, default=0.024)
+    parser.add_argument('--local-usd-per-hour', type=float, default=0.10, help="Cost of the machine running local models")
+    parser.add_argument('--price', action='append', default=[], metavar='SYSTEM=USD_PER_MINUTE',
+                        help="Price a system per audio minute instead")
+    parser.add_argument('--limit', type=int, help="Only the first N recordings")
+    parser.add_argument('--no-warmup', action='store_true')
+    parser.add_argument('--output', help="JSON file for the summaries and per-utterance scores")
+    args = parser.parse_args()
+
+    items = load_corpus(args.corpus)[:args.limit]
+    if not items:
+        raise SystemExit("No labeled recordings in the corpus")
+    systems = [create_system(spec, args.google_usd_per_minute) for spec in args.system]
+    by_name = {system.name: system for system in systems}
+    for price in args.price:
+        name, _, usd = price.partition('=')
+        if name not in by_name:
+            raise SystemExit(f"--price names unknown system '{name}'")
+        by_name[name].usd_per_minute = float(usd)
+
+    records = evaluate(systems, items, concurrency=args.concurrency, local_parallelism=args.local_parallelism,
+                       local_usd_per_hour=args.local_usd_per_hour, warmup=not args.no_warmup)
+    summaries = summarize(records)
+    frontier = pareto_frontier(summaries)
+
+    audio_minutes = sum(record['audio_seconds'] or 0 for record in records if record['system'] == systems[0].name) / 60
+    print(f"{len(items)} recordings, {audio_minutes:.1f} minutes of audio\n")
+    width = max(len(name) for name in summaries) + 2
+    print(f"{'':2}{'system':<{width}}{'WER':>7}{'CER':>7}{'sub':>6}{'del':>6}{'ins':>6}{'RTF':>7}"
+          f"{'p50 s':>7}{'p90 s':>7}{'$/audio h':>10}{'failed':>7}")
+    for name, s in sorted(summaries.items(), key=lambda entry: entry[1]['wer'] if entry[1]['wer'] is not None else math.inf):
+        print(f"{'*' if name in frontier else '':2}{name:<{width}}{_format(s['wer'], '7.1%')}{_format(s['cer'], '7.1%')}"
+              f"{_format(s['substitution_rate'], '6.1%')}{_format(s['deletion_rate'], '6.1%')}"
+              f"{_format(s['insertion_rate'], '6.1%')}{_format(s['rtf'], '7.3f')}{_format(s['latency_p50'], '7.2f')}"
+              f"{_format(s['latency_p90'], '7.2f')}{_format(s['usd_per_audio_hour'], '10.3f')}{s['failures']:>7}")
+    print("\n* Pareto frontier on WER, RTF and cost among systems without failures: "
+          "each other system is no better than one of these on all three")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"systems": summaries, "pareto_frontier": frontier, "utterances": records}, f, indent=1)
+        print(f"Wrote {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
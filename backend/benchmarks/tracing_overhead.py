@@ -0,0 +1,55 @@
+"""
+Measure the cost of a tracing span
+
+Times entering and leaving span() with tracing disabled, enabled but
+outside a request trace, and enabled inside a trace, against an empty
+loop body.
+
+Usage (from the backend directory):
+    python -m benchmarks.tracing_overhead --iterations 200000
+"""
+import argparse
+import time
+
+from utils import tracing
+
+
+def per_call_ns(iterations, body):
+    start = time.perf_counter_ns()
+    body(iterations)
+    return (time.perf_counter_ns() - start) / iterations
+
+
+def empty(n):
+    for _ in range(n):
+        pass
+
+
+def spans(n):
+    for _ in range(n):
+        with tracing.span('stage', attempt=1):
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200000)
+    args = parser.parse_args()
+
+    baseline = per_call_ns(args.iterations, empty)
+    tracing.configure_tracing(enabled=False)
+    disabled = per_call_ns(args.iterations, spans) - baseline
+
+    tracing.configure_tracing(enabled=True)
+    no_trace = per_call_ns(args.iterations, spans) - baseline
+
+    trace = tracing.start_trace('benchmark')
+    enabled = per_call_ns(args.iterations, spans) - baseline
+    tracing.end_trace(trace)
+
+    print(f"span cost: disabled {disabled:.0f} ns, enabled outside a trace {no_trace:.0f} ns, "
+          f"enabled in a trace {enabled:.0f} ns")
+
+
+if __name__ == '__main__':
+    main()
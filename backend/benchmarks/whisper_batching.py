@@ -0,0 +1,68 @@
+"""
+Benchmark Whisper micro-batching against one-at-a-time transcription
+
+Usage (from the backend directory):
+    python -m benchmarks.whisper_batching path/to/sample.wav --clients 1 4 16
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from open_source_services.speech_service import OpenSourceSpeechService
+from open_source_services.whisper_batching import BatchingSpeechService
+
+
+def run(service, audio_file, clients, requests_per_client):
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            service.transcribe_audio(audio_file)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for future in [pool.submit(client) for _ in range(clients)]:
+            future.result()
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "throughput": len(latencies) / wall,
+        "p50": statistics.median(latencies),
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('audio_file')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests-per-client', type=int, default=4)
+    parser.add_argument('--max-batch-size', type=int, default=8)
+    parser.add_argument('--max-wait-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    speech_service = OpenSourceSpeechService()
+    batching_service = BatchingSpeechService(speech_service, args.max_batch_size, args.max_wait_ms)
+
+    # Warm up both paths so model loading and first-call overhead are not measured
+    speech_service.transcribe_audio(args.audio_file)
+    batching_service.transcribe_audio(args.audio_file)
+
+    # "serial" shares one model between the client threads; OpenSourceSpeechService holds
+    # its model lock around each transcription, so they queue rather than decode together
+    print(f"{'clients':>8} {'mode':>10} {'req/s':>8} {'p50 s':>8} {'p95 s':>8}")
+    for clients in args.clients:
+        for mode, service in (("serial", speech_service), ("batched", batching_service)):
+            stats = run(service, args.audio_file, clients, args.requests_per_client)
+            print(f"{clients:>8} {mode:>10} {stats['throughput']:>8.2f} {stats['p50']:>8.2f} {stats['p95']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
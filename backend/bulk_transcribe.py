@@ -0,0 +1,392 @@
+"""
+Bulk transcription of archived recordings, without the HTTP API
+
+Reads audio from a directory (recursively) or a JSONL manifest, decodes it
+on a pool of producer threads and transcribes it on consumer threads, with
+a bounded number of decoded files held in memory. Results are appended to a
+JSONL journal as they finish, which is also the checkpoint: rerunning the
+same command skips recordings already transcribed, and retries failed ones.
+With --format parquet the journal is converted to Parquet once every
+recording is done (needs pyarrow). With --diarize, segments are labelled
+with speakers from the decoded audio, see open_source_services/diarization.py.
+
+Run (from the backend directory):
+    python -m bulk_transcribe recordings/ --output transcripts.jsonl
+    python -m bulk_transcribe manifest.jsonl --provider google --output transcripts.parquet --format parquet
+    python -m bulk_transcribe calls/ --output calls.jsonl --diarize --speakers 2
+
+Manifest lines are JSON objects with a "path" (relative to the manifest)
+and an optional "id"; any other fields are copied to the result's
+"metadata". Without an "id" the path is the ID.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger('bulk_transcribe')
+
+AUDIO_EXTENSIONS = {'.wav', '.mp3', '.webm', '.ogg', '.opus', '.flac', '.m4a', '.mp4', '.aac', '.wma'}
+# Whisper decodes to 16 kHz mono float32
+SAMPLE_RATE = 16000
+
+_DONE = object()
+
+
+def directory_items(root):
+    """Audio files under a directory, in a stable order, with their path relative to it as the ID"""
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                path = os.path.join(directory, name)
+                yield {"id": os.path.relpath(path, root), "path": path, "metadata": {}}
+
+
+def manifest_items(manifest_path):
+    """Recordings listed in a JSONL manifest"""
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if 'path' not in entry:
+                raise ValueError(f"{manifest_path}:{line_number}: manifest entry has no 'path'")
+            path = entry.pop('path')
+            item_id = str(entry.pop('id', path))
+            yield {"id": item_id, "path": os.path.join(base, path), "metadata": entry}
+
+
+class Journal:
+    """Append-only JSONL of results, read back on start to resume"""
+
+    def __init__(self, path, sync_every=50):
+        self.path = path
+        self.sync_every = sync_every
+        self.done = set()
+        self._unsynced = 0
+        self._file = None
+
+    def open(self):
+        """Read completed IDs and open for appending, dropping a line cut off by a crash"""
+        if os.path.exists(self.path):
+            with open(self.path, 'rb+') as f:
+                data = f.read()
+                end = data.rfind(b'\n') + 1
+                if end < len(data):
+                    logger.warning("Dropping incomplete last line of %s", self.path)
+                    f.truncate(end)
+            for line in data[:end].splitlines():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('success'):
+                    self.done.add(record['id'])
+                else:
+                    self.done.discard(record['id'])
+        self._file = open(self.path, 'a', encoding='utf-8')
+        return self
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def records(self):
+        """Latest record per ID, in first-seen order"""
+        latest = {}
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                latest[record['id']] = record
+        return list(latest.values())
+
+
+def write_parquet(records, path):
+    """Write results as Parquet; segments, diarization and metadata are stored as JSON strings"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("--format parquet needs pyarrow (pip install pyarrow); the JSONL journal is kept")
+    rows = [
+        dict(record, segments=json.dumps(record.get('segments'), ensure_ascii=False),
+             diarization=json.dumps(record.get('diarization'), ensure_ascii=False),
+             metadata=json.dumps(record.get('metadata'), ensure_ascii=False))
+        for record in records
+    ]
+    schema = pa.schema([
+        ('id', pa.string()), ('path', pa.string()), ('provider', pa.string()), ('success', pa.bool_()),
+        ('text', pa.string()), ('confidence', pa.float64()), ('error', pa.string()),
+        ('model_used', pa.string()), ('audio_seconds', pa.float64()), ('processing_time', pa.float64()),
+        ('transcribed_at', pa.string()), ('segments', pa.string()), ('diarization', pa.string()),
+        ('metadata', pa.string()),
+    ])
+    pq.write_table(pa.Table.from_pylist(rows, schema=schema), path)
+
+
+class Progress:
+    """Throughput and ETA, estimated from the bytes of audio still to transcribe"""
+
+    def __init__(self, total_files, total_bytes, interval=10.0, stream=sys.stderr):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.stream = stream
+        self.files = 0
+        self.failed = 0
+        self.bytes = 0
+        self.audio_seconds = 0.0
+        self.started = time.monotonic()
+        self._last_report = self.started
+
+    def update(self, record, size):
+        self.files += 1
+        self.failed += 0 if record['success'] else 1
+        self.bytes += size
+        self.audio_seconds += record.get('audio_seconds') or 0.0
+        now = time.monotonic()
+        if now - self._last_report >= self.interval or self.files == self.total_files:
+            self._last_report = now
+            self.report()
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        bytes_rate = self.bytes / elapsed
+        eta = (self.total_bytes - self.bytes) / bytes_rate if bytes_rate else float('inf')
+        audio = f", {self.audio_seconds / elapsed:.1f}x realtime" if self.audio_seconds else ""
+        self.stream.write(
+            f"[{self.files}/{self.total_files}] {self.files / elapsed:.2f} files/s{audio}, "
+            f"{self.failed} failed, elapsed {_duration(elapsed)}, ETA {_duration(eta)}\n"
+        )
+        self.stream.flush()
+
+
+def _duration(seconds):
+    if seconds == float('inf'):
+        return "unknown"
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def create_speech_service(provider, batch_size=1):
+    """The speech service for a provider, built on its own rather than through app.py"""
+    if provider == 'opensource':
+        from open_source_services.speech_service import OpenSourceSpeechService
+        service = OpenSourceSpeechService()
+        if batch_size > 1:
+            from open_source_services.whisper_batching import BatchingSpeechService
+            service = BatchingSpeechService(service, max_batch_size=batch_size)
+        return service
+    if provider == 'google':
+        from google_services.speech_service import SpeechService
+        return SpeechService()
+    # Providers added through plugins, see utils/providers.py
+    from utils.providers import ProviderRegistry
+    registry = ProviderRegistry()
+    registry.load_plugins()
+    return registry.get(provider, 'speech')
+
+
+def run(service, items, journal, provider, decode_workers=2, concurrency=1, prefetch=None,
+        word_timestamps=False, progress_interval=10.0, diarizer=None, num_speakers=None):
+    """
+    Transcribe every item not already in the journal
+
+    Services with decode_audio() (Whisper) get audio decoded by the producer
+    pool, so ffmpeg runs alongside inference; other services get the path
+    and do their own reading. At most prefetch decoded recordings wait for
+    a consumer at any time. With a diarizer, each transcript's segments get
+    speaker labels, from the same decoded samples when there are any.
+
+    Returns:
+        Progress: Final counts
+    """
+    pending = [item for item in items if item['id'] not in journal.done]
+    sizes = {}
+    for item in pending:
+        try:
+            sizes[item['id']] = os.path.getsize(item['path'])
+        except OSError:
+            sizes[item['id']] = 0
+    skipped = len(journal.done)
+    logger.info("%s recordings to transcribe, %s already done", len(pending), skipped)
+    progress = Progress(len(pending), sum(sizes.values()), interval=progress_interval)
+    if not pending:
+        return progress
+
+    decode = getattr(service, 'decode_audio', None)
+    if diarizer is not None:
+        from open_source_services.diarization import diarize_transcript
+    prefetch = prefetch or max(decode_workers, concurrency) * 2
+    slots = threading.BoundedSemaphore(prefetch)
+    decoded = queue.Queue()
+    results = queue.Queue()
+    stop = threading.Event()
+
+    def produce(item):
+        try:
+            if decode is not None:
+                audio = decode(item['path'])
+                return item, audio, len(audio) / SAMPLE_RATE, None
+            return item, item['path'], None, None
+        except Exception as e:
+            return item, None, None, e
+
+    def producer():
+        with ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix='decode') as pool:
+            for item in pending:
+                slots.acquire()
+                if stop.is_set():
+                    break
+                pool.submit(produce, item).add_done_callback(lambda future: decoded.put(future.result()))
+        for _ in range(concurrency):
+            decoded.put(_DONE)
+
+    def consumer():
+        while True:
+            entry = decoded.get()
+            if entry is _DONE:
+                results.put(_DONE)
+                return
+            item, audio, audio_seconds, error = entry
+            started = time.monotonic()
+            try:
+                if error is not None:
+                    raise error
+                result = service.transcribe_audio(audio, word_timestamps=word_timestamps)
+                if diarizer is not None and result.get('success') and result.get('segments'):
+                    result['diarization'] = diarize_transcript(diarizer, audio, result['segments'],
+                                                               num_speakers=num_speakers)
+            except Exception as e:
+                result = {"success": False, "error": f"{type(e).__name__}: {e}", "text": None}
+            finally:
+                del audio
+                slots.release()
+            results.put((item, result, audio_seconds, time.monotonic() - started))
+
+    threads = [threading.Thread(target=producer, name='producer', daemon=True)]
+    threads += [threading.Thread(target=consumer, name=f'transcribe-{i}', daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+
+    running = concurrency
+    try:
+        while running:
+            entry = results.get()
+            if entry is _DONE:
+                running -= 1
+                continue
+            item, result, audio_seconds, elapsed = entry
+            record = {
+                "id": item['id'],
+                "path": item['path'],
+                "provider": provider,
+                "success": bool(result.get('success')),
+                "text": result.get('text'),
+                "confidence": result.get('confidence'),
+                "error": result.get('error'),
+                "model_used": result.get('model_used'),
+                "audio_seconds": audio_seconds,
+                "processing_time": round(elapsed, 3),
+                "transcribed_at": datetime.now().isoformat(),
+                "segments": result.get('segments'),
+                "diarization": result.get('diarization'),
+                "metadata": item['metadata'],
+            }
+            journal.write(record)
+            if not record['success']:
+                logger.warning("Failed to transcribe %s: %s", item['path'], record['error'])
+            progress.update(record, sizes[item['id']])
+    finally:
+        # On Ctrl-C, stop decoding more; everything written so far is kept for the next run
+        stop.set()
+        journal.sync()
+    return progress
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('source', help="Directory of recordings or JSONL manifest")
+    parser.add_argument('--output', required=True, help="Results file (.jsonl or .parquet)")
+    parser.add_argument('--format', choices=['jsonl', 'parquet'],
+                        help="Output format, default from the output file extension")
+    parser.add_argument('--provider', default='opensource', help="Speech provider (default: opensource)")
+    parser.add_argument('--decode-workers', type=int, default=max(1, min(4, (os.cpu_count() or 2) // 2)),
+                        help="Threads decoding audio ahead of transcription")
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help="Recordings transcribed at once (default: 1, or --batch-size for batched Whisper, "
+                             "8 for Google). Unbatched Whisper decodes one recording at a time on its model "
+                             "whatever this is; more threads only overlap diarization with it")
+    parser.add_argument('--batch-size', type=int, default=int(os.environ.get('WHISPER_BATCH_SIZE', '1')),
+                        help="Whisper windows decoded together across recordings (opensource only)")
+    parser.add_argument('--prefetch', type=int, help="Most decoded recordings held in memory")
+    parser.add_argument('--word-timestamps', action='store_true')
+    parser.add_argument('--diarize', action='store_true', help="Label segments with speakers")
+    parser.add_argument('--speakers', type=int, help="Number of speakers per recording, if known (with --diarize)")
+    parser.add_argument('--progress-interval', type=float, default=10.0, help="Seconds between progress lines")
+    parser.add_argument('--log-level', default=os.environ.get('LOG_LEVEL', 'WARNING'))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    output_format = args.format or ('parquet' if args.output.endswith('.parquet') else 'jsonl')
+    journal_path = args.output if output_format == 'jsonl' else f"{args.output}.journal.jsonl"
+
+    if os.path.isdir(args.source):
+        items = list(directory_items(args.source))
+    else:
+        items = list(manifest_items(args.source))
+    duplicates = len(items) - len({item['id'] for item in items})
+    if duplicates:
+        raise SystemExit(f"{duplicates} recordings share an ID; give manifest entries unique ids")
+
+    concurrency = args.concurrency or (args.batch_size if args.provider == 'opensource' else 8)
+    if args.provider == 'opensource' and args.batch_size <= 1 and concurrency > 1 and not args.diarize:
+        logger.warning("--concurrency %s without --batch-size: Whisper transcribes one recording at a time, "
+                       "so the other threads only hold decoded audio", concurrency)
+    service = create_speech_service(args.provider, batch_size=args.batch_size)
+    diarizer = None
+    if args.diarize:
+        from open_source_services.diarization import DiarizationService
+        diarizer = DiarizationService()
+    journal = Journal(journal_path).open()
+    try:
+        progress = run(service, items, journal, args.provider, decode_workers=args.decode_workers,
+                       concurrency=concurrency, prefetch=args.prefetch, word_timestamps=args.word_timestamps,
+                       progress_interval=args.progress_interval, diarizer=diarizer, num_speakers=args.speakers)
+    except KeyboardInterrupt:
+        journal.close()
+        raise SystemExit(f"Interrupted; rerun the same command to resume from {journal_path}")
+    journal.close()
+
+    if output_format == 'parquet':
+        records = journal.records()
+        write_parquet(records, args.output)
+        print(f"Wrote {len(records)} results to {args.output}", file=sys.stderr)
+    print(f"Transcribed {progress.files - progress.failed} recordings, {progress.failed} failed; "
+          f"results in {args.output}", file=sys.stderr)
+    return 1 if progress.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Batch text-to-speech rendering of prompt libraries, without the HTTP API
+
+Renders every (text, voice) item of a prompt file into a content-addressed
+directory: each rendering is stored as <key>.mp3, where the key hashes
+provider, voice and text, and manifest.jsonl maps keys to their prompts.
+Duplicate items are rendered once, and items already in the directory are
+skipped, so rerunning after editing the library only renders what changed.
+With --format (and --bitrate/--sample-rate) prompts are rendered as e.g.
+Ogg Opus instead; each format gets its own keys, so libraries can be kept
+in several formats side by side.
+
+Run (from the backend directory):
+    python -m bulk_tts prompts.jsonl --output-dir ivr_audio/
+    python -m bulk_tts prompts.txt --provider opensource --voice en-US-JennyNeural --output-dir ivr_audio/
+    python -m bulk_tts prompts.jsonl --format ogg_opus --bitrate 24 --sample-rate 16000 --output-dir ivr_audio/
+
+Prompt files are JSONL objects with "text" and optional "id", "voice" and
+"provider", or plain text with one prompt per line.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from utils.audio_format import FORMATS, OutputFormat
+from utils.tts_batch import TTSBatchRenderer
+
+
+def read_items(path):
+    """Batch items from a JSONL or plain text prompt file"""
+    with open(path, encoding='utf-8') as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if path.endswith('.jsonl'):
+        return [json.loads(line) for line in lines]
+    return lines
+
+
+def create_text_service(provider):
+    """The text service for a provider, built on its own rather than through app.py"""
+    if provider == 'google':
+        from google_services.text_service import TextService
+        return TextService()
+    if provider == 'opensource':
+        from open_source_services.text_service import OpenSourceTextService
+        return OpenSourceTextService()
+    # Providers added through plugins, see utils/providers.py
+    from utils.providers import ProviderRegistry
+    registry = ProviderRegistry()
+    registry.load_plugins()
+    return registry.get(provider, 'text')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('prompts', help="JSONL or text file of prompts")
+    parser.add_argument('--output-dir', required=True, help="Directory for the audio files and manifest.jsonl")
+    parser.add_argument('--provider', default='google', help="Provider for items that name none (default: google)")
+    parser.add_argument('--voice', help="Voice for items that name none (default: the provider's default voice)")
+    parser.add_argument('--format', choices=sorted(FORMATS), help="Audio format (default: mp3)")
+    parser.add_argument('--bitrate', type=int, help="Target bitrate in kbps (default: the provider's)")
+    parser.add_argument('--sample-rate', type=int, help="Sample rate in Hz (default: the provider's)")
+    parser.add_argument('--concurrency', type=int, default=int(os.environ.get('TTS_BATCH_CONCURRENCY', '4')),
+                        help="Most synthesis calls in flight per provider")
+    parser.add_argument('--log-level', default=os.environ.get('LOG_LEVEL', 'WARNING'))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        output_format = OutputFormat.parse(args.format, args.bitrate, args.sample_rate)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    raw_items = read_items(args.prompts)
+    names = {args.provider} | {item['provider'] for item in raw_items if isinstance(item, dict) and item.get('provider')}
+    renderer = TTSBatchRenderer({name: create_text_service(name) for name in names}, args.output_dir,
+                                concurrency=args.concurrency)
+    try:
+        items = renderer.prepare(raw_items, provider=args.provider, voice=args.voice, output_format=output_format)
+    except ValueError as e:
+        raise SystemExit(f"{args.prompts}: {e}")
+
+    result = renderer.render(items)
+    for item in result['items']:
+        if item['status'] == 'failed':
+            print(f"failed {item['id']}: {item['error']}", file=sys.stderr)
+    print(f"{result['rendered']} rendered, {result['cached']} already rendered, {result['duplicate']} duplicates, "
+          f"{result['failed']} failed; manifest at {result['manifest']}", file=sys.stderr)
+    return 1 if result['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
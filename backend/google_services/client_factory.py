@@ -0,0 +1,284 @@
+import importlib
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# Client class, asyncio client class and default endpoint for each Google API. grpc and the SDKs
+# are imported when the first client is created, so importing this module costs nothing
+APIS = {
+    'speech': ('google.cloud.speech', 'SpeechClient', 'SpeechAsyncClient', 'speech.googleapis.com:443'),
+    'text': ('google.cloud.texttospeech', 'TextToSpeechClient', 'TextToSpeechAsyncClient',
+             'texttospeech.googleapis.com:443'),
+    'language': ('google.cloud.language', 'LanguageServiceClient', 'LanguageServiceAsyncClient',
+                 'language.googleapis.com:443'),
+}
+
+# Per-call deadline (seconds) and whether transient errors are retried within it
+DEFAULT_CALL_POLICIES = {
+    'speech.recognize': {'timeout': 60.0, 'retry': True},
+    # Overall deadline for trying each recognition model in turn; each call gets what is left
+    'speech.recognize_models': {'timeout': 90.0},
+    'speech.long_running_recognize': {'timeout': 600.0, 'retry': True},
+    'speech.streaming_recognize': {'timeout': 600.0, 'retry': False},
+    'text.synthesize_speech': {'timeout': 20.0, 'retry': True},
+    'text.list_voices': {'timeout': 10.0, 'retry': True},
+    'language.analyze_sentiment': {'timeout': 10.0, 'retry': True},
+}
+
+
+def retryable_errors():
+    """Errors worth retrying: the request never reached the backend or the backend was overloaded"""
+    from google.api_core import exceptions, retry
+    return retry.if_exception_type(
+        exceptions.ServiceUnavailable,
+        exceptions.TooManyRequests,
+        exceptions.InternalServerError,
+    )
+
+
+class GoogleClientFactory:
+    """Shared, fork-safe factory for Google Cloud API clients"""
+
+    def __init__(self, keepalive_time_ms=300000, keepalive_timeout_ms=20000, pool_size=1,
+                 endpoints=None, insecure=False, call_policies=None):
+        """
+        Initialize the factory
+
+        Nothing is connected here: credentials are loaded and channels are
+        created on first use, so a factory built before a gunicorn fork never
+        hands a parent's gRPC channel to a worker.
+
+        Args:
+            keepalive_time_ms: Interval between HTTP/2 keepalive pings while
+                               calls are in flight; Google's servers answer
+                               pings more often than every 5 minutes with
+                               GOAWAY too_many_pings
+            keepalive_timeout_ms: How long to wait for a ping ack before
+                                  considering the connection dead
+            pool_size: Channels (TCP/TLS connections) per API; calls are
+                       spread round-robin over them
+            endpoints: Optional dict of API name -> host:port overrides
+            insecure: Use plaintext channels (for local fake servers)
+            call_policies: Overrides for DEFAULT_CALL_POLICIES
+        """
+        self.keepalive_time_ms = keepalive_time_ms
+        self.keepalive_timeout_ms = keepalive_timeout_ms
+        self.pool_size = max(1, pool_size)
+        self.endpoints = endpoints or {}
+        self.insecure = insecure
+        self.call_policies = dict(DEFAULT_CALL_POLICIES)
+        self.call_policies.update(call_policies or {})
+        # Reentrant: the first client() call loads credentials while holding it
+        self._lock = threading.RLock()
+        self._credentials = None
+        self._credentials_loaded = False
+        self._reset()
+
+    def _reset(self):
+        # Drop references without closing: closing a channel inherited across fork can hang
+        self._pid = os.getpid()
+        self._clients = {}
+        self._cycles = {}
+        # Asyncio channels belong to the event loop they were created on: loop -> {api: cycle}
+        self._async_cycles = weakref.WeakKeyDictionary()
+
+    @property
+    def credentials(self):
+        """Service account credentials, loaded once per process"""
+        if not self._credentials_loaded:
+            with self._lock:
+                if not self._credentials_loaded:
+                    credentials_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
+                    if credentials_path and os.path.exists(credentials_path):
+                        from google.oauth2 import service_account
+                        self._credentials = service_account.Credentials.from_service_account_file(
+                            credentials_path, scopes=["https://www.googleapis.com/auth/cloud-platform"]
+                        )
+                        logger.info("Loaded credentials from %s", credentials_path)
+                    else:
+                        # Try to use default credentials
+                        self._credentials = None
+                        logger.warning("No explicit credentials provided, using default credentials")
+                    self._credentials_loaded = True
+        return self._credentials
+
+    def channel_options(self):
+        return [
+            ('grpc.keepalive_time_ms', self.keepalive_time_ms),
+            ('grpc.keepalive_timeout_ms', self.keepalive_timeout_ms),
+            # Idle channels are not pinged: a dropped idle connection is simply reopened on the next call
+            ('grpc.keepalive_permit_without_calls', 0),
+            # Give each pooled channel its own connection instead of a shared global subchannel
+            ('grpc.use_local_subchannel_pool', 1),
+        ]
+
+    def _create_client(self, api, asynchronous=False):
+        module, class_name, async_class_name, default_endpoint = APIS[api]
+        client_cls = getattr(importlib.import_module(module), async_class_name if asynchronous else class_name)
+        target = self.endpoints.get(api, default_endpoint)
+        transport_cls = client_cls.get_transport_class('grpc_asyncio' if asynchronous else 'grpc')
+        if self.insecure:
+            import grpc
+            if asynchronous:
+                import grpc.aio
+                channel = grpc.aio.insecure_channel(target, options=self.channel_options())
+            else:
+                channel = grpc.insecure_channel(target, options=self.channel_options())
+        else:
+            channel = transport_cls.create_channel(
+                target,
+                credentials=self.credentials,
+                scopes=["https://www.googleapis.com/auth/cloud-platform"],
+                options=self.channel_options()
+            )
+        return client_cls(transport=transport_cls(channel=channel))
+
+    def client(self, api):
+        """
+        Get a client for an API from the channel pool
+
+        Args:
+            api: One of 'speech', 'text' or 'language'
+
+        Returns:
+            The GAPIC client bound to the next pooled channel
+        """
+        if self._pid != os.getpid():
+            # First use in a forked child: never reuse the parent's channels
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+        cycle = self._cycles.get(api)
+        if cycle is None:
+            with self._lock:
+                cycle = self._cycles.get(api)
+                if cycle is None:
+                    clients = [self._create_client(api) for _ in range(self.pool_size)]
+                    self._clients[api] = clients
+                    cycle = self._cycles[api] = itertools.cycle(clients)
+                    logger.info("Created %s gRPC channel(s) for %s in process %s", len(clients), api, self._pid)
+        with self._lock:
+            return next(cycle)
+
+    def async_client(self, api):
+        """
+        Get an asyncio client for an API, for the running event loop
+
+        Pooled, with the same channel options as client(); each event loop
+        gets its own channels, since a gRPC asyncio channel cannot be used
+        from another loop.
+
+        Args:
+            api: One of 'speech', 'text' or 'language'
+
+        Returns:
+            The GAPIC asyncio client bound to the next pooled channel
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+        with self._lock:
+            cycles = self._async_cycles.setdefault(loop, {})
+            cycle = cycles.get(api)
+            if cycle is None:
+                clients = [self._create_client(api, asynchronous=True) for _ in range(self.pool_size)]
+                cycle = cycles[api] = itertools.cycle(clients)
+                logger.info("Created %s gRPC asyncio channel(s) for %s in process %s", len(clients), api, self._pid)
+            return next(cycle)
+
+    def deadline(self, method):
+        """
+        Monotonic time by which a sequence of calls must finish
+
+        Args:
+            method: Policy name, e.g. 'speech.recognize_models'
+
+        Returns:
+            float: time.monotonic() value to pass to call_options()
+        """
+        return time.monotonic() + self.call_policies.get(method, {'timeout': 30.0})['timeout']
+
+    def call_options(self, method, asynchronous=False, deadline=None):
+        """
+        Retry and deadline keyword arguments for a client call
+
+        Args:
+            method: Policy name, e.g. 'speech.recognize'
+            asynchronous: For a call on an async_client() client
+            deadline: Optional deadline() value; the call's timeout is cut
+                      to the time left before it
+
+        Returns:
+            dict: retry/timeout kwargs to pass to the client method, or None
+                  if the deadline has already passed
+        """
+        policy = self.call_policies.get(method, {'timeout': 30.0, 'retry': True})
+        timeout = policy['timeout']
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                return None
+        # None, not the GAPIC default, which retries DEADLINE_EXCEEDED well past any timeout
+        options = {'timeout': timeout, 'retry': None}
+        if policy.get('retry'):
+            from google.api_core import retry, retry_async
+            options['retry'] = (retry_async.AsyncRetry if asynchronous else retry.Retry)(
+                predicate=retryable_errors(),
+                initial=0.1,
+                maximum=2.0,
+                multiplier=2.0,
+                deadline=timeout
+            )
+        return options
+
+
+_factory = None
+_factory_lock = threading.Lock()
+
+
+def _env_policies():
+    raw = os.environ.get('GOOGLE_CALL_POLICIES')
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError as e:
+        logger.error("Ignoring invalid GOOGLE_CALL_POLICIES: %s", e)
+        return None
+
+
+def get_client_factory():
+    """Process-wide client factory, configured from the environment"""
+    global _factory
+    if _factory is None:
+        with _factory_lock:
+            if _factory is None:
+                _factory = GoogleClientFactory(
+                    keepalive_time_ms=int(os.environ.get('GOOGLE_GRPC_KEEPALIVE_MS', '300000')),
+                    keepalive_timeout_ms=int(os.environ.get('GOOGLE_GRPC_KEEPALIVE_TIMEOUT_MS', '20000')),
+                    pool_size=int(os.environ.get('GOOGLE_GRPC_POOL_SIZE', '1')),
+                    call_policies=_env_policies()
+                )
+    return _factory
+
+
+def _after_fork_in_child():
+    # Locks may have been held by another parent thread at fork time
+    global _factory_lock
+    _factory_lock = threading.Lock()
+    if _factory is not None:
+        _factory._lock = threading.RLock()
+        _factory._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
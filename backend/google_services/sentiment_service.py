@@ -1,7 +1,7 @@
 from google.cloud import language
 import logging
-import os
-from google.oauth2 import service_account
+from google_services.client_factory import get_client_factory
+from utils.logging_config import log_text
 
 logger = logging.getLogger(__name__)
 
@@ -9,18 +9,17 @@ class SentimentService:
     """Service for analyzing sentiment using Google Cloud Natural Language API"""
     
     def __init__(self):
-        # Load service account credentials
-        credentials_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
-        if credentials_path and os.path.exists(credentials_path):
-            self.credentials = service_account.Credentials.from_service_account_file(credentials_path)
-            logger.info(f"Loaded credentials from {credentials_path}")
-        else:
-            # Try to use default credentials
-            self.credentials = None
-            logger.warning("No explicit credentials provided, using default credentials")
-        
-        # Initialize the client
-        self.client = language.LanguageServiceClient(credentials=self.credentials)
+        # Clients come from the shared factory, so credentials are loaded once per
+        # process and gRPC channels are only created in the worker that uses them
+        self._factory = get_client_factory()
+    
+    @property
+    def client(self):
+        return self._factory.client('language')
+    
+    @property
+    def credentials(self):
+        return self._factory.credentials
     
     def analyze_sentiment(self, text):
         """
@@ -34,63 +33,87 @@ class SentimentService:
         """
         if not text or len(text) < 3:
             logger.warning("Text too short for sentiment analysis")
-            return {
-                "success": False,
-                "error": "Text too short for sentiment analysis",
-                "score": None,
-                "magnitude": None
-            }
+            return self._failure("Text too short for sentiment analysis", input_error=True)
         
         try:
-            logger.info(f"Analyzing sentiment for text: '{text[:50]}{'...' if len(text) > 50 else ''}'")
-            
-            # Prepare document for analysis
-            document = language.Document(
-                content=text,
-                type_=language.Document.Type.PLAIN_TEXT,
-                language="en"
-            )
-            
             # Call the API
             response = self.client.analyze_sentiment(
-                request={"document": document}
+                request={"document": self._build_document(text)},
+                **self._factory.call_options('language.analyze_sentiment')
             )
             
-            # Extract sentiment details
-            sentiment = response.document_sentiment
+            return self._build_result(response)
             
-            logger.info(f"Sentiment analysis complete: score={sentiment.score}, magnitude={sentiment.magnitude}")
-            logger.info(f"Raw sentiment values - score: {sentiment.score}, magnitude: {sentiment.magnitude}")
-            # Interpret sentiment
-            sentiment_label = self._interpret_sentiment(sentiment.score)
-            confidence = min(abs(sentiment.score) * 2, 1.0)  # Convert to 0-1 range
+        except Exception as e:
+            logger.error("Error analyzing sentiment: %s", e)
             
-            return {
-                "success": True,
-                "score": sentiment.score,
-                "magnitude": sentiment.magnitude,
-                "sentiment": sentiment_label,
-                "confidence": confidence,
-                "sentences": [
-                    {
-                        "text": sentence.text.content,
-                        "score": sentence.sentiment.score,
-                        "magnitude": sentence.sentiment.magnitude,
-                        "sentiment": self._interpret_sentiment(sentence.sentiment.score)
-                    }
-                    for sentence in response.sentences
-                ]
-            }
+            return self._failure(str(e))
+    
+    async def analyze_sentiment_async(self, text):
+        """Async variant of analyze_sentiment using the gRPC asyncio client"""
+        if not text or len(text) < 3:
+            logger.warning("Text too short for sentiment analysis")
+            return self._failure("Text too short for sentiment analysis", input_error=True)
+        
+        try:
+            response = await self._factory.async_client('language').analyze_sentiment(
+                request={"document": self._build_document(text)},
+                **self._factory.call_options('language.analyze_sentiment', asynchronous=True)
+            )
+            
+            return self._build_result(response)
             
         except Exception as e:
-            logger.error(f"Error analyzing sentiment: {str(e)}")
+            logger.error("Error analyzing sentiment: %s", e)
             
-            return {
-                "success": False,
-                "error": str(e),
-                "score": None,
-                "magnitude": None
-            }
+            return self._failure(str(e))
+    
+    def _failure(self, error, input_error=False):
+        result = {
+            "success": False,
+            "error": error,
+            "score": None,
+            "magnitude": None
+        }
+        if input_error:
+            result["input_error"] = True
+        return result
+    
+    def _build_document(self, text):
+        logger.info("Analyzing sentiment for text: '%s'", log_text(text), extra={'sample': True})
+        
+        # Prepare document for analysis
+        return language.Document(
+            content=text,
+            type_=language.Document.Type.PLAIN_TEXT,
+            language="en"
+        )
+    
+    def _build_result(self, response):
+        # Extract sentiment details
+        sentiment = response.document_sentiment
+        
+        logger.info("Sentiment analysis complete: score=%s, magnitude=%s", sentiment.score, sentiment.magnitude, extra={'sample': True})
+        # Interpret sentiment
+        sentiment_label = self._interpret_sentiment(sentiment.score)
+        confidence = min(abs(sentiment.score) * 2, 1.0)  # Convert to 0-1 range
+        
+        return {
+            "success": True,
+            "score": sentiment.score,
+            "magnitude": sentiment.magnitude,
+            "sentiment": sentiment_label,
+            "confidence": confidence,
+            "sentences": [
+                {
+                    "text": sentence.text.content,
+                    "score": sentence.sentiment.score,
+                    "magnitude": sentence.sentiment.magnitude,
+                    "sentiment": self._interpret_sentiment(sentence.sentiment.score)
+                }
+                for sentence in response.sentences
+            ]
+        }
     
     def _interpret_sentiment(self, score):
         """Interpret sentiment score as a label"""
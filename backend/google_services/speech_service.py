@@ -1,27 +1,37 @@
 from google.cloud import speech
+import asyncio
 import logging
 import time
 import os
-from google.oauth2 import service_account
+import subprocess
+from datetime import timedelta
+from google_services.client_factory import get_client_factory
+from utils.transcript import build_segment, build_word
+from utils.logging_config import log_text
+from utils.tracing import span
 
 logger = logging.getLogger(__name__)
 
+# Synchronous recognize only accepts about one minute of audio
+SYNC_RECOGNIZE_MAX_SECONDS = 55
+# Each streaming request may carry at most 25 KB of audio
+STREAM_CHUNK_BYTES = 16 * 1024
+# Google ends a recognition stream after about 305 seconds of audio, so longer audio is sent
+# as consecutive streams of at most this many seconds
+STREAM_MAX_SECONDS = 290
+# Audio after a stream's last final result is sent again at the start of the next, up to this much
+STREAM_CARRY_SECONDS = 10
+# Long audio is streamed as 16 kHz mono LINEAR16, which can be cut anywhere between streams
+PCM_SAMPLE_RATE = 16000
+PCM_BYTES_PER_SECOND = PCM_SAMPLE_RATE * 2
+
 class SpeechService:
     """Service for handling speech-to-text conversions using Google Cloud Speech API"""
     
     def __init__(self):
-        # Load service account credentials
-        credentials_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
-        if credentials_path and os.path.exists(credentials_path):
-            self.credentials = service_account.Credentials.from_service_account_file(credentials_path)
-            logger.info(f"Loaded credentials from {credentials_path}")
-        else:
-            # Try to use default credentials
-            self.credentials = None
-            logger.warning("No explicit credentials provided, using default credentials")
-        
-        # Initialize the client
-        self.client = speech.SpeechClient(credentials=self.credentials)
+        # Clients come from the shared factory, so credentials are loaded once per
+        # process and gRPC channels are only created in the worker that uses them
+        self._factory = get_client_factory()
         
         # Define models to try
         self.models = [
@@ -33,6 +43,7 @@ class SpeechService:
                     language_code="en-US",
                     audio_channel_count=1,
                     enable_automatic_punctuation=True,
+                    enable_word_time_offsets=True,
                     model="default",
                 )
             },
@@ -44,6 +55,7 @@ class SpeechService:
                     language_code="en-US",
                     audio_channel_count=1,
                     enable_automatic_punctuation=True,
+                    enable_word_time_offsets=True,
                     model="default",
                 )
             },
@@ -55,6 +67,7 @@ class SpeechService:
                     language_code="en-US",
                     audio_channel_count=1,
                     enable_automatic_punctuation=True,
+                    enable_word_time_offsets=True,
                     model="latest_short",
                 )
             },
@@ -66,6 +79,7 @@ class SpeechService:
                     language_code="en-US",
                     audio_channel_count=1,
                     enable_automatic_punctuation=True,
+                    enable_word_time_offsets=True,
                     model="phone_call",
                     use_enhanced=True,
                 )
@@ -78,6 +92,7 @@ class SpeechService:
                     language_code="en-US",
                     audio_channel_count=1,
                     enable_automatic_punctuation=True,
+                    enable_word_time_offsets=True,
                     model="default",
                     use_enhanced=True,
                 )
@@ -90,6 +105,7 @@ class SpeechService:
                     language_code="en-US",
                     audio_channel_count=1,
                     enable_automatic_punctuation=True,
+                    enable_word_time_offsets=True,
                     model="default",
                     use_enhanced=True,
                     speech_contexts=[speech.SpeechContext(
@@ -100,93 +116,383 @@ class SpeechService:
             }
         ]
     
-    def transcribe_audio(self, audio_file_path):
+    @property
+    def client(self):
+        return self._factory.client('speech')
+    
+    @property
+    def credentials(self):
+        return self._factory.credentials
+    
+    def transcribe_audio(self, audio_file_path, word_timestamps=False):
         """
         Transcribe audio file to text using multiple models until one succeeds
         
         Args:
             audio_file_path: Path to the audio file to transcribe
+            word_timestamps: Also return per-word start/end offsets
             
         Returns:
             dict: Dictionary containing transcription results and metadata
         """
-        logger.info(f"Transcribing audio file: {audio_file_path}")
+        error = self._check_file(audio_file_path)
+        if error:
+            return error
+        
+        # Longer audio, or audio of unknown length, goes through streaming recognition, read from disk in chunks
+        with span('speech.probe_duration'):
+            duration = self._estimate_duration(audio_file_path)
+        if duration is None or duration > SYNC_RECOGNIZE_MAX_SECONDS:
+            return self._transcribe_streaming(audio_file_path, word_timestamps)
+        
+        audio = self._load_audio(audio_file_path)
+        
+        # Try each model until one works, all within one deadline
+        deadline = self._factory.deadline('speech.recognize_models')
+        raised = False
+        for model_info in self.models:
+            options = self._factory.call_options('speech.recognize', deadline=deadline)
+            if options is None:
+                return self._failure("Transcription deadline passed before any model succeeded")
+            try:
+                logger.info("Trying model: %s", model_info['name'])
+                start_time = time.time()
+                
+                with span('speech.recognize', model=model_info['name']) as attempt:
+                    response = self.client.recognize(config=model_info['config'], audio=audio, **options)
+                    result = self._build_result(response.results, model_info, time.time() - start_time, word_timestamps)
+                    attempt.set('transcribed', bool(result))
+                if result:
+                    return result
+            
+            except Exception as e:
+                logger.error("Error with model '%s': %s", model_info['name'], e)
+                raised = True
+        
+        # If we get here, all models failed
+        return self._all_models_failed(raised)
+    
+    async def transcribe_audio_async(self, audio_file_path, word_timestamps=False):
+        """
+        Async variant of transcribe_audio for the ASGI app
+        
+        Uses the gRPC asyncio client so the event loop is free while Google
+        processes the request; probing and reading the file run in the
+        loop's default executor.
+        """
+        error = self._check_file(audio_file_path)
+        if error:
+            return error
+        
+        loop = asyncio.get_running_loop()
+        with span('speech.probe_duration'):
+            duration = await loop.run_in_executor(None, self._estimate_duration, audio_file_path)
+        if duration is None or duration > SYNC_RECOGNIZE_MAX_SECONDS:
+            # Streaming reads the file in chunks from a blocking generator, so keep it off the loop
+            return await loop.run_in_executor(None, self._transcribe_streaming, audio_file_path, word_timestamps)
+        
+        audio = await loop.run_in_executor(None, self._load_audio, audio_file_path)
+        
+        deadline = self._factory.deadline('speech.recognize_models')
+        raised = False
+        for model_info in self.models:
+            options = self._factory.call_options('speech.recognize', asynchronous=True, deadline=deadline)
+            if options is None:
+                return self._failure("Transcription deadline passed before any model succeeded")
+            try:
+                logger.info("Trying model: %s", model_info['name'])
+                start_time = time.time()
+                
+                with span('speech.recognize', model=model_info['name']) as attempt:
+                    response = await self._factory.async_client('speech').recognize(
+                        config=model_info['config'], audio=audio, **options
+                    )
+                    result = self._build_result(response.results, model_info, time.time() - start_time, word_timestamps)
+                    attempt.set('transcribed', bool(result))
+                if result:
+                    return result
+            
+            except Exception as e:
+                logger.error("Error with model '%s': %s", model_info['name'], e)
+                raised = True
+        
+        return self._all_models_failed(raised)
+    
+    def _failure(self, error, input_error=False):
+        result = {
+            "success": False,
+            "error": error,
+            "text": None,
+            "model_used": None
+        }
+        if input_error:
+            # The audio, not Google, is at fault, so the call does not count against the provider's health
+            result["input_error"] = True
+        return result
+    
+    def _all_models_failed(self, raised):
+        """Failure once every model was tried; if none raised, they all found no speech in the audio"""
+        if raised:
+            return self._failure("Failed to transcribe with any model")
+        return self._failure("No speech recognized with any model", input_error=True)
+    
+    def _check_file(self, audio_file_path):
+        """Return an error result if the audio file is missing or empty, else None"""
+        logger.info("Transcribing audio file: %s", audio_file_path)
         
         # Check if file exists and has content
         if not os.path.exists(audio_file_path):
-            logger.error(f"Audio file does not exist: {audio_file_path}")
-            return {
-                "success": False,
-                "error": "Audio file does not exist",
-                "text": None,
-                "model_used": None
-            }
+            logger.error("Audio file does not exist: %s", audio_file_path)
+            return self._failure("Audio file does not exist", input_error=True)
         
         file_size = os.path.getsize(audio_file_path)
         if file_size < 1000:
-            logger.warning(f"Audio file too small: {file_size} bytes")
-            return {
-                "success": False,
-                "error": "Audio file too small or empty",
-                "text": None,
-                "model_used": None
-            }
+            logger.warning("Audio file too small: %s bytes", file_size)
+            return self._failure("Audio file too small or empty", input_error=True)
         
-        # Read the audio file
+        return None
+    
+    def _load_audio(self, audio_file_path):
+        """Read a short audio file into a RecognitionAudio"""
         with open(audio_file_path, 'rb') as audio_file:
             content = audio_file.read()
         
         # Create the audio object
-        audio = speech.RecognitionAudio(content=content)
+        return speech.RecognitionAudio(content=content)
+    
+    def _estimate_duration(self, audio_file_path):
+        """
+        Audio duration in seconds from ffprobe, or None if it cannot tell
         
-        # Try each model until one works
+        Browser WebM recordings often carry no duration header, and their
+        bitrate varies too much to go by the file size, so the end of the
+        last audio packet is read instead; ffprobe demuxes the file for that
+        without decoding it.
+        """
+        try:
+            output = self._ffprobe(audio_file_path, '-show_entries', 'format=duration')
+            if output and output != 'N/A':
+                return float(output)
+            # One "pts_time,duration_time" line per packet, in order
+            packets = self._ffprobe(audio_file_path, '-select_streams', 'a:0',
+                                    '-show_entries', 'packet=pts_time,duration_time')
+            last = packets.splitlines()[-1].split(',')
+            return float(last[0]) + (float(last[1]) if len(last) > 1 and last[1] != 'N/A' else 0.0)
+        except Exception as e:
+            logger.warning("Could not determine the duration of %s: %s", audio_file_path, e)
+            return None
+    
+    def _ffprobe(self, audio_file_path, *args):
+        return subprocess.run(
+            ['ffprobe', '-v', 'error', *args, '-of', 'csv=p=0', audio_file_path],
+            capture_output=True, text=True, timeout=30, check=True
+        ).stdout.strip()
+    
+    def _pcm_chunks(self, audio_file_path):
+        """
+        Yield the file decoded to 16 kHz mono LINEAR16, STREAM_CHUNK_BYTES at a time
+
+        ffmpeg decodes through a pipe, so the file is never held in memory whole.
+        
+        Raises:
+            RuntimeError: ffmpeg failed to decode the file
+        """
+        process = subprocess.Popen(
+            ['ffmpeg', '-nostdin', '-v', 'error', '-i', audio_file_path, '-vn', '-ac', '1',
+             '-ar', str(PCM_SAMPLE_RATE), '-f', 's16le', 'pipe:1'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        try:
+            while True:
+                chunk = process.stdout.read(STREAM_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+            if process.wait() != 0:
+                raise RuntimeError(f"ffmpeg could not decode the audio: {process.stderr.read().decode(errors='replace').strip()}")
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            process.stderr.close()
+    
+    @staticmethod
+    def _pcm_config(config):
+        """A copy of a recognition config for the LINEAR16 audio _pcm_chunks produces"""
+        pcm_config = speech.RecognitionConfig.deserialize(speech.RecognitionConfig.serialize(config))
+        pcm_config.encoding = speech.RecognitionConfig.AudioEncoding.LINEAR16
+        pcm_config.sample_rate_hertz = PCM_SAMPLE_RATE
+        return pcm_config
+    
+    @staticmethod
+    def _shift(result, offset):
+        """Move a stream's result times from the start of its stream to the start of the file"""
+        if not offset:
+            return
+        result.result_end_time = timedelta(seconds=result.result_end_time.total_seconds() + offset)
+        for alternative in result.alternatives:
+            for word in alternative.words:
+                word.start_time = timedelta(seconds=word.start_time.total_seconds() + offset)
+                word.end_time = timedelta(seconds=word.end_time.total_seconds() + offset)
+    
+    def _recognize_streams(self, audio_file_path, config):
+        """
+        Run streaming recognition over the whole file, restarting the stream before Google's limit
+        
+        Each stream carries at most STREAM_MAX_SECONDS of audio. The next one
+        starts where the last final result ended (or STREAM_CARRY_SECONDS
+        before the cut, if that is later), so speech cut by the restart is
+        sent again rather than lost; results are shifted to file time.
+        
+        Returns:
+            tuple: (final results in order, number of streams)
+        """
+        streaming_config = speech.StreamingRecognitionConfig(config=config, interim_results=False)
+        limit = STREAM_MAX_SECONDS * PCM_BYTES_PER_SECOND
+        chunks = self._pcm_chunks(audio_file_path)
+        try:
+            pending = next(chunks, b'')
+            carry = b''
+            offset = 0.0
+            final_results = []
+            streams = 0
+            while pending:
+                sent = bytearray(carry)
+                
+                def requests():
+                    nonlocal pending
+                    for start in range(0, len(carry), STREAM_CHUNK_BYTES):
+                        yield speech.StreamingRecognizeRequest(audio_content=carry[start:start + STREAM_CHUNK_BYTES])
+                    while pending and len(sent) < limit:
+                        sent.extend(pending)
+                        yield speech.StreamingRecognizeRequest(audio_content=pending)
+                        pending = next(chunks, b'')
+                
+                responses = self.client.streaming_recognize(
+                    config=streaming_config,
+                    requests=requests(),
+                    **self._factory.call_options('speech.streaming_recognize')
+                )
+                results = [result for response in responses for result in response.results if result.is_final]
+                streams += 1
+                last_end = max((result.result_end_time.total_seconds() for result in results), default=0.0)
+                for result in results:
+                    self._shift(result, offset)
+                final_results.extend(results)
+                if not pending:
+                    break
+                
+                carry_from = max(last_end, len(sent) / PCM_BYTES_PER_SECOND - STREAM_CARRY_SECONDS)
+                carry_bytes = min(int(carry_from * PCM_SAMPLE_RATE) * 2, len(sent))
+                carry = bytes(sent[carry_bytes:])
+                offset += carry_bytes / PCM_BYTES_PER_SECOND
+                logger.info("Restarting recognition stream at %.1f seconds", offset)
+            return final_results, streams
+        finally:
+            chunks.close()
+    
+    def _transcribe_streaming(self, audio_file_path, word_timestamps=False):
+        """
+        Transcribe long audio with streaming recognition
+        
+        The file is decoded to LINEAR16 as it is sent and never read into
+        memory as a whole. Streams are restarted before Google's limit of
+        about five minutes each, and their final results are merged into a
+        single transcript.
+        """
+        tried = set()
+        raised = False
         for model_info in self.models:
+            # latest_short is tuned for utterances, not long recordings
+            if model_info['config'].model == 'latest_short':
+                continue
+            # Configs that differed only in their container encoding are the same once decoded
+            config = self._pcm_config(model_info['config'])
+            key = speech.RecognitionConfig.serialize(config)
+            if key in tried:
+                continue
+            tried.add(key)
             try:
-                logger.info(f"Trying model: {model_info['name']}")
+                logger.info("Trying streaming model: %s", model_info['name'])
                 start_time = time.time()
                 
-                response = self.client.recognize(config=model_info['config'], audio=audio)
-                
-                elapsed_time = time.time() - start_time
-                logger.info(f"API response time: {elapsed_time:.2f} seconds")
-                
-                # Check if we got results
-                if response.results:
-                    # Build transcript
-                    transcript_parts = []
-                    confidence_sum = 0
-                    confidence_count = 0
-                    
-                    for result in response.results:
-                        for alternative in result.alternatives:
-                            transcript_parts.append(alternative.transcript)
-                            if hasattr(alternative, 'confidence'):
-                                confidence_sum += alternative.confidence
-                                confidence_count += 1
-                    
-                    transcript = " ".join(transcript_parts)
-                    avg_confidence = confidence_sum / confidence_count if confidence_count > 0 else None
-                    
-                    logger.info(f"Successful transcription with model '{model_info['name']}': {transcript}")
-                    logger.info(f"Average confidence: {avg_confidence}")
-                    
-                    return {
-                        "success": True,
-                        "text": transcript,
-                        "model_used": model_info['name'],
-                        "confidence": avg_confidence,
-                        "processing_time": elapsed_time
-                    }
-                else:
-                    logger.warning(f"No transcription results with model '{model_info['name']}'")
+                with span('speech.streaming_recognize', model=model_info['name']) as attempt:
+                    final_results, streams = self._recognize_streams(audio_file_path, config)
+                    attempt.set('streams', streams)
+                    result = self._build_result(final_results, model_info, time.time() - start_time, word_timestamps)
+                    attempt.set('transcribed', bool(result))
+                if result:
+                    result["streaming"] = True
+                    return result
             
             except Exception as e:
-                logger.error(f"Error with model '{model_info['name']}': {str(e)}")
+                logger.error("Error with streaming model '%s': %s", model_info['name'], e)
+                raised = True
+        
+        return self._all_models_failed(raised)
+    
+    def _build_result(self, results, model_info, elapsed_time, word_timestamps=False):
+        """Build the transcription result from recognition results, or None if there are none"""
+        logger.info("API response time: %.2f seconds", elapsed_time, extra={'sample': True})
+        
+        # Check if we got results
+        if not results:
+            logger.warning("No transcription results with model '%s'", model_info['name'])
+            return None
+        
+        # Build transcript
+        transcript_parts = []
+        confidence_sum = 0
+        confidence_count = 0
+        
+        for result in results:
+            for alternative in result.alternatives:
+                transcript_parts.append(alternative.transcript)
+                if hasattr(alternative, 'confidence'):
+                    confidence_sum += alternative.confidence
+                    confidence_count += 1
+        
+        transcript = " ".join(transcript_parts)
+        avg_confidence = confidence_sum / confidence_count if confidence_count > 0 else None
+        segments = self._normalize_segments(results, word_timestamps)
+        
+        logger.info("Successful transcription with model '%s': %s", model_info['name'], log_text(transcript, 100), extra={'sample': True})
+        logger.info("Average confidence: %s", avg_confidence, extra={'sample': True})
         
-        # If we get here, all models failed
         return {
-            "success": False,
-            "error": "Failed to transcribe with any model",
-            "text": None,
-            "model_used": None
-        }
\ No newline at end of file
+            "success": True,
+            "text": transcript,
+            "model_used": model_info['name'],
+            "confidence": avg_confidence,
+            "processing_time": elapsed_time,
+            "segments": segments
+        }
+    
+    def _normalize_segments(self, results, word_timestamps=False):
+        """Convert recognition results to the shared transcript segment schema"""
+        segments = []
+        previous_end = 0.0
+        for index, result in enumerate(results):
+            if not result.alternatives:
+                continue
+            alternative = result.alternatives[0]
+            words = [
+                build_word(word.word, word.start_time, word.end_time, getattr(word, 'confidence', None) or None)
+                for word in alternative.words
+            ]
+            
+            # A result spans from its first word (or the previous result) to its reported end
+            start = words[0]["start"] if words else previous_end
+            end = result.result_end_time.total_seconds() if result.result_end_time else (words[-1]["end"] if words else start)
+            previous_end = end
+            
+            segments.append(build_segment(
+                index,
+                alternative.transcript,
+                start,
+                end,
+                confidence=alternative.confidence or None,
+                words=words if word_timestamps else None
+            ))
+        return segments
\ No newline at end of file
@@ -1,55 +1,71 @@
-from google.cloud import texttospeech
 import logging
-import os
-from google.oauth2 import service_account
+from google_services.client_factory import get_client_factory
+from utils.logging_config import log_text
+from utils.audio_format import OutputFormat, transcode, transcode_async
 
 logger = logging.getLogger(__name__)
 
+# Formats Google encodes itself (LINEAR16 comes with a WAV header), by AudioEncoding name;
+# the SDK itself is only imported by the methods that call the API
+NATIVE_ENCODINGS = {
+    'mp3': 'MP3',
+    'ogg_opus': 'OGG_OPUS',
+    'wav': 'LINEAR16'
+}
+
 class TextService:
     """Service for handling text-to-speech conversions using Google Cloud Text-to-Speech API"""
     
     def __init__(self):
-        # Load service account credentials
-        credentials_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
-        if credentials_path and os.path.exists(credentials_path):
-            self.credentials = service_account.Credentials.from_service_account_file(credentials_path)
-            logger.info(f"Loaded credentials from {credentials_path}")
-        else:
-            # Try to use default credentials
-            self.credentials = None
-            logger.warning("No explicit credentials provided, using default credentials")
-        
-        # Initialize the client
-        self.client = texttospeech.TextToSpeechClient(credentials=self.credentials)
+        # Clients come from the shared factory, so credentials are loaded once per
+        # process and gRPC channels are only created in the worker that uses them
+        self._factory = get_client_factory()
         
         # Cache available voices
         self._available_voices = None
         
+    @property
+    def client(self):
+        return self._factory.client('text')
+    
+    @property
+    def credentials(self):
+        return self._factory.credentials
+    
+    def fetch_voices(self):
+        """
+        Fetch the voice list from Google Cloud TTS API, bypassing the cache
+        
+        Raises:
+            Exception: The API call failed
+        """
+        from google.cloud import texttospeech
+        response = self.client.list_voices(**self._factory.call_options('text.list_voices'))
+        
+        # Format voice information for easy consumption
+        return [
+            {
+                "name": voice.name,
+                "language_codes": list(voice.language_codes),  # Convert to a regular list
+                "gender": texttospeech.SsmlVoiceGender(voice.ssml_gender).name,
+                "natural": voice.natural_sample_rate_hertz > 0
+            }
+            for voice in response.voices
+        ]
+    
     def get_available_voices(self):
         """Get list of available voices from Google Cloud TTS API"""
         if self._available_voices is None:
             try:
-                response = self.client.list_voices()
-                
-                # Format voice information for easy consumption
-                self._available_voices = [
-                    {
-                        "name": voice.name,
-                        "language_codes": list(voice.language_codes),  # Convert to a regular list
-                        "gender": texttospeech.SsmlVoiceGender(voice.ssml_gender).name,
-                        "natural": voice.natural_sample_rate_hertz > 0
-                    }
-                    for voice in response.voices
-                ]
-                
-                logger.info(f"Retrieved {len(self._available_voices)} available voices")
+                self._available_voices = self.fetch_voices()
+                logger.info("Retrieved %s available voices", len(self._available_voices))
             except Exception as e:
-                logger.error(f"Error retrieving available voices: {str(e)}")
+                logger.error("Error retrieving available voices: %s", e)
                 self._available_voices = []
         
         return self._available_voices
     
-    def synthesize_speech(self, text, voice_name=None):
+    def synthesize_speech(self, text, voice_name=None, output_format=None):
         """
         Convert text to speech using Google Cloud TTS
         
@@ -57,11 +73,68 @@ class TextService:
             text: Text to convert to speech
             voice_name: Name of the voice to use (e.g., "en-US-Neural2-F")
                         If None, defaults to a standard voice
+            output_format: OutputFormat to return, default 24 kHz MP3. Google
+                           encodes MP3, Ogg Opus and WAV itself at any sample
+                           rate; it has no bitrate setting, so for a bitrate
+                           it returns uncompressed audio encoded once here
                         
         Returns:
             tuple: (audio_file_name, audio_content)
         """
-        logger.info(f"Synthesizing text to speech: '{text[:50]}{'...' if len(text) > 50 else ''}'")
+        input_text, voice, audio_config = self._build_request(text, voice_name, output_format)
+        
+        try:
+            # Call the API
+            response = self.client.synthesize_speech(
+                input=input_text,
+                voice=voice,
+                audio_config=audio_config,
+                **self._factory.call_options('text.synthesize_speech')
+            )
+            
+            audio_content = response.audio_content
+            if output_format and output_format.bitrate:
+                audio_content = transcode(audio_content, output_format)
+            return self._build_result(text, audio_content, output_format)
+            
+        except Exception as e:
+            logger.error("Error synthesizing speech: %s", e)
+            raise
+    
+    async def synthesize_speech_async(self, text, voice_name=None, output_format=None):
+        """Async variant of synthesize_speech using the gRPC asyncio client"""
+        input_text, voice, audio_config = self._build_request(text, voice_name, output_format)
+        
+        try:
+            response = await self._factory.async_client('text').synthesize_speech(
+                input=input_text,
+                voice=voice,
+                audio_config=audio_config,
+                **self._factory.call_options('text.synthesize_speech', asynchronous=True)
+            )
+            
+            audio_content = response.audio_content
+            if output_format and output_format.bitrate:
+                audio_content = await transcode_async(audio_content, output_format)
+            return self._build_result(text, audio_content, output_format)
+            
+        except Exception as e:
+            logger.error("Error synthesizing speech: %s", e)
+            raise
+    
+    def _build_result(self, text, audio_content, output_format=None):
+        # Generate a filename
+        file_name = f"tts_{hash(text) % 10000}{(output_format or OutputFormat()).extension}"
+        
+        logger.info("Successfully synthesized speech, %s bytes", len(audio_content), extra={'sample': True})
+        
+        return file_name, audio_content
+    
+    def _build_request(self, text, voice_name=None, output_format=None):
+        """Build the (input, voice, audio_config) synthesis request parameters"""
+        logger.info("Synthesizing text to speech: '%s'", log_text(text), extra={'sample': True})
+        
+        from google.cloud import texttospeech
         
         # Prepare input text
         input_text = texttospeech.SynthesisInput(text=text)
@@ -92,30 +165,18 @@ class TextService:
                 name="en-US-Neural2-F"  # Modern neural voice
             )
         
-        # Set audio format
+        # Set audio format; for a bitrate, uncompressed audio is requested and encoded after
+        output_format = output_format or OutputFormat()
+        if output_format.bitrate:
+            audio_encoding = texttospeech.AudioEncoding.LINEAR16
+        else:
+            audio_encoding = texttospeech.AudioEncoding[NATIVE_ENCODINGS[output_format.name]]
         audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
+            audio_encoding=audio_encoding,
             speaking_rate=1.0,  # Normal speed
             pitch=0.0,  # Normal pitch
             volume_gain_db=0.0,  # Normal volume
-            sample_rate_hertz=24000  # High quality
+            sample_rate_hertz=output_format.sample_rate or 24000  # High quality by default
         )
         
-        try:
-            # Call the API
-            response = self.client.synthesize_speech(
-                input=input_text,
-                voice=voice,
-                audio_config=audio_config
-            )
-            
-            # Generate a filename
-            file_name = f"tts_{hash(text) % 10000}.mp3"
-            
-            logger.info(f"Successfully synthesized speech, {len(response.audio_content)} bytes")
-            
-            return file_name, response.audio_content
-            
-        except Exception as e:
-            logger.error(f"Error synthesizing speech: {str(e)}")
-            raise
\ No newline at end of file
+        return input_text, voice, audio_config
\ No newline at end of file
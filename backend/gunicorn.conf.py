@@ -0,0 +1,47 @@
+"""
+gunicorn settings, read automatically when gunicorn is started from this directory
+
+Preload mode loads Whisper, spaCy and the other services once in the master
+and forks the workers from it, so model weights are shared copy-on-write
+instead of loaded per worker (see utils/prefork.py):
+
+    PRELOAD_MODELS=true gunicorn -w 4 app:app
+
+Without it every worker imports app.py and loads its own models; the hooks
+below then only install the drain-on-SIGTERM handler (utils/lifecycle.py).
+"""
+import os
+import sys
+
+from utils import prefork
+
+preload_app = os.environ.get('PRELOAD_MODELS', 'false').lower() == 'true' or '--preload' in sys.argv
+# Longer than the drain deadline, so a draining worker is not killed
+graceful_timeout = int(float(os.environ.get('SHUTDOWN_TIMEOUT', '20'))) + 10
+
+if preload_app:
+    # Runs as gunicorn reads this file, before the master imports app.py
+    prefork.prepare_master()
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        prefork.log_memory(f"Master {os.getpid()} with models loaded")
+
+
+def pre_fork(server, worker):
+    if server.cfg.preload_app:
+        prefork.before_fork()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        # Split the cores between the workers unless TORCH_THREADS says otherwise
+        prefork.after_fork(os.environ.get('TORCH_THREADS') or max(1, (os.cpu_count() or 1) // server.cfg.workers))
+
+
+def post_worker_init(worker):
+    import app
+    # gunicorn has just installed the worker's own signal handlers; drain before they run
+    app.lifecycle.install_signal_handlers()
+    prefork.log_memory(f"Worker {worker.pid} booted")
@@ -0,0 +1,463 @@
+# open_source_services/diarization.py
+import logging
+import os
+import subprocess
+import time
+
+import numpy as np
+
+from utils.providers import analyze_sentiment_batch
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+# 25 ms frames every 10 ms, as for speech recognition features
+FRAME_LENGTH = 400
+FRAME_HOP = 160
+N_FFT = 512
+N_MELS = 40
+N_MFCC = 20
+
+
+def _mel_filterbank(n_mels=N_MELS, n_fft=N_FFT, sample_rate=SAMPLE_RATE, low_hz=20.0, high_hz=7600.0):
+    """Triangular HTK mel filters as an (n_fft // 2 + 1, n_mels) matrix"""
+    def to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    mel_points = np.linspace(to_mel(low_hz), to_mel(high_hz), n_mels + 2)
+    hz_points = 700.0 * (10 ** (mel_points / 2595.0) - 1.0)
+    bins = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+    lower, center, upper = hz_points[:-2, None], hz_points[1:-1, None], hz_points[2:, None]
+    rising = (bins - lower) / (center - lower)
+    falling = (upper - bins) / (upper - center)
+    return np.maximum(0.0, np.minimum(rising, falling)).T.astype(np.float32)
+
+
+def _dct_matrix(n_mels=N_MELS, n_mfcc=N_MFCC):
+    """Orthonormal DCT-II as an (n_mels, n_mfcc) matrix"""
+    n = np.arange(n_mels)
+    k = np.arange(n_mfcc)[:, None]
+    dct = np.cos(np.pi / n_mels * (n + 0.5) * k) * np.sqrt(2.0 / n_mels)
+    dct[0] /= np.sqrt(2.0)
+    return dct.T.astype(np.float32)
+
+
+def stream_audio(audio_file, block_seconds=30.0):
+    """
+    Decode an audio file with ffmpeg into blocks of 16 kHz mono float32 samples
+
+    Only one block is in memory at a time, whatever the length of the file.
+    """
+    process = subprocess.Popen(
+        ['ffmpeg', '-nostdin', '-v', 'error', '-i', audio_file, '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), '-'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    block_bytes = int(block_seconds * SAMPLE_RATE) * 2
+    decoded = 0
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            decoded += len(data)
+            yield np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        error = process.stderr.read().decode('utf-8', 'replace').strip()
+        process.stderr.close()
+        process.wait()
+    if not decoded and process.returncode:
+        raise RuntimeError(f"ffmpeg could not decode {audio_file}: {error}")
+
+
+class DiarizationStream:
+    """Incremental diarization state: feed blocks of samples, then finish() for speaker turns"""
+
+    def __init__(self, service, num_speakers=None):
+        self.service = service
+        self.num_speakers = num_speakers
+        self._samples = np.zeros(0, dtype=np.float32)  # Tail not yet framed
+        self._frames = np.zeros((0, N_MFCC), dtype=np.float32)  # Frame features not yet windowed
+        self._next_window = 0  # Index of the first window not yet embedded
+        self._frame_offset = 0  # Global index of self._frames[0]
+        self.total_samples = 0
+        # Running sums over voiced window embeddings, to standardize them
+        self._stat_count = 0
+        self._stat_sum = np.zeros(N_MFCC - 1)
+        self._stat_squares = np.zeros(N_MFCC - 1)
+        # Micro-clusters, kept as sums of embeddings so merging them is exact
+        self._centroid_sums = np.zeros((0, N_MFCC - 1))
+        self._centroid_counts = np.zeros(0)
+        # One label per window: micro-cluster index, or -1 for silence
+        self._labels = []
+
+    def _frame_features(self, samples):
+        """One row per complete frame: 1 for voiced frames in column 0, their MFCCs 1.. in the others (zero if silent)"""
+        if len(samples) < FRAME_LENGTH:
+            return np.zeros((0, N_MFCC), dtype=np.float32), samples
+        count = 1 + (len(samples) - FRAME_LENGTH) // FRAME_HOP
+        frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_LENGTH)[::FRAME_HOP][:count]
+        power = np.abs(np.fft.rfft(frames * self.service.window, n=N_FFT)) ** 2 / N_FFT
+        mfcc = np.log(power @ self.service.mel_filters + 1e-10) @ self.service.dct
+        # MFCC 0 tracks loudness, not the speaker; its column flags voiced frames instead. Silent frames
+        # are zeroed so window sums only count speech, not the background of pauses
+        voiced = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10) > self.service.silence_db
+        mfcc[:, 0] = 1.0
+        mfcc *= voiced[:, None]
+        return mfcc.astype(np.float32), samples[count * FRAME_HOP:]
+
+    def feed(self, samples):
+        """Add the next block of samples"""
+        self.total_samples += len(samples)
+        frames, self._samples = self._frame_features(np.concatenate((self._samples, samples)))
+        self._frames = np.concatenate((self._frames, frames))
+
+        window, hop = self.service.window_frames, self.service.hop_frames
+        first = self._next_window * hop - self._frame_offset
+        count = max(0, (len(self._frames) - first - window) // hop + 1)
+        if count:
+            # Mean MFCCs over the voiced frames of each window, from cumulative sums, all windows at once
+            frames = self._frames[first:first + (count - 1) * hop + window].astype(np.float64)
+            sums = np.vstack((np.zeros(N_MFCC), np.cumsum(frames, axis=0)))
+            starts = np.arange(count) * hop
+            totals = sums[starts + window] - sums[starts]
+            voiced = totals[:, 0] >= window / 2
+            self._cluster(totals[:, 1:] / np.maximum(totals[:, :1], 1.0), voiced)
+            self._next_window += count
+
+        # Keep only the frames later windows still need
+        keep_from = self._next_window * hop - self._frame_offset
+        self._frames = self._frames[keep_from:]
+        self._frame_offset += keep_from
+
+    def _normalized(self, embeddings):
+        mean = self._stat_sum / self._stat_count
+        std = np.sqrt(np.maximum(self._stat_squares / self._stat_count - mean ** 2, 1e-8))
+        standardized = (embeddings - mean) / std
+        return standardized / np.maximum(np.linalg.norm(standardized, axis=1, keepdims=True), 1e-8)
+
+    def _cluster(self, embeddings, voiced):
+        """Assign this block's windows to micro-clusters, opening new ones for windows unlike any"""
+        labels = np.full(len(embeddings), -1)
+        voiced_embeddings = embeddings[voiced]
+        if len(voiced_embeddings):
+            self._stat_count += len(voiced_embeddings)
+            self._stat_sum += voiced_embeddings.sum(axis=0)
+            self._stat_squares += (voiced_embeddings ** 2).sum(axis=0)
+
+            normalized = self._normalized(voiced_embeddings)
+            assigned = np.full(len(normalized), -1)
+            best = np.full(len(normalized), -np.inf)
+            if len(self._centroid_counts):
+                similarity = normalized @ self._normalized(self._centroid_sums / self._centroid_counts[:, None]).T
+                assigned = similarity.argmax(axis=1)
+                best = similarity.max(axis=1)
+            # Seed new micro-clusters from the windows least like the existing ones, one vectorized pass each
+            while (best < self.service.cluster_threshold).any():
+                seed = int(np.argmin(best))
+                self._centroid_sums = np.vstack((self._centroid_sums, voiced_embeddings[seed]))
+                self._centroid_counts = np.append(self._centroid_counts, 0.0)
+                similarity = normalized @ normalized[seed]
+                closer = similarity > best
+                assigned[closer] = len(self._centroid_counts) - 1
+                best[closer] = similarity[closer]
+                best[seed] = np.inf
+
+            np.add.at(self._centroid_sums, assigned, voiced_embeddings)
+            self._centroid_counts += np.bincount(assigned, minlength=len(self._centroid_counts))
+            labels[voiced] = assigned
+        self._labels.extend(labels.tolist())
+        while len(self._centroid_counts) > self.service.max_clusters:
+            self._merge_closest()
+
+    def _merge_closest(self):
+        """Merge the two most similar micro-clusters, relabelling past windows"""
+        normalized = self._normalized(self._centroid_sums / self._centroid_counts[:, None])
+        similarity = normalized @ normalized.T
+        np.fill_diagonal(similarity, -np.inf)
+        keep, drop = sorted(np.unravel_index(np.argmax(similarity), similarity.shape))
+        self._centroid_sums[keep] += self._centroid_sums[drop]
+        self._centroid_counts[keep] += self._centroid_counts[drop]
+        self._centroid_sums = np.delete(self._centroid_sums, drop, axis=0)
+        self._centroid_counts = np.delete(self._centroid_counts, drop)
+        labels = np.asarray(self._labels)
+        labels[labels == drop] = keep
+        labels[labels > drop] -= 1
+        self._labels = labels.tolist()
+
+    def _speakers(self):
+        """Group micro-clusters into speakers by average-linkage agglomerative clustering"""
+        count = len(self._centroid_counts)
+        if not count:
+            return np.zeros(0, dtype=int)
+        normalized = self._normalized(self._centroid_sums / self._centroid_counts[:, None])
+        similarity = normalized @ normalized.T
+        weights = self._centroid_counts.copy()
+        sums = self._centroid_sums.copy()
+        groups = [[i] for i in range(count)]
+        np.fill_diagonal(similarity, -np.inf)
+        target = self.num_speakers or 1
+        while len(groups) > target:
+            i, j = sorted(np.unravel_index(np.argmax(similarity), similarity.shape))
+            too_many = len(groups) > (self.num_speakers or self.service.max_speakers)
+            if not self.num_speakers and not too_many and similarity[i, j] < self.service.speaker_threshold:
+                # Similarity is relative to the spread of the recording, so with one voice any split
+                # looks distinct; groups whose mean spectra are close in absolute terms are one voice
+                # heard at different levels
+                centroids = sums / weights[:, None]
+                distance = np.linalg.norm(centroids[:, None] - centroids[None], axis=2)
+                np.fill_diagonal(distance, np.inf)
+                i, j = sorted(np.unravel_index(np.argmin(distance), distance.shape))
+                if distance[i, j] >= self.service.min_speaker_distance:
+                    # Tiny groups (a cough, crosstalk) are folded into their closest speaker all the same
+                    seconds = weights * self.service.hop_seconds
+                    minimum = max(self.service.min_speaker_seconds, self.service.min_speaker_share * seconds.sum())
+                    small = np.flatnonzero(seconds < minimum)
+                    if not len(small):
+                        break
+                    i = int(small[np.argmin(seconds[small])])
+                    j = int(np.argmax(similarity[i]))
+                    i, j = min(i, j), max(i, j)
+            # Average linkage: the merged group's similarity is the weighted mean of its parts'
+            merged = (similarity[i] * weights[i] + similarity[j] * weights[j]) / (weights[i] + weights[j])
+            similarity[i, :] = merged
+            similarity[:, i] = merged
+            similarity[i, i] = -np.inf
+            similarity = np.delete(np.delete(similarity, j, axis=0), j, axis=1)
+            weights[i] += weights[j]
+            weights = np.delete(weights, j)
+            sums[i] += sums[j]
+            sums = np.delete(sums, j, axis=0)
+            groups[i].extend(groups.pop(j))
+
+        speaker_of = np.zeros(count, dtype=int)
+        for speaker, members in enumerate(groups):
+            speaker_of[members] = speaker
+        return speaker_of
+
+    def finish(self):
+        """
+        Speaker turns for everything fed so far
+
+        Returns:
+            dict: speakers (in order of first appearance), turns with
+                  speaker/start/end in seconds, and speaking time per speaker
+        """
+        labels = np.asarray(self._labels, dtype=int)
+        speaker_of = self._speakers()
+        speakers = np.where(labels >= 0, speaker_of[np.maximum(labels, 0)] if len(speaker_of) else -1, -1)
+
+        # Majority of each window and its neighbours, so single windows do not flip speakers
+        if len(speakers) > 2:
+            padded = np.concatenate(([speakers[0]], speakers, [speakers[-1]]))
+            left, middle, right = padded[:-2], padded[1:-1], padded[2:]
+            smoothed = np.where((left == right) & (left >= 0) & (middle >= 0), left, middle)
+            speakers = smoothed
+
+        # Each window speaks for the hop at its centre
+        hop, window = self.service.hop_seconds, self.service.window_seconds
+        duration = self.total_samples / SAMPLE_RATE
+        starts = np.arange(len(speakers)) * hop + (window - hop) / 2
+        starts[:1] = 0.0
+        ends = np.minimum(np.append(starts[1:], duration), duration)
+
+        turns = []
+        names = {}
+        for speaker, start, end in zip(speakers.tolist(), starts.tolist(), ends.tolist()):
+            if speaker < 0:
+                continue
+            name = names.setdefault(speaker, f"SPEAKER_{len(names) + 1}")
+            if turns and turns[-1]["speaker"] == name and start - turns[-1]["end"] <= hop + 1e-6:
+                turns[-1]["end"] = round(end, 2)
+            else:
+                turns.append({"speaker": name, "start": round(start, 2), "end": round(end, 2)})
+
+        speaking_time = {}
+        for turn in turns:
+            speaking_time[turn["speaker"]] = round(speaking_time.get(turn["speaker"], 0.0) + turn["end"] - turn["start"], 2)
+        return {
+            "speakers": list(names.values()),
+            "turns": turns,
+            "speaking_time": speaking_time,
+            "audio_seconds": round(duration, 2)
+        }
+
+
+class DiarizationService:
+    """CPU-only speaker diarization: who spoke when, from window embeddings clustered with NumPy"""
+
+    def __init__(self, window_seconds=1.5, hop_seconds=0.75, max_speakers=None, silence_db=None,
+                 cluster_threshold=0.5, speaker_threshold=0.1, min_speaker_distance=6.0, max_clusters=32,
+                 min_speaker_seconds=3.0, min_speaker_share=0.01):
+        """
+        Initialize the diarizer
+
+        Each window is described by its mean MFCCs (the spectral envelope,
+        which follows the speaker's vocal tract rather than the words) and
+        assigned on the fly to a bounded set of micro-clusters, which are
+        grouped into speakers once the recording ends. Memory is bounded by
+        the block size and the number of micro-clusters, plus one label per
+        window. This is a spectral baseline rather than a trained speaker
+        embedding: it separates distinct voices on clean calls, but similar
+        voices or heavy overlap will be merged.
+
+        Args:
+            window_seconds: Length of audio described by one embedding
+            hop_seconds: Step between windows, the resolution of speaker turns
+            max_speakers: Most speakers reported, default DIARIZATION_MAX_SPEAKERS or 4
+            silence_db: Frames quieter than this (dBFS) are silence, and windows
+                        mostly silent are not attributed; default
+                        DIARIZATION_SILENCE_DB or -45
+            cluster_threshold: Cosine similarity below which a window opens a new micro-cluster
+            speaker_threshold: Cosine similarity below which micro-clusters stay separate speakers
+            min_speaker_distance: Euclidean distance between mean MFCCs below which groups are one
+                                  speaker whatever their similarity
+            max_clusters: Micro-clusters kept while streaming
+            min_speaker_seconds: Speakers with less speech are merged into the closest one
+            min_speaker_share: Same, as a share of all speech, for long recordings
+        """
+        self.window_seconds = window_seconds
+        self.hop_seconds = hop_seconds
+        self.window_frames = int(round(window_seconds * SAMPLE_RATE / FRAME_HOP))
+        self.hop_frames = int(round(hop_seconds * SAMPLE_RATE / FRAME_HOP))
+        self.max_speakers = max_speakers or int(os.environ.get('DIARIZATION_MAX_SPEAKERS', '4'))
+        self.silence_db = silence_db if silence_db is not None else float(os.environ.get('DIARIZATION_SILENCE_DB', '-45'))
+        self.cluster_threshold = cluster_threshold
+        self.speaker_threshold = speaker_threshold
+        self.min_speaker_distance = min_speaker_distance
+        self.max_clusters = max_clusters
+        self.min_speaker_seconds = min_speaker_seconds
+        self.min_speaker_share = min_speaker_share
+        self.window = np.hamming(FRAME_LENGTH).astype(np.float32)
+        self.mel_filters = _mel_filterbank()
+        self.dct = _dct_matrix()
+
+    def stream(self, num_speakers=None):
+        """Start an incremental diarization, for audio that arrives in blocks"""
+        return DiarizationStream(self, num_speakers)
+
+    def diarize(self, audio, num_speakers=None, block_seconds=30.0):
+        """
+        Diarize a recording
+
+        Args:
+            audio: Path to an audio file (decoded in blocks with ffmpeg), an
+                   array of 16 kHz mono samples (e.g. from decode_audio), or
+                   an iterable of such arrays
+            num_speakers: Number of speakers if known, otherwise estimated
+            block_seconds: Audio processed per step when decoding a file or
+                           splitting an array
+
+        Returns:
+            dict: speakers, turns, speaking_time, audio_seconds and processing_time
+        """
+        start_time = time.time()
+        if isinstance(audio, str):
+            blocks = stream_audio(audio, block_seconds)
+        elif isinstance(audio, np.ndarray):
+            step = int(block_seconds * SAMPLE_RATE)
+            blocks = (audio[i:i + step] for i in range(0, len(audio), step))
+        else:
+            blocks = audio
+
+        stream = self.stream(num_speakers)
+        for block in blocks:
+            stream.feed(np.asarray(block, dtype=np.float32))
+        result = stream.finish()
+        result["processing_time"] = round(time.time() - start_time, 3)
+        logger.info("Diarized %.0f seconds of audio into %s speakers in %.2f seconds",
+                    result["audio_seconds"], len(result["speakers"]), result["processing_time"])
+        return result
+
+
+def assign_speakers(segments, turns):
+    """
+    Label transcript segments with the speaker who talks most during them
+
+    Segments that overlap no turn get the speaker of the nearest one.
+
+    Args:
+        segments: Segments in the shared transcript schema, updated in place
+        turns: Turns from DiarizationService.diarize
+
+    Returns:
+        list: The segments
+    """
+    if not turns:
+        return segments
+    starts = np.array([turn["start"] for turn in turns])
+    ends = np.array([turn["end"] for turn in turns])
+    names = [turn["speaker"] for turn in turns]
+    speakers = sorted(set(names))
+    speaker_index = np.array([speakers.index(name) for name in names])
+    for segment in segments:
+        if segment.get("start") is None:
+            continue
+        start, end = segment["start"], segment.get("end") or segment["start"]
+        overlap = np.clip(np.minimum(ends, end) - np.maximum(starts, start), 0.0, None)
+        if overlap.any():
+            segment["speaker"] = speakers[int(np.argmax(np.bincount(speaker_index, overlap, len(speakers))))]
+        else:
+            distance = np.maximum(starts - end, start - ends)
+            segment["speaker"] = names[int(np.argmin(distance))]
+    return segments
+
+
+def speaker_sentiment(segments, sentiment_service):
+    """
+    Sentiment of each speaker's words, from segments labelled by assign_speakers
+
+    Args:
+        segments: Segments with a "speaker" key
+        sentiment_service: SentimentProvider scoring each speaker's words
+
+    Returns:
+        dict: Speaker -> sentiment result
+    """
+    texts = {}
+    for segment in segments:
+        if segment.get("speaker") and segment.get("text", "").strip():
+            texts.setdefault(segment["speaker"], []).append(segment["text"].strip())
+    names = list(texts)
+    results = analyze_sentiment_batch(sentiment_service, [" ".join(texts[name]) for name in names])
+    return dict(zip(names, results))
+
+
+def diarize_transcript(diarizer, audio, segments, sentiment_service=None, num_speakers=None):
+    """
+    Diarize a recording and label its transcript segments with speakers
+
+    Args:
+        diarizer: DiarizationService
+        audio: Audio file path or decoded samples, as for DiarizationService.diarize
+        segments: Transcript segments, labelled with a "speaker" key in place
+        sentiment_service: If given, each speaker's words are scored separately
+        num_speakers: Number of speakers if known
+
+    Returns:
+        dict: success, speakers (speaking time, segments and sentiment per
+              speaker), turns, audio_seconds and processing_time, or an error
+    """
+    try:
+        result = diarizer.diarize(audio, num_speakers=num_speakers)
+        assign_speakers(segments, result["turns"])
+        sentiments = speaker_sentiment(segments, sentiment_service) if sentiment_service else {}
+        speakers = {}
+        for name in result["speakers"]:
+            speakers[name] = {
+                "speaking_time": result["speaking_time"].get(name, 0.0),
+                "segments": sum(1 for segment in segments if segment.get("speaker") == name),
+                "sentiment": sentiments.get(name)
+            }
+        return {
+            "success": True,
+            "speakers": speakers,
+            "turns": result["turns"],
+            "audio_seconds": result["audio_seconds"],
+            "processing_time": result["processing_time"]
+        }
+    except Exception as e:
+        logger.error("Error in diarization: %s", e)
+        return {"success": False, "error": str(e)}
@@ -0,0 +1,249 @@
+import importlib.util
+import logging
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+from itertools import chain, repeat
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Same rules as TextBlob's pattern analyzer, which spacytextblob uses
+NEGATIONS = ("no", "not", "n't", "never")
+# Adverbs scale the polarity of the next known word ("very good")
+MODIFIER_POS = "RB"
+EXCLAMATION_BOOST = 1.25
+
+# Sentence ends at ., ! or ? (plus closing quotes/brackets) followed by whitespace
+_SENTENCE_END = re.compile(r'(?<=[.!?])["\')\]]*\s+')
+# Tokens are whitespace-separated, as in pattern's tokenizer: punctuation is split off the edges of
+# words (but kept inside them, "int(x"), "!" stands alone, contractions are split ("is n't") and then,
+# as TextBlob does, every apostrophe is a token of its own ("is n ' t"). So "n't" never reaches the
+# negation rule: TextBlob scores "it isn't great" as "great", and so does this engine
+_EDGE_PUNCTUATION = re.compile(r"""(?<!\S)[(\[{"'`]+|[)\]}"'`.,;:?]+(?!\S)""")
+_CONTRACTION = re.compile(r"(n't|'(?:s|re|ll|ve|d|m))\b")
+
+# Flags of the rows in the lookup table
+_KNOWN, _MODIFIER, _LY_MODIFIER, _NEGATION, _EXCLAMATION = 1, 2, 4, 8, 16
+
+
+def default_lexicon_path():
+    """TextBlob's English subjectivity lexicon, installed with spacytextblob"""
+    spec = importlib.util.find_spec('textblob')
+    if spec is None or not spec.submodule_search_locations:
+        raise FileNotFoundError("textblob is not installed; set FAST_SENTIMENT_LEXICON to an en-sentiment.xml file")
+    return os.path.join(spec.submodule_search_locations[0], 'en', 'en-sentiment.xml')
+
+
+def _label(score, threshold):
+    if score >= threshold:
+        return "positive"
+    if score <= -threshold:
+        return "negative"
+    return "neutral"
+
+
+class FastSentimentService:
+    """Lexicon sentiment scorer, a fast alternative to OpenSourceSentimentService"""
+
+    def __init__(self, lexicon_path=None):
+        """
+        Compile the lexicon into a lookup table
+
+        Scores follow TextBlob's pattern analyzer, which is what
+        OpenSourceSentimentService reports: the average polarity and
+        subjectivity of the known words, where an adverb scales the next
+        word ("very good"), a negation flips and halves it ("not good") and
+        an exclamation mark boosts it. Like TextBlob, contractions ("isn't",
+        "wasn't") do not negate; only "no", "not" and "never" do. Emoticons are not scored, and
+        sentences are split on punctuation rather than by spaCy's parser,
+        so the per-sentence breakdown can differ.
+
+        Args:
+            lexicon_path: en-sentiment.xml in pattern's format, default
+                          FAST_SENTIMENT_LEXICON or TextBlob's copy
+        """
+        path = lexicon_path or os.environ.get('FAST_SENTIMENT_LEXICON') or default_lexicon_path()
+        senses = {}
+        for word in ElementTree.parse(path).getroot().iter('word'):
+            form = word.get('form')
+            if form:
+                senses.setdefault(form, {}).setdefault(word.get('pos'), []).append(
+                    (float(word.get('polarity', 0.0)), float(word.get('subjectivity', 0.0)),
+                     float(word.get('intensity', 1.0)))
+                )
+
+        # Senses averaged per part of speech, then across parts of speech
+        per_pos = {form: {pos: tuple(np.mean(values, axis=0)) for pos, values in tags.items()}
+                   for form, tags in senses.items()}
+        scores = {form: tuple(np.mean(list(tags.values()), axis=0)) for form, tags in per_pos.items()}
+        modifiers = {form for form, tags in per_pos.items() if MODIFIER_POS in tags}
+        # Adjectives also score as their adverbs ("terrible" -> "terribly"), as TextBlob does
+        for form, tags in list(per_pos.items()):
+            if "JJ" in tags:
+                stem = form[:-1] + "i" if form.endswith("y") else form
+                stem = stem[:-2] if stem.endswith("le") else stem
+                scores[stem + "ly"] = tags["JJ"]
+                modifiers.add(stem + "ly")
+
+        # One row per known word, then negations and "!" if not known; unknown tokens map to -1, the last row
+        words = list(scores)
+        extra = [token for token in NEGATIONS + ("!",) if token not in scores]
+        size = len(words) + len(extra) + 1
+        self.polarity = np.zeros(size)
+        self.subjectivity = np.zeros(size)
+        self.intensity = np.ones(size)
+        self.flags = np.zeros(size, dtype=np.uint8)
+        for row, form in enumerate(words):
+            self.polarity[row], self.subjectivity[row], self.intensity[row] = scores[form]
+            self.flags[row] = _KNOWN
+            if form in modifiers:
+                self.flags[row] |= _MODIFIER | (_LY_MODIFIER if form.endswith("ly") else 0)
+        self.index = {form: row for row, form in enumerate(words + extra)}
+        for token in NEGATIONS:
+            self.flags[self.index[token]] |= _NEGATION
+        self.flags[self.index["!"]] |= _EXCLAMATION
+        logger.info("Compiled sentiment lexicon with %s words from %s", len(words), path)
+
+    @staticmethod
+    def split_sentences(text):
+        return [sentence for sentence in _SENTENCE_END.split(text.strip()) if sentence]
+
+    @staticmethod
+    def tokenize(text):
+        text = _EDGE_PUNCTUATION.sub(" ", text.lower().replace("!", " ! "))
+        return _CONTRACTION.sub(r" \1", text).replace("'", " ' ").split()
+
+    def _score(self, texts):
+        """
+        Polarity and subjectivity of many texts in one vectorized pass
+
+        Returns:
+            tuple: Arrays of polarity and subjectivity, one entry per text
+        """
+        token_lists = [self.tokenize(text) for text in texts]
+        counts = np.fromiter(map(len, token_lists), dtype=np.int64, count=len(token_lists))
+        tokens = list(chain.from_iterable(token_lists))
+        total = len(tokens)
+
+        ids = np.fromiter(map(self.index.get, tokens, repeat(-1)), dtype=np.int64, count=total)
+        lengths = np.fromiter(map(len, tokens), dtype=np.int64, count=total)
+        flags = self.flags[ids]
+        known = (flags & _KNOWN) > 0
+        unknown = ~known
+        negation = unknown & ((flags & _NEGATION) > 0)
+        positions = np.arange(total)
+        text_of = np.repeat(np.arange(len(texts)), counts)
+        text_start = np.repeat(np.cumsum(counts) - counts, counts)
+
+        def last_before(mask):
+            # Index of the nearest earlier token in the same text matching mask, else -1
+            last = np.full(total, -1)
+            last[1:] = np.maximum.accumulate(np.where(mask, positions, -1))[:-1]
+            return np.where(last >= text_start, last, -1)
+
+        # A known adverb modifies what follows; unknown words of up to two letters do not break the link
+        previous_known = last_before(known)
+        after_modifier = (previous_known >= 0) & ((flags[previous_known] & _MODIFIER) > 0)
+        # "really not good": a negation right after an -ly adverb negates the adverb's assessment
+        negates_modifier = (negation & after_modifier & ((flags[previous_known] & _LY_MODIFIER) > 0)
+                            & (last_before(unknown & ~negation & (lengths > 2)) < previous_known))
+        # A known word after a modifier merges into the modifier's assessment ("very good")
+        modified = known & after_modifier & (
+            last_before(unknown & ~negates_modifier & (lengths > 2)) < previous_known
+        )
+        # Other negations carry over to the next known word across one-letter words ("not a good")
+        last_negation = last_before(negation & ~negates_modifier)
+        negated = known & (last_negation >= 0) & (
+            last_negation >= last_before(known | (unknown & ~negation & (lengths > 1)))
+        )
+        # A negated adverb weakens rather than strengthens what follows ("not very good")
+        intensity = self.intensity[ids[previous_known]]
+        scale = np.where(modified, np.where(negated[previous_known], 1.0 / intensity, intensity), 1.0)
+        negated[previous_known[negates_modifier]] = True
+
+        polarity = np.clip(self.polarity[ids] * scale, -1.0, 1.0)
+        subjectivity = np.clip(self.subjectivity[ids] * scale, -1.0, 1.0)
+
+        # One assessment per chain of known words: the values of its last word
+        known_at = np.flatnonzero(known)
+        starts = ~modified[known_at]
+        group = np.cumsum(starts) - 1
+        last_in_group = np.concatenate((group[1:] != group[:-1], [True])) if len(group) else group.astype(bool)
+        assessed = known_at[last_in_group]
+        assessed_polarity = polarity[assessed]
+        assessed_subjectivity = subjectivity[assessed]
+        assessed_negated = np.maximum.reduceat(negated[known_at], np.flatnonzero(starts)) if len(group) else negated[:0]
+
+        # Each "!" boosts the assessment before it
+        group_of = np.full(total, -1)
+        group_of[known_at] = group
+        boosted = previous_known[(flags & _EXCLAMATION) > 0]
+        boosts = np.bincount(group_of[boosted[boosted >= 0]], minlength=len(assessed))
+        assessed_polarity = np.clip(assessed_polarity * EXCLAMATION_BOOST ** boosts, -1.0, 1.0)
+        # "not good" is slightly bad, "not bad" slightly good
+        assessed_polarity = np.where(assessed_negated, assessed_polarity * -0.5, assessed_polarity)
+
+        assessed_text = text_of[assessed]
+        divisor = np.maximum(np.bincount(assessed_text, minlength=len(texts)), 1)
+        return (np.bincount(assessed_text, assessed_polarity, len(texts)) / divisor,
+                np.bincount(assessed_text, assessed_subjectivity, len(texts)) / divisor)
+
+    def analyze_sentiment(self, text):
+        """Analyze the sentiment of text with the lexicon"""
+        return self.analyze_sentiment_batch([text], include_sentences=True)[0]
+
+    def analyze_sentiment_batch(self, texts, include_sentences=False):
+        """
+        Analyze the sentiment of many texts in one vectorized pass
+
+        Args:
+            texts: List of texts to analyze
+            include_sentences: Also return the per-sentence breakdown
+
+        Returns:
+            list: One result dict per text, in input order, in the same
+                  schema as OpenSourceSentimentService
+        """
+        results = [{"success": False, "error": "Text too short for sentiment analysis", "input_error": True} for _ in texts]
+        valid = [(i, text) for i, text in enumerate(texts) if text and len(text) >= 3]
+        if not valid:
+            return results
+
+        try:
+            # Sentences are scored on their own, like spacytextblob does, in the same pass as the texts
+            segments = [text for _, text in valid]
+            sentence_lists = [self.split_sentences(text) for text in segments] if include_sentences else []
+            segments.extend(chain.from_iterable(sentence_lists))
+            polarity, subjectivity = (values.tolist() for values in self._score(segments))
+
+            offset = len(valid)
+            for n, (i, _) in enumerate(valid):
+                score = polarity[n]
+                result = {
+                    "success": True,
+                    "score": score,
+                    "magnitude": subjectivity[n],
+                    "sentiment": _label(score, 0.1),
+                    "confidence": min(abs(score) * 2, 1.0)
+                }
+                if include_sentences:
+                    result["sentences"] = [
+                        {
+                            "text": segments[j],
+                            "score": polarity[j],
+                            "magnitude": subjectivity[j],
+                            "sentiment": _label(polarity[j], 0.25)
+                        }
+                        for j in range(offset, offset + len(sentence_lists[n]))
+                    ]
+                    offset += len(sentence_lists[n])
+                results[i] = result
+        except Exception as e:
+            logger.error("Error analyzing sentiment batch: %s", e)
+            for i, _ in valid:
+                if not results[i]["success"]:
+                    results[i] = {"success": False, "error": str(e)}
+
+        return results
@@ -0,0 +1,309 @@
+# open_source_services/model_server.py
+import argparse
+import logging
+import os
+import secrets
+import tempfile
+import threading
+from multiprocessing.managers import BaseManager
+
+from utils.batching import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ADDRESS = os.path.join(os.environ.get('TMPDIR', '/tmp'), 'speech_analysis_models.sock')
+
+
+def parse_address(address):
+    """Parse 'host:port' into a TCP address, anything else is a Unix socket path"""
+    if ':' in address and not address.startswith('/'):
+        host, port = address.rsplit(':', 1)
+        return (host, int(port))
+    return address
+
+
+def key_path(address):
+    """File the server writes a generated authkey to, next to its Unix socket"""
+    return f"{address}.key"
+
+
+def _configured_authkey(address, authkey):
+    # The manager protocol unpickles what clients send, so the authkey is all that stands between
+    # anyone who can connect and code execution on the host; a TCP listener needs a real secret
+    authkey = authkey or os.environ.get('MODEL_SERVER_AUTHKEY')
+    if not authkey and isinstance(address, tuple):
+        raise ValueError("MODEL_SERVER_AUTHKEY must be set when the model server address is host:port")
+    return authkey.encode() if authkey else None
+
+
+def server_authkey(address, authkey=None):
+    """
+    Authkey for the model server at an address
+
+    The configured key (authkey, or MODEL_SERVER_AUTHKEY) if there is one.
+    A Unix socket may run without: a random key is then written to
+    key_path(address), readable only by this user, for clients to read.
+
+    Raises:
+        ValueError: No key is configured and the address is TCP
+    """
+    configured = _configured_authkey(address, authkey)
+    if configured:
+        return configured
+    generated = secrets.token_hex(32).encode()
+    path = key_path(address)
+    if os.path.exists(path):
+        os.remove(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(generated)
+    return generated
+
+
+def client_authkey(address, authkey=None):
+    """
+    Authkey to connect to the model server with: the configured key, or the one it generated
+
+    Raises:
+        ValueError: No key is configured and the address is TCP
+        OSError: No key is configured and the server has not written one
+    """
+    configured = _configured_authkey(address, authkey)
+    if configured:
+        return configured
+    with open(key_path(address), 'rb') as f:
+        return f.read().strip()
+
+
+class ModelServerManager(BaseManager):
+    """Manager run by the model server process"""
+    pass
+
+
+class ModelServerClient(BaseManager):
+    """Manager used by HTTP workers to connect to the model server"""
+    pass
+
+
+ModelServerClient.register('models')
+
+
+class ModelServer:
+    """Owns the open-source models and serves them to many HTTP workers"""
+
+    def __init__(self, speech_service, sentiment_service, max_batch_size=16, max_wait_ms=10,
+                 batched_speech=False):
+        """
+        Initialize the model server
+
+        Args:
+            speech_service: Local OpenSourceSpeechService or BatchingSpeechService
+            sentiment_service: Local OpenSourceSentimentService
+            max_batch_size: Largest sentiment batch run in one spaCy pass
+            max_wait_ms: How long a sentiment request waits for others to batch with
+            batched_speech: speech_service schedules its own batches and
+                            serializes its use of the model, so it can be
+                            called concurrently
+        """
+        self.speech_service = speech_service
+        self.sentiment_service = sentiment_service
+        # Unbatched Whisper already uses every core for one file, so those transcriptions run one at a time
+        self._speech_lock = threading.Lock() if not batched_speech else None
+        self._sentiment_batcher = MicroBatcher(
+            lambda texts: self.sentiment_service.analyze_sentiment_batch(texts, include_sentences=True),
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            name="sentiment-batcher"
+        )
+
+    def ping(self):
+        return True
+
+    def transcribe_audio_bytes(self, audio_content, suffix='.wav', word_timestamps=False):
+        """
+        Transcribe audio sent by a worker
+
+        Workers send the file's content rather than its path, since a worker
+        connected over TCP may not share a filesystem with the server.
+        """
+        fd, path = tempfile.mkstemp(suffix=suffix, prefix='model_server_')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(audio_content)
+            if self._speech_lock is None:
+                return self.speech_service.transcribe_audio(path, word_timestamps=word_timestamps)
+            with self._speech_lock:
+                return self.speech_service.transcribe_audio(path, word_timestamps=word_timestamps)
+        finally:
+            os.remove(path)
+
+    def analyze_sentiment(self, text):
+        # Concurrent requests from all workers are coalesced into one nlp.pipe call
+        return self._sentiment_batcher.call(text)
+
+    def analyze_sentiment_batch(self, texts, include_sentences=False):
+        return self.sentiment_service.analyze_sentiment_batch(texts, include_sentences=include_sentences)
+
+
+# Errors meaning the connection to the model server is gone, e.g. because it restarted
+CONNECTION_ERRORS = (EOFError, OSError)
+
+
+class _RemoteModels:
+    """Lazily connected proxy to a running model server, reconnecting after it restarts"""
+
+    def __init__(self, address=None, authkey=None):
+        self.address = parse_address(address or os.environ.get('MODEL_SERVER_ADDRESS', DEFAULT_ADDRESS))
+        # Checked now, so a worker configured for TCP without a key fails at startup
+        self.authkey = _configured_authkey(self.address, authkey)
+        self._models = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        # Connect on first use so the proxy is always created in the worker process after fork
+        if self._models is None:
+            with self._lock:
+                if self._models is None:
+                    # A generated key is read on every connect, since a restarted server writes a new one
+                    manager = ModelServerClient(address=self.address,
+                                                authkey=self.authkey or client_authkey(self.address))
+                    manager.connect()
+                    self._models = manager.models()
+                    logger.info("Connected to model server at %s", self.address)
+        return self._models
+
+    def call(self, method, *args):
+        """
+        Call a model server method, reconnecting once if the connection is gone
+
+        The proxy is dropped on a connection error, so a restarted server is
+        picked up by the retry here or, if it is not back yet, by the next call.
+        """
+        models = self.get()
+        try:
+            return getattr(models, method)(*args)
+        except CONNECTION_ERRORS as e:
+            logger.warning("Lost connection to model server at %s, reconnecting: %s", self.address, e)
+            self._drop(models)
+        return getattr(self.get(), method)(*args)
+
+    def _drop(self, models):
+        with self._lock:
+            # Another thread may already have reconnected
+            if self._models is models:
+                self._models = None
+
+
+class RemoteSpeechService:
+    """Drop-in replacement for OpenSourceSpeechService backed by the model server"""
+
+    audio_format = 'wav'
+
+    def __init__(self, address=None, authkey=None, remote=None):
+        self._remote = remote or _RemoteModels(address, authkey)
+
+    def transcribe_audio(self, audio_file, word_timestamps=False):
+        if not os.path.exists(audio_file):
+            logger.error("Audio file does not exist: %s", audio_file)
+            return {'success': False, 'error': "Audio file does not exist", 'input_error': True, 'text': None,
+                    'confidence': None, 'model_used': 'Whisper Base'}
+        try:
+            with open(audio_file, 'rb') as f:
+                audio_content = f.read()
+            return self._remote.call('transcribe_audio_bytes', audio_content, os.path.splitext(audio_file)[1],
+                                     word_timestamps)
+        except Exception as e:
+            logger.error("Error calling model server for transcription: %s", e)
+            return {
+                'success': False,
+                'error': str(e),
+                'text': None,
+                'confidence': None,
+                'model_used': 'Whisper Base'
+            }
+
+
+class RemoteSentimentService:
+    """Drop-in replacement for OpenSourceSentimentService backed by the model server"""
+
+    def __init__(self, address=None, authkey=None, remote=None):
+        self._remote = remote or _RemoteModels(address, authkey)
+
+    def analyze_sentiment(self, text):
+        if not text or len(text) < 3:
+            return {"success": False, "error": "Text too short for sentiment analysis", "input_error": True}
+        try:
+            return self._remote.call('analyze_sentiment', text)
+        except Exception as e:
+            logger.error("Error calling model server for sentiment: %s", e)
+            return {"success": False, "error": str(e)}
+
+    def analyze_sentiment_batch(self, texts, include_sentences=False):
+        try:
+            return self._remote.call('analyze_sentiment_batch', texts, include_sentences)
+        except Exception as e:
+            logger.error("Error calling model server for sentiment batch: %s", e)
+            return [{"success": False, "error": str(e)} for _ in texts]
+
+
+def serve(address, authkey=None, max_batch_size=16, max_wait_ms=10, whisper_batch_size=1, whisper_wait_ms=50):
+    """
+    Load the models once and serve them until interrupted
+
+    Raises:
+        ValueError: The address is TCP and no authkey is configured
+    """
+    address = parse_address(address)
+    # Refuse before loading any model
+    _configured_authkey(address, authkey)
+
+    from open_source_services.speech_service import OpenSourceSpeechService
+    from open_source_services.sentiment_service import OpenSourceSentimentService
+
+    speech_service = OpenSourceSpeechService()
+    if whisper_batch_size > 1:
+        from open_source_services.whisper_batching import BatchingSpeechService
+        speech_service = BatchingSpeechService(speech_service, whisper_batch_size, whisper_wait_ms)
+
+    model_server = ModelServer(
+        speech_service,
+        OpenSourceSentimentService(),
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+        batched_speech=whisper_batch_size > 1
+    )
+    ModelServerManager.register('models', callable=lambda: model_server)
+
+    if isinstance(address, str) and os.path.exists(address):
+        os.remove(address)  # Stale socket from a previous run
+
+    manager = ModelServerManager(address=address, authkey=server_authkey(address, authkey))
+    server = manager.get_server()
+    if isinstance(address, str):
+        os.chmod(address, 0o600)
+    logger.info("Model server listening on %s", address)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Serve the open-source models to local HTTP workers")
+    parser.add_argument('--address', default=os.environ.get('MODEL_SERVER_ADDRESS', DEFAULT_ADDRESS),
+                        help="Unix socket path or host:port")
+    parser.add_argument('--authkey', default=os.environ.get('MODEL_SERVER_AUTHKEY'),
+                        help="Required for host:port; a Unix socket without one gets a generated key file")
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=10)
+    parser.add_argument('--whisper-batch-size', type=int, default=int(os.environ.get('WHISPER_BATCH_SIZE', '1')),
+                        help="Batch concurrent Whisper windows; 1 disables batching")
+    parser.add_argument('--whisper-wait-ms', type=float, default=float(os.environ.get('WHISPER_BATCH_WAIT_MS', '50')))
+    args = parser.parse_args()
+    try:
+        _configured_authkey(parse_address(args.address), args.authkey)
+    except ValueError as e:
+        parser.error(str(e))
+    serve(args.address, args.authkey, args.max_batch_size, args.max_wait_ms,
+          args.whisper_batch_size, args.whisper_wait_ms)
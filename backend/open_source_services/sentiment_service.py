@@ -1,13 +1,13 @@
-import spacy
 import logging
-from spacytextblob.spacytextblob import SpacyTextBlob
 
 logger = logging.getLogger(__name__)
 class OpenSourceSentimentService:
     """Service for analyzing sentiment using spaCy with TextBlob"""
    
     def __init__(self):
-        # Load spaCy model and add TextBlob component
+        # Load spaCy model and add TextBlob component; importing spacytextblob registers the component
+        import spacy
+        import spacytextblob.spacytextblob  # noqa: F401
         self.nlp = spacy.load("en_core_web_sm")
         self.nlp.add_pipe("spacytextblob")
         logger.info("Initialized spaCy with TextBlob for sentiment analysis")
@@ -15,58 +15,94 @@ class OpenSourceSentimentService:
     def analyze_sentiment(self, text):
         """Analyze the sentiment of text using spaCy with TextBlob"""
         if not text or len(text) < 3:
-            return {"success": False, "error": "Text too short for sentiment analysis"}
+            return {"success": False, "error": "Text too short for sentiment analysis", "input_error": True}
         
         try:
             # Process the text
             doc = self.nlp(text)
+            return self._build_result(doc)
             
-            # Get the overall polarity (-1 to 1)
-            polarity = doc._.blob.polarity
-            
-            # Get the subjectivity (0 to 1)
-            subjectivity = doc._.blob.subjectivity
+        except Exception as e:
+            logger.error("Error analyzing sentiment: %s", e)
+            return {"success": False, "error": str(e)}
+    
+    def _build_result(self, doc, include_sentences=True):
+        """Build the sentiment response for a processed spaCy doc"""
+        # Get the overall polarity (-1 to 1)
+        polarity = doc._.blob.polarity
+        
+        # Get the subjectivity (0 to 1)
+        subjectivity = doc._.blob.subjectivity
+        
+        # Determine sentiment label
+        if polarity >= 0.1:
+            sentiment_label = "positive"
+        elif polarity <= -0.1:
+            sentiment_label = "negative"
+        else:
+            sentiment_label = "neutral"
+        
+        # Calculate confidence
+        confidence = min(abs(polarity) * 2, 1.0)
+        
+        result = {
+            "success": True,
+            "score": polarity,
+            "magnitude": subjectivity,
+            "sentiment": sentiment_label,
+            "confidence": confidence
+        }
+        if not include_sentences:
+            return result
+        
+        # Process sentences
+        sentences = []
+        for sent in doc.sents:
+            sent_doc = self.nlp(sent.text)
+            sent_polarity = sent_doc._.blob.polarity
             
-            # Determine sentiment label
-            if polarity >= 0.1:
-                sentiment_label = "positive"
-            elif polarity <= -0.1:
-                sentiment_label = "negative"
+            if sent_polarity >= 0.25:
+                sent_label = "positive"
+            elif sent_polarity <= -0.25:
+                sent_label = "negative"
             else:
-                sentiment_label = "neutral"
-            
-            # Calculate confidence
-            confidence = min(abs(polarity) * 2, 1.0)
+                sent_label = "neutral"
             
-            # Process sentences
-            sentences = []
-            for sent in doc.sents:
-                sent_doc = self.nlp(sent.text)
-                sent_polarity = sent_doc._.blob.polarity
-                
-                if sent_polarity >= 0.25:
-                    sent_label = "positive"
-                elif sent_polarity <= -0.25:
-                    sent_label = "negative"
-                else:
-                    sent_label = "neutral"
-                
-                sentences.append({
-                    "text": sent.text,
-                    "score": sent_polarity,
-                    "magnitude": sent_doc._.blob.subjectivity,
-                    "sentiment": sent_label
-                })
-            
-            return {
-                "success": True,
-                "score": polarity,
-                "magnitude": subjectivity,
-                "sentiment": sentiment_label,
-                "confidence": confidence,
-                "sentences": sentences
-            }
+            sentences.append({
+                "text": sent.text,
+                "score": sent_polarity,
+                "magnitude": sent_doc._.blob.subjectivity,
+                "sentiment": sent_label
+            })
+        
+        result["sentences"] = sentences
+        return result
+    
+    def analyze_sentiment_batch(self, texts, include_sentences=False):
+        """
+        Analyze the sentiment of many texts in a single spaCy pass
+        
+        By default the per-sentence breakdown is not computed, which keeps
+        this cheap enough to run over every transcript segment.
+        
+        Args:
+            texts: List of texts to analyze
+            include_sentences: Also compute the per-sentence breakdown
             
+        Returns:
+            list: One result dict per text, in input order
+        """
+        results = [{"success": False, "error": "Text too short for sentiment analysis", "input_error": True} for _ in texts]
+        valid = [(i, text) for i, text in enumerate(texts) if text and len(text) >= 3]
+        
+        try:
+            docs = self.nlp.pipe([text for _, text in valid])
+            for (i, _), doc in zip(valid, docs):
+                results[i] = self._build_result(doc, include_sentences=include_sentences)
         except Exception as e:
-            logger.error(f"Error analyzing sentiment: {str(e)}")
-            return {"success": False, "error": str(e)}
\ No newline at end of file
+            logger.error("Error analyzing sentiment batch: %s", e)
+            for i, _ in valid:
+                if not results[i]["success"]:
+                    results[i] = {"success": False, "error": str(e)}
+        
+        return results
\ No newline at end of file
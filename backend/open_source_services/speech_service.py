@@ -1,82 +1,127 @@
 # open_source_services/speech_service.py
 import logging
 import os
-import whisper
-import ffmpeg
+import threading
+from utils.transcript import build_segment, build_word, logprob_to_confidence, average_confidence
+from utils.logging_config import log_text
+from utils.tracing import span
 
 logger = logging.getLogger(__name__)
 
 class OpenSourceSpeechService:
     """Service for handling speech-to-text conversions using Whisper"""
     
-    def __init__(self):
-        # Initialize the model (you can choose different sizes: "tiny", "base", "small", "medium", "large")
-        self.model = whisper.load_model("base")
-        logger.info("Initialized Whisper model for speech-to-text")
+    # Compare endpoints hand this provider a 16 kHz mono WAV conversion of the upload
+    audio_format = 'wav'
     
-    def transcribe_audio(self, audio_file):
+    def __init__(self, model_name=None, decode_options=None):
+        """
+        Load the Whisper model
+        
+        Args:
+            model_name: Model size ("tiny", "base", "small", "medium", "large"),
+                        default WHISPER_MODEL or "base"
+            decode_options: Extra whisper.transcribe options, e.g. beam_size
+                            or temperature (see benchmarks/stt_eval.py)
+        """
+        self.model_name = model_name or os.environ.get('WHISPER_MODEL', 'base')
+        self.decode_options = decode_options or {}
+        self.model_used = f"Whisper {self.model_name.capitalize()}"
+        # Imported here rather than at module level: whisper brings in torch
+        import whisper
+        self.model = whisper.load_model(self.model_name)
+        # Whisper's kv-cache hooks live on the model, so one transcription decodes at a time;
+        # BatchingSpeechService holds the same lock around its batches
+        self.model_lock = threading.Lock()
+        logger.info("Initialized Whisper %s model for speech-to-text", self.model_name)
+    
+    def decode_audio(self, audio_file):
+        """Decode an audio file to the 16 kHz mono float32 samples transcribe_audio also accepts"""
+        import whisper
+        return whisper.load_audio(audio_file)
+    
+    def transcribe_audio(self, audio_file, word_timestamps=False):
         """
         Transcribe audio using Whisper
         
         Args:
-            audio_file: Path to audio file
+            audio_file: Path to audio file, or samples from decode_audio
+            word_timestamps: Also return per-word start/end offsets
             
         Returns:
             dict: Transcription results
         """
         try:
-            logger.info(f"Transcribing audio file with Whisper: {audio_file}")
-            
-            # Debug: Check if file exists
-            if not os.path.exists(audio_file):
-                logger.error(f"File does not exist: {audio_file}")
-                return {
-                    'success': False,
-                    'error': f"File does not exist: {audio_file}",
-                    'text': None,
-                    'confidence': None,
-                    'model_used': 'Whisper Base'
-                }
-            
-            # Debug: Log file details
-            file_size = os.path.getsize(audio_file)
-            logger.info(f"File size: {file_size} bytes")
+            # Paths are checked here; samples were decoded by the caller (e.g. bulk_transcribe's decode pool)
+            if isinstance(audio_file, str):
+                logger.info("Transcribing audio file with Whisper: %s", audio_file)
+                
+                # Debug: Check if file exists
+                if not os.path.exists(audio_file):
+                    logger.error("File does not exist: %s", audio_file)
+                    return {
+                        'success': False,
+                        'error': f"File does not exist: {audio_file}",
+                        'input_error': True,
+                        'text': None,
+                        'confidence': None,
+                        'model_used': self.model_used
+                    }
+                
+                # Debug: Log file details
+                file_size = os.path.getsize(audio_file)
+                logger.info("File size: %s bytes", file_size)
             
             # Transcribe with Whisper
-            result = self.model.transcribe(audio_file)
+            with self.model_lock, span('whisper.transcribe', word_timestamps=word_timestamps):
+                result = self.model.transcribe(audio_file, word_timestamps=word_timestamps, **self.decode_options)
             
             transcription_text = result["text"]
-            segments = result["segments"]
+            segments = self._normalize_segments(result["segments"], word_timestamps)
             
-            # Calculate average confidence
-
-            try:
-                avg_confidence = sum(segment.get("confidence", 0) for segment in segments) / len(segments) if segments else 0
-            except Exception as e:
-                logger.warning(f"Could not calculate confidence: {str(e)}")
-                avg_confidence = None
-
-            # avg_confidence = sum(segment["confidence"] for segment in segments) / len(segments) if segments else 0
-            if avg_confidence == 0:
-                avg_confidence = None
-            logger.info(f"Successful transcription with Whisper: {transcription_text[:100]}")
-            logger.info(f"Average confidence: {avg_confidence}")
+            # Whisper has no per-segment confidence, derive it from the token log probabilities
+            avg_confidence = average_confidence(segments)
+            logger.info("Successful transcription with Whisper: %s", log_text(transcription_text, 100), extra={'sample': True})
+            logger.info("Average confidence: %s", avg_confidence, extra={'sample': True})
             
             return {
                 'success': True,
                 'text': transcription_text,
                 'confidence': avg_confidence,
-                'model_used': 'Whisper Base',
-                'processing_time': 0.0  # Whisper doesn't provide this, so we use a default
+                'model_used': self.model_used,
+                'processing_time': 0.0,  # Whisper doesn't provide this, so we use a default
+                'segments': segments
             }
             
         except Exception as e:
-            logger.error(f"Error transcribing audio with Whisper: {str(e)}")
-            logger.exception(e)  # Log full stack trace
+            logger.exception("Error transcribing audio with Whisper: %s", e)
             return {
                 'success': False,
                 'error': str(e),
                 'text': None,
                 'confidence': None,
-                'model_used': 'Whisper Base'
-            }
\ No newline at end of file
+                'model_used': self.model_used
+            }
+    
+    def _normalize_segments(self, raw_segments, word_timestamps=False):
+        """Convert Whisper segments to the shared transcript segment schema"""
+        segments = []
+        for index, segment in enumerate(raw_segments):
+            words = None
+            if word_timestamps:
+                words = [
+                    build_word(word["word"].strip(), word["start"], word["end"], word.get("probability"))
+                    for word in segment.get("words", [])
+                ]
+            segments.append(build_segment(
+                segment.get("id", index),
+                segment["text"],
+                segment["start"],
+                segment["end"],
+                confidence=logprob_to_confidence(segment.get("avg_logprob")),
+                avg_logprob=segment.get("avg_logprob"),
+                no_speech_prob=segment.get("no_speech_prob"),
+                compression_ratio=segment.get("compression_ratio"),
+                words=words
+            ))
+        return segments
\ No newline at end of file
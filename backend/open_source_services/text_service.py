@@ -3,10 +3,19 @@ import logging
 import os
 import asyncio
 import tempfile
-import edge_tts
+from utils.logging_config import log_text
+from utils.audio_format import OutputFormat, transcode, transcode_async
 
 logger = logging.getLogger(__name__)
 
+
+def _needs_transcode(output_format):
+    # Edge TTS always returns 24 kHz, 48 kbps MP3
+    return bool(output_format) and not (
+        output_format.name == 'mp3' and output_format.bitrate in (None, 48) and output_format.sample_rate in (None, 24000)
+    )
+
+
 class OpenSourceTextService:
     """Service for handling text-to-speech conversions using Edge TTS"""
     
@@ -14,29 +23,29 @@ class OpenSourceTextService:
         self._available_voices = None
         logger.info("Initialized Edge TTS for text-to-speech")
     
+    async def _fetch_voices(self):
+        # edge_tts (and aiohttp under it) is imported on first use rather than with the app
+        import edge_tts
+        logger.info("Calling edge_tts.list_voices()")
+        voices = await edge_tts.list_voices()
+        logger.info("Successfully retrieved %s voices from Edge TTS", len(voices))
+        
+        return [
+            {
+                "name": voice["ShortName"],
+                "language_codes": [voice["Locale"]],
+                "gender": "FEMALE" if "Female" in voice["Gender"] else "MALE",
+                # Assume all Edge TTS voices are neural/natural
+                "natural": True
+            }
+            for voice in voices
+        ]
+    
     async def _get_voices(self):
         try:
-            logger.info("Calling edge_tts.list_voices()")
-            voices = await edge_tts.list_voices()
-            logger.info(f"Successfully retrieved {len(voices)} voices from Edge TTS")
-            
-            # Let's log a sample voice to see its structure
-            if voices:
-                logger.info(f"Sample voice structure: {voices[0]}")
-            
-            return [
-                {
-                    "name": voice["ShortName"],
-                    "language_codes": [voice["Locale"]],
-                    "gender": "FEMALE" if "Female" in voice["Gender"] else "MALE",
-                    # Assume all Edge TTS voices are neural/natural
-                    "natural": True
-                }
-                for voice in voices
-            ]
+            return await self._fetch_voices()
         except Exception as e:
-            logger.error(f"Error in _get_voices: {str(e)}")
-            logger.exception(e)  # This logs the full stack trace
+            logger.exception("Error in _get_voices: %s", e)
             return [
                 {
                     "name": "en-US-ChristopherNeural",
@@ -52,6 +61,20 @@ class OpenSourceTextService:
                 }
             ]
     
+    def fetch_voices(self):
+        """
+        Fetch the voice list from Edge TTS, bypassing the cache and fallbacks
+        
+        Raises:
+            Exception: The Edge TTS call failed
+        """
+        # A fresh loop, since this may run on a background thread
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self._fetch_voices())
+        finally:
+            loop.close()
+    
     def get_available_voices(self):
         """Get list of available voices for TTS"""
         if self._available_voices is None:
@@ -67,10 +90,9 @@ class OpenSourceTextService:
                 # Run the coroutine in the event loop
                 self._available_voices = loop.run_until_complete(self._get_voices())
                 
-                logger.info(f"Retrieved {len(self._available_voices)} available voices")
+                logger.info("Retrieved %s available voices", len(self._available_voices))
             except Exception as e:
-                logger.error(f"Error retrieving available voices: {str(e)}")
-                logger.exception(e)
+                logger.exception("Error retrieving available voices: %s", e)
                 # Provide fallback voices
                 self._available_voices = [
                     {
@@ -86,7 +108,7 @@ class OpenSourceTextService:
                         "natural": True
                     }
                 ]
-                logger.info(f"Using {len(self._available_voices)} fallback voices")
+                logger.info("Using %s fallback voices", len(self._available_voices))
         
         return self._available_voices
     
@@ -94,24 +116,27 @@ class OpenSourceTextService:
         with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_file:
             temp_path = temp_file.name
         
+        import edge_tts
         communicate = edge_tts.Communicate(text, voice)
         await communicate.save(temp_path)
         
         return temp_path
     
-    def synthesize_speech(self, text, voice_name=None):
+    def synthesize_speech(self, text, voice_name=None, output_format=None):
         """
         Convert text to speech using Edge TTS
         
         Args:
             text: Text to convert to speech
             voice_name: Name of the voice to use
+            output_format: OutputFormat to return; Edge TTS only produces
+                           24 kHz MP3, anything else is transcoded from it
                        
         Returns:
             tuple: (audio_file_name, audio_content)
         """
         try:
-            logger.info(f"Synthesizing text to speech: '{text[:50]}{'...' if len(text) > 50 else ''}'")
+            logger.info("Synthesizing text to speech: '%s'", log_text(text), extra={'sample': True})
             
             # Use default voice if not specified
             voice = voice_name or "en-US-ChristopherNeural"
@@ -133,12 +158,49 @@ class OpenSourceTextService:
             # Clean up temporary file
             os.remove(temp_path)
             
-            file_name = f"tts_os_{hash(text) % 10000}.mp3"
-            logger.info(f"Successfully synthesized speech, {len(audio_content)} bytes")
+            if _needs_transcode(output_format):
+                audio_content = transcode(audio_content, output_format)
+            
+            file_name = f"tts_os_{hash(text) % 10000}{(output_format or OutputFormat()).extension}"
+            logger.info("Successfully synthesized speech, %s bytes", len(audio_content), extra={'sample': True})
+            
+            return file_name, audio_content
+            
+        except Exception as e:
+            # The route logs the stack trace
+            logger.error("Error synthesizing speech: %s", e)
+            raise
+    
+    async def get_available_voices_async(self):
+        """Async variant of get_available_voices that awaits edge_tts directly"""
+        if self._available_voices is None:
+            self._available_voices = await self._get_voices()
+            logger.info("Retrieved %s available voices", len(self._available_voices))
+        return self._available_voices
+    
+    async def synthesize_speech_async(self, text, voice_name=None, output_format=None):
+        """Async variant of synthesize_speech that awaits edge_tts directly"""
+        try:
+            logger.info("Synthesizing text to speech: '%s'", log_text(text), extra={'sample': True})
+            
+            import edge_tts
+            
+            # Stream audio chunks straight into memory instead of a temp file
+            communicate = edge_tts.Communicate(text, voice_name or "en-US-ChristopherNeural")
+            chunks = []
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    chunks.append(chunk["data"])
+            audio_content = b"".join(chunks)
+            if _needs_transcode(output_format):
+                audio_content = await transcode_async(audio_content, output_format)
+            
+            file_name = f"tts_os_{hash(text) % 10000}{(output_format or OutputFormat()).extension}"
+            logger.info("Successfully synthesized speech, %s bytes", len(audio_content), extra={'sample': True})
             
             return file_name, audio_content
             
         except Exception as e:
-            logger.error(f"Error synthesizing speech: {str(e)}")
-            logger.exception(e)
+            # The route logs the stack trace
+            logger.error("Error synthesizing speech: %s", e)
             raise
\ No newline at end of file
@@ -0,0 +1,201 @@
+# open_source_services/whisper_batching.py
+import logging
+import os
+import time
+import torch
+import whisper
+from whisper.audio import SAMPLE_RATE, N_SAMPLES
+from whisper.tokenizer import get_tokenizer
+
+from utils.batching import MicroBatcher
+from utils.transcript import build_segment, logprob_to_confidence, average_confidence
+
+logger = logging.getLogger(__name__)
+
+# Same silence heuristic whisper.transcribe applies to each window
+NO_SPEECH_THRESHOLD = 0.6
+LOGPROB_THRESHOLD = -1.0
+# Seconds per timestamp token, and samples per timestamp step
+TIME_PRECISION = 0.02
+SAMPLES_PER_TIMESTAMP = int(TIME_PRECISION * SAMPLE_RATE)
+
+
+class BatchingSpeechService:
+    """Micro-batching scheduler in front of OpenSourceSpeechService"""
+
+    audio_format = 'wav'
+
+    def __init__(self, speech_service, max_batch_size=8, max_wait_ms=50):
+        """
+        Initialize the scheduler
+
+        Each request walks its audio in 30-second windows the way
+        whisper.transcribe does: a window is split into segments at its
+        timestamp tokens, and the next window starts at the last complete
+        segment's end, so words at window edges are decoded again rather
+        than cut. The windows pending across concurrent requests at any
+        moment are run through the encoder/decoder as one batch.
+
+        Unlike whisper.transcribe, no prompt is carried over from the
+        previous window (as with condition_on_previous_text=False) and there
+        is no temperature fallback, since every window in a batch is decoded
+        with the same options. A single long file gains nothing from
+        batching; its windows still run one after another.
+
+        Args:
+            speech_service: OpenSourceSpeechService owning the Whisper model
+            max_batch_size: Most windows decoded together; larger batches raise
+                            throughput at the cost of per-request latency
+            max_wait_ms: How long a window waits for others before its batch
+                         runs anyway; 0 disables waiting
+        """
+        self.speech_service = speech_service
+        self.model = speech_service.model
+        self.options = whisper.DecodingOptions(fp16=self.model.device.type != 'cpu')
+        self.tokenizer = get_tokenizer(self.model.is_multilingual, num_languages=self.model.num_languages)
+        # Whisper's kv-cache hooks live on the model, so the batcher thread and word-timestamp
+        # requests (which run whisper.transcribe) must never decode at the same time
+        self._model_lock = speech_service.model_lock
+        self._batcher = MicroBatcher(
+            self._decode_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            name="whisper-batcher"
+        )
+        logger.info("Whisper micro-batching enabled: max_batch_size=%s, max_wait_ms=%s", max_batch_size, max_wait_ms)
+
+    def close(self, cancel=False):
+        """Stop the batcher; windows still queued are decoded first unless cancel is set"""
+        self._batcher.close(cancel=cancel)
+
+    def _decode_batch(self, mels):
+        with self._model_lock, torch.no_grad():
+            return whisper.decode(self.model, torch.stack(mels), self.options)
+
+    def _mel(self, chunk):
+        mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(chunk), self.model.dims.n_mels)
+        return mel.to(self.model.device)
+
+    def _split(self, tokens, window_samples):
+        """
+        Split a window's tokens at timestamp tokens, as whisper.transcribe does
+
+        Returns:
+            tuple: (list of (start_seconds, end_seconds, text) relative to the
+                   window, samples to advance to the next window)
+        """
+        timestamp_begin = self.tokenizer.timestamp_begin
+        is_timestamp = [token >= timestamp_begin for token in tokens]
+        text = lambda part: self.tokenizer.decode([token for token in part if token < self.tokenizer.eot])
+        single_timestamp_ending = is_timestamp[-2:] == [False, True]
+        # Segment boundaries: between two consecutive timestamp tokens
+        slices = [i + 1 for i in range(len(tokens) - 1) if is_timestamp[i] and is_timestamp[i + 1]]
+        if not slices:
+            end = window_samples / SAMPLE_RATE
+            timestamps = [token for token, stamp in zip(tokens, is_timestamp) if stamp]
+            if timestamps and timestamps[-1] != timestamp_begin:
+                end = (timestamps[-1] - timestamp_begin) * TIME_PRECISION
+            return [(0.0, end, text(tokens))], window_samples
+
+        if single_timestamp_ending:
+            slices.append(len(tokens))
+        segments = []
+        last = 0
+        for current in slices:
+            part = tokens[last:current]
+            segments.append(((part[0] - timestamp_begin) * TIME_PRECISION,
+                             (part[-1] - timestamp_begin) * TIME_PRECISION, text(part)))
+            last = current
+        if single_timestamp_ending:
+            return segments, window_samples
+        # The text after the last complete segment was cut by the window edge: decode it again next window
+        advance = (tokens[last - 1] - timestamp_begin) * SAMPLES_PER_TIMESTAMP
+        return segments, min(advance, window_samples) if advance > 0 else window_samples
+
+    def decode_audio(self, audio_file):
+        return self.speech_service.decode_audio(audio_file)
+
+    def transcribe_audio(self, audio_file, word_timestamps=False):
+        """
+        Transcribe audio using batched Whisper decoding
+
+        Word-level timestamps need whisper.transcribe's alignment pass, so those
+        requests bypass the batcher, holding the model while they run.
+
+        Args:
+            audio_file: Path to audio file, or samples from decode_audio
+            word_timestamps: Also return per-word start/end offsets
+
+        Returns:
+            dict: Transcription results, same schema as OpenSourceSpeechService
+        """
+        if word_timestamps:
+            # Takes the model lock itself
+            return self.speech_service.transcribe_audio(audio_file, word_timestamps=True)
+
+        if isinstance(audio_file, str) and not os.path.exists(audio_file):
+            logger.error("File does not exist: %s", audio_file)
+            return {
+                'success': False,
+                'error': f"File does not exist: {audio_file}",
+                'input_error': True,
+                'text': None,
+                'confidence': None,
+                'model_used': self.speech_service.model_used
+            }
+
+        try:
+            start_time = time.time()
+            audio = self.decode_audio(audio_file) if isinstance(audio_file, str) else audio_file
+            total_samples = len(audio)
+
+            segments = []
+            windows = 0
+            seek = 0
+            while seek < max(total_samples, 1):
+                chunk = audio[seek:seek + N_SAMPLES]
+                offset = seek / SAMPLE_RATE
+                # Batched with the windows other requests have pending
+                result = self._batcher.call(self._mel(chunk))
+                windows += 1
+                if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+                    seek += max(len(chunk), 1)
+                    continue
+                window_segments, advance = self._split(list(result.tokens), len(chunk))
+                for start, end, text in window_segments:
+                    if not text.strip():
+                        continue
+                    segments.append(build_segment(
+                        len(segments),
+                        text.strip(),
+                        offset + start,
+                        min(offset + end, total_samples / SAMPLE_RATE),
+                        confidence=logprob_to_confidence(result.avg_logprob),
+                        avg_logprob=result.avg_logprob,
+                        no_speech_prob=result.no_speech_prob,
+                        compression_ratio=result.compression_ratio
+                    ))
+                seek += max(advance, 1)
+
+            transcription_text = " ".join(segment["text"] for segment in segments)
+            elapsed_time = time.time() - start_time
+            logger.info("Batched Whisper transcription of %s windows in %.2f seconds", windows, elapsed_time)
+
+            return {
+                'success': True,
+                'text': transcription_text,
+                'confidence': average_confidence(segments),
+                'model_used': self.speech_service.model_used,
+                'processing_time': elapsed_time,
+                'segments': segments
+            }
+
+        except Exception as e:
+            logger.exception("Error transcribing audio with batched Whisper: %s", e)
+            return {
+                'success': False,
+                'error': str(e),
+                'text': None,
+                'confidence': None,
+                'model_used': self.speech_service.model_used
+            }
@@ -0,0 +1,40 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Tests import the backend modules the way app.py does, from the backend directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from open_source_services.speech_service import OpenSourceSpeechService  # noqa: E402
+
+
+class OverlapDetectingModel:
+    """Stands in for a Whisper model; records whether two transcriptions ever ran at once"""
+
+    def __init__(self):
+        self.active = 0
+        self.most_active = 0
+        self._count = threading.Lock()
+
+    def transcribe(self, audio, word_timestamps=False, **options):
+        with self._count:
+            self.active += 1
+            self.most_active = max(self.most_active, self.active)
+        time.sleep(0.02)
+        with self._count:
+            self.active -= 1
+        return {"text": "hello", "segments": []}
+
+
+@pytest.fixture
+def whisper_without_model():
+    """OpenSourceSpeechService over an OverlapDetectingModel; no model is loaded"""
+    service = OpenSourceSpeechService.__new__(OpenSourceSpeechService)
+    service.model = OverlapDetectingModel()
+    service.model_lock = threading.Lock()
+    service.decode_options = {}
+    service.model_used = "Whisper Test"
+    return service
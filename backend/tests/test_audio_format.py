@@ -0,0 +1,38 @@
+import io
+import struct
+import subprocess
+import wave
+
+from utils import audio_format
+from utils.audio_format import OutputFormat, transcode
+
+SAMPLE_RATE = 16000
+
+
+def piped_wav(frames):
+    """WAV as ffmpeg writes it to pipe:1: placeholder sizes and a LIST chunk before the data"""
+    info = b'INFO' + b'ISFT' + struct.pack('<I', 14) + b'Lavf60.16.100\0'
+    fmt = struct.pack('<HHIIHH', 1, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16)
+    return (b'RIFF' + struct.pack('<I', 0xFFFFFFFF) + b'WAVE'
+            + b'fmt ' + struct.pack('<I', len(fmt)) + fmt
+            + b'LIST' + struct.pack('<I', len(info)) + info
+            + b'data' + struct.pack('<I', 0xFFFFFFFF) + b'\x01\x00' * frames)
+
+
+def test_wav_from_the_ffmpeg_pipe_gets_real_sizes(monkeypatch):
+    frames = SAMPLE_RATE // 2
+    monkeypatch.setattr(audio_format.subprocess, 'run', lambda command, **kwargs: subprocess.CompletedProcess(
+        command, 0, stdout=piped_wav(frames), stderr=b''))
+
+    audio = transcode(b'mp3 bytes', OutputFormat('wav', sample_rate=SAMPLE_RATE))
+
+    assert struct.unpack_from('<I', audio, 4)[0] == len(audio) - 8
+    with wave.open(io.BytesIO(audio)) as wav:
+        assert wav.getnframes() == frames
+        assert wav.readframes(frames) == b'\x01\x00' * frames
+
+
+def test_other_formats_are_returned_as_ffmpeg_wrote_them(monkeypatch):
+    monkeypatch.setattr(audio_format.subprocess, 'run', lambda command, **kwargs: subprocess.CompletedProcess(
+        command, 0, stdout=b'OggS\xff\xff\xff\xff', stderr=b''))
+    assert transcode(b'mp3 bytes', OutputFormat('ogg_opus')) == b'OggS\xff\xff\xff\xff'
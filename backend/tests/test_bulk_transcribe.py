@@ -0,0 +1,19 @@
+from bulk_transcribe import Journal, run
+
+
+def test_unbatched_whisper_transcribes_one_recording_at_a_time(whisper_without_model, tmp_path):
+    service = whisper_without_model
+    # Samples as Whisper's decoder would hand them over, without ffmpeg
+    service.decode_audio = lambda path: [0.0] * 16000
+    items = []
+    for n in range(8):
+        path = tmp_path / f"{n}.wav"
+        path.write_bytes(b"\0" * 64)
+        items.append({"id": f"{n}.wav", "path": str(path), "metadata": {}})
+    journal = Journal(str(tmp_path / "out.jsonl")).open()
+
+    progress = run(service, items, journal, 'opensource', decode_workers=2, concurrency=4, progress_interval=60)
+    journal.close()
+
+    assert (progress.files, progress.failed) == (8, 0)
+    assert service.model.most_active == 1
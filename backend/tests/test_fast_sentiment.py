@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip("textblob")
+
+from textblob.en import sentiment as pattern_sentiment  # noqa: E402
+
+from benchmarks.fast_sentiment import generate  # noqa: E402
+from open_source_services.fast_sentiment import FastSentimentService  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def fast():
+    return FastSentimentService()
+
+
+@pytest.mark.parametrize("text", [
+    "it isn't great",
+    "the film wasn't bad",
+    "it wasn't good, but fine",
+    "I don't think it's 'good' at all",
+    "it is not great",
+    "the agent was never very helpful!",
+])
+def test_contractions_score_as_textblob_scores_them(fast, text):
+    assert fast.analyze_sentiment(text)['score'] == pytest.approx(pattern_sentiment(text)[0], abs=1e-9)
+
+
+def test_the_generated_corpus_has_contractions_and_agrees(fast):
+    texts = generate(300, seed=3)
+    assert sum("n't" in text for text in texts) > 50
+    scores = [result['score'] for result in fast.analyze_sentiment_batch(texts)]
+    assert scores == pytest.approx([pattern_sentiment(text)[0] for text in texts], abs=1e-9)
@@ -0,0 +1,167 @@
+import asyncio
+import subprocess
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("grpc")
+pytest.importorskip("google.cloud.speech")
+
+import google_services.client_factory as client_factory  # noqa: E402
+import google_services.speech_service as speech_service  # noqa: E402
+from benchmarks.fake_google import FakeSpeechServer  # noqa: E402
+from google_services.speech_service import PCM_BYTES_PER_SECOND, STREAM_CHUNK_BYTES, SpeechService  # noqa: E402
+
+MAX_STREAM_SECONDS = 60
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeSpeechServer(chunks_per_result=8, bytes_per_second=PCM_BYTES_PER_SECOND,
+                              max_stream_seconds=MAX_STREAM_SECONDS)
+    server.start()
+    monkeypatch.setattr(client_factory, '_factory', client_factory.GoogleClientFactory(
+        endpoints={'speech': server.endpoint}, insecure=True
+    ))
+    # A shorter stream limit, so the test sends a few MB rather than Google's five minutes per stream
+    monkeypatch.setattr(speech_service, 'STREAM_MAX_SECONDS', MAX_STREAM_SECONDS - 5)
+    yield server
+    server.stop()
+
+
+def long_audio(tmp_path, monkeypatch, seconds):
+    """A file whose decoded audio is `seconds` long; ffmpeg is replaced by silent LINEAR16 chunks"""
+    path = tmp_path / "long.webm"
+    path.write_bytes(b"\0" * 4096)
+    total = seconds * PCM_BYTES_PER_SECOND
+
+    def pcm_chunks(self, audio_file_path):
+        for start in range(0, total, STREAM_CHUNK_BYTES):
+            yield b"\0" * min(STREAM_CHUNK_BYTES, total - start)
+
+    monkeypatch.setattr(SpeechService, '_pcm_chunks', pcm_chunks)
+    monkeypatch.setattr(SpeechService, '_estimate_duration', lambda self, audio_file_path: seconds)
+    return str(path)
+
+
+def test_short_audio_uses_recognize(server, tmp_path):
+    path = tmp_path / "short.webm"
+    path.write_bytes(b"\0" * 4096)
+    service = SpeechService()
+    service._estimate_duration = lambda audio_file_path: 5
+    result = service.transcribe_audio(str(path))
+    assert result['success'] and result['text'] == "short clip"
+    assert server.recognize_calls == 1
+
+
+def test_async_recognize_goes_through_the_factory_off_the_loop(server, tmp_path):
+    path = tmp_path / "short.webm"
+    path.write_bytes(b"\0" * 4096)
+    service = SpeechService()
+    probed_on = []
+
+    def estimate_duration(audio_file_path):
+        probed_on.append(threading.current_thread())
+        return 5
+    service._estimate_duration = estimate_duration
+
+    async def run():
+        result = await service.transcribe_audio_async(str(path))
+        return result, threading.current_thread()
+
+    result, loop_thread = asyncio.run(run())
+    assert result['success'] and result['text'] == "short clip"
+    # The fake server is only reachable through the factory's endpoint override
+    assert server.recognize_calls == 1
+    assert probed_on and probed_on[0] is not loop_thread
+
+
+def test_long_audio_restarts_the_stream_before_the_limit(server, tmp_path, monkeypatch):
+    seconds = 200
+    result = SpeechService().transcribe_audio(long_audio(tmp_path, monkeypatch, seconds), word_timestamps=True)
+
+    assert result['success'], result.get('error')
+    assert result['streaming']
+    assert len(server.stream_seconds) > 3
+    assert max(server.stream_seconds) <= MAX_STREAM_SECONDS
+    assert max(server.audio_message_sizes) <= STREAM_CHUNK_BYTES
+
+    # Results carry over across streams in file time, up to the end of the audio
+    ends = [segment['end'] for segment in result['segments']]
+    assert ends == sorted(ends)
+    assert ends[-1] == pytest.approx(seconds, abs=0.1)
+
+
+def test_audio_cut_by_a_restart_is_sent_again(server, tmp_path, monkeypatch):
+    # A result every 100 messages (about 51 s); the rest of each stream gets none until it is sent again
+    server.chunks_per_result = 100
+    server.final_at_end = False
+    seconds = 150
+    result = SpeechService().transcribe_audio(long_audio(tmp_path, monkeypatch, seconds))
+
+    assert result['success'], result.get('error')
+    assert sum(server.stream_seconds) > seconds
+    ends = [segment['end'] for segment in result['segments']]
+    # Each stream's result lands where the previous stream's last result ended plus about 51 s
+    assert ends == pytest.approx([51.2 * n for n in range(1, len(ends) + 1)], abs=0.1)
+    assert ends[-1] > seconds - 51.2
+
+
+def test_the_model_fallback_shares_one_deadline(tmp_path, monkeypatch):
+    server = FakeSpeechServer(recognize_delay_ms=2000)
+    server.start()
+    # Every model would get the full per-call timeout; the chain as a whole gets half a second
+    monkeypatch.setattr(client_factory, '_factory', client_factory.GoogleClientFactory(
+        endpoints={'speech': server.endpoint}, insecure=True,
+        call_policies={'speech.recognize': {'timeout': 60.0, 'retry': False},
+                       'speech.recognize_models': {'timeout': 0.5}}
+    ))
+    path = tmp_path / "short.webm"
+    path.write_bytes(b"\0" * 4096)
+    service = SpeechService()
+    service._estimate_duration = lambda audio_file_path: 5
+    try:
+        start = time.monotonic()
+        result = service.transcribe_audio(str(path))
+        elapsed = time.monotonic() - start
+    finally:
+        server.stop()
+
+    assert result['success'] is False
+    assert result['error'] == "Transcription deadline passed before any model succeeded"
+    assert elapsed < 1.5
+    assert server.recognize_calls == 1
+
+
+def fake_ffprobe(monkeypatch, format_duration, packets):
+    """Answer ffprobe's duration and packet queries; None makes ffprobe fail as if it were missing"""
+    def run(command, **kwargs):
+        if format_duration is None:
+            raise FileNotFoundError(command[0])
+        stdout = format_duration if 'format=duration' in command else packets
+        return subprocess.CompletedProcess(command, 0, stdout=stdout + "\n", stderr="")
+    monkeypatch.setattr(speech_service.subprocess, 'run', run)
+
+
+def test_duration_without_a_header_comes_from_the_last_packet(tmp_path, monkeypatch):
+    # 90 s of Opus at 6 kbps is about 68 KB, under 9 s if the size were read at 64 kbps
+    path = tmp_path / "quiet.webm"
+    path.write_bytes(b"\0" * 68 * 1024)
+    packets = "\n".join(f"{n * 0.02:.6f},0.020000" for n in range(4500))
+    fake_ffprobe(monkeypatch, "N/A", packets)
+
+    assert SpeechService()._estimate_duration(str(path)) == pytest.approx(90.0)
+
+
+def test_audio_of_unknown_length_is_streamed(server, tmp_path, monkeypatch):
+    estimate_duration = SpeechService._estimate_duration
+    path = long_audio(tmp_path, monkeypatch, 90)
+    monkeypatch.setattr(SpeechService, '_estimate_duration', estimate_duration)
+    fake_ffprobe(monkeypatch, None, None)
+
+    result = SpeechService().transcribe_audio(path)
+
+    assert result['success'], result.get('error')
+    assert result['streaming']
+    assert server.recognize_calls == 0
@@ -0,0 +1,26 @@
+import io
+import json
+import logging
+
+from utils.logging_config import configure_logging, stop_logging
+
+
+def test_messages_are_merged_when_logged_and_formatted_by_the_listener():
+    stream = io.StringIO()
+    configure_logging(level='INFO', fmt='json', sample_rate=1.0, stream=stream)
+    try:
+        items = ['first']
+        logging.getLogger('test').info("Items: %s", items)
+        # Changed after the call, before the listener thread gets to the record
+        items.append('second')
+        try:
+            raise ValueError("bad input")
+        except ValueError:
+            logging.getLogger('test').exception("Failed for %s", 'google')
+    finally:
+        stop_logging()
+
+    logged, failed = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert logged['msg'] == "Items: ['first']"
+    assert failed['msg'] == "Failed for google"
+    assert 'ValueError: bad input' in failed['exc']
@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import stat
+
+import pytest
+
+from open_source_services.model_server import (ModelServer, ModelServerManager, RemoteSentimentService,
+                                               RemoteSpeechService, key_path, serve, server_authkey)
+from utils.batching import MicroBatcher
+
+
+class StubSpeech:
+    """Transcribes a file to its size, so a test can tell the server read the bytes the worker sent"""
+
+    def transcribe_audio(self, audio_file, word_timestamps=False):
+        with open(audio_file, 'rb') as f:
+            return {'success': True, 'text': f"{len(f.read())} bytes", 'suffix': audio_file[-4:]}
+
+
+class StubSentiment:
+    def analyze_sentiment_batch(self, texts, include_sentences=False):
+        return [{'success': True, 'score': 0.0} for _ in texts]
+
+
+def start_server(address, authkey=b'test'):
+    model_server = ModelServer(StubSpeech(), StubSentiment())
+    ModelServerManager.register('models', callable=lambda: model_server)
+    manager = ModelServerManager(address=address, authkey=authkey)
+    manager.start()
+    return manager
+
+
+@pytest.fixture
+def fork():
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip("needs the fork start method")
+    previous = multiprocessing.get_start_method(allow_none=True)
+    multiprocessing.set_start_method('fork', force=True)
+    yield
+    multiprocessing.set_start_method(previous, force=True)
+
+
+def test_workers_send_the_audio_and_reconnect_after_a_restart(fork, tmp_path):
+    address = str(tmp_path / 'models.sock')
+    audio = tmp_path / 'clip.webm'
+    audio.write_bytes(b'\0' * 2048)
+    service = RemoteSpeechService(address=address, authkey='test')
+
+    manager = start_server(address)
+    try:
+        result = service.transcribe_audio(str(audio))
+    finally:
+        manager.shutdown()
+    # The server wrote what it received to its own file, keeping the extension
+    assert result == {'success': True, 'text': '2048 bytes', 'suffix': 'webm'}
+
+    # Down: the call fails cleanly and the stale proxy is dropped
+    assert service.transcribe_audio(str(audio))['success'] is False
+
+    manager = start_server(address)
+    try:
+        assert service.transcribe_audio(str(audio))['text'] == '2048 bytes'
+    finally:
+        manager.shutdown()
+
+
+def test_missing_files_are_reported_without_calling_the_server(tmp_path):
+    service = RemoteSpeechService(address=str(tmp_path / 'none.sock'), authkey='test')
+    assert service.transcribe_audio(str(tmp_path / 'missing.wav'))['error'] == "Audio file does not exist"
+
+
+def test_a_short_batch_result_fails_the_unanswered_items():
+    batcher = MicroBatcher(lambda items: items[:1], max_batch_size=3, max_wait_ms=200)
+    futures = [batcher.submit(n) for n in range(3)]
+    try:
+        assert futures[0].result(timeout=5) == 0
+        for future in futures[1:]:
+            with pytest.raises(RuntimeError):
+                future.result(timeout=5)
+    finally:
+        batcher.close()
+
+
+def test_a_tcp_address_needs_a_configured_authkey(monkeypatch):
+    monkeypatch.delenv('MODEL_SERVER_AUTHKEY', raising=False)
+    with pytest.raises(ValueError, match="MODEL_SERVER_AUTHKEY"):
+        serve('0.0.0.0:6000')
+    with pytest.raises(ValueError, match="MODEL_SERVER_AUTHKEY"):
+        RemoteSentimentService(address='10.0.0.5:6000')
+
+
+def test_a_unix_socket_without_a_key_shares_a_generated_one(fork, tmp_path, monkeypatch):
+    monkeypatch.delenv('MODEL_SERVER_AUTHKEY', raising=False)
+    address = str(tmp_path / 'models.sock')
+    service = RemoteSentimentService(address=address)
+
+    manager = start_server(address, server_authkey(address))
+    try:
+        assert stat.S_IMODE(os.stat(key_path(address)).st_mode) == 0o600
+        assert service.analyze_sentiment_batch(["fine"]) == [{'success': True, 'score': 0.0}]
+    finally:
+        manager.shutdown()
+
+    # A restarted server writes a new key, which the worker reads when it reconnects
+    assert service.analyze_sentiment_batch(["fine"])[0]['success'] is False
+    manager = start_server(address, server_authkey(address))
+    try:
+        assert service.analyze_sentiment_batch(["fine"]) == [{'success': True, 'score': 0.0}]
+    finally:
+        manager.shutdown()
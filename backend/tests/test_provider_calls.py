@@ -0,0 +1,185 @@
+import asyncio
+import time
+
+import pytest
+
+from utils.providers import ProviderRegistry
+from utils.provider_calls import ProviderCalls
+from utils.resilience import AdaptiveLimiter, CircuitBreaker, ProviderGuard, ProviderUnavailable
+
+
+class StubSentiment:
+    """Sentiment provider with a blocking and, optionally, an async method"""
+
+    def __init__(self, ok=True, native_async=False):
+        self.ok = ok
+        self.calls = []
+        if native_async:
+            self.analyze_sentiment_async = self._analyze_async
+
+    def _result(self, text):
+        if self.ok:
+            return {"success": True, "score": 0.5, "text": text}
+        return {"success": False, "error": "backend unavailable", "text": None}
+
+    def analyze_sentiment(self, text):
+        self.calls.append('sync')
+        return self._result(text)
+
+    async def _analyze_async(self, text):
+        self.calls.append('async')
+        await asyncio.sleep(0)
+        return self._result(text)
+
+
+def provider_calls(google, opensource, **kwargs):
+    registry = ProviderRegistry()
+    registry.register('google', 'sentiment', google)
+    registry.register('opensource', 'sentiment', opensource)
+    return ProviderCalls(registry, **kwargs)
+
+
+def test_blocking_and_async_calls_fail_over_the_same_way():
+    calls = provider_calls(StubSentiment(ok=False), StubSentiment(native_async=True))
+
+    result, failover = calls.call('google', 'sentiment', 'analyze_sentiment', 'hello there')
+    async_result, async_failover = asyncio.run(calls.call_async('google', 'sentiment', 'analyze_sentiment',
+                                                                'hello there'))
+
+    assert result == async_result and result['success']
+    assert failover == async_failover == {"service": "sentiment", "from": "google", "to": "opensource",
+                                          "reason": "backend unavailable"}
+    # The async path awaits the native variant where there is one and runs the blocking method otherwise
+    assert calls.service('opensource', 'sentiment').calls == ['sync', 'async']
+
+
+def test_async_calls_count_against_the_shared_breaker():
+    google = StubSentiment(ok=False, native_async=True)
+    breaker = CircuitBreaker('google.sentiment', min_calls=2, open_seconds=60)
+    calls = provider_calls(google, StubSentiment(), failover=False,
+                           guards={('google', 'sentiment'): ProviderGuard('google.sentiment', breaker=breaker),
+                                   ('opensource', 'sentiment'): ProviderGuard('opensource.sentiment')})
+
+    for _ in range(2):
+        asyncio.run(calls.call_async('google', 'sentiment', 'analyze_sentiment', 'hello there'))
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Both apps now get the open breaker for this provider
+    with pytest.raises(ProviderUnavailable):
+        calls.call('google', 'sentiment', 'analyze_sentiment', 'hello there')
+    with pytest.raises(ProviderUnavailable):
+        asyncio.run(calls.call_async('google', 'sentiment', 'analyze_sentiment', 'hello there'))
+    assert google.calls == ['async', 'async']
+
+
+def test_async_calls_wait_for_a_slot_without_blocking_the_loop():
+    limiter = AdaptiveLimiter(initial_limit=1, max_limit=1, queue_timeout_seconds=0.2)
+    calls = provider_calls(StubSentiment(native_async=True), StubSentiment(), failover=False,
+                           guards={('google', 'sentiment'): ProviderGuard('google.sentiment', limiter=limiter)})
+    limiter.acquire()
+
+    async def run():
+        ticks = 0
+        call = asyncio.ensure_future(calls.call_async('google', 'sentiment', 'analyze_sentiment', 'hello there'))
+        while not call.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        return ticks, call.exception()
+
+    ticks, error = asyncio.run(run())
+    assert isinstance(error, ProviderUnavailable)
+    assert ticks >= 10
+    assert limiter.status()['rejected'] == 1
+
+
+def test_the_asgi_app_answers_like_the_flask_app():
+    pytest.importorskip('quart')
+    pytest.importorskip('quart_cors')
+    from asgi_app import create_app
+
+    app = create_app(provider_calls=provider_calls(StubSentiment(ok=False, native_async=True), StubSentiment()))
+
+    async def run():
+        client = app.test_client()
+        failed_over = await client.post('/api/sentiment', json={"text": "hello there"})
+        empty = await client.post('/api/sentiment', json={"text": "  "})
+        unknown = await client.post('/api/sentiment', json={"text": "hello there", "provider": "nope"})
+        status = await client.get('/api/providers/status')
+        return ([(response.status_code, await response.get_json()) for response in (failed_over, empty, unknown)],
+                await status.get_json())
+
+    (failed_over, empty, unknown), status = asyncio.run(run())
+    assert failed_over[0] == 200
+    assert failed_over[1]['failover'] == [{"service": "sentiment", "from": "google", "to": "opensource",
+                                           "reason": "backend unavailable"}]
+    assert empty == (400, {"error": "Empty text"})
+    assert unknown == (400, {"error": "Unknown sentiment provider 'nope', available: ['google', 'opensource']"})
+    assert status['providers']['google']['sentiment']['circuit']['calls_in_window'] == 1
+
+
+def test_services_for_the_asgi_app_can_be_async_only():
+    class AsyncSentiment:
+        async def analyze_sentiment_async(self, text):
+            return {"success": True, "score": 0.5}
+
+    registry = ProviderRegistry()
+    registry.register('stub', 'sentiment', AsyncSentiment())
+    with pytest.raises(TypeError):
+        registry.register('stub', 'text', AsyncSentiment())
+    result, failover = asyncio.run(ProviderCalls(registry).call_async('stub', 'sentiment', 'analyze_sentiment', 'hi'))
+    assert result == {"success": True, "score": 0.5} and failover is None
+
+
+def test_a_sentiment_batch_without_a_batch_call_is_guarded_and_parallel():
+    class SlowSentiment(StubSentiment):
+        def analyze_sentiment(self, text):
+            time.sleep(0.05)
+            result = super().analyze_sentiment(text)
+            result['sentences'] = [{"text": text}]
+            return result
+
+    google = SlowSentiment()
+    calls = provider_calls(google, StubSentiment())
+    texts = [f"segment {n}" for n in range(16)]
+
+    started = time.perf_counter()
+    results = calls.analyze_sentiment_batch('google', texts, max_parallel=8)
+    elapsed = time.perf_counter() - started
+
+    assert [result['text'] for result in results] == texts
+    assert not any('sentences' in result for result in results)
+    # 16 calls of 50 ms, eight at a time; one after another they took 0.8 s
+    assert elapsed < 0.4
+    assert calls.status()['providers']['google']['sentiment']['circuit']['calls_in_window'] == 16
+
+
+def test_a_sentiment_batch_call_is_one_guarded_call():
+    class BatchSentiment(StubSentiment):
+        def analyze_sentiment_batch(self, texts):
+            self.calls.append('batch')
+            return [self._result(text) for text in texts]
+
+    opensource = BatchSentiment()
+    calls = provider_calls(StubSentiment(), opensource)
+
+    results = calls.guarded_sentiment('opensource').analyze_sentiment_batch(["one", "two", "three"])
+
+    assert [result['text'] for result in results] == ["one", "two", "three"]
+    assert opensource.calls == ['batch']
+    assert calls.status()['providers']['opensource']['sentiment']['circuit']['calls_in_window'] == 1
+
+
+def test_a_rejected_sentiment_batch_fails_each_text():
+    class BrokenBatchSentiment(StubSentiment):
+        def analyze_sentiment_batch(self, texts):
+            raise ConnectionError("model server is down")
+
+    calls = provider_calls(StubSentiment(), BrokenBatchSentiment())
+    for _ in range(5):
+        with pytest.raises(ConnectionError):
+            calls.analyze_sentiment_batch('opensource', ["one", "two"])
+
+    results = calls.analyze_sentiment_batch('opensource', ["one", "two"])
+
+    assert [result['success'] for result in results] == [False, False]
+    assert results[0]['error'] == "Circuit for opensource.sentiment is open"
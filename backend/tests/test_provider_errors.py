@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+
+import pytest
+
+from open_source_services.model_server import RemoteSentimentService, RemoteSpeechService
+from open_source_services.sentiment_service import OpenSourceSentimentService
+from open_source_services.speech_service import OpenSourceSpeechService
+from utils.resilience import result_failed
+
+
+class FakeRecognizeClient:
+    """Answers recognize with no results, as Google does for silent audio, or raises"""
+
+    def __init__(self, raises=None):
+        self.raises = raises
+        self.calls = 0
+
+    def recognize(self, config=None, audio=None, **options):
+        self.calls += 1
+        if self.raises:
+            raise self.raises
+        return SimpleNamespace(results=[])
+
+
+def google_speech(client):
+    pytest.importorskip("google.cloud.speech")
+    from google_services.speech_service import SpeechService
+
+    service = SpeechService.__new__(SpeechService)
+    service._factory = SimpleNamespace(
+        client=lambda kind: client,
+        deadline=lambda name: None,
+        call_options=lambda name, deadline=None: {}
+    )
+    service.models = [{"name": "first", "config": None}, {"name": "second", "config": None}]
+    service._estimate_duration = lambda audio_file_path: 5
+    service._load_audio = lambda audio_file_path: None
+    return service
+
+
+@pytest.fixture
+def audio_file(tmp_path):
+    path = tmp_path / "silence.webm"
+    path.write_bytes(b"\0" * 4096)
+    return str(path)
+
+
+def test_google_silent_audio_is_an_input_error(audio_file):
+    client = FakeRecognizeClient()
+    result = google_speech(client).transcribe_audio(audio_file)
+
+    assert client.calls == 2
+    assert not result['success']
+    assert not result_failed(result)
+
+
+def test_google_model_errors_count_against_the_provider(audio_file):
+    result = google_speech(FakeRecognizeClient(raises=RuntimeError("503 unavailable"))).transcribe_audio(audio_file)
+
+    assert result['error'] == "Failed to transcribe with any model"
+    assert result_failed(result)
+
+
+def test_google_missing_and_empty_files_are_input_errors(tmp_path):
+    service = google_speech(FakeRecognizeClient())
+    (tmp_path / "empty.webm").write_bytes(b"")
+
+    for path in (tmp_path / "missing.webm", tmp_path / "empty.webm"):
+        result = service.transcribe_audio(str(path))
+        assert not result['success'] and not result_failed(result)
+
+
+def test_google_short_text_is_an_input_error():
+    pytest.importorskip("google.cloud.language")
+    from google_services.sentiment_service import SentimentService
+
+    result = SentimentService.__new__(SentimentService).analyze_sentiment("ok")
+    assert not result['success'] and not result_failed(result)
+
+
+def test_whisper_missing_file_is_an_input_error(tmp_path):
+    service = OpenSourceSpeechService.__new__(OpenSourceSpeechService)
+    service.model_used = "Whisper Base"
+
+    result = service.transcribe_audio(str(tmp_path / "missing.wav"))
+    assert result['error'].startswith("File does not exist")
+    assert not result_failed(result)
+
+
+def test_model_server_input_errors_and_connection_errors(tmp_path):
+    class Unreachable:
+        def call(self, *args):
+            raise ConnectionRefusedError("model server is down")
+
+    speech = RemoteSpeechService(remote=Unreachable())
+    assert not result_failed(speech.transcribe_audio(str(tmp_path / "missing.wav")))
+    (tmp_path / "clip.wav").write_bytes(b"\0" * 4096)
+    assert result_failed(speech.transcribe_audio(str(tmp_path / "clip.wav")))
+
+    sentiment = RemoteSentimentService(remote=Unreachable())
+    assert not result_failed(sentiment.analyze_sentiment("ok"))
+    assert result_failed(sentiment.analyze_sentiment("the model server answers nothing"))
+
+
+def test_open_source_short_text_is_an_input_error():
+    service = OpenSourceSentimentService.__new__(OpenSourceSentimentService)
+    assert not result_failed(service.analyze_sentiment("ok"))
+    assert [result_failed(result) for result in service.analyze_sentiment_batch(["ok", ""])] == [False, False]
+
+
+def test_fast_sentiment_short_text_is_an_input_error():
+    pytest.importorskip("textblob")
+    from open_source_services.fast_sentiment import FastSentimentService
+
+    assert not result_failed(FastSentimentService().analyze_sentiment_batch(["ok"])[0])
@@ -0,0 +1,192 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from utils import resilience
+from utils.resilience import AdaptiveLimiter, CircuitBreaker, ProviderGuard, ProviderUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience, 'time', SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def stub(clock, latency=0.01, error=None, raises=None, input_error=False):
+    """A fault-injecting provider call: takes latency seconds on the fake clock, then fails or succeeds"""
+    def call(*args):
+        clock.advance(latency)
+        if raises:
+            raise raises
+        if error and input_error:
+            return {"success": False, "error": error, "input_error": True}
+        if error:
+            return {"success": False, "error": error}
+        return {"success": True}
+    return call
+
+
+def test_long_transcriptions_do_not_open_the_speech_breaker(clock):
+    guard = ProviderGuard('opensource.speech', kind='speech')
+    for _ in range(20):
+        guard.call(stub(clock, latency=12.0))
+    status = guard.status()
+    assert status['circuit']['state'] == CircuitBreaker.CLOSED
+    assert status['concurrency']['limit'] >= 8
+
+
+def test_slow_sentiment_calls_open_the_breaker(clock):
+    guard = ProviderGuard('google.sentiment', kind='sentiment')
+    for _ in range(5):
+        guard.call(stub(clock, latency=12.0))
+    assert guard.status()['circuit']['state'] == CircuitBreaker.OPEN
+    with pytest.raises(ProviderUnavailable):
+        guard.call(stub(clock))
+
+
+def test_failures_open_the_breaker_and_a_trial_call_closes_it(clock):
+    guard = ProviderGuard('google.text', kind='text')
+    failing = stub(clock, error="503 Service Unavailable")
+    for _ in range(5):
+        guard.call(failing)
+    assert guard.breaker.state == CircuitBreaker.OPEN
+
+    calls = []
+    with pytest.raises(ProviderUnavailable):
+        guard.call(lambda: calls.append(1))
+    assert not calls
+
+    clock.advance(guard.breaker.open_seconds)
+    assert guard.call(stub(clock)) == {"success": True}
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_trial_call_reopens_the_breaker(clock):
+    guard = ProviderGuard('google.text', kind='text')
+    for _ in range(5):
+        with pytest.raises(RuntimeError):
+            guard.call(stub(clock, raises=RuntimeError("connection reset")))
+    clock.advance(guard.breaker.open_seconds)
+    guard.call(stub(clock, error="deadline exceeded"))
+    assert guard.breaker.state == CircuitBreaker.OPEN
+
+
+def test_input_errors_do_not_count_against_the_provider(clock):
+    guard = ProviderGuard('google.sentiment', kind='sentiment')
+    for _ in range(10):
+        guard.call(stub(clock, error="Text too short for sentiment analysis", input_error=True))
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_errors_are_classified_by_flag_not_message(clock):
+    guard = ProviderGuard('google.sentiment', kind='sentiment')
+    for _ in range(5):
+        guard.call(stub(clock, error="Text too short, but from the provider"))
+    assert guard.breaker.state == CircuitBreaker.OPEN
+
+
+def test_limit_halves_on_failure_and_grows_back(clock):
+    limiter = AdaptiveLimiter(initial_limit=8)
+    assert limiter.acquire()
+    limiter.release(failed=True, elapsed=0.1)
+    assert limiter.limit == 4
+    for _ in range(20):
+        assert limiter.acquire()
+        limiter.release(failed=False, elapsed=0.1)
+    assert 4 < limiter.limit < 8
+
+
+def test_speech_limit_ignores_latency():
+    limiter = AdaptiveLimiter(latency_target_seconds=None)
+    for _ in range(5):
+        assert limiter.acquire()
+        limiter.release(failed=False, elapsed=600.0)
+    assert limiter.limit >= 8
+
+
+def test_calls_over_the_limit_are_rejected():
+    limiter = AdaptiveLimiter(initial_limit=1, queue_timeout_seconds=0.01)
+    guard = ProviderGuard('stub', limiter=limiter)
+    assert limiter.acquire()
+    with pytest.raises(ProviderUnavailable):
+        guard.call(lambda: {"success": True})
+    assert limiter.status()['rejected'] == 1
+
+
+def test_cancelled_waiters_leave_no_slot_behind():
+    limiter = AdaptiveLimiter(initial_limit=1, max_limit=1, queue_timeout_seconds=5)
+    guard = ProviderGuard('google.sentiment', limiter=limiter)
+
+    async def run():
+        assert await limiter.acquire_async()
+        # Clients that disconnect while their requests wait for the slot
+        waiting = [asyncio.ensure_future(guard.call_async(asyncio.sleep, 0, {"success": True})) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        for task in waiting[:4]:
+            task.cancel()
+        await asyncio.sleep(0.01)
+        limiter.release(failed=False, elapsed=0.1)
+        return await waiting[4]
+
+    assert asyncio.run(run()) == {"success": True}
+    assert limiter.status() == {"limit": 1, "in_flight": 0, "rejected": 0}
+
+
+def test_a_cancelled_call_is_not_a_provider_failure():
+    breaker = CircuitBreaker('google.sentiment', min_calls=1)
+    limiter = AdaptiveLimiter(initial_limit=8)
+    guard = ProviderGuard('google.sentiment', breaker=breaker, limiter=limiter)
+
+    async def run():
+        call = asyncio.ensure_future(guard.call_async(asyncio.sleep, 10))
+        await asyncio.sleep(0.01)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    asyncio.run(run())
+    assert limiter.status() == {"limit": 8, "in_flight": 0, "rejected": 0}
+    assert breaker.status()['calls_in_window'] == 0 and breaker.state == CircuitBreaker.CLOSED
+
+
+def test_a_slot_freed_by_a_thread_is_handed_to_a_waiting_coroutine():
+    limiter = AdaptiveLimiter(initial_limit=1, max_limit=1, queue_timeout_seconds=5)
+    assert limiter.acquire()
+
+    async def run():
+        threading.Timer(0.05, limiter.release, kwargs={'failed': False, 'elapsed': 0.1}).start()
+        return await limiter.acquire_async()
+
+    assert asyncio.run(run())
+    assert limiter.status()['in_flight'] == 1
+
+
+def test_the_limit_doubles_per_round_trip_until_the_first_failure():
+    limiter = AdaptiveLimiter(initial_limit=8, max_limit=64)
+    for _ in range(8):
+        assert limiter.acquire()
+    for _ in range(8):
+        limiter.release(failed=False, elapsed=0.1)
+    assert limiter.limit == 16
+
+    assert limiter.acquire()
+    limiter.release(failed=True, elapsed=0.1)
+    assert limiter.limit == 8
+    for _ in range(8):
+        assert limiter.acquire()
+        limiter.release(failed=False, elapsed=0.1)
+    assert limiter.limit < 9
@@ -0,0 +1,84 @@
+import math
+
+from open_source_services.diarization import speaker_sentiment
+from utils.sentiment_timeline import SentimentTimeline
+
+
+class SingleTextSentiment:
+    """A plugin sentiment service with only the protocol's analyze_sentiment"""
+
+    def __init__(self):
+        self.texts = []
+
+    def analyze_sentiment(self, text):
+        self.texts.append(text)
+        if len(text) < 3:
+            return {"success": False, "error": "Text too short for sentiment analysis", "input_error": True}
+        return {"success": True, "score": 0.5 if "good" in text else -0.5, "magnitude": 0.5}
+
+
+def segment(start, end, text, speaker=None):
+    return {"start": start, "end": end, "text": text, "speaker": speaker}
+
+
+def test_a_timeline_scores_segments_with_a_single_text_plugin():
+    service = SingleTextSentiment()
+    timeline = SentimentTimeline(service)
+
+    appended = timeline.extend([segment(0.0, 1.0, "good start"), segment(1.0, 2.0, "ok"),
+                                segment(2.0, 3.0, "bad end")])
+
+    assert appended == 3
+    assert service.texts == ["good start", "ok", "bad end"]
+    assert timeline.scores[0] == 0.5 and math.isnan(timeline.scores[1]) and timeline.scores[2] == -0.5
+
+
+def test_speaker_sentiment_works_with_a_single_text_plugin():
+    segments = [segment(0.0, 1.0, "good morning", "A"), segment(1.0, 2.0, "bad news", "B"),
+                segment(2.0, 3.0, "good to hear", "A")]
+
+    sentiments = speaker_sentiment(segments, SingleTextSentiment())
+
+    assert sentiments["A"]["score"] == 0.5
+    assert sentiments["B"]["score"] == -0.5
+
+
+def scored_timeline(scores):
+    """A timeline of one-second segments with these scores; None is an unscored gap"""
+    timeline = SentimentTimeline(None)
+    for n, score in enumerate(scores):
+        timeline.starts.append(float(n))
+        timeline.ends.append(n + 1.0)
+        timeline.scores.append(math.nan if score is None else score)
+        timeline.magnitudes.append(math.nan if score is None else abs(score))
+    return timeline
+
+
+def test_smoothing_is_a_trailing_average_that_skips_gaps():
+    timeline = scored_timeline([1.0, None, 0.0, -1.0, None, None, None])
+
+    smoothed = list(timeline.smoothed_scores(3))
+
+    assert smoothed[:5] == [1.0, 1.0, 0.5, -0.5, -0.5]
+    # Only gaps left in the window
+    assert math.isnan(smoothed[6])
+
+
+def test_to_dict_reports_gaps_as_none_and_the_window_used():
+    timeline = scored_timeline([0.5, None, -0.5])
+
+    raw = timeline.to_dict()
+    smoothed = timeline.to_dict(window=2)
+
+    assert raw == {"start": [0.0, 1.0, 2.0], "end": [1.0, 2.0, 3.0], "score": [0.5, None, -0.5],
+                   "magnitude": [0.5, None, 0.5], "window": 1}
+    assert smoothed["score"] == [0.5, 0.5, -0.5] and smoothed["window"] == 2
+
+
+def test_segments_without_offsets_are_skipped_and_missing_ends_collapse_to_the_start():
+    timeline = SentimentTimeline(SingleTextSentiment())
+
+    appended = timeline.extend([{"start": None, "text": "good"}, {"start": 4.0, "end": None, "text": "good one"}])
+
+    assert appended == 1
+    assert (list(timeline.starts), list(timeline.ends)) == ([4.0], [4.0])
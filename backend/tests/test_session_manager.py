@@ -0,0 +1,106 @@
+import random
+
+import pytest
+from flask import Flask, session
+
+from utils.result_stats import MAX_BUCKET, ResultStats
+from utils.session_manager import SessionManager
+
+# Flask warns, and browsers drop the cookie, above this
+MAX_COOKIE_BYTES = 4093
+PROVIDERS = ("google", "opensource", "fast")
+TYPES = ("speech-to-text", "text-to-speech", "sentiment")
+WORDS = ("hello", "refund", "agent", "waited", "thanks", "invoice", "never", "quickly")
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.secret_key = "test"
+    return app
+
+
+def random_result(rng, index):
+    def sentiment():
+        return {"success": True, "sentiment": rng.choice(("positive", "neutral", "negative")),
+                "score": rng.uniform(-1, 1)}
+    processing_time = rng.lognormvariate(0, 2)
+    if index % 4 == 0:
+        return {"id": f"r{index}", "type": "compare-sentiment", "providers": list(PROVIDERS),
+                "processing_time": processing_time, "text": f"comparison {index}",
+                **{name: {"sentiment": sentiment()} for name in PROVIDERS}}
+    return {"id": f"r{index}", "type": rng.choice(TYPES), "provider": rng.choice(PROVIDERS),
+            "processing_time": processing_time, "sentiment": sentiment(),
+            "text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 80)))}
+
+
+def test_cookie_stays_under_the_browser_limit(app):
+    rng = random.Random(0)
+    with app.test_request_context():
+        manager = SessionManager()
+        serializer = app.session_interface.get_signing_serializer(app)
+        for index in range(1, 1001):
+            manager.add_result(random_result(rng, index))
+            if index % 100 == 0:
+                assert len(serializer.dumps(dict(session))) < MAX_COOKIE_BYTES
+                storage = manager.storage_stats()
+                if storage['results'] > 1:
+                    assert storage['stored_bytes'] + storage['stats_bytes'] <= manager.max_bytes
+        assert manager.get_stats()['total'] == 1000
+
+
+def test_time_histogram_has_a_fixed_number_of_buckets():
+    stats = ResultStats()
+    for exponent in range(-6, 8):
+        stats.add({"type": "speech-to-text", "processing_time": 10.0 ** exponent})
+    buckets = stats.state['time']['type:speech-to-text']['buckets']
+    assert max(int(bucket) for bucket in buckets) == MAX_BUCKET
+
+
+def test_removing_results_is_exact():
+    rng = random.Random(1)
+    results = [random_result(rng, index) for index in range(50)]
+    stats = ResultStats()
+    for result in results:
+        stats.add(result)
+    for result in results[10:]:
+        stats.remove(result)
+    expected = ResultStats()
+    for result in results[:10]:
+        expected.add(result)
+    assert stats.summary() == expected.summary()
+
+
+def long_transcription(rng, index, segments=120):
+    """A 10-minute transcription: 120 five-second segments with word timings"""
+    def words(start):
+        return [{"word": rng.choice(WORDS), "start": round(start + n * 0.4, 2), "end": round(start + n * 0.4 + 0.3, 2)}
+                for n in range(12)]
+    segments = [{"start": n * 5.0, "end": n * 5.0 + 5.0, "words": words(n * 5.0),
+                 "text": " ".join(f"{rng.choice(WORDS)}{rng.randint(0, 999)}" for _ in range(12))}
+                for n in range(segments)]
+    text = " ".join(segment["text"] for segment in segments)
+    return {"id": f"long{index}", "type": "speech_to_text", "provider": "google", "processing_time": 42.0,
+            "transcription": {"success": True, "text": text, "segments": segments},
+            "sentiment": {"success": True, "sentiment": "negative", "score": -0.4, "sentences": [{"text": text}]}}
+
+
+def test_a_result_too_large_for_the_cookie_is_stored_as_a_summary(app):
+    rng = random.Random(2)
+    with app.test_request_context():
+        manager = SessionManager()
+        serializer = app.session_interface.get_signing_serializer(app)
+        manager.add_result(random_result(rng, 1))
+        manager.add_result(long_transcription(rng, 2))
+
+        assert len(serializer.dumps(dict(session))) < MAX_COOKIE_BYTES
+        stored = manager.get_result("long2")
+        assert stored["summarized"] and stored["provider"] == "google" and stored["sentiment"]["score"] == -0.4
+        assert "segments" not in stored["transcription"] and len(stored["transcription"]["text"]) < 250
+        # The earlier history survives
+        assert manager.get_result("r1") is not None
+
+        # Removing the summary subtracts exactly what adding the full result added
+        manager.remove_result("long2")
+        assert manager.get_stats()['total'] == 1
+        assert "speech_to_text" not in {key for key, count in manager.get_stats()['by_type'].items() if count}
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+from utils.single_flight import SingleFlight
+
+KEY = ('google', 'text', 'synthesize_speech', ('hello',), ())
+
+
+def result_path(lock_dir):
+    return os.path.join(lock_dir, f"{hashlib.sha256(repr(KEY).encode('utf-8')).hexdigest()}.result")
+
+
+def across_workers(lock_dir, leader_fn, follower_fn):
+    """Run leader_fn in one 'worker' and, once it has the lock, follower_fn in another; returns both results"""
+    # Separate instances share nothing in memory, like two worker processes
+    leader, follower = SingleFlight(lock_dir=str(lock_dir)), SingleFlight(lock_dir=str(lock_dir))
+    results = {}
+    thread = threading.Thread(target=lambda: results.setdefault('leader', leader.do(KEY, leader_fn)))
+    thread.start()
+    time.sleep(0.1)
+    results['follower'] = follower.do(KEY, follower_fn)
+    thread.join()
+    return results['leader'], results['follower'], follower.coalesced
+
+
+def test_results_are_shared_across_workers_as_json(tmp_path):
+    def synthesize():
+        time.sleep(0.3)
+        return ("tts_1.mp3", b"\x00\xffaudio"), None
+
+    leader, follower, coalesced = across_workers(tmp_path, synthesize, lambda: "called again")
+
+    assert leader == (("tts_1.mp3", b"\x00\xffaudio"), None)
+    # Tuples come back as lists, which the routes unpack the same way
+    assert follower == [["tts_1.mp3", b"\x00\xffaudio"], None]
+    assert coalesced == 1
+    with open(result_path(str(tmp_path))) as f:
+        assert f.read().startswith('[["tts_1.mp3", {"__bytes__": ')
+
+
+class Exploit:
+    def __reduce__(self):
+        return os.makedirs, (self.marker,)
+
+
+def test_a_planted_pickle_is_not_loaded(tmp_path):
+    Exploit.marker = str(tmp_path / 'pwned')
+
+    def plant_then_fail():
+        # Written after the follower started waiting, so it is fresh enough to be read
+        time.sleep(0.3)
+        with open(result_path(str(tmp_path)), 'wb') as f:
+            pickle.dump(Exploit(), f)
+        raise RuntimeError("provider failed")
+
+    thread_errors = []
+    leader = SingleFlight(lock_dir=str(tmp_path))
+    follower = SingleFlight(lock_dir=str(tmp_path))
+
+    def lead():
+        try:
+            leader.do(KEY, plant_then_fail)
+        except RuntimeError as e:
+            thread_errors.append(e)
+
+    thread = threading.Thread(target=lead)
+    thread.start()
+    time.sleep(0.1)
+    assert follower.do(KEY, lambda: "made the call itself") == "made the call itself"
+    thread.join()
+
+    assert thread_errors
+    assert not os.path.exists(Exploit.marker)
+    assert follower.coalesced == 0
+
+
+def test_the_coalesced_count_is_exact_under_threads():
+    flight = SingleFlight()
+    release = threading.Event()
+    threads = [threading.Thread(target=flight.do, args=(KEY, release.wait)) for _ in range(32)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert flight.coalesced == 31
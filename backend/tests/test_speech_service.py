@@ -0,0 +1,15 @@
+import threading
+
+
+def test_threads_sharing_the_model_transcribe_one_at_a_time(whisper_without_model):
+    service = whisper_without_model
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.transcribe_audio([0.0] * 16)))
+               for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [result['success'] for result in results] == [True] * 6
+    assert service.model.most_active == 1
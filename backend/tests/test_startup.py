@@ -0,0 +1,25 @@
+import pytest
+
+# app.py imports Flask and flask_cors at module level, so without them there is nothing to measure
+pytest.importorskip("flask")
+pytest.importorskip("flask_cors")
+
+from benchmarks.startup import app_import_us, forbidden, measure  # noqa: E402
+
+# Same as benchmarks/startup.py's default; gateway mode imports Flask and the utils in about 200 ms
+BUDGET_MS = 1500
+RUNS = 3
+
+
+@pytest.fixture(scope="module")
+def gateway_imports():
+    # The fastest of a few fresh interpreters, as the benchmark reports, so a busy machine doesn't fail the test
+    return min((measure('gateway') for _ in range(RUNS)), key=app_import_us)
+
+
+def test_gateway_mode_does_not_import_the_ml_stack_or_provider_sdks(gateway_imports):
+    assert forbidden(gateway_imports) == []
+
+
+def test_gateway_mode_imports_within_the_budget(gateway_imports):
+    assert app_import_us(gateway_imports) / 1000 < BUDGET_MS
@@ -0,0 +1,78 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from utils.transcript import average_confidence, build_segment, build_word, logprob_to_confidence
+
+
+@pytest.mark.parametrize("offset", [1.5, timedelta(seconds=1, microseconds=500000),
+                                    SimpleNamespace(seconds=1, nanos=500000000)])
+def test_word_offsets_are_seconds_whatever_the_provider_gives(offset):
+    assert build_word("hello", offset, 2, 0.9) == {"word": "hello", "start": 1.5, "end": 2.0, "probability": 0.9}
+
+
+def test_segments_strip_their_text_and_only_carry_words_when_given():
+    segment = build_segment(0, "  hello there ", 0, timedelta(seconds=1.25), confidence=0.8)
+
+    assert segment["text"] == "hello there"
+    assert (segment["start"], segment["end"]) == (0.0, 1.25)
+    assert "words" not in segment
+    assert build_segment(1, None, None, None, words=[])["words"] == []
+
+
+def test_log_probabilities_become_bounded_confidences():
+    assert logprob_to_confidence(None) is None
+    assert logprob_to_confidence(0.0) == 1.0
+    assert logprob_to_confidence(-0.5) == pytest.approx(0.6065, abs=1e-4)
+    assert logprob_to_confidence("n/a") is None
+
+
+def test_average_confidence_is_weighted_by_duration():
+    segments = [
+        {"start": 0.0, "end": 3.0, "confidence": 0.9},
+        {"start": 3.0, "end": 4.0, "confidence": 0.5},
+        {"start": 4.0, "end": 5.0, "confidence": None},
+    ]
+    assert average_confidence(segments) == pytest.approx(0.8)
+    # Without offsets every segment counts the same
+    assert average_confidence([{"confidence": 0.9}, {"confidence": 0.5}]) == pytest.approx(0.7)
+    assert average_confidence([{"confidence": None}]) is None
+
+
+def test_whisper_segments_are_normalized_with_words_and_confidence(whisper_without_model):
+    raw = [{"id": 0, "text": " Hello there.", "start": 0.0, "end": 1.2, "avg_logprob": -0.1,
+            "no_speech_prob": 0.01, "compression_ratio": 1.1,
+            "words": [{"word": " Hello", "start": 0.0, "end": 0.5, "probability": 0.95},
+                      {"word": " there.", "start": 0.5, "end": 1.2, "probability": 0.9}]}]
+
+    with_words, = whisper_without_model._normalize_segments(raw, word_timestamps=True)
+    without_words, = whisper_without_model._normalize_segments(raw)
+
+    assert with_words["text"] == "Hello there."
+    assert with_words["confidence"] == pytest.approx(logprob_to_confidence(-0.1))
+    assert [word["word"] for word in with_words["words"]] == ["Hello", "there."]
+    assert "words" not in without_words
+
+
+def test_google_results_are_normalized_from_their_words():
+    speech = pytest.importorskip("google.cloud.speech")
+    from google_services.speech_service import SpeechService
+
+    def result(transcript, words, end):
+        return speech.SpeechRecognitionResult(
+            alternatives=[speech.SpeechRecognitionAlternative(transcript=transcript, confidence=0.9, words=[
+                speech.WordInfo(word=word, start_time=timedelta(seconds=start), end_time=timedelta(seconds=stop))
+                for word, start, stop in words
+            ])],
+            result_end_time=timedelta(seconds=end)
+        )
+
+    results = [result("hello there", [("hello", 0.4, 0.8), ("there", 0.8, 1.1)], 1.3),
+               result("no words", [], 2.0)]
+    segments = SpeechService.__new__(SpeechService)._normalize_segments(results, word_timestamps=True)
+
+    # A result starts at its first word; one without words starts where the previous one ended
+    assert [(segment["start"], segment["end"]) for segment in segments] == [(0.4, 1.3), (1.3, 2.0)]
+    assert segments[0]["words"][1] == {"word": "there", "start": 0.8, "end": 1.1, "probability": None}
+    assert segments[0]["confidence"] == pytest.approx(0.9)
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from utils.tts_batch import TTSBatchRenderer
+
+
+def renderer(output_dir):
+    return TTSBatchRenderer({'google': None}, str(output_dir), concurrency=2,
+                            synthesize=lambda provider, text, voice, output_format: text.encode('utf-8'))
+
+
+def render_batches(output_dir, worker, batches):
+    tts = renderer(output_dir)
+    for batch in range(batches):
+        items = [{'id': f"w{worker}-b{batch}-{n}", 'text': f"prompt {n % 7} of batch {batch % 3}"} for n in range(10)]
+        tts.render(tts.prepare(items))
+    tts.close()
+
+
+def test_workers_appending_to_one_manifest_lose_nothing(tmp_path):
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip("needs the fork start method")
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=render_batches, args=(tmp_path, worker, 12)) for worker in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    entries = renderer(tmp_path).load_manifest()
+    # 7 prompts in each of 3 batch variants, every item ID recorded under its prompt
+    assert len(entries) == 21
+    assert sum(len(entry['ids']) for entry in entries.values()) == 4 * 12 * 10
+    for entry in entries.values():
+        assert os.path.getsize(tmp_path / entry['file']) == entry['bytes']
+
+
+def test_repeat_batches_append_only_what_they_add(tmp_path):
+    tts = renderer(tmp_path)
+    items = tts.prepare([{'id': str(n), 'text': f"prompt {n}"} for n in range(50)])
+    tts.render(items)
+    size = os.path.getsize(tts.manifest_path)
+
+    tts.render(items)
+    assert os.path.getsize(tts.manifest_path) == size
+
+    tts.render(tts.prepare([{'id': 'new', 'text': "prompt 3"}]))
+    with open(tts.manifest_path) as f:
+        last = json.loads(f.readlines()[-1])
+    assert last == {'key': items[3]['key'], 'ids': ['new']}
+    assert renderer(tmp_path).load_manifest()[items[3]['key']]['ids'] == ['3', 'new']
+
+
+def test_a_cut_off_line_does_not_swallow_the_next(tmp_path):
+    tts = renderer(tmp_path)
+    tts.render(tts.prepare(["first"]))
+    with open(tts.manifest_path, 'ab') as f:
+        f.write(b'{"key": "cut')
+
+    tts.render(tts.prepare(["second"]))
+    entries = renderer(tmp_path).load_manifest()
+    assert sorted(entry['text'] for entry in entries.values()) == ["first", "second"]
+
+
+def test_http_batches_are_capped_to_finish_within_the_worker_timeout(tmp_path, monkeypatch):
+    pytest.importorskip('quart')
+    pytest.importorskip('quart_cors')
+    from asgi_app import create_app
+
+    class StubText:
+        def synthesize_speech(self, text, voice_name=None, output_format=None):
+            return "tts.mp3", text.encode('utf-8')
+
+        def get_available_voices(self):
+            return []
+
+    monkeypatch.delenv('TTS_BATCH_MAX_ITEMS', raising=False)
+    tts = renderer(tmp_path)
+    app = create_app(services={'google': {'text': StubText()}}, temp_dir=str(tmp_path), tts_batch=tts)
+
+    async def post(count):
+        response = await app.test_client().post('/api/text-to-speech/batch',
+                                                json={"items": [f"prompt {n}" for n in range(count)]})
+        return response.status_code, await response.get_json()
+
+    status, body = asyncio.run(post(51))
+    tts.close()
+    assert (status, body) == (400, {"error": "At most 50 items per batch"})
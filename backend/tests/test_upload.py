@@ -0,0 +1,59 @@
+import struct
+
+import pytest
+
+from utils import upload
+from utils.upload import UploadRejected, receive_upload, sniff_audio
+
+
+def box(kind, payload=b''):
+    return struct.pack('>I', 8 + len(payload)) + kind + payload
+
+
+def hdlr(handler):
+    return box(b'hdlr', b'\0' * 8 + handler + b'\0' * 12)
+
+
+def mp4(brand, handler=None, sample_entry=None, mdat_bytes=8192):
+    ftyp = box(b'ftyp', brand + b'\0\0\0\0' + brand + b'isom')
+    moov = b''
+    if handler:
+        moov = box(b'moov', box(b'trak', hdlr(handler) + box(b'stsd', b'\0' * 8 + box(sample_entry, b'\0' * 28))))
+    return ftyp + moov + box(b'mdat', b'\0' * mdat_bytes)
+
+
+def test_flac_is_not_held_to_the_lossy_bitrate(tmp_path, monkeypatch):
+    # 10 MB of FLAC is about a minute of 48 kHz stereo, not the 160 s a 512 kbps bound would imply
+    monkeypatch.setattr(upload, 'probe_duration', lambda path: 60.0)
+    audio = b'fLaC' + b'\0' * (10 * 1024 * 1024)
+    with open(tmp_path / 'in.flac', 'wb') as f:
+        f.write(audio)
+    with open(tmp_path / 'in.flac', 'rb') as stream:
+        received = receive_upload(stream, str(tmp_path), max_duration_seconds=120)
+    assert received.duration == 60.0
+    received.close()
+
+
+def test_mp3_is_still_rejected_while_streaming(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload, 'probe_duration', lambda path: pytest.fail("rejected before ffprobe"))
+    with open(tmp_path / 'in.mp3', 'wb') as f:
+        f.write(b'ID3' + b'\0' * (10 * 1024 * 1024))
+    with open(tmp_path / 'in.mp3', 'rb') as stream, pytest.raises(UploadRejected) as rejected:
+        receive_upload(stream, str(tmp_path), max_duration_seconds=120)
+    assert rejected.value.status == 413
+
+
+def test_mp4_tracks_are_identified_from_the_moov_box():
+    assert sniff_audio(mp4(b'M4A ', b'soun', b'alac'))['codec'] == 'alac'
+    assert sniff_audio(mp4(b'M4A ', b'soun', b'mp4a'))['codec'] == 'aac'
+    assert sniff_audio(mp4(b'isom', b'vide', b'avc1')) is None
+
+
+def test_video_mp4_with_moov_at_the_end_is_rejected_after_ffprobe(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload, 'probe_has_video', lambda path: True)
+    with open(tmp_path / 'in.mp4', 'wb') as f:
+        f.write(mp4(b'isom'))
+    with open(tmp_path / 'in.mp4', 'rb') as stream, pytest.raises(UploadRejected) as rejected:
+        receive_upload(stream, str(tmp_path))
+    assert rejected.value.status == 415
+    assert list(tmp_path.iterdir()) == [tmp_path / 'in.mp4']
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from utils.voice_catalog import VoiceCatalog
+
+
+class StubText:
+    """Text service whose voice list fetch can be held until released"""
+
+    def __init__(self, name, release=None):
+        self.voices = [{"name": f"{name}-voice", "language_codes": ["en-US"], "gender": "FEMALE"}]
+        self.release = release
+        self.fetches = 0
+
+    def fetch_voices(self):
+        self.fetches += 1
+        if self.release is not None:
+            self.release.wait(5)
+        return self.voices
+
+
+def test_a_slow_fetch_does_not_hold_up_other_providers(tmp_path):
+    release = threading.Event()
+    google, opensource = StubText('google', release), StubText('opensource')
+    catalog = VoiceCatalog({'google': google, 'opensource': opensource}, cache_path=str(tmp_path / 'voices.json'))
+    try:
+        threading.Thread(target=catalog.refresh, args=('google',)).start()
+        time.sleep(0.1)
+
+        start = time.monotonic()
+        voices, _ = catalog.voices('opensource')
+        assert voices == opensource.voices
+        assert time.monotonic() - start < 1
+    finally:
+        release.set()
+        catalog.close()
+    assert google.fetches == 1
+
+
+def test_concurrent_cold_callers_share_one_fetch(tmp_path):
+    release = threading.Event()
+    google = StubText('google', release)
+    catalog = VoiceCatalog({'google': google}, cache_path=str(tmp_path / 'voices.json'))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(catalog.voices('google')[0])) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    catalog.close()
+    assert results == [google.voices] * 8
+    assert google.fetches == 1
+
+
+def test_workers_pick_up_and_keep_what_other_workers_wrote(tmp_path):
+    path = str(tmp_path / 'voices.json')
+    first = {'google': StubText('google'), 'opensource': StubText('opensource')}
+    second = {'google': StubText('google'), 'opensource': StubText('opensource')}
+    # Both workers start before anything is on disk
+    first_catalog, second_catalog = VoiceCatalog(first, cache_path=path), VoiceCatalog(second, cache_path=path)
+
+    first_catalog.refresh('google')
+    # The second worker reads the first one's list instead of fetching its own
+    assert second_catalog.voices('google')[0] == first['google'].voices
+    assert second['google'].fetches == 0
+
+    second_catalog.refresh('opensource')
+    first_catalog.close()
+    second_catalog.close()
+    # Saving the second worker's list kept the first worker's
+    assert set(VoiceCatalog(first, cache_path=path).status()) == {'google', 'opensource'}
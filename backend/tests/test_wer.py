@@ -0,0 +1,71 @@
+import random
+import time
+
+import pytest
+
+from utils import wer
+from utils.wer import aligned_error_counts, edit_distance, error_counts, score_transcript
+
+
+def noisy_copy(words, vocab, rng):
+    """The words with about 5% substitutions, 3% deletions and 2% insertions"""
+    hypothesis = []
+    for word in words:
+        roll = rng.random()
+        if roll < 0.05:
+            hypothesis.append(rng.choice(vocab))
+        elif roll < 0.08:
+            continue
+        elif roll < 0.1:
+            hypothesis += [word, rng.choice(vocab)]
+        else:
+            hypothesis.append(word)
+    return hypothesis
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_the_anchored_breakdown_matches_the_full_alignment(seed):
+    rng = random.Random(seed)
+    vocab = [f"w{i}" for i in range(300)]
+    reference = [rng.choice(vocab) for _ in range(400)]
+    hypothesis = noisy_copy(reference, vocab, rng)
+
+    counts = aligned_error_counts(reference, hypothesis)
+
+    assert sum(counts) == sum(error_counts(reference, hypothesis)) == edit_distance(reference, hypothesis)
+    assert counts[1] - counts[2] == len(reference) - len(hypothesis)
+
+
+def test_a_long_transcript_is_scored_quickly():
+    rng = random.Random(7)
+    vocab = [f"w{i}" for i in range(500)]
+    reference = [rng.choice(vocab) for _ in range(4000)]
+    hypothesis = noisy_copy(reference, vocab, rng)
+
+    started = time.perf_counter()
+    scores = score_transcript(" ".join(reference), " ".join(hypothesis))
+
+    # The full dynamic-programming table took over 15 s here
+    assert time.perf_counter() - started < 5
+    assert scores["word_errors"] == edit_distance(reference, hypothesis)
+    assert scores["substitutions"] + scores["deletions"] + scores["insertions"] == scores["word_errors"]
+
+
+def test_an_unrelated_transcript_keeps_an_exact_wer_and_a_bounded_breakdown(monkeypatch):
+    monkeypatch.setattr(wer, "MAX_GAP_CELLS", 100)
+    rng = random.Random(3)
+    reference = [f"r{rng.randrange(50)}" for _ in range(60)]
+    hypothesis = [f"h{rng.randrange(50)}" for _ in range(40)]
+
+    scores = score_transcript(" ".join(reference), " ".join(hypothesis))
+
+    assert scores["word_errors"] == 60
+    assert (scores["substitutions"], scores["deletions"], scores["insertions"]) == (40, 20, 0)
+
+
+def test_scores_ignore_case_and_punctuation():
+    scores = score_transcript("Hello, world! Don't stop.", "hello world don't go")
+
+    assert scores["ref_words"] == 4
+    assert (scores["word_errors"], scores["substitutions"]) == (1, 1)
+    assert scores["wer"] == 0.25
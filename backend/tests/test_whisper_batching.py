@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("whisper")
+
+from open_source_services.whisper_batching import BatchingSpeechService  # noqa: E402
+
+TIMESTAMP_BEGIN = 1000
+WINDOW = 480000
+
+
+@pytest.fixture
+def service():
+    # Only the tokenizer is needed to split a window; no model is loaded
+    service = BatchingSpeechService.__new__(BatchingSpeechService)
+    service.tokenizer = SimpleNamespace(
+        timestamp_begin=TIMESTAMP_BEGIN,
+        eot=999,
+        decode=lambda tokens: " ".join(f"w{token}" for token in tokens)
+    )
+    return service
+
+
+def ts(seconds):
+    return TIMESTAMP_BEGIN + int(seconds / 0.02)
+
+
+def test_window_is_split_at_timestamp_pairs_and_cut_text_is_decoded_again(service):
+    tokens = [ts(0), 1, 2, ts(2), ts(2), 3, 4, ts(10), ts(10), 5, 6]
+    segments, advance = service._split(tokens, WINDOW)
+    assert segments == [(0.0, 2.0, "w1 w2"), (2.0, 10.0, "w3 w4")]
+    # Words 5 and 6 ran into the window edge; the next window starts at 10 s
+    assert advance == 10 * 16000
+
+
+def test_single_timestamp_ending_consumes_the_window(service):
+    tokens = [ts(0), 1, ts(2), ts(3), 2, ts(6), 7, ts(8)]
+    segments, advance = service._split(tokens, WINDOW)
+    assert segments == [(0.0, 2.0, "w1"), (3.0, 8.0, "w2 w7")]
+    assert advance == WINDOW
+
+
+def test_window_without_segment_boundaries_is_one_segment(service):
+    segments, advance = service._split([ts(0), 1, 2, ts(5)], WINDOW)
+    assert segments == [(0.0, 5.0, "w1 w2")]
+    assert advance == WINDOW
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import struct
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# Output formats the TTS endpoints can return, with the ffmpeg encoder used when a provider cannot
+# produce one natively
+FORMATS = {
+    'mp3': {
+        'extension': '.mp3', 'mimetype': 'audio/mpeg', 'container': 'mp3', 'codec': ['-c:a', 'libmp3lame'],
+        'sample_rates': (8000, 11025, 12000, 16000, 22050, 24000, 32000, 44100, 48000), 'bitrates': (8, 320)
+    },
+    'ogg_opus': {
+        'extension': '.ogg', 'mimetype': 'audio/ogg', 'container': 'ogg',
+        'codec': ['-c:a', 'libopus', '-application', 'voip'],
+        'sample_rates': (8000, 12000, 16000, 24000, 48000), 'bitrates': (6, 256)
+    },
+    'wav': {
+        'extension': '.wav', 'mimetype': 'audio/wav', 'container': 'wav', 'codec': ['-c:a', 'pcm_s16le'],
+        'sample_rates': (8000, 11025, 16000, 22050, 24000, 32000, 44100, 48000), 'bitrates': None
+    },
+}
+DEFAULT_FORMAT = 'mp3'
+# Accepted spellings of format names
+ALIASES = {'opus': 'ogg_opus', 'ogg': 'ogg_opus', 'linear16': 'wav', 'pcm': 'wav'}
+
+
+class OutputFormat:
+    """Encoding, bitrate and sample rate requested for synthesized audio"""
+
+    def __init__(self, name=DEFAULT_FORMAT, bitrate=None, sample_rate=None):
+        """
+        Args:
+            name: Key of FORMATS
+            bitrate: Target bitrate in kbps, or None for the provider's own
+            sample_rate: Sample rate in Hz, or None for the provider's own
+        """
+        self.name = name
+        self.bitrate = bitrate
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def parse(cls, name=None, bitrate=None, sample_rate=None):
+        """
+        Validate a requested format
+
+        Returns:
+            OutputFormat or None: None when nothing was requested, meaning
+                                  each provider's default MP3
+
+        Raises:
+            ValueError: Unknown format, or a bitrate/sample rate it does not support
+        """
+        if name is None and bitrate is None and sample_rate is None:
+            return None
+        name = ALIASES.get(str(name or DEFAULT_FORMAT).lower(), str(name or DEFAULT_FORMAT).lower())
+        if name not in FORMATS:
+            raise ValueError(f"Unknown audio format '{name}', available: {sorted(FORMATS)}")
+        spec = FORMATS[name]
+        try:
+            bitrate = int(bitrate) if bitrate is not None else None
+            sample_rate = int(sample_rate) if sample_rate is not None else None
+        except (TypeError, ValueError):
+            raise ValueError("bitrate and sample_rate must be integers")
+        if bitrate is not None:
+            if not spec['bitrates']:
+                raise ValueError(f"{name} has no bitrate setting")
+            low, high = spec['bitrates']
+            if not low <= bitrate <= high:
+                raise ValueError(f"{name} bitrate must be between {low} and {high} kbps")
+        if sample_rate is not None and sample_rate not in spec['sample_rates']:
+            raise ValueError(f"{name} sample rate must be one of {list(spec['sample_rates'])}")
+        return cls(name, bitrate, sample_rate)
+
+    @property
+    def extension(self):
+        return FORMATS[self.name]['extension']
+
+    @property
+    def mimetype(self):
+        return FORMATS[self.name]['mimetype']
+
+    @property
+    def key(self):
+        """Short stable name, e.g. 'ogg_opus-24k-16000', for cache keys and file names"""
+        parts = [self.name]
+        if self.bitrate:
+            parts.append(f"{self.bitrate}k")
+        if self.sample_rate:
+            parts.append(str(self.sample_rate))
+        return '-'.join(parts)
+
+    def to_dict(self):
+        return {"format": self.name, "bitrate": self.bitrate, "sample_rate": self.sample_rate,
+                "mimetype": self.mimetype}
+
+    def __eq__(self, other):
+        return isinstance(other, OutputFormat) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"OutputFormat({self.key})"
+
+
+def output_format_from_request(data):
+    """
+    Output format from a request's JSON: "format", "bitrate" (kbps) and "sample_rate" (Hz)
+
+    Raises:
+        ValueError: The requested format is not supported
+    """
+    return OutputFormat.parse(data.get('format'), data.get('bitrate'), data.get('sample_rate'))
+
+
+def _ffmpeg_command(output_format):
+    spec = FORMATS[output_format.name]
+    command = ['ffmpeg', '-nostdin', '-v', 'error', '-i', 'pipe:0', '-vn', '-ac', '1']
+    if output_format.sample_rate:
+        command += ['-ar', str(output_format.sample_rate)]
+    command += spec['codec']
+    if output_format.bitrate:
+        command += ['-b:a', f"{output_format.bitrate}k"]
+    return command + ['-f', spec['container'], 'pipe:1']
+
+
+def _with_wav_sizes(audio):
+    """
+    Fill in the RIFF and data chunk sizes of a WAV file ffmpeg wrote to a pipe
+
+    ffmpeg cannot seek back on pipe:1 to write the sizes, so it leaves placeholders
+    that strict decoders read as a truncated or endless stream.
+    """
+    if len(audio) < 12 or audio[:4] != b'RIFF' or audio[8:12] != b'WAVE':
+        return audio
+    audio = bytearray(audio)
+    struct.pack_into('<I', audio, 4, len(audio) - 8)
+    # The data chunk follows fmt and, unless metadata is stripped, a LIST chunk
+    offset = 12
+    while offset + 8 <= len(audio):
+        chunk_id = bytes(audio[offset:offset + 4])
+        if chunk_id == b'data':
+            struct.pack_into('<I', audio, offset + 4, len(audio) - offset - 8)
+            break
+        size, = struct.unpack_from('<I', audio, offset + 4)
+        offset += 8 + size + (size & 1)
+    return bytes(audio)
+
+
+def _transcoded(stdout, output_format):
+    if FORMATS[output_format.name]['container'] == 'wav':
+        return _with_wav_sizes(stdout)
+    return stdout
+
+
+def transcode(audio, output_format):
+    """
+    Re-encode audio bytes (any format ffmpeg detects) into output_format
+
+    One ffmpeg process, fed and read through pipes; nothing touches disk.
+
+    Raises:
+        RuntimeError: ffmpeg failed
+    """
+    process = subprocess.run(_ffmpeg_command(output_format), input=audio, capture_output=True)
+    if process.returncode != 0 or not process.stdout:
+        raise RuntimeError(f"Transcoding to {output_format.key} failed: "
+                           f"{process.stderr.decode('utf-8', 'replace').strip()}")
+    logger.info("Transcoded %s bytes to %s bytes of %s", len(audio), len(process.stdout), output_format.key,
+                extra={'sample': True})
+    return _transcoded(process.stdout, output_format)
+
+
+async def transcode_async(audio, output_format):
+    """Async variant of transcode that waits for ffmpeg without blocking the event loop"""
+    process = await asyncio.create_subprocess_exec(
+        *_ffmpeg_command(output_format),
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate(audio)
+    if process.returncode != 0 or not stdout:
+        raise RuntimeError(f"Transcoding to {output_format.key} failed: {stderr.decode('utf-8', 'replace').strip()}")
+    logger.info("Transcoded %s bytes to %s bytes of %s", len(audio), len(stdout), output_format.key,
+                extra={'sample': True})
+    return _transcoded(stdout, output_format)
+
+
+def format_kwargs(output_format):
+    """synthesize_speech keyword arguments for a format, none for the default so any provider accepts them"""
+    return {'output_format': output_format} if output_format else {}
@@ -0,0 +1,119 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Collects concurrent calls into batches for a batch-capable function"""
+
+    def __init__(self, batch_fn, max_batch_size=16, max_wait_ms=10, name="batcher"):
+        """
+        Initialize the batcher and start its worker thread
+
+        Args:
+            batch_fn: Callable taking a list of items and returning a list of
+                      results in the same order
+            max_batch_size: Largest batch handed to batch_fn (throughput knob)
+            max_wait_ms: How long the first item of a batch waits for company
+                         before the batch is run anyway (latency knob)
+            name: Name used for the worker thread and in logs
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._closed = False
+        self._lock = threading.Lock()
+        self._start()
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, args=(self._queue,), name=self.name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """
+        Queue an item for the next batch
+
+        Args:
+            item: Item to pass to batch_fn
+
+        Returns:
+            Future: Resolves to the result for this item
+        """
+        if self._closed:
+            raise RuntimeError(f"{self.name} is closed")
+        if self._pid != os.getpid():
+            # First use in a forked worker (e.g. a preloading master's child): the thread did not survive fork
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def call(self, item, timeout=None):
+        """Submit an item and block until its result is available"""
+        return self.submit(item).result(timeout=timeout)
+
+    def close(self, cancel=False):
+        """Stop accepting items; queued items are still processed, or failed if cancel is set"""
+        self._closed = True
+        if self._pid != os.getpid():
+            # Never started in this process
+            return
+        while cancel:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not None:
+                entry[1].set_exception(RuntimeError(f"{self.name} is shutting down"))
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first, work_queue):
+        """Gather up to max_batch_size items, waiting at most max_wait after the first"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = work_queue.get(timeout=remaining) if remaining > 0 else work_queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # Re-queue the sentinel so the run loop stops after this batch
+                work_queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self, work_queue):
+        while True:
+            first = work_queue.get()
+            if first is None:
+                return
+            batch = self._collect(first, work_queue)
+            items = [item for item, _ in batch]
+            try:
+                results = self.batch_fn(items)
+            except Exception as e:
+                logger.error("Error in %s batch of %s: %s", self.name, len(items), e)
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            results = list(results)
+            if len(results) != len(batch):
+                # Never leave a caller waiting: fail the items a short (or long) result list did not answer
+                logger.error("%s batch of %s returned %s results", self.name, len(batch), len(results))
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            for _, future in batch[len(results):]:
+                future.set_exception(RuntimeError(f"{self.name} returned no result for this item"))
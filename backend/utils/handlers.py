@@ -0,0 +1,306 @@
+import base64
+import logging
+from datetime import datetime
+
+from utils.audio_format import OutputFormat, output_format_from_request
+from utils.providers import requested_providers
+from utils.resilience import ProviderUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Validation, session records, responses and error statuses shared by app.py and asgi_app.py, which
+# only differ in how they read requests and whether provider calls block or are awaited
+
+# Voices the text-to-speech endpoints use when a request names none
+DEFAULT_VOICES = {'google': 'en-US-Neural2-F', 'opensource': 'en-US-ChristopherNeural'}
+
+
+class RequestRejected(Exception):
+    """Raised when a request is invalid; answered with {"error": message} and the status"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _flag(values, name):
+    return values.get(name, 'false').lower() == 'true'
+
+
+def audio_upload(files):
+    """The uploaded audio file of a speech-to-text request"""
+    if 'audio' not in files:
+        raise RequestRejected("No audio file provided")
+    file = files['audio']
+    if file.filename == '':
+        raise RequestRejected("Empty filename")
+    return file
+
+
+def request_text(data):
+    """The stripped text of a JSON request"""
+    if not data or 'text' not in data:
+        raise RequestRejected("No text provided")
+    text = data.get('text', '').strip()
+    if not text:
+        raise RequestRejected("Empty text")
+    return text
+
+
+def request_output_format(data):
+    """Optional "format" (mp3, ogg_opus, wav), "bitrate" (kbps) and "sample_rate"; None for the default MP3"""
+    try:
+        return output_format_from_request(data)
+    except ValueError as e:
+        raise RequestRejected(str(e)) from None
+
+
+def speech_to_text_options(form, calls):
+    """
+    Options of a speech-to-text request
+
+    Raises:
+        UnknownProvider: The speech or sentiment provider is not registered
+    """
+    provider = form.get('provider', 'google')
+    options = {
+        'provider': provider,
+        # Sentiment can come from another provider, e.g. the 'fast' lexicon engine
+        'sentiment_provider': form.get('sentiment_provider', provider),
+        'word_timestamps': _flag(form, 'word_timestamps'),
+        # Optional per-segment sentiment timeline, smoothed over `timeline_window` segments
+        'include_timeline': _flag(form, 'sentiment_timeline'),
+        'timeline_window': form.get('timeline_window', 1, type=int),
+        # Optional speaker labels on segments and sentiment per speaker; `speakers` if the count is known
+        'diarize': _flag(form, 'diarize'),
+        'num_speakers': form.get('speakers', None, type=int),
+    }
+    calls.check('speech', provider)
+    calls.check('sentiment', options['sentiment_provider'])
+    return options
+
+
+def compare_speech_to_text_options(form, calls):
+    """Word timestamps flag and provider names of a speech-to-text comparison"""
+    names = requested_providers(form.get('providers'))
+    calls.check('speech', *names)
+    return _flag(form, 'word_timestamps'), names
+
+
+def text_to_speech_options(data, calls):
+    """
+    Options of a text-to-speech request
+
+    Raises:
+        RequestRejected: No text, or an invalid output format
+        UnknownProvider: The text or sentiment provider is not registered
+    """
+    text = request_text(data)
+    provider = data.get('provider', 'google')
+    options = {
+        'text': text,
+        'voice': data.get('voice', DEFAULT_VOICES['google']),
+        'provider': provider,
+        'sentiment_provider': data.get('sentiment_provider', provider),
+        'output_format': request_output_format(data),
+    }
+    calls.check('text', provider)
+    calls.check('sentiment', options['sentiment_provider'])
+    return options
+
+
+def sentiment_options(data, calls):
+    """Text and provider of a sentiment request"""
+    text = request_text(data)
+    provider = data.get('provider', 'google')
+    calls.check('sentiment', provider)
+    return text, provider
+
+
+def compare_sentiment_options(data, calls):
+    """Text and provider names of a sentiment comparison"""
+    text = request_text(data)
+    names = requested_providers(data.get('providers'))
+    calls.check('sentiment', *names)
+    return text, names
+
+
+def compare_text_to_speech_options(data, calls):
+    """Text, voice by provider, output format and provider names of a text-to-speech comparison"""
+    text = request_text(data)
+    # Voices by provider; google_voice and os_voice are still accepted for the two built-in providers
+    voices = {
+        'google': data.get('google_voice', DEFAULT_VOICES['google']),
+        'opensource': data.get('os_voice', DEFAULT_VOICES['opensource']),
+        **(data.get('voices') or {})
+    }
+    output_format = request_output_format(data)
+    names = requested_providers(data.get('providers'))
+    calls.check('text', *names)
+    return text, voices, output_format, names
+
+
+def text_to_speech_batch_items(data, calls, tts_batch, max_items):
+    """
+    Items of a batch text-to-speech request, prepared by the renderer
+
+    Raises:
+        RequestRejected: No items, too many, or an invalid item
+        UnknownProvider: The text provider is not registered
+    """
+    if not data or not isinstance(data.get('items'), list) or not data['items']:
+        raise RequestRejected("No items provided")
+    if len(data['items']) > max_items:
+        raise RequestRejected(f"At most {max_items} items per batch")
+    provider = data.get('provider', 'google')
+    calls.check('text', provider)
+    try:
+        return tts_batch.prepare(data['items'], provider=provider, voice=data.get('voice'),
+                                 output_format=output_format_from_request(data))
+    except ValueError as e:
+        raise RequestRejected(str(e)) from None
+
+
+def speech_to_text_result(conversion_id, options, results, sentiment, sentiment_timeline, diarization, failovers,
+                          audio_sha256, processing_time):
+    """
+    Session record and response of a transcription
+
+    Returns:
+        tuple: (session record, response body)
+    """
+    record = {
+        'id': conversion_id,
+        'type': 'speech_to_text',
+        'provider': options['provider'],
+        'sentiment_provider': options['sentiment_provider'],
+        'timestamp': datetime.now().isoformat(),
+        'processing_time': processing_time,
+        'transcription': results,
+        'sentiment': sentiment,
+        'sentiment_timeline': sentiment_timeline,
+        # Turns are left out of the session, the segments carry the speaker labels
+        'diarization': {key: value for key, value in diarization.items() if key != 'turns'} if diarization else None,
+        'failover': failovers or None,
+        'audio_sha256': audio_sha256
+    }
+    response = {
+        "id": conversion_id,
+        "provider": options['provider'],
+        "sentiment_provider": options['sentiment_provider'],
+        "results": results,
+        "sentiment": sentiment,
+        "sentiment_timeline": sentiment_timeline,
+        "diarization": diarization,
+        "failover": failovers or None,
+        "audio_sha256": audio_sha256
+    }
+    return record, response
+
+
+def compare_speech_to_text_result(conversion_id, names, compared, processing_time):
+    """Session record and response of a speech-to-text comparison, from provider -> {results, sentiment}"""
+    record = {
+        'id': conversion_id,
+        'type': 'speech_to_text_comparison',
+        'timestamp': datetime.now().isoformat(),
+        'processing_time': processing_time,
+        'providers': names
+    }
+    for name, entry in compared.items():
+        record[name] = {'transcription': entry['results'], 'sentiment': entry['sentiment']}
+    # Keyed by provider name, matching the structure the frontend expects for google/opensource
+    return record, {"id": conversion_id, "providers": names, **compared}
+
+
+def text_to_speech_result(conversion_id, options, audio_path, audio_content, sentiment, failovers, processing_time):
+    """Session record and response of a synthesis; the response carries the audio as base64"""
+    record = {
+        'id': conversion_id,
+        'type': 'text_to_speech',
+        'provider': options['provider'],
+        'sentiment_provider': options['sentiment_provider'],
+        'timestamp': datetime.now().isoformat(),
+        'processing_time': processing_time,
+        'text': options['text'],
+        'audio_path': audio_path,
+        'sentiment': sentiment,
+        'failover': failovers or None
+    }
+    response = {
+        "id": conversion_id,
+        "provider": options['provider'],
+        "sentiment_provider": options['sentiment_provider'],
+        "audio": base64.b64encode(audio_content).decode('utf-8'),
+        "format": (options['output_format'] or OutputFormat()).to_dict(),
+        "sentiment": sentiment,
+        "failover": failovers or None
+    }
+    return record, response
+
+
+def compared_synthesis(voice, audio=None, audio_path=None, sentiment=None, error=None):
+    """
+    One provider's entry in a text-to-speech comparison
+
+    Returns:
+        tuple: (response entry, session entry or None if synthesis failed)
+    """
+    if error is not None:
+        return {"voice": voice, "error": error}, None
+    return ({"voice": voice, "audio": base64.b64encode(audio).decode('utf-8'), "sentiment": sentiment},
+            {"voice": voice, "audio_path": audio_path, "sentiment": sentiment})
+
+
+def compare_text_to_speech_result(conversion_id, text, names, compared, processing_time):
+    """Session record and response of a text-to-speech comparison, from compared_synthesis() by provider"""
+    record = {
+        'id': conversion_id,
+        'type': 'comparison',
+        'timestamp': datetime.now().isoformat(),
+        'processing_time': processing_time,
+        'text': text,
+        'providers': names
+    }
+    response = {"id": conversion_id, "text": text, "providers": names}
+    for name, (entry, stored) in compared.items():
+        record[name] = stored or entry
+        response[name] = entry
+    return record, response
+
+
+def sentiment_response(text, provider, sentiment, failover):
+    return {"text": text, "provider": provider, "sentiment": sentiment, "failover": [failover] if failover else None}
+
+
+def compare_sentiment_response(text, names, sentiments):
+    """Response of a sentiment comparison, from provider -> sentiment"""
+    response = {"text": text, "providers": names}
+    for name, sentiment in sentiments.items():
+        response[name] = {"provider": name, "sentiment": sentiment}
+    return response
+
+
+def failure(e, action, provider=None):
+    """
+    Log an exception raised while handling a request, and the body and status to answer with
+
+    Call from the except block, so the traceback is logged. A call rejected
+    by a provider's breaker or concurrency limit is a 503, anything else a 500.
+
+    Args:
+        e: The exception
+        action: What failed, e.g. 'speech-to-text conversion'
+        provider: Provider the request asked for, if any
+
+    Returns:
+        tuple: ({"error": message}, status)
+    """
+    if isinstance(e, ProviderUnavailable):
+        logger.warning("%s rejected for %s: %s", action, provider, e)
+        return {"error": str(e)}, 503
+    if provider:
+        logger.exception("Error in %s using %s", action, provider)
+    else:
+        logger.exception("Error in %s", action)
+    return {"error": str(e)}, 500
@@ -0,0 +1,276 @@
+import logging
+import os
+import re
+import shutil
+import signal
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STARTING = "starting"
+READY = "ready"
+DRAINING = "draining"
+STOPPED = "stopped"
+
+
+class Lifecycle:
+    """Readiness, in-flight request tracking and ordered shutdown for one worker process"""
+
+    def __init__(self, drain_timeout=None, drain_grace=None):
+        """
+        Initialize the lifecycle in the starting state
+
+        Args:
+            drain_timeout: Longest wait in seconds for in-flight requests once
+                           draining starts, default SHUTDOWN_TIMEOUT or 20.
+                           Keep it below the server's own kill timeout
+                           (gunicorn's --graceful-timeout, 30 s by default)
+            drain_grace: Seconds requests are still accepted after SIGTERM
+                         while readiness fails, so load balancers stop routing
+                         here first, default SHUTDOWN_GRACE or 3
+        """
+        self.drain_timeout = float(drain_timeout if drain_timeout is not None
+                                   else os.environ.get('SHUTDOWN_TIMEOUT', '20'))
+        self.drain_grace = float(drain_grace if drain_grace is not None
+                                 else os.environ.get('SHUTDOWN_GRACE', '3'))
+        self.state = STARTING
+        self.started_at = time.time()
+        self.in_flight = 0
+        self._idle = threading.Condition()
+        self._checks = {}
+        self._hooks = []
+        self._shutdown_lock = threading.Lock()
+        self._draining_since = None
+        self._previous_handlers = {}
+
+    def add_check(self, name, check):
+        """Add a readiness check: a callable returning None when healthy, or an error message"""
+        self._checks[name] = check
+
+    def on_shutdown(self, name, hook):
+        """Add a hook run once requests have drained; hooks run in the order they were added"""
+        self._hooks.append((name, hook))
+
+    def mark_ready(self):
+        if self.state == STARTING:
+            self.state = READY
+            logger.info("Ready after %.1f seconds", time.time() - self.started_at)
+
+    def request_started(self):
+        with self._idle:
+            self.in_flight += 1
+
+    def request_finished(self):
+        with self._idle:
+            self.in_flight -= 1
+            if not self.in_flight:
+                self._idle.notify_all()
+
+    def wrap_wsgi(self, wsgi_app):
+        """WSGI middleware counting a request as in flight until its response body has been sent"""
+        from werkzeug.wsgi import ClosingIterator
+
+        def tracked(environ, start_response):
+            self.request_started()
+            try:
+                response = wsgi_app(environ, start_response)
+            except BaseException:
+                self.request_finished()
+                raise
+            return ClosingIterator(response, self.request_finished)
+        return tracked
+
+    def wrap_asgi(self, asgi_app):
+        """ASGI middleware counting HTTP requests as in flight until their response has been sent"""
+        async def tracked(scope, receive, send):
+            if scope['type'] != 'http':
+                return await asgi_app(scope, receive, send)
+            self.request_started()
+            try:
+                return await asgi_app(scope, receive, send)
+            finally:
+                self.request_finished()
+        return tracked
+
+    def liveness(self):
+        """Whether the process is up; stays true while draining, so the orchestrator does not kill it early"""
+        return {
+            "status": "alive",
+            "state": self.state,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "in_flight": self.in_flight,
+            "pid": os.getpid()
+        }
+
+    def readiness(self):
+        """
+        Whether the process should be sent new requests
+
+        Returns:
+            tuple: (ready, details); not ready while starting, draining or
+                   when any check fails
+        """
+        failed = {}
+        for name, check in self._checks.items():
+            try:
+                error = check()
+            except Exception as e:
+                error = str(e)
+            if error:
+                failed[name] = error
+        ready = self.state == READY and not failed
+        details = {"status": "ready" if ready else "not_ready", "state": self.state, "in_flight": self.in_flight}
+        if failed:
+            details["failed_checks"] = failed
+        return ready, details
+
+    def _begin_draining(self):
+        """Fail readiness from now on; returns False if draining had already started"""
+        with self._idle:
+            if self._draining_since is not None:
+                return False
+            self._draining_since = time.monotonic()
+            self.state = DRAINING
+        logger.info("Draining %s in-flight requests, deadline %s seconds", self.in_flight, self.drain_timeout)
+        return True
+
+    def drain(self):
+        """
+        Fail readiness and wait for in-flight requests to finish
+
+        Requests keep being served throughout: for drain_grace seconds
+        regardless, then until none are in flight or drain_timeout has passed
+        since draining started.
+
+        Returns:
+            int: Requests still in flight at the deadline
+        """
+        self._begin_draining()
+        deadline = self._draining_since + self.drain_timeout
+        time.sleep(max(0.0, min(self._draining_since + self.drain_grace, deadline) - time.monotonic()))
+        with self._idle:
+            while self.in_flight and time.monotonic() < deadline:
+                self._idle.wait(deadline - time.monotonic())
+            remaining = self.in_flight
+        if remaining:
+            logger.warning("Drain deadline passed with %s requests still in flight", remaining)
+        else:
+            logger.info("Drained in %.1f seconds", time.monotonic() - self._draining_since)
+        return remaining
+
+    def shutdown(self, drain=True):
+        """
+        Drain, then run the shutdown hooks; only the first call does anything
+
+        Args:
+            drain: Wait for in-flight requests first; false when the server has
+                   already drained them (e.g. an ASGI lifespan shutdown)
+        """
+        with self._shutdown_lock:
+            if self.state == STOPPED:
+                return
+            if drain:
+                self.drain()
+            for name, hook in self._hooks:
+                try:
+                    hook()
+                    logger.info("Shutdown: %s done", name)
+                except Exception as e:
+                    logger.error("Shutdown: %s failed: %s", name, e)
+            self.state = STOPPED
+
+    def install_signal_handlers(self, signals=(signal.SIGTERM,)):
+        """
+        Drain and shut down on these signals before handing them to the server
+
+        The previous handler (e.g. gunicorn's worker exit) runs once shutdown
+        has finished, so the server still exits the way it normally would.
+        Only possible from the main thread; returns whether handlers were installed.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return False
+        for signum in signals:
+            if signal.getsignal(signum) == self._handle_signal:
+                continue
+            self._previous_handlers[signum] = signal.signal(signum, self._handle_signal)
+        return True
+
+    def remove_signal_handlers(self):
+        """Restore the handlers replaced by install_signal_handlers"""
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for signum, previous in self._previous_handlers.items():
+            signal.signal(signum, previous if previous is not None else signal.SIG_DFL)
+        self._previous_handlers = {}
+
+    def _handle_signal(self, signum, frame):
+        if self.state == STOPPED:
+            previous = self._previous_handlers.get(signum)
+            if callable(previous):
+                previous(signum, frame)
+            elif previous != signal.SIG_IGN:
+                signal.signal(signum, signal.SIG_DFL)
+                os.kill(os.getpid(), signum)
+            return
+        logger.info("Received %s, shutting down", signal.Signals(signum).name)
+        if not self._begin_draining():
+            return
+        # Not in the handler itself, which interrupts the main thread that may be serving a request
+        threading.Thread(target=self._shutdown_and_resignal, args=(signum,), name="shutdown").start()
+
+    def _shutdown_and_resignal(self, signum):
+        self.shutdown()
+        # Delivered to the main thread, where the handler now passes it on to the server
+        os.kill(os.getpid(), signum)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_stale_temp_dirs(prefix, parent=None):
+    """
+    Remove temp dirs made by create_temp_dir in processes that no longer exist
+
+    Covers processes that never ran their shutdown hooks, e.g. after SIGKILL.
+
+    Returns:
+        list: Paths removed
+    """
+    parent = parent or tempfile.gettempdir()
+    pattern = re.compile(rf"^{re.escape(prefix)}(\d+)_\w+$")
+    removed = []
+    for name in os.listdir(parent):
+        match = pattern.match(name)
+        if not match or int(match.group(1)) == os.getpid() or _process_alive(int(match.group(1))):
+            continue
+        path = os.path.join(parent, name)
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(path)
+    if removed:
+        logger.info("Removed %s temporary directories left by exited processes", len(removed))
+    return removed
+
+
+def create_temp_dir(prefix="speech_analysis_"):
+    """A temp dir named after this process's PID, first removing those of processes that have exited"""
+    remove_stale_temp_dirs(prefix)
+    return tempfile.mkdtemp(prefix=f"{prefix}{os.getpid()}_")
+
+
+def remove_temp_dir(path):
+    """Remove a create_temp_dir directory, unless it belongs to the process this one was forked from"""
+    match = re.search(r"_(\d+)_\w+$", os.path.basename(path))
+    if match and int(match.group(1)) != os.getpid():
+        # Workers forked from a preloading master share its directory; it goes when the master exits
+        return
+    shutil.rmtree(path, ignore_errors=True)
+    logger.info("Cleaned up temporary directory: %s", path)
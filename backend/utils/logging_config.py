@@ -0,0 +1,175 @@
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+# Request ID of the request being handled, attached to every log record
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+# Whether user text and transcripts may appear in logs
+LOG_TEXT = os.environ.get('LOG_TEXT', 'false').lower() == 'true'
+
+# Attributes every LogRecord has; anything else was passed through extra= and is logged as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id', 'sample'}
+
+
+class _LoggedText:
+    """Defers truncation/redaction of user text until a record is actually formatted"""
+
+    __slots__ = ('text', 'limit')
+
+    def __init__(self, text, limit):
+        self.text = text
+        self.limit = limit
+
+    def __str__(self):
+        text = self.text or ''
+        if not LOG_TEXT:
+            return f"<{len(text)} chars>"
+        return text if len(text) <= self.limit else f"{text[:self.limit]}..."
+
+    __repr__ = __str__
+
+
+def log_text(text, limit=50):
+    """
+    Wrap user text or a transcript for logging
+
+    The text is only included when LOG_TEXT=true, otherwise its length is
+    logged instead. Either way nothing is formatted unless the record is
+    emitted.
+    """
+    return _LoggedText(text, limit)
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of records logged with extra={'sample': True}; everything else passes"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, 'sample', False) and record.levelno < logging.WARNING:
+            return self.rate >= 1.0 or random.random() < self.rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with request ID, extra fields and exception text"""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves the JSON formatting to the listener thread"""
+
+    def prepare(self, record):
+        # The message is merged here, on the request thread, so the listener never sees args
+        # that changed after the call; the stock handler also formats the whole line and
+        # drops exc_info, which would put the formatter and the traceback on this thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_listener = None
+
+
+def configure_logging(level=None, fmt=None, sample_rate=None, stream=None):
+    """
+    Route all logging through a queue to a background listener thread
+
+    Request threads only build the record, tag it with the request ID, drop
+    it if sampled out and put it on the queue; formatting and writing happen
+    on the listener thread.
+
+    Args:
+        level: Root log level, default LOG_LEVEL or INFO
+        fmt: 'json' or 'text', default LOG_FORMAT or json
+        sample_rate: Fraction of sampled success logs kept, default LOG_SAMPLE_RATE or 1.0
+        stream: Where logs are written, default stderr
+
+    Returns:
+        QueueListener: The started listener
+    """
+    global _listener
+    level = level or os.environ.get('LOG_LEVEL', 'INFO')
+    fmt = fmt or os.environ.get('LOG_FORMAT', 'json')
+    sample_rate = sample_rate if sample_rate is not None else float(os.environ.get('LOG_SAMPLE_RATE', '1.0'))
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    if fmt == 'json':
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    # The request ID is read here, on the request thread, before the record crosses threads
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    if _listener is not None:
+        _listener.stop()
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _after_fork_in_child():
+    # The listener thread does not survive fork: give the child a fresh queue and thread
+    if _listener is None:
+        return
+    log_queue = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            handler.queue = log_queue
+    _listener.queue = log_queue
+    _listener._thread = None
+    _listener.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
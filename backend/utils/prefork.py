@@ -0,0 +1,85 @@
+import gc
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+def prepare_master():
+    """
+    Call in the master before the models are loaded
+
+    Disables the cyclic GC so collections do not leave freed holes in pages
+    the workers will share, and keeps torch from starting OpenMP threads,
+    which do not survive fork; each worker starts its own in after_fork().
+    """
+    gc.disable()
+    if 'torch' in sys.modules:
+        logger.warning("torch was imported before prepare_master(), its thread pool may already be running")
+    os.environ.setdefault('OMP_NUM_THREADS', '1')
+    os.environ.setdefault('MKL_NUM_THREADS', '1')
+
+
+def before_fork():
+    """
+    Call in the master right before each fork
+
+    Moves every object the master has allocated (model weights' Python
+    wrappers, spaCy's vocab and pipeline, lexicons) to the permanent GC
+    generation, so collections in the workers never write to their headers
+    and the pages stay shared copy-on-write.
+    """
+    gc.freeze()
+
+
+def after_fork(torch_threads=None):
+    """
+    Call first thing in each worker
+
+    Args:
+        torch_threads: Intra-op threads for this worker, default
+                       TORCH_THREADS or 1; torch and MKL pools are started
+                       fresh in the worker rather than inherited
+    """
+    gc.enable()
+    torch_threads = int(torch_threads or os.environ.get('TORCH_THREADS', '1'))
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        torch.set_num_threads(torch_threads)
+    logger.info("Worker %s: GC enabled with %s objects frozen, %s torch threads", os.getpid(),
+                gc.get_freeze_count(), torch_threads if torch is not None else 0)
+
+
+def memory_usage(pid=None):
+    """
+    Unique (USS), proportional (PSS) and resident (RSS) memory of a process, in bytes
+
+    USS is what the process alone holds and would be freed if it exited;
+    pages shared copy-on-write with the master count toward RSS and, split
+    between the sharers, toward PSS. Linux only (/proc/<pid>/smaps_rollup).
+
+    Returns:
+        dict: uss, pss and rss, or None where smaps_rollup is unavailable
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid or os.getpid()}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    fields[name] = int(value.split()[0]) * 1024
+    except OSError:
+        return None
+    return {
+        "uss": fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+        "pss": fields.get('Pss', 0),
+        "rss": fields.get('Rss', 0)
+    }
+
+
+def log_memory(label):
+    usage = memory_usage()
+    if usage:
+        logger.info("%s: USS %.0f MiB, PSS %.0f MiB, RSS %.0f MiB", label,
+                    usage['uss'] / 2 ** 20, usage['pss'] / 2 ** 20, usage['rss'] / 2 ** 20)
@@ -0,0 +1,263 @@
+import asyncio
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from utils.providers import KINDS
+from utils.resilience import ProviderGuard, ProviderUnavailable, result_failed
+from utils.single_flight import AsyncSingleFlight, SingleFlight
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Fail over to FAILOVER_PROVIDER (the open-source provider by default) when a provider is unavailable or failing
+PROVIDER_FAILOVER = os.environ.get('PROVIDER_FAILOVER', 'true').lower() == 'true'
+FAILOVER_PROVIDER = os.environ.get('FAILOVER_PROVIDER', 'opensource')
+# Most analyze_sentiment calls one batch makes at once to a provider without a batch call (Google)
+SENTIMENT_BATCH_CONCURRENCY = int(os.environ.get('SENTIMENT_BATCH_CONCURRENCY', '8'))
+
+
+class ProviderCalls:
+    """
+    Provider calls as both apps make them: guarded, with failover and coalescing
+
+    The Flask app uses the blocking methods and the ASGI app the *_async
+    ones; both go through the same ProviderGuard per provider and kind, so
+    a provider's breaker and concurrency limit see every call the process
+    makes, whichever app served it.
+    """
+
+    def __init__(self, providers, guards=None, failover=PROVIDER_FAILOVER, failover_provider=FAILOVER_PROVIDER,
+                 lock_dir=None):
+        """
+        Initialize the calls
+
+        Args:
+            providers: ProviderRegistry with the services to call
+            guards: Dict of (provider, kind) -> ProviderGuard; by default each
+                    service gets a guard with its kind's KIND_SETTINGS
+            failover: Retry with failover_provider when a provider is
+                      unavailable or fails
+            failover_provider: Provider to fail over to
+            lock_dir: Optional directory that extends coalescing of blocking
+                      calls across worker processes (see SingleFlight)
+        """
+        self.providers = providers
+        self.guards = guards if guards is not None else {
+            (name, kind): ProviderGuard(f"{name}.{kind}", kind=kind)
+            for kind in KINDS for name in providers.names(kind)
+        }
+        self.failover = failover
+        self.failover_provider = failover_provider
+        self.single_flight = SingleFlight(lock_dir=lock_dir)
+        self.async_single_flight = AsyncSingleFlight()
+
+    def service(self, provider, kind):
+        """Look up a provider's service, raising UnknownProvider for names that are not registered"""
+        return self.providers.get(provider, kind)
+
+    def unknown(self, kind, *names):
+        """Error message for the first name with no service of this kind, or None if all are known"""
+        for name in names:
+            if name not in self.providers.names(kind):
+                return f"Unknown {kind} provider '{name}', available: {self.providers.names(kind)}"
+        return None
+
+    def check(self, kind, *names):
+        """
+        Raises:
+            UnknownProvider: A name has no service of this kind
+        """
+        for name in names:
+            self.service(name, kind)
+
+    def _can_fail_over(self, provider, kind, failover):
+        failover = self.failover if failover is None else failover
+        return (failover and provider != self.failover_provider
+                and self.failover_provider in self.providers.names(kind))
+
+    def _failing_over(self, provider, kind, reason):
+        logger.warning("Failing over %s from %s to %s: %s", kind, provider, self.failover_provider, reason)
+        return {"service": kind, "from": provider, "to": self.failover_provider, "reason": reason}
+
+    def call(self, provider, kind, method, *args, failover=None, failover_args=None, **kwargs):
+        """
+        Call a provider service through its circuit breaker and concurrency limit
+
+        Args:
+            provider: Registered provider name, e.g. 'google' or 'opensource'
+            kind: 'speech', 'text' or 'sentiment'
+            method: Service method to call
+            failover: Retry with the failover provider if the provider is
+                      unavailable or fails; None for the configured default
+            failover_args: Positional arguments for the failover call, if they differ
+
+        Returns:
+            tuple: (result, failover record or None)
+
+        Raises:
+            UnknownProvider: The provider is not registered for this kind
+            ProviderUnavailable: The provider rejected the call and failover is off
+        """
+        service = self.service(provider, kind)
+        can_fail_over = self._can_fail_over(provider, kind, failover)
+        try:
+            with span(f"{provider}.{kind}", method=method):
+                result = self.guards[(provider, kind)].call(getattr(service, method), *args, **kwargs)
+            if not can_fail_over or not result_failed(result):
+                return result, None
+            reason = result.get('error')
+        except Exception as e:
+            if not can_fail_over:
+                raise
+            reason = str(e)
+
+        record = self._failing_over(provider, kind, reason)
+        fallback = self.service(self.failover_provider, kind)
+        with span(f"{self.failover_provider}.{kind}", method=method, failover_from=provider):
+            result = self.guards[(self.failover_provider, kind)].call(
+                getattr(fallback, method), *(failover_args if failover_args is not None else args), **kwargs
+            )
+        return result, record
+
+    def coalesced(self, provider, kind, method, *args, **kwargs):
+        """call(), sharing one in-flight call between identical concurrent requests"""
+        key = (provider, kind, method, args, tuple(sorted(kwargs.items())))
+        return self.single_flight.do(key, self.call, provider, kind, method, *args, **kwargs)
+
+    def call_or_error(self, provider, kind, method, *args, **kwargs):
+        """call() without failover, reporting a rejected call as a failed result"""
+        try:
+            return self.call(provider, kind, method, *args, failover=False, **kwargs)[0]
+        except ProviderUnavailable as e:
+            return {"success": False, "error": str(e), "text": None}
+
+    def analyze_sentiment_batch(self, provider, texts, max_parallel=SENTIMENT_BATCH_CONCURRENCY):
+        """
+        Sentiment of many texts from one provider, through its guard and without failover
+
+        A service with analyze_sentiment_batch gets one guarded call. Others
+        get one guarded analyze_sentiment call per text, at most max_parallel
+        at a time, so a long transcript costs a few round trips rather than
+        one per segment in turn.
+
+        Returns:
+            list: One result dict per text, in input order; a call the guard
+                  rejected gives a failed result for its texts
+        """
+        service = self.service(provider, 'sentiment')
+        if callable(getattr(service, 'analyze_sentiment_batch', None)):
+            results = self.call_or_error(provider, 'sentiment', 'analyze_sentiment_batch', texts)
+            return results if isinstance(results, list) else [dict(results) for _ in texts]
+        if len(texts) <= 1 or max_parallel <= 1:
+            results = [self.call_or_error(provider, 'sentiment', 'analyze_sentiment', text) for text in texts]
+        else:
+            # One copy of the request's context per call, so each logs with its request ID and nests its span
+            contexts = [contextvars.copy_context() for _ in texts]
+            with ThreadPoolExecutor(max_workers=min(max_parallel, len(texts)),
+                                    thread_name_prefix=f"{provider}-sentiment") as pool:
+                results = list(pool.map(
+                    lambda context, text: context.run(self.call_or_error, provider, 'sentiment', 'analyze_sentiment',
+                                                      text),
+                    contexts, texts
+                ))
+        # Without the per-sentence breakdown, like a batch call's results
+        for result in results:
+            result.pop('sentences', None)
+        return results
+
+    def guarded_sentiment(self, provider):
+        """A provider's sentiment service for SentimentTimeline and speaker_sentiment, scoring through its guard"""
+        return _GuardedSentiment(self, provider)
+
+    async def _invoke(self, service, method, args, kwargs, executor):
+        # The service's native async variant when it has one, else the blocking method on the executor
+        async_method = getattr(service, f"{method}_async", None)
+        if async_method is not None:
+            return await async_method(*args, **kwargs)
+        # Run in a copy of the request's context so pool threads log with its request ID
+        # and their spans nest under the caller's
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, partial(context.run, getattr(service, method), *args, **kwargs)
+        )
+
+    async def call_async(self, provider, kind, method, *args, executor=None, failover=None, failover_args=None,
+                         **kwargs):
+        """
+        Awaitable call(), for the ASGI app
+
+        Args:
+            executor: Pool for services without an async variant of the
+                      method; None for the loop's default executor
+
+        Returns:
+            tuple: (result, failover record or None)
+
+        Raises:
+            UnknownProvider: The provider is not registered for this kind
+            ProviderUnavailable: The provider rejected the call and failover is off
+        """
+        service = self.service(provider, kind)
+        can_fail_over = self._can_fail_over(provider, kind, failover)
+        try:
+            with span(f"{provider}.{kind}", method=method):
+                result = await self.guards[(provider, kind)].call_async(
+                    self._invoke, service, method, args, kwargs, executor
+                )
+            if not can_fail_over or not result_failed(result):
+                return result, None
+            reason = result.get('error')
+        except Exception as e:
+            if not can_fail_over:
+                raise
+            reason = str(e)
+
+        record = self._failing_over(provider, kind, reason)
+        fallback = self.service(self.failover_provider, kind)
+        with span(f"{self.failover_provider}.{kind}", method=method, failover_from=provider):
+            result = await self.guards[(self.failover_provider, kind)].call_async(
+                self._invoke, fallback, method, failover_args if failover_args is not None else args, kwargs, executor
+            )
+        return result, record
+
+    async def coalesced_async(self, provider, kind, method, *args, **kwargs):
+        """call_async(), sharing one in-flight call between identical concurrent requests"""
+        key = (provider, kind, method, args, tuple(sorted((k, v) for k, v in kwargs.items() if k != 'executor')))
+        return await self.async_single_flight.do(key, self.call_async, provider, kind, method, *args, **kwargs)
+
+    async def call_or_error_async(self, provider, kind, method, *args, **kwargs):
+        """call_async() without failover, reporting a rejected call as a failed result"""
+        try:
+            return (await self.call_async(provider, kind, method, *args, failover=False, **kwargs))[0]
+        except ProviderUnavailable as e:
+            return {"success": False, "error": str(e), "text": None}
+
+    @property
+    def coalesced_count(self):
+        return self.single_flight.coalesced + self.async_single_flight.coalesced
+
+    def status(self):
+        """Failover settings and each provider's guard state by kind"""
+        return {
+            "failover": self.failover,
+            "failover_provider": self.failover_provider,
+            "coalesced_calls": self.coalesced_count,
+            "providers": {
+                name: {kind: self.guards[(name, kind)].status() for kind in KINDS if name in self.providers.names(kind)}
+                for name in self.providers.names()
+            }
+        }
+
+
+class _GuardedSentiment:
+    """analyze_sentiment_batch of one provider, as ProviderCalls makes it"""
+
+    def __init__(self, calls, provider):
+        self.calls = calls
+        self.provider = provider
+
+    def analyze_sentiment_batch(self, texts):
+        return self.calls.analyze_sentiment_batch(self.provider, texts)
@@ -0,0 +1,201 @@
+import importlib
+import logging
+import os
+from typing import Any, Dict, List, Optional, Protocol, Tuple, runtime_checkable
+
+logger = logging.getLogger(__name__)
+
+# Entry point group third-party provider packages register under
+ENTRY_POINT_GROUP = 'speech_analysis.providers'
+
+KINDS = ('speech', 'text', 'sentiment')
+
+# Providers the compare endpoints call when a request names none
+DEFAULT_COMPARED = ('google', 'opensource')
+
+
+@runtime_checkable
+class SpeechProvider(Protocol):
+    """Speech-to-text: returns a dict with success, text, confidence, segments, ..."""
+
+    def transcribe_audio(self, audio_file: str, word_timestamps: bool = False) -> Dict[str, Any]:
+        ...
+
+
+@runtime_checkable
+class TextProvider(Protocol):
+    """
+    Text-to-speech: returns (file name, audio bytes) and lists its voices
+
+    Audio is MP3 unless an output_format (utils.audio_format.OutputFormat)
+    is passed; callers only pass one when a client asked for another format.
+    """
+
+    def synthesize_speech(self, text: str, voice_name: Optional[str] = None,
+                          output_format: Optional[Any] = None) -> Tuple[str, bytes]:
+        ...
+
+    def get_available_voices(self) -> List[Dict[str, Any]]:
+        ...
+
+
+@runtime_checkable
+class SentimentProvider(Protocol):
+    """
+    Sentiment analysis: returns a dict with success, score, magnitude, sentences, ...
+
+    A provider may also offer analyze_sentiment_batch(texts), returning one
+    result per text; analyze_sentiment_batch below falls back to one
+    analyze_sentiment call per text for those that don't.
+    """
+
+    def analyze_sentiment(self, text: str) -> Dict[str, Any]:
+        ...
+
+
+PROTOCOLS = {'speech': SpeechProvider, 'text': TextProvider, 'sentiment': SentimentProvider}
+# Method names of each protocol
+PROTOCOL_METHODS = {kind: tuple(name for name, value in vars(protocol).items()
+                                if not name.startswith('_') and callable(value))
+                    for kind, protocol in PROTOCOLS.items()}
+
+
+def implements(service, kind):
+    """
+    Whether a service implements the protocol for its kind
+
+    A service only the ASGI app calls may implement every method as its
+    awaitable `<method>_async` variant instead.
+    """
+    return isinstance(service, PROTOCOLS[kind]) or all(
+        callable(getattr(service, f"{method}_async", None)) for method in PROTOCOL_METHODS[kind]
+    )
+
+
+def analyze_sentiment_batch(service, texts):
+    """
+    Sentiment of many texts, in one call where the service supports it
+
+    Args:
+        service: SentimentProvider
+        texts: List of texts to analyze
+
+    Returns:
+        list: One result dict per text, in input order
+    """
+    batch = getattr(service, 'analyze_sentiment_batch', None)
+    if callable(batch):
+        return batch(texts)
+    return [service.analyze_sentiment(text) for text in texts]
+
+
+class UnknownProvider(ValueError):
+    """Raised when a request names a provider (or a service kind) that is not registered"""
+    pass
+
+
+def requested_providers(value, default=DEFAULT_COMPARED):
+    """
+    Provider names requested for a comparison
+
+    Args:
+        value: JSON list, comma-separated form field, or None
+
+    Returns:
+        list: Names in request order without duplicates, or the default
+    """
+    if isinstance(value, str):
+        value = [name.strip() for name in value.split(',')]
+    return list(dict.fromkeys(name for name in value or [] if name)) or list(default)
+
+
+class ProviderRegistry:
+    """Services by provider name and kind ('speech', 'text', 'sentiment')"""
+
+    def __init__(self):
+        self._services = {}
+
+    def register(self, name, kind, service):
+        """
+        Register one service of a provider
+
+        Raises:
+            TypeError: The service does not implement the protocol for its kind
+        """
+        if kind not in PROTOCOLS:
+            raise ValueError(f"Unknown service kind '{kind}', expected one of {KINDS}")
+        if not implements(service, kind):
+            raise TypeError(f"{type(service).__name__} does not implement {PROTOCOLS[kind].__name__}")
+        self._services.setdefault(name, {})[kind] = service
+
+    def register_provider(self, name, services):
+        """Register a provider's services from a dict of kind -> service"""
+        for kind, service in services.items():
+            self.register(name, kind, service)
+
+    def get(self, name, kind):
+        """
+        Look up a provider's service
+
+        Raises:
+            UnknownProvider: No such provider, or it has no service of this kind
+        """
+        try:
+            return self._services[name][kind]
+        except KeyError:
+            raise UnknownProvider(f"Unknown {kind} provider '{name}', available: {self.names(kind)}") from None
+
+    def names(self, kind=None):
+        """Registered provider names, optionally only those offering a kind"""
+        return [name for name, services in self._services.items() if kind is None or kind in services]
+
+    def as_dict(self):
+        return {name: dict(services) for name, services in self._services.items()}
+
+    def __contains__(self, name):
+        return name in self._services
+
+    def load_plugins(self, specs=None):
+        """
+        Register providers from installed entry points and PROVIDER_PLUGINS
+
+        Each plugin is a factory returning a dict of kind -> service. Packages
+        expose one through the 'speech_analysis.providers' entry point group,
+        e.g. in setup.cfg:
+
+            [options.entry_points]
+            speech_analysis.providers =
+                fasterwhisper = my_package.providers:create
+
+        PROVIDER_PLUGINS ("name=module:factory,...") loads factories from
+        importable modules without packaging them. A plugin that fails to
+        load is logged and skipped.
+
+        Args:
+            specs: Optional "name=module:factory,..." string, default PROVIDER_PLUGINS
+        """
+        factories = []
+        try:
+            from importlib.metadata import entry_points
+            eps = entry_points()
+            group = eps.select(group=ENTRY_POINT_GROUP) if hasattr(eps, 'select') else eps.get(ENTRY_POINT_GROUP, [])
+            factories.extend((ep.name, ep.load) for ep in group)
+        except Exception as e:
+            logger.warning("Could not read provider entry points: %s", e)
+
+        specs = specs if specs is not None else os.environ.get('PROVIDER_PLUGINS', '')
+        for spec in filter(None, (part.strip() for part in specs.split(','))):
+            name, _, target = spec.partition('=')
+            module_name, _, attr = target.partition(':')
+            factories.append((name.strip(), lambda m=module_name, a=attr: getattr(importlib.import_module(m), a)))
+
+        for name, load in factories:
+            if name in self._services:
+                logger.warning("Ignoring plugin '%s': a provider with that name is already registered", name)
+                continue
+            try:
+                self.register_provider(name, load()())
+                logger.info("Registered provider plugin '%s' (%s)", name, ', '.join(self._services[name]))
+            except Exception as e:
+                self._services.pop(name, None)
+                logger.error("Could not load provider plugin '%s': %s", name, e)
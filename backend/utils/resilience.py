@@ -0,0 +1,354 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Breaker and limiter settings per service kind. Transcription time grows with the audio's length,
+# so a long but healthy Whisper or streaming call says nothing about provider health: only
+# failures count for speech, while text-to-speech and sentiment calls are expected in milliseconds
+KIND_SETTINGS = {
+    'speech': {'breaker': {'slow_call_seconds': None}, 'limiter': {'latency_target_seconds': None}},
+    'text': {'breaker': {'slow_call_seconds': 10.0}, 'limiter': {'latency_target_seconds': 5.0}},
+    'sentiment': {'breaker': {'slow_call_seconds': 10.0}, 'limiter': {'latency_target_seconds': 5.0}},
+}
+
+
+class ProviderUnavailable(Exception):
+    """Raised when a provider call is rejected by its breaker or concurrency limit"""
+    pass
+
+
+def result_failed(result):
+    """
+    Whether a service result counts against provider health
+
+    The services report most provider errors as {"success": False, ...}
+    results rather than exceptions, so those count as failures unless the
+    service flagged the error as caused by the input ("input_error": True),
+    e.g. a missing file, silent audio or text too short to analyze.
+    """
+    if not isinstance(result, dict) or result.get("success") is not False:
+        return False
+    return not result.get("input_error")
+
+
+class CircuitBreaker:
+    """Error-rate and latency based circuit breaker"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, window=20, min_calls=5, failure_rate_threshold=0.5,
+                 slow_call_seconds=10.0, slow_rate_threshold=0.8, open_seconds=30.0):
+        """
+        Initialize the breaker
+
+        Args:
+            name: Provider name used in logs and status
+            window: Number of recent calls the rates are computed over
+            min_calls: Calls needed in the window before the breaker can trip
+            failure_rate_threshold: Failure rate that opens the breaker
+            slow_call_seconds: Calls slower than this count as slow; None to
+                               judge by failures only
+            slow_rate_threshold: Slow call rate that opens the breaker
+            open_seconds: How long the breaker stays open before a trial call
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate_threshold = slow_rate_threshold
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=window)  # (failed, slow) per call
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may proceed; in half-open state only one trial call is let through"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+                logger.info("Circuit for %s half-open, allowing a trial call", self.name)
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def cancel(self):
+        """Forget a call that allow() let through but that ended without an outcome, e.g. cancelled"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+    def record(self, failed, elapsed):
+        """Record the outcome of a call that allow() let through"""
+        slow = self.slow_call_seconds is not None and elapsed >= self.slow_call_seconds
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = False
+                if failed or slow:
+                    self._open()
+                else:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                    logger.info("Circuit for %s closed after successful trial call", self.name)
+                return
+
+            self._outcomes.append((failed, slow))
+            if len(self._outcomes) < self.min_calls:
+                return
+            failure_rate, slow_rate = self._rates()
+            if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_rate_threshold:
+                self._open()
+
+    def _rates(self):
+        count = len(self._outcomes)
+        if not count:
+            return 0.0, 0.0
+        failures = sum(1 for failed, _ in self._outcomes if failed)
+        slow = sum(1 for _, is_slow in self._outcomes if is_slow)
+        return failures / count, slow / count
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        logger.warning("Circuit for %s opened for %ss", self.name, self.open_seconds)
+
+    def status(self):
+        with self._lock:
+            failure_rate, slow_rate = self._rates()
+            return {
+                "state": self.state,
+                "failure_rate": failure_rate,
+                "slow_rate": slow_rate,
+                "calls_in_window": len(self._outcomes),
+                "retry_in": max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+                if self.state == self.OPEN else 0.0
+            }
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit: grows additively on healthy calls, halves on failures
+
+    Until the first failure or slow call the limit is in slow start and grows
+    by one per healthy call, doubling each round trip, so a cold limit reaches
+    the load a healthy provider takes within a few round trips.
+    """
+
+    def __init__(self, initial_limit=8, min_limit=1, max_limit=64, latency_target_seconds=5.0, backoff=0.5,
+                 queue_timeout_seconds=5.0):
+        """
+        Initialize the limiter
+
+        Args:
+            initial_limit: Starting number of concurrent calls allowed
+            min_limit: Lowest the limit can shrink to
+            max_limit: Highest the limit can grow to
+            latency_target_seconds: Calls slower than this shrink the limit;
+                                    None to shrink on failures only
+            backoff: Multiplicative decrease applied on failure or slow call
+            queue_timeout_seconds: How long a call waits for a free slot before
+                                   it is rejected
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target_seconds = latency_target_seconds
+        self.backoff = backoff
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.in_flight = 0
+        self.rejected = 0
+        self.slow_start = True
+        self._slot_freed = threading.Condition()
+        # (loop, future) of coroutines waiting in acquire_async; freed slots are handed to them directly
+        self._async_waiters = deque()
+
+    def acquire(self, timeout=None):
+        """Take a slot, waiting up to timeout (default queue_timeout_seconds); False if none became free"""
+        timeout = self.queue_timeout_seconds if timeout is None else timeout
+        with self._slot_freed:
+            if not self._slot_freed.wait_for(lambda: self.in_flight < int(self.limit), timeout):
+                if timeout:
+                    self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    async def acquire_async(self, timeout=None):
+        """
+        Take a slot like acquire(), waiting on the event loop instead of blocking a thread
+
+        A task cancelled while it waits leaves no slot behind.
+        """
+        timeout = self.queue_timeout_seconds if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        with self._slot_freed:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            if not timeout:
+                return False
+            waiter = (loop, loop.create_future())
+            self._async_waiters.append(waiter)
+        future = waiter[1]
+        try:
+            await asyncio.wait((future,), timeout=timeout)
+        except asyncio.CancelledError:
+            if self._withdraw(waiter):
+                if future.done():
+                    self.cancel()
+                else:
+                    # The grant has not run yet; it gives the slot back when it finds the future cancelled
+                    future.cancel()
+            raise
+        if future.done() or self._withdraw(waiter):
+            return True
+        with self._slot_freed:
+            self.rejected += 1
+        return False
+
+    def _withdraw(self, waiter):
+        """Stop waiting in acquire_async; True if the waiter had already been handed a slot"""
+        with self._slot_freed:
+            try:
+                self._async_waiters.remove(waiter)
+                return False
+            except ValueError:
+                return True
+
+    def _grant(self, future):
+        # Runs on the waiter's loop; a waiter that gave up returns the slot it was handed
+        if future.done():
+            self.cancel()
+        else:
+            future.set_result(True)
+
+    def _hand_over(self):
+        # Called holding the lock: pass free slots to waiting coroutines first, then wake waiting threads
+        while self._async_waiters and self.in_flight < int(self.limit):
+            loop, future = self._async_waiters.popleft()
+            self.in_flight += 1
+            try:
+                loop.call_soon_threadsafe(self._grant, future)
+            except RuntimeError:
+                # The waiter's loop is closed
+                self.in_flight -= 1
+        self._slot_freed.notify_all()
+
+    def cancel(self):
+        """Give back a slot for a call that never started or was cancelled, without changing the limit"""
+        with self._slot_freed:
+            self.in_flight -= 1
+            self._hand_over()
+
+    def release(self, failed, elapsed):
+        with self._slot_freed:
+            self.in_flight -= 1
+            if failed or (self.latency_target_seconds is not None and elapsed > self.latency_target_seconds):
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.slow_start = False
+            elif self.slow_start:
+                self.limit = min(self.max_limit, self.limit + 1.0)
+            else:
+                # +1 per limit's worth of successful calls, i.e. roughly +1 per round trip
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._hand_over()
+
+    def status(self):
+        with self._slot_freed:
+            return {"limit": int(self.limit), "in_flight": self.in_flight, "rejected": self.rejected}
+
+
+class ProviderGuard:
+    """Circuit breaker and adaptive concurrency limit in front of one provider's service of one kind"""
+
+    def __init__(self, name, kind=None, breaker=None, limiter=None, failed=result_failed):
+        """
+        Initialize the guard
+
+        Args:
+            name: Name used in logs and errors, e.g. 'opensource.speech'
+            kind: Service kind whose KIND_SETTINGS the default breaker and
+                  limiter use
+            breaker: CircuitBreaker to use instead of the default
+            limiter: AdaptiveLimiter to use instead of the default
+            failed: Predicate telling whether a result counts as a failure
+        """
+        settings = KIND_SETTINGS.get(kind, {})
+        self.name = name
+        self.kind = kind
+        self.breaker = breaker or CircuitBreaker(name, **settings.get('breaker', {}))
+        self.limiter = limiter or AdaptiveLimiter(**settings.get('limiter', {}))
+        self.failed = failed
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Call a provider function through the breaker and limiter
+
+        Raises:
+            ProviderUnavailable: The breaker is open or the concurrency limit is reached
+        """
+        if not self.limiter.acquire():
+            raise ProviderUnavailable(f"Concurrency limit reached for {self.name}")
+        if not self.breaker.allow():
+            self.limiter.cancel()
+            raise ProviderUnavailable(f"Circuit for {self.name} is open")
+
+        start = time.monotonic()
+        failed = True
+        try:
+            result = fn(*args, **kwargs)
+            failed = self.failed(result)
+            return result
+        finally:
+            elapsed = time.monotonic() - start
+            self.limiter.release(failed, elapsed)
+            self.breaker.record(failed, elapsed)
+
+    async def call_async(self, coro_fn, *args, **kwargs):
+        """
+        Await a provider coroutine through the breaker and limiter, like call()
+
+        The wait for a slot happens on the event loop. A call cancelled while
+        it waits or runs (e.g. the client disconnected) gives its slot back
+        and is not counted against the provider.
+
+        Raises:
+            ProviderUnavailable: The breaker is open or the concurrency limit is reached
+        """
+        if not await self.limiter.acquire_async():
+            raise ProviderUnavailable(f"Concurrency limit reached for {self.name}")
+        if not self.breaker.allow():
+            self.limiter.cancel()
+            raise ProviderUnavailable(f"Circuit for {self.name} is open")
+
+        start = time.monotonic()
+        failed = True
+        try:
+            result = await coro_fn(*args, **kwargs)
+            failed = self.failed(result)
+            return result
+        except asyncio.CancelledError:
+            self.limiter.cancel()
+            self.breaker.cancel()
+            start = None
+            raise
+        finally:
+            if start is not None:
+                elapsed = time.monotonic() - start
+                self.limiter.release(failed, elapsed)
+                self.breaker.record(failed, elapsed)
+
+    def status(self):
+        return {"circuit": self.breaker.status(), "concurrency": self.limiter.status()}
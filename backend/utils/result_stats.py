@@ -0,0 +1,178 @@
+import json
+import math
+import zlib
+from itertools import combinations
+
+# Processing times go into a fixed set of log-spaced buckets: bucket b holds times up to
+# MIN_SECONDS * GROWTH ** b, times over MAX_SECONDS share the last one. Percentiles are within
+# about 25%, and a time histogram never has more than MAX_BUCKET + 1 entries, because the state
+# lives in the session cookie next to the results
+MIN_SECONDS = 0.001
+GROWTH = 1.5
+MAX_SECONDS = 3600.0
+MAX_BUCKET = math.ceil(math.log(MAX_SECONDS / MIN_SECONDS, GROWTH))
+SENTIMENT_LABELS = ("positive", "neutral", "negative")
+# Sentiment scores from -1 to 1 in bins of 0.2
+SCORE_BINS = 10
+PERCENTILES = (50, 90, 99)
+
+
+def _bucket(seconds):
+    if seconds <= MIN_SECONDS:
+        return 0
+    return min(math.ceil(math.log(seconds / MIN_SECONDS, GROWTH)), MAX_BUCKET)
+
+
+def _bucket_seconds(bucket):
+    # Geometric middle of the bucket
+    return MIN_SECONDS * GROWTH ** (bucket - 0.5) if bucket else MIN_SECONDS
+
+
+def _valid_sentiment(sentiment):
+    return isinstance(sentiment, dict) and sentiment.get('success') and sentiment.get('sentiment') in SENTIMENT_LABELS
+
+
+class ResultStats:
+    """Running aggregates over a session's results, kept up to date as results are added or removed"""
+
+    def __init__(self, state=None):
+        """
+        Wrap the aggregate state stored in the session
+
+        Every aggregate is a count or a sum, so a result is added and removed
+        by the same walk with opposite signs. The state's size depends on the
+        number of types, providers and time buckets, never on the number of
+        results; size() is what it adds to the session. Results dropped by the history
+        limits stay counted; removing or clearing results subtracts them.
+
+        Args:
+            state: JSON-serializable dict from a previous ResultStats.state
+        """
+        self.state = state if state is not None else {}
+
+    @staticmethod
+    def _provider_entries(result):
+        """(provider, provider's part of the result) pairs: one for single results, one per provider for comparisons"""
+        if result.get('providers'):
+            return [(name, result[name]) for name in result['providers'] if isinstance(result.get(name), dict)]
+        return [(result.get('sentiment_provider') or result.get('provider'), result)]
+
+    def _count(self, section, key, sign):
+        counts = self.state.setdefault(section, {})
+        counts[key] = counts.get(key, 0) + sign
+
+    def _time(self, key, seconds, sign):
+        entry = self.state.setdefault('time', {}).setdefault(key, {'n': 0, 'sum': 0.0, 'buckets': {}})
+        entry['n'] += sign
+        entry['sum'] = round(entry['sum'] + sign * seconds, 3)
+        bucket = str(_bucket(seconds))
+        entry['buckets'][bucket] = entry['buckets'].get(bucket, 0) + sign
+        if not entry['buckets'][bucket]:
+            del entry['buckets'][bucket]
+
+    def add(self, result, sign=1):
+        """
+        Add a result to the aggregates
+
+        Args:
+            result: Result dict as stored by SessionManager
+            sign: -1 subtracts the result instead
+        """
+        result_type = result.get('type') or 'unknown'
+        self.state['n'] = self.state.get('n', 0) + sign
+        self._count('types', result_type, sign)
+        for name in result.get('providers') or [result.get('provider')]:
+            if name:
+                self._count('providers', name, sign)
+
+        seconds = result.get('processing_time')
+        if isinstance(seconds, (int, float)):
+            self._time(f"type:{result_type}", seconds, sign)
+            if not result.get('providers') and result.get('provider'):
+                self._time(f"provider:{result['provider']}", seconds, sign)
+
+        labels = {}
+        for name, entry in self._provider_entries(result):
+            sentiment = entry.get('sentiment')
+            if not name or not _valid_sentiment(sentiment):
+                continue
+            labels[name] = sentiment['sentiment']
+            counts = self.state.setdefault('sentiment', {}).setdefault(
+                name, {'labels': dict.fromkeys(SENTIMENT_LABELS, 0), 'scores': [0] * SCORE_BINS}
+            )
+            counts['labels'][sentiment['sentiment']] += sign
+            score = sentiment.get('score')
+            if isinstance(score, (int, float)):
+                counts['scores'][min(max(int((score + 1) / 2 * SCORE_BINS), 0), SCORE_BINS - 1)] += sign
+
+        # Agreement between every pair of providers that scored the same input
+        for first, second in combinations(sorted(labels), 2):
+            compared, agreed = self.state.setdefault('agreement', {}).get(f"{first}|{second}", (0, 0))
+            self.state['agreement'][f"{first}|{second}"] = [
+                compared + sign, agreed + (sign if labels[first] == labels[second] else 0)
+            ]
+
+    def size(self):
+        """Bytes the state takes as compressed JSON, as the results are counted against the session budget"""
+        return len(zlib.compress(json.dumps(self.state, separators=(',', ':')).encode('utf-8'), 6))
+
+    def remove(self, result):
+        """Subtract a result previously added"""
+        self.add(result, sign=-1)
+
+    @staticmethod
+    def _time_summary(entry):
+        if not entry['n']:
+            return None
+        summary = {"count": entry['n'], "mean": round(entry['sum'] / entry['n'], 4)}
+        buckets = sorted((int(bucket), count) for bucket, count in entry['buckets'].items())
+        for percentile in PERCENTILES:
+            rank = percentile / 100 * entry['n']
+            seen = 0
+            for bucket, count in buckets:
+                seen += count
+                if seen >= rank:
+                    summary[f"p{percentile}"] = round(_bucket_seconds(bucket), 4)
+                    break
+        return summary
+
+    def summary(self):
+        """
+        The aggregates in the shape /api/results/stats returns
+
+        Cost depends on the number of types, providers and occupied time
+        buckets, not on the number of results.
+        """
+        processing_time = {"by_type": {}, "by_provider": {}}
+        for key, entry in self.state.get('time', {}).items():
+            group, name = key.split(':', 1)
+            summary = self._time_summary(entry)
+            if summary:
+                processing_time[f"by_{group}"][name] = summary
+
+        sentiment = {}
+        for name, counts in self.state.get('sentiment', {}).items():
+            total = sum(counts['labels'].values())
+            if total:
+                sentiment[name] = {
+                    "count": total,
+                    **counts['labels'],
+                    "score_histogram": {
+                        f"{-1 + i * 2 / SCORE_BINS:+.1f}..{-1 + (i + 1) * 2 / SCORE_BINS:+.1f}": count
+                        for i, count in enumerate(counts['scores'])
+                    }
+                }
+
+        agreement = {
+            pair: {"compared": compared, "agreed": agreed, "rate": round(agreed / compared, 4)}
+            for pair, (compared, agreed) in self.state.get('agreement', {}).items() if compared
+        }
+
+        return {
+            "total": self.state.get('n', 0),
+            "by_type": {name: count for name, count in self.state.get('types', {}).items() if count},
+            "by_provider": {name: count for name, count in self.state.get('providers', {}).items() if count},
+            "processing_time": processing_time,
+            "sentiment": sentiment,
+            "sentiment_agreement": agreement
+        }
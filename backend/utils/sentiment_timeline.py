@@ -0,0 +1,107 @@
+import logging
+import math
+from array import array
+
+from utils.providers import analyze_sentiment_batch
+
+logger = logging.getLogger(__name__)
+
+
+class SentimentTimeline:
+    """Incremental sentiment-over-time built from transcript segments"""
+
+    def __init__(self, sentiment_service):
+        """
+        Initialize the timeline
+
+        Args:
+            sentiment_service: SentimentProvider scoring the segments
+        """
+        self.sentiment_service = sentiment_service
+        # Column storage keeps long live-stream timelines compact
+        self.starts = array('d')
+        self.ends = array('d')
+        self.scores = array('d')
+        self.magnitudes = array('d')
+
+    def __len__(self):
+        return len(self.scores)
+
+    def extend(self, segments):
+        """
+        Score new transcript segments and append them to the timeline
+
+        Only the segments passed in are scored, so a live stream can keep
+        appending without rescoring what is already on the timeline.
+
+        Args:
+            segments: List of segments in the shared transcript schema
+
+        Returns:
+            int: Number of segments appended
+        """
+        segments = [s for s in segments if s.get("start") is not None]
+        if not segments:
+            return 0
+
+        results = analyze_sentiment_batch(self.sentiment_service, [s.get("text", "") for s in segments])
+
+        for segment, result in zip(segments, results):
+            self.starts.append(segment["start"])
+            self.ends.append(segment["end"] if segment.get("end") is not None else segment["start"])
+            if result.get("success"):
+                self.scores.append(result["score"])
+                self.magnitudes.append(result["magnitude"])
+            else:
+                # Unscored segments (too short, provider error) are kept as gaps
+                self.scores.append(math.nan)
+                self.magnitudes.append(math.nan)
+
+        logger.info("Added %s segments to sentiment timeline, total: %s", len(segments), len(self))
+        return len(segments)
+
+    def smoothed_scores(self, window):
+        """
+        Trailing moving average of the scores over the last `window` segments
+
+        Gaps are skipped rather than treated as neutral.
+
+        Args:
+            window: Number of segments to average over
+
+        Returns:
+            array: Smoothed scores, NaN where the window holds no scored segment
+        """
+        smoothed = array('d')
+        total = 0.0
+        count = 0
+        for i, score in enumerate(self.scores):
+            if not math.isnan(score):
+                total += score
+                count += 1
+            if i >= window:
+                dropped = self.scores[i - window]
+                if not math.isnan(dropped):
+                    total -= dropped
+                    count -= 1
+            smoothed.append(total / count if count else math.nan)
+        return smoothed
+
+    def to_dict(self, window=None):
+        """
+        Columnar representation for JSON responses
+
+        Args:
+            window: Optional smoothing window in segments
+
+        Returns:
+            dict: Parallel start/end/score/magnitude lists
+        """
+        scores = self.smoothed_scores(window) if window and window > 1 else self.scores
+        return {
+            "start": list(self.starts),
+            "end": list(self.ends),
+            "score": [None if math.isnan(v) else v for v in scores],
+            "magnitude": [None if math.isnan(v) else v for v in self.magnitudes],
+            "window": window if window and window > 1 else 1
+        }
@@ -2,27 +2,223 @@ import logging
 import os
 import json
 import time
+import zlib
 from flask import session
+from utils.result_stats import ResultStats
 
 logger = logging.getLogger(__name__)
 
+# Stored record layout: [id, type, expanded size in bytes, compressed blob]
+_ID, _TYPE, _SIZE, _BLOB = range(4)
+# Longest string a summary keeps from a result too large for the session
+SUMMARY_TEXT_CHARS = 200
+
+
+def _collect_texts(value, texts):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == 'text' and isinstance(item, str):
+                texts.add(item)
+            else:
+                _collect_texts(item, texts)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_texts(item, texts)
+
+
+def _replace(value, refs, audio_dir):
+    if isinstance(value, dict):
+        compacted = {}
+        for key, item in value.items():
+            if key == 'text' and isinstance(item, str):
+                compacted['text@'] = refs[item]
+            elif key == 'audio_path' and audio_dir and isinstance(item, str) and os.path.dirname(item) == audio_dir:
+                compacted['audio_path@'] = os.path.basename(item)
+            else:
+                compacted[key] = _replace(item, refs, audio_dir)
+        return compacted
+    if isinstance(value, list):
+        return [_replace(item, refs, audio_dir) for item in value]
+    return value
+
+
+def _restore(value, texts, audio_dir):
+    if isinstance(value, dict):
+        expanded = {}
+        for key, item in value.items():
+            if key == 'text@':
+                source = texts[item[0]]
+                expanded['text'] = source[item[1]:item[2]] if len(item) == 3 else source
+            elif key == 'audio_path@':
+                expanded['audio_path'] = os.path.join(audio_dir or '', item)
+            else:
+                expanded[key] = _restore(item, texts, audio_dir)
+        return expanded
+    if isinstance(value, list):
+        return [_restore(item, texts, audio_dir) for item in value]
+    return value
+
+
+def compact_result(result_data, audio_dir=None):
+    """
+    Serialize a result into a compressed blob
+
+    Every "text" field is stored once: sentence and segment texts that are
+    part of a longer text (the transcript, the synthesized text) become
+    offsets into it. Audio paths inside audio_dir are stored by file name.
+
+    Returns:
+        tuple: (blob, size of the uncompressed JSON in bytes)
+    """
+    texts = set()
+    _collect_texts(result_data, texts)
+    sources = []
+    refs = {}
+    for text in sorted(texts, key=len, reverse=True):
+        for index, source in enumerate(sources):
+            start = source.find(text)
+            if start >= 0:
+                refs[text] = [index, start, start + len(text)]
+                break
+        else:
+            refs[text] = [len(sources)]
+            sources.append(text)
+    encoded = json.dumps([sources, _replace(result_data, refs, audio_dir)], separators=(',', ':'),
+                         ensure_ascii=False).encode('utf-8')
+    return zlib.compress(encoded, 6), len(encoded)
+
+
+def expand_result(blob, audio_dir=None):
+    """Inverse of compact_result"""
+    sources, compacted = json.loads(zlib.decompress(blob).decode('utf-8'))
+    return _restore(compacted, sources, audio_dir)
+
+
+_DROPPED = object()
+
+
+def _summarize(value, depth=0):
+    if isinstance(value, str):
+        return value if len(value) <= SUMMARY_TEXT_CHARS else value[:SUMMARY_TEXT_CHARS] + '...'
+    if isinstance(value, dict) and depth < 3:
+        summary = {key: _summarize(item, depth + 1) for key, item in value.items()}
+        return {key: item for key, item in summary.items() if item is not _DROPPED}
+    if isinstance(value, list) and len(value) <= 16 and all(isinstance(item, str) for item in value):
+        # Provider names and the like; lists of segments, words or sentences are dropped
+        return value
+    if isinstance(value, (dict, list)):
+        return _DROPPED
+    return value
+
+
+def summarize_result(result_data):
+    """
+    Summary of a result too large for the session
+
+    Keeps the fields of the result and its nested objects (provider,
+    timings, sentiment scores, ...) and short lists of names, with strings
+    cut to SUMMARY_TEXT_CHARS, and drops lists such as segments, words and
+    sentences. Everything the aggregates read is kept, so removing the
+    summary later subtracts what adding the result added.
+
+    Returns:
+        dict: The summary, with "summarized": True
+    """
+    return dict(_summarize(result_data), summarized=True)
+
+
 class SessionManager:
     """Utility for managing session-based result storage"""
     
-    def __init__(self, max_results=30):
+    def __init__(self, max_results=30, session_store=None, max_bytes=None, audio_dir=None):
         """
         Initialize session manager
         
+        Results are kept compressed in the session and only expanded when
+        read; lookups by ID or type do not expand the others. Aggregates for
+        /api/results/stats are kept next to them and updated on every change.
+        
         Args:
             max_results: Maximum number of results to store in a session
+            session_store: Session proxy to store results in, defaults to
+                           Flask's session (the ASGI app passes Quart's)
+            max_bytes: Bytes per session for the compressed results and the
+                       aggregates together, oldest results dropped first;
+                       a result that cannot fit on its own is stored as a
+                       summary (see summarize_result). Default
+                       SESSION_MAX_BYTES, 0 for no limit
+            audio_dir: Directory of result audio files, stored by name only
         """
         self.max_results = max_results
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.environ.get('SESSION_MAX_BYTES', '2048'))
+        self.audio_dir = audio_dir
+        self.session = session_store if session_store is not None else session
         # self._ensure_session_results()
     
     def _ensure_session_results(self):
-        """Ensure the results list exists in the session"""
-        if 'results' not in session:
-            session['results'] = []
+        """Ensure the results list exists in the session, compacting results stored in the old dict form"""
+        if 'results' not in self.session:
+            self.session['results'] = []
+        elif any(isinstance(record, dict) for record in self.session['results']):
+            self.session['results'] = [self._compact(record) if isinstance(record, dict) else record
+                                       for record in self.session['results']]
+            self.session.modified = True
+        if 'result_stats' not in self.session:
+            # Sessions from before aggregates were kept start from the results they still hold
+            stats = ResultStats()
+            for record in self.session['results']:
+                stats.add(self._expand(record))
+            self.session['result_stats'] = stats.state
+    
+    def _update_stats(self, added=(), removed=()):
+        stats = ResultStats(self.session['result_stats'])
+        for result in added:
+            stats.add(result)
+        for result in removed:
+            stats.remove(result)
+        self.session['result_stats'] = stats.state
+    
+    def _compact(self, result_data):
+        blob, size = compact_result(result_data, self.audio_dir)
+        return [result_data.get('id'), result_data.get('type'), size, blob]
+    
+    def _expand(self, record):
+        return expand_result(record[_BLOB], self.audio_dir)
+    
+    def _fitting(self, result_data):
+        """
+        Compacted record of a result, or of its summary if the result cannot fit in the budget next to
+        the aggregates; None if neither can
+
+        The session is usually a signed cookie, and a browser drops a cookie over 4 KB along with all
+        the history in it, so nothing is stored past the budget.
+        """
+        record = self._compact(result_data)
+        if not self.max_bytes:
+            return record
+        available = self.max_bytes - ResultStats(self.session['result_stats']).size()
+        if len(record[_BLOB]) <= available:
+            return record
+        summary = self._compact(summarize_result(result_data))
+        if len(summary[_BLOB]) <= available:
+            logger.warning("Result %s is %s bytes compressed, over the session budget of %s; storing a summary",
+                           result_data.get('id'), len(record[_BLOB]), self.max_bytes)
+            return summary
+        logger.warning("Result %s does not fit in the session budget of %s even summarized; not stored",
+                       result_data.get('id'), self.max_bytes)
+        return None
+
+    def _trim(self, records):
+        """Drop the oldest records over max_results or max_bytes, counting the aggregates toward the bytes"""
+        records = records[:self.max_results]
+        if self.max_bytes:
+            total = ResultStats(self.session['result_stats']).size()
+            for keep, record in enumerate(records):
+                total += len(record[_BLOB])
+                if total > self.max_bytes:
+                    logger.info("Session over %s bytes, dropping %s oldest results", self.max_bytes, len(records) - keep)
+                    return records[:keep]
+        return records
     
     def add_result(self, result_data):
         """
@@ -37,17 +233,15 @@ class SessionManager:
         if 'timestamp' not in result_data:
             result_data['timestamp'] = time.time()
         
-        # Add to beginning of list (newest first)
-        session['results'].insert(0, result_data)
-        
-        # Limit the number of stored results
-        if len(session['results']) > self.max_results:
-            session['results'] = session['results'][:self.max_results]
+        # Add to beginning of list (newest first), dropping the oldest over the count and byte limits
+        self._update_stats(added=[result_data])
+        record = self._fitting(result_data)
+        self.session['results'] = self._trim(([record] if record else []) + self.session['results'])
         
         # Save session
-        session.modified = True
+        self.session.modified = True
         
-        logger.info(f"Added result {result_data.get('id')} to session, total results: {len(session['results'])}")
+        logger.info("Added result %s to session, total results: %s", result_data.get('id'), len(self.session['results']), extra={'sample': True})
         
         return result_data
     
@@ -63,11 +257,11 @@ class SessionManager:
         """
         self._ensure_session_results()
         
-        for result in session['results']:
-            if result.get('id') == result_id:
-                return result
+        for record in self.session['results']:
+            if record[_ID] == result_id:
+                return self._expand(record)
         
-        logger.warning(f"Result {result_id} not found in session")
+        logger.warning("Result %s not found in session", result_id)
         return None
     
     def get_all_results(self):
@@ -78,13 +272,14 @@ class SessionManager:
             list: List of result dictionaries
         """
         self._ensure_session_results()
-        return session['results']
+        return [self._expand(record) for record in self.session['results']]
     
     def clear_results(self):
         """Clear all results from the current session"""
         self._ensure_session_results()
-        session['results'] = []
-        session.modified = True
+        self.session['results'] = []
+        self.session['result_stats'] = ResultStats().state
+        self.session.modified = True
         logger.info("Cleared all results from session")
     
     def remove_result(self, result_id):
@@ -99,17 +294,18 @@ class SessionManager:
         """
         self._ensure_session_results()
         
-        initial_count = len(session['results'])
-        session['results'] = [r for r in session['results'] if r.get('id') != result_id]
+        removed_records = [r for r in self.session['results'] if r[_ID] == result_id]
+        self.session['results'] = [r for r in self.session['results'] if r[_ID] != result_id]
         
         # Check if anything was removed
-        removed = len(session['results']) < initial_count
+        removed = len(removed_records) > 0
         
         if removed:
-            session.modified = True
-            logger.info(f"Removed result {result_id} from session")
+            self._update_stats(removed=[self._expand(r) for r in removed_records])
+            self.session.modified = True
+            logger.info("Removed result %s from session", result_id)
         else:
-            logger.warning(f"Result {result_id} not found for removal")
+            logger.warning("Result %s not found for removal", result_id)
         
         return removed
     
@@ -126,16 +322,25 @@ class SessionManager:
         """
         self._ensure_session_results()
         
-        for i, result in enumerate(session['results']):
-            if result.get('id') == result_id:
+        for i, record in enumerate(self.session['results']):
+            if record[_ID] == result_id:
                 # Update the result with new data
+                result = self._expand(record)
+                previous = dict(result)
                 result.update(updated_data)
-                session['results'][i] = result
-                session.modified = True
-                logger.info(f"Updated result {result_id}")
+                self._update_stats(added=[result], removed=[previous])
+                results = list(self.session['results'])
+                record = self._fitting(result)
+                if record:
+                    results[i] = record
+                else:
+                    del results[i]
+                self.session['results'] = self._trim(results)
+                self.session.modified = True
+                logger.info("Updated result %s", result_id)
                 return result
         
-        logger.warning(f"Result {result_id} not found for update")
+        logger.warning("Result %s not found for update", result_id)
         return None
     
     def filter_results_by_type(self, result_type):
@@ -150,8 +355,8 @@ class SessionManager:
         """
         self._ensure_session_results()
         
-        filtered_results = [r for r in session['results'] if r.get('type') == result_type]
-        logger.info(f"Retrieved {len(filtered_results)} results of type {result_type}")
+        filtered_results = [self._expand(r) for r in self.session['results'] if r[_TYPE] == result_type]
+        logger.info("Retrieved %s results of type %s", len(filtered_results), result_type, extra={'sample': True})
         
         return filtered_results
     
@@ -167,8 +372,8 @@ class SessionManager:
         """
         self._ensure_session_results()
         
-        recent = session['results'][:count]
-        logger.info(f"Retrieved {len(recent)} recent results")
+        recent = [self._expand(record) for record in self.session['results'][:count]]
+        logger.info("Retrieved %s recent results", len(recent), extra={'sample': True})
         
         return recent
     
@@ -180,4 +385,37 @@ class SessionManager:
             bool: True if there are results, False otherwise
         """
         self._ensure_session_results()
-        return len(session['results']) > 0
\ No newline at end of file
+        return len(self.session['results']) > 0
+    
+    def get_stats(self):
+        """
+        Aggregates over the session's results, without reading the results
+
+        Returns:
+            dict: Counts per type and provider, processing time mean and
+                  percentiles, sentiment histograms and provider agreement
+        """
+        self._ensure_session_results()
+        return ResultStats(self.session['result_stats']).summary()
+    
+    def storage_stats(self):
+        """
+        Report how much the current session's results take up
+        
+        Returns:
+            dict: Result count, compressed bytes stored in the session, the
+                  bytes they expand to, and the budget
+        """
+        self._ensure_session_results()
+        records = self.session['results']
+        stored_bytes = sum(len(record[_BLOB]) for record in records)
+        expanded_bytes = sum(record[_SIZE] for record in records)
+        return {
+            "results": len(records),
+            "stored_bytes": stored_bytes,
+            "stats_bytes": ResultStats(self.session['result_stats']).size(),
+            "expanded_bytes": expanded_bytes,
+            "compression_ratio": round(expanded_bytes / stored_bytes, 2) if stored_bytes else None,
+            "max_bytes": self.max_bytes or None,
+            "max_results": self.max_results
+        }
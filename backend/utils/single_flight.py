@@ -0,0 +1,193 @@
+import asyncio
+import base64
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(result):
+    """
+    JSON for a result shared through the lock directory
+
+    Results are provider responses: dicts, lists and tuples (returned as
+    lists) of JSON values, and the audio bytes of text-to-speech. JSON
+    rather than pickle, so a file planted in the directory is only data.
+
+    Raises:
+        TypeError: The result holds anything else
+    """
+    def default(value):
+        if isinstance(value, bytes):
+            return {'__bytes__': base64.b64encode(value).decode('ascii')}
+        raise TypeError(f"{type(value).__name__} cannot be shared across workers")
+    return json.dumps(result, default=default)
+
+
+def _decode(text):
+    def object_hook(value):
+        if len(value) == 1 and '__bytes__' in value:
+            return base64.b64decode(value['__bytes__'])
+        return value
+    return json.loads(text, object_hook=object_hook)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Deduplicates concurrent identical calls so only one reaches the provider"""
+
+    def __init__(self, lock_dir=None, linger_seconds=5.0):
+        """
+        Initialize the coalescer
+
+        Args:
+            lock_dir: Optional directory for lock files, which extends
+                      coalescing across worker processes on the same host
+            linger_seconds: How long a cross-process result file is kept for
+                            workers that were blocked on the lock to read it
+        """
+        self.lock_dir = lock_dir
+        self.linger_seconds = linger_seconds
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+        if lock_dir:
+            # Only this user's workers may plant lock and result files
+            os.makedirs(lock_dir, mode=0o700, exist_ok=True)
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Call fn, or wait for an identical in-flight call and share its result
+
+        Nothing is stored once the call finishes: a later identical call runs
+        fn again, and a failure is raised to every waiter without being kept.
+
+        Args:
+            key: Tuple identifying identical calls
+            fn: Function to call
+
+        Returns:
+            The result of fn (a private copy for waiters)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            # Each waiter gets its own copy, so a route mutating its result cannot affect the others
+            return copy.deepcopy(call.result)
+
+        try:
+            if self.lock_dir:
+                call.result = self._do_across_processes(key, fn, *args, **kwargs)
+            else:
+                call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                logger.info("Coalesced %s identical in-flight calls", call.waiters)
+            call.done.set()
+
+    def _do_across_processes(self, key, fn, *args, **kwargs):
+        """Coalesce with other worker processes through an flock'd lock file"""
+        import fcntl
+
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        lock_path = os.path.join(self.lock_dir, f"{digest}.lock")
+        result_path = os.path.join(self.lock_dir, f"{digest}.result")
+        started = time.time()
+
+        with open(lock_path, 'a+b') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another worker is making this call: wait for it, then read what it wrote
+                fcntl.flock(lock_file, fcntl.LOCK_SH)
+                try:
+                    # Only a result written while we waited counts, anything older is not reused
+                    if os.path.exists(result_path) and os.path.getmtime(result_path) >= started:
+                        with open(result_path) as f:
+                            result = _decode(f.read())
+                        with self._lock:
+                            self.coalesced += 1
+                        return result
+                except ValueError as e:
+                    logger.warning("Ignoring unreadable coalesced result %s: %s", result_path, e)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                # The other worker failed, so make the call ourselves
+                return fn(*args, **kwargs)
+
+            try:
+                self._remove(result_path)
+                result = fn(*args, **kwargs)
+                try:
+                    encoded = _encode(result)
+                except TypeError as e:
+                    # Waiting workers find no result file and make the call themselves
+                    logger.warning("Not sharing result across workers: %s", e)
+                    return result
+                tmp_path = f"{result_path}.{os.getpid()}"
+                with open(tmp_path, 'w') as f:
+                    f.write(encoded)
+                os.replace(tmp_path, result_path)
+                # Keep the result only long enough for the blocked workers to read it
+                timer = threading.Timer(self.linger_seconds, self._remove, (result_path,))
+                timer.daemon = True
+                timer.start()
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines sharing one event loop"""
+
+    def __init__(self):
+        self._tasks = {}
+        self.coalesced = 0
+        # The count is read from other threads, e.g. by the status endpoint
+        self._count_lock = threading.Lock()
+
+    async def do(self, key, coro_fn, *args, **kwargs):
+        """Await coro_fn, or an identical in-flight call of it; nothing is kept afterwards"""
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(coro_fn(*args, **kwargs))
+            task.add_done_callback(lambda done: self._tasks.pop(key, None) if self._tasks.get(key) is done else None)
+            # Shielded so a disconnecting first caller does not cancel the call for everyone else
+            return await asyncio.shield(task)
+        with self._count_lock:
+            self.coalesced += 1
+        return copy.deepcopy(await asyncio.shield(task))
@@ -0,0 +1,225 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_enabled = False
+_exporter = None
+
+# Innermost open span of the current request (or task), None outside a trace
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """One timed stage of a request"""
+
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'attributes', 'start_ns', 'end_ns', 'error', '_token')
+
+    def __init__(self, trace, name, parent_id, attributes):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self._token = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Closed from a different context than it was opened in (e.g. an ASGI after-request hook)
+            _current_span.set(None)
+        self.trace.spans.append(self)
+        return False
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_otel(self):
+        """The span in the OTLP/JSON span shape"""
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": "SPAN_KIND_SERVER" if self.parent_id is None else "SPAN_KIND_INTERNAL",
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otel_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": "STATUS_CODE_ERROR", "message": self.error} if self.error else {"code": "STATUS_CODE_OK"},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otel_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Trace:
+    """All spans recorded for one request"""
+
+    def __init__(self, name, attributes):
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self.root = Span(self, name, None, attributes)
+        self.root.__enter__()
+
+    def server_timing(self):
+        """
+        Server-Timing header value: the root's direct children, then the total
+
+        Repeated stage names are summed, e.g. several attempts of one call.
+        """
+        stages = {}
+        for span in self.spans:
+            if span.parent_id == self.root.span_id:
+                stages[span.name] = stages.get(span.name, 0.0) + span.duration_ms
+        entries = [f"{name};dur={duration:.1f}" for name, duration in stages.items()]
+        entries.append(f"total;dur={self.root.duration_ms:.1f}")
+        return ", ".join(entries)
+
+
+class _NoopSpan:
+    """Returned when tracing is off or no trace is active; costs one attribute lookup"""
+
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name, **attributes):
+    """
+    Context manager timing a stage as a child of the current span
+
+    Does nothing unless tracing is enabled and a request trace is active.
+    """
+    if not _enabled:
+        return _NOOP
+    parent = _current_span.get()
+    if parent is None:
+        return _NOOP
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+def start_trace(name, **attributes):
+    """Start a request's trace, or return None when tracing is disabled"""
+    if not _enabled:
+        return None
+    return Trace(name, attributes)
+
+
+def end_trace(trace):
+    """Close a request's trace and queue its spans for export"""
+    if trace is None or trace.root.end_ns is not None:
+        return
+    trace.root.__exit__(None, None, None)
+    if _exporter is not None:
+        _exporter.export(trace.spans)
+
+
+class JsonlExporter:
+    """Appends spans as OTLP-shaped JSON lines from a background thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self._queue = queue.SimpleQueue()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_writer(self):
+        # Started lazily in each process, since threads do not survive fork
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.SimpleQueue()
+                self._pid = os.getpid()
+                threading.Thread(target=self._write_loop, name="trace-exporter", daemon=True).start()
+
+    def export(self, spans):
+        self._ensure_writer()
+        self._queue.put(spans)
+
+    def flush(self, timeout=5.0):
+        """Wait until the spans queued so far are written; returns whether they were in time"""
+        if self._pid != os.getpid():
+            return True
+        written = threading.Event()
+        self._queue.put(written)
+        return written.wait(timeout)
+
+    def _write_loop(self):
+        span_queue = self._queue
+        while True:
+            batch = [span_queue.get()]
+            while not span_queue.empty():
+                batch.append(span_queue.get())
+            # flush() markers are set once everything queued before them is written
+            flushed = [entry for entry in batch if isinstance(entry, threading.Event)]
+            try:
+                with open(self.path, 'a') as f:
+                    for spans in batch:
+                        if isinstance(spans, threading.Event):
+                            continue
+                        for s in spans:
+                            f.write(json.dumps(s.to_otel()) + "\n")
+            except OSError as e:
+                logger.warning("Could not export spans to %s: %s", self.path, e)
+            for written in flushed:
+                written.set()
+
+
+def configure_tracing(enabled=None, export_path=None):
+    """
+    Enable or disable tracing
+
+    Args:
+        enabled: Record spans, default TRACING env var (false)
+        export_path: JSONL file for finished spans, default TRACE_EXPORT_PATH
+    """
+    global _enabled, _exporter
+    _enabled = enabled if enabled is not None else os.environ.get('TRACING', 'false').lower() == 'true'
+    export_path = export_path or os.environ.get('TRACE_EXPORT_PATH')
+    _exporter = JsonlExporter(export_path) if _enabled and export_path else None
+    if _enabled:
+        logger.info("Tracing enabled, exporting spans to %s", export_path or "nowhere")
+
+
+def flush_tracing(timeout=5.0):
+    """Write out spans still queued for export, e.g. before the process exits"""
+    if _exporter is not None and not _exporter.flush(timeout):
+        logger.warning("Spans still unwritten after %s seconds", timeout)
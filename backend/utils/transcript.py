@@ -0,0 +1,108 @@
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _seconds(value):
+    """Convert a provider time offset (float, timedelta or proto Duration) to seconds"""
+    if value is None:
+        return None
+    if hasattr(value, 'total_seconds'):
+        return value.total_seconds()
+    if hasattr(value, 'seconds') and hasattr(value, 'nanos'):
+        return value.seconds + value.nanos / 1e9
+    return float(value)
+
+
+def build_word(word, start, end, probability=None):
+    """
+    Build a word entry in the shared transcript schema
+
+    Args:
+        word: The word text
+        start: Start offset in seconds
+        end: End offset in seconds
+        probability: Provider confidence for the word (0-1) if available
+
+    Returns:
+        dict: Normalized word entry
+    """
+    return {
+        "word": word,
+        "start": _seconds(start),
+        "end": _seconds(end),
+        "probability": probability
+    }
+
+
+def build_segment(segment_id, text, start, end, confidence=None, avg_logprob=None,
+                  no_speech_prob=None, compression_ratio=None, words=None):
+    """
+    Build a segment entry in the shared transcript schema
+
+    Both the Google and the Whisper services return segments in this shape so
+    that the frontend and downstream stages (sentiment timeline, diarization)
+    do not need to know which provider produced them.
+
+    Args:
+        segment_id: Index of the segment within the transcript
+        text: Segment text
+        start: Start offset in seconds
+        end: End offset in seconds
+        confidence: Segment confidence (0-1) if available
+        avg_logprob: Average token log probability (Whisper only)
+        no_speech_prob: Probability that the segment is silence (Whisper only)
+        compression_ratio: Gzip compression ratio of the text (Whisper only)
+        words: Optional list of word entries from build_word
+
+    Returns:
+        dict: Normalized segment entry
+    """
+    segment = {
+        "id": segment_id,
+        "start": _seconds(start),
+        "end": _seconds(end),
+        "text": text.strip() if text else "",
+        "confidence": confidence,
+        "avg_logprob": avg_logprob,
+        "no_speech_prob": no_speech_prob,
+        "compression_ratio": compression_ratio
+    }
+    if words is not None:
+        segment["words"] = words
+    return segment
+
+
+def logprob_to_confidence(avg_logprob):
+    """Convert an average token log probability to a 0-1 confidence"""
+    if avg_logprob is None:
+        return None
+    try:
+        return min(max(math.exp(avg_logprob), 0.0), 1.0)
+    except (TypeError, OverflowError):
+        return None
+
+
+def average_confidence(segments):
+    """
+    Duration-weighted average confidence over segments
+
+    Args:
+        segments: List of normalized segments
+
+    Returns:
+        float or None: Average confidence, None if no segment has one
+    """
+    total = 0.0
+    weight = 0.0
+    for segment in segments:
+        confidence = segment.get("confidence")
+        if confidence is None:
+            continue
+        duration = (segment.get("end") or 0) - (segment.get("start") or 0)
+        # Fall back to equal weights when offsets are missing
+        segment_weight = duration if duration > 0 else 1.0
+        total += confidence * segment_weight
+        weight += segment_weight
+    return total / weight if weight > 0 else None
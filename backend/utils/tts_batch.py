@@ -0,0 +1,314 @@
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from datetime import datetime
+
+from utils.audio_format import FORMATS, OutputFormat, format_kwargs
+
+logger = logging.getLogger(__name__)
+
+# Voices used when an item names none, so the same prompt always maps to the same file
+DEFAULT_VOICES = {
+    'google': 'en-US-Neural2-F',
+    'opensource': 'en-US-ChristopherNeural'
+}
+# Append-only: one line per new rendering, or per batch that added item IDs to a rendering
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+def render_key(provider, voice, text, output_format=None):
+    """Content address of a rendering: the same provider, voice, text and format always give the same key"""
+    parts = [provider, voice or '', text]
+    if output_format:
+        # Default MP3 renderings keep the keys they had before formats could be chosen
+        parts.append(output_format.key)
+    return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+
+class TTSBatchRenderer:
+    """Renders (text, voice) items into a content-addressed directory with a manifest"""
+
+    def __init__(self, text_services, output_dir, concurrency=4, synthesize=None):
+        """
+        Initialize the renderer
+
+        Each item is stored as <key>.mp3 (or the extension of its format),
+        where the key hashes provider, voice, text and format, so repeated
+        items are rendered once and items already on disk are skipped on
+        later runs; each format is rendered once and never transcoded again.
+        manifest.jsonl maps each key to its provider, voice, text, format and
+        the item IDs that asked for it; workers sharing the directory append
+        to it under an flock and only read what others appended since.
+
+        Args:
+            text_services: Dict of provider name -> text service
+            output_dir: Directory for the audio files and manifest
+            concurrency: Most synthesis calls in flight per provider, an int
+                         or a dict of provider name -> int
+            synthesize: Callable (provider, text, voice, output_format) ->
+                        audio bytes; by default calls the text service directly
+        """
+        self.text_services = text_services
+        self.output_dir = output_dir
+        self.concurrency = concurrency
+        self.synthesize = synthesize or (
+            lambda provider, text, voice, output_format: self.text_services[provider].synthesize_speech(
+                text, voice, **format_kwargs(output_format)
+            )[1]
+        )
+        self.manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        # Manifest entries as of _manifest_offset bytes into the file with inode _manifest_inode
+        self._entries = {}
+        self._manifest_offset = 0
+        self._manifest_inode = None
+        self._executors = {}
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _executor(self, provider):
+        # One pool per provider, shared by every batch, bounds that provider's concurrent calls
+        with self._lock:
+            if provider not in self._executors:
+                limit = self.concurrency.get(provider, 4) if isinstance(self.concurrency, dict) else self.concurrency
+                self._executors[provider] = ThreadPoolExecutor(max_workers=limit,
+                                                               thread_name_prefix=f"tts-batch-{provider}")
+            return self._executors[provider]
+
+    def audio_path(self, key, output_format=None):
+        return os.path.join(self.output_dir, f"{key}{(output_format or OutputFormat()).extension}")
+
+    def find_audio(self, key):
+        """(file name, mimetype) of the rendering behind a key, or None if it is not rendered"""
+        for spec in FORMATS.values():
+            file_name = f"{key}{spec['extension']}"
+            if os.path.exists(os.path.join(self.output_dir, file_name)):
+                return file_name, spec['mimetype']
+        return None
+
+    def prepare(self, items, provider='google', voice=None, output_format=None):
+        """
+        Normalize batch items
+
+        Args:
+            items: List of strings or dicts with 'text' and optional 'voice',
+                   'provider' and 'id'
+            provider: Provider for items that name none
+            voice: Voice for items that name none; otherwise the provider default
+            output_format: OutputFormat for every item, default MP3
+
+        Returns:
+            list: Dicts with id, text, provider, voice, format and key, in input order
+
+        Raises:
+            ValueError: An item has no text or names an unknown provider
+        """
+        prepared = []
+        for index, item in enumerate(items):
+            if isinstance(item, str):
+                item = {'text': item}
+            if not isinstance(item, dict):
+                raise ValueError(f"Item {index} must be a string or an object with 'text'")
+            text = (item.get('text') or '').strip()
+            if not text:
+                raise ValueError(f"Item {index} has no text")
+            item_provider = item.get('provider') or provider
+            if item_provider not in self.text_services:
+                raise ValueError(f"Item {index}: unknown text provider '{item_provider}', "
+                                 f"available: {sorted(self.text_services)}")
+            item_voice = item.get('voice') or voice or DEFAULT_VOICES.get(item_provider)
+            prepared.append({
+                'id': str(item.get('id', index)),
+                'text': text,
+                'provider': item_provider,
+                'voice': item_voice,
+                'format': output_format,
+                'key': render_key(item_provider, item_voice, text, output_format)
+            })
+        return prepared
+
+    def render(self, items):
+        """
+        Render prepared items, skipping duplicates and files already on disk
+
+        Args:
+            items: Items from prepare()
+
+        Returns:
+            dict: Counts of rendered, cached, duplicate and failed items, and
+                  per-item results with key, file and status
+        """
+        unique = {}
+        for item in items:
+            unique.setdefault(item['key'], item)
+
+        futures = {}
+        for key, item in unique.items():
+            if os.path.exists(self.audio_path(key, item['format'])):
+                continue
+            futures[key] = self._executor(item['provider']).submit(
+                contextvars.copy_context().run, self._render_one, item
+            )
+
+        errors = {}
+        sizes = {}
+        for key, future in futures.items():
+            try:
+                sizes[key] = future.result()
+            except CancelledError:
+                errors[key] = "Cancelled by shutdown"
+            except Exception as e:
+                logger.warning("Batch text-to-speech failed for item %s: %s", unique[key]['id'], e)
+                errors[key] = str(e)
+
+        self._update_manifest(items, errors)
+
+        results = []
+        seen = set()
+        counts = {'rendered': 0, 'cached': 0, 'duplicate': 0, 'failed': 0}
+        for item in items:
+            key = item['key']
+            if key in errors:
+                status = 'failed'
+            elif key in seen:
+                status = 'duplicate'
+            elif key in futures:
+                status = 'rendered'
+            else:
+                status = 'cached'
+            seen.add(key)
+            counts[status] += 1
+            result = {'id': item['id'], 'key': key, 'provider': item['provider'], 'voice': item['voice'],
+                      'status': status}
+            if key in errors:
+                result['error'] = errors[key]
+            else:
+                result['file'] = os.path.basename(self.audio_path(key, item['format']))
+            results.append(result)
+
+        logger.info("Batch text-to-speech: %s rendered, %s cached, %s duplicate, %s failed",
+                    counts['rendered'], counts['cached'], counts['duplicate'], counts['failed'])
+        return {**counts, 'output_dir': self.output_dir, 'manifest': self.manifest_path, 'items': results}
+
+    def _render_one(self, item):
+        audio = self.synthesize(item['provider'], item['text'], item['voice'], item['format'])
+        path = self.audio_path(item['key'], item['format'])
+        fd, tmp_path = tempfile.mkstemp(dir=self.output_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(audio)
+            # Atomic, so an interrupted run never leaves a truncated file that later runs would skip
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return len(audio)
+
+    def close(self):
+        """Stop the render pools, cancelling renders not yet started; finished files and the manifest are kept"""
+        with self._lock:
+            executors, self._executors = list(self._executors.values()), {}
+        for executor in executors:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def load_manifest(self):
+        """Manifest entries by key, or {} if nothing was rendered yet"""
+        import fcntl
+
+        with self._lock:
+            try:
+                f = open(self.manifest_path, 'rb')
+            except FileNotFoundError:
+                return {}
+            with f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                try:
+                    self._read_manifest(f)
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+            return json.loads(json.dumps(self._entries))
+
+    def _read_manifest(self, f):
+        """Merge what was appended since the last read into self._entries; call holding the flock"""
+        stat = os.fstat(f.fileno())
+        if stat.st_ino != self._manifest_inode or stat.st_size < self._manifest_offset:
+            # First read, or the manifest was replaced: start over
+            self._entries = {}
+            self._manifest_offset = 0
+            self._manifest_inode = stat.st_ino
+        f.seek(self._manifest_offset)
+        data = f.read()
+        self._manifest_offset += len(data)
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+                key = record.pop('key')
+            except (ValueError, KeyError, AttributeError) as e:
+                # A line cut short by a killed worker; the rendering it described is listed again when next requested
+                logger.warning("Skipping unreadable manifest line in %s: %s", self.manifest_path, e)
+                continue
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = record
+            else:
+                entry['ids'].extend(item_id for item_id in record.get('ids', []) if item_id not in entry['ids'])
+        return data
+
+    def _update_manifest(self, items, errors):
+        import fcntl
+
+        with self._lock, open(self.manifest_path, 'a+b') as f:
+            # Exclusive across workers: read what others appended, then append what is new here
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                data = self._read_manifest(f)
+                now = datetime.now().isoformat()
+                new_keys = set()
+                new_ids = {}
+                for item in items:
+                    key = item['key']
+                    if key in errors:
+                        continue
+                    entry = self._entries.get(key)
+                    if entry is None:
+                        path = self.audio_path(key, item['format'])
+                        entry = self._entries[key] = {
+                            'file': os.path.basename(path),
+                            'provider': item['provider'],
+                            'voice': item['voice'],
+                            'format': (item['format'] or OutputFormat()).key,
+                            'text': item['text'],
+                            'rendered_at': now,
+                            'bytes': os.path.getsize(path),
+                            'ids': []
+                        }
+                        new_keys.add(key)
+                    if item['id'] not in entry['ids']:
+                        entry['ids'].append(item['id'])
+                        new_ids.setdefault(key, []).append(item['id'])
+
+                lines = []
+                for key, ids in new_ids.items():
+                    # A new rendering is written with all its details, a known one with the IDs it gained
+                    record = self._entries[key] if key in new_keys else {'ids': ids}
+                    lines.append(json.dumps({'key': key, **record}, ensure_ascii=False))
+                if not lines:
+                    return
+                # Terminate a line a killed worker left unfinished, so it cannot swallow the first new one
+                prefix = '\n' if self._manifest_offset and not self._ends_with_newline(f, data) else ''
+                f.write((prefix + '\n'.join(lines) + '\n').encode('utf-8'))
+                f.flush()
+                self._manifest_offset = f.tell()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _ends_with_newline(f, data):
+        if data:
+            return data.endswith(b'\n')
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
@@ -0,0 +1,287 @@
+import hashlib
+import json
+import logging
+import os
+import struct
+import subprocess
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Bytes buffered before the format is sniffed; enough for WebM/Ogg codec headers
+SNIFF_BYTES = 4096
+# Highest bitrate expected for lossy compressed audio, so bytes * 8 / this is a lower bound on duration
+MAX_COMPRESSED_BITRATE_BPS = 512000
+# Codecs that bound holds for; lossless audio (FLAC, ALAC, PCM) and unidentified codecs can run at
+# several Mbps, so their duration is only checked with ffprobe once the upload is complete
+LOSSY_CODECS = ('opus', 'vorbis', 'aac', 'mp3')
+
+
+def upload_limits():
+    """(max upload bytes, max audio seconds) from MAX_UPLOAD_MB and MAX_AUDIO_SECONDS"""
+    return (int(float(os.environ.get('MAX_UPLOAD_MB', '50')) * 1024 * 1024),
+            float(os.environ.get('MAX_AUDIO_SECONDS', '1800')))
+
+
+class UploadRejected(Exception):
+    """Raised while an upload is being received if it is not acceptable audio"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _wav_info(head):
+    """Codec and byte rate from the fmt chunk of a RIFF/WAVE header"""
+    offset = 12
+    while offset + 8 <= len(head):
+        chunk_id, size = head[offset:offset + 4], struct.unpack('<I', head[offset + 4:offset + 8])[0]
+        if chunk_id == b'fmt ' and offset + 24 <= len(head):
+            audio_format, channels, sample_rate, byte_rate = struct.unpack('<HHII', head[offset + 8:offset + 20])
+            codec = {1: 'pcm', 3: 'pcm_float', 6: 'alaw', 7: 'mulaw', 0xFFFE: 'extensible'}.get(audio_format)
+            return codec, byte_rate or None
+        offset += 8 + size + (size & 1)
+    return None, None
+
+
+def _mp4_info(head):
+    """Codec and whether there is a video track, from the moov box if it is within the head"""
+    codec = next((name for tag, name in ((b'alac', 'alac'), (b'fLaC', 'flac'), (b'Opus', 'opus'), (b'mp4a', 'aac'))
+                  if tag in head), None)
+    # hdlr boxes: 'hdlr', version and flags, pre_defined, then the handler type of the track
+    video = False
+    offset = head.find(b'hdlr')
+    while offset != -1:
+        if head[offset + 12:offset + 16] == b'vide':
+            video = True
+        offset = head.find(b'hdlr', offset + 4)
+    return 'video' if video else codec
+
+
+def sniff_audio(head):
+    """
+    Identify the audio container and codec from the first bytes of a file
+
+    Args:
+        head: First bytes of the file (up to SNIFF_BYTES)
+
+    Returns:
+        dict: container, codec (or None), file extension and byte_rate (WAV
+              only), or None if this is not a recognized audio format
+    """
+    audio = None
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        # EBML header: WebM or Matroska, with the CodecID string in the track entry
+        codec = next((name for tag, name in ((b'A_OPUS', 'opus'), (b'A_VORBIS', 'vorbis'), (b'A_AAC', 'aac'),
+                                             (b'A_MPEG/L3', 'mp3'), (b'A_PCM', 'pcm'), (b'A_FLAC', 'flac'),
+                                             (b'A_ALAC', 'alac'), (b'V_', 'video'))
+                      if tag in head), None)
+        audio = {"container": "webm" if b'webm' in head[:64] else "matroska", "codec": codec, "extension": ".webm"}
+    elif head.startswith(b'RIFF') and head[8:12] == b'WAVE':
+        codec, byte_rate = _wav_info(head)
+        audio = {"container": "wav", "codec": codec, "extension": ".wav", "byte_rate": byte_rate}
+    elif head.startswith(b'OggS'):
+        codec = 'opus' if b'OpusHead' in head else 'vorbis' if b'\x01vorbis' in head else \
+            'flac' if b'FLAC' in head else None
+        audio = {"container": "ogg", "codec": codec, "extension": ".ogg"}
+    elif head.startswith(b'fLaC'):
+        audio = {"container": "flac", "codec": "flac", "extension": ".flac"}
+    elif head.startswith(b'ID3') or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        audio = {"container": "mp3", "codec": "mp3", "extension": ".mp3"}
+    elif head[4:8] == b'ftyp':
+        # The moov box with the tracks is often at the end; finish() then asks ffprobe about video
+        audio = {"container": "mp4", "codec": _mp4_info(head), "extension": ".m4a"}
+
+    if audio is None or audio["codec"] == 'video':
+        return None
+    audio.setdefault("byte_rate", None)
+    return audio
+
+
+def probe_duration(path):
+    """Duration in seconds from the container header via ffprobe, or None if unknown"""
+    try:
+        output = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+            capture_output=True, text=True, timeout=10, check=True
+        ).stdout.strip()
+        return float(output)
+    except Exception:
+        return None
+
+
+def probe_has_video(path):
+    """Whether ffprobe finds a video stream (cover art aside), or None if it cannot tell"""
+    try:
+        streams = json.loads(subprocess.run(
+            ['ffprobe', '-v', 'error', '-select_streams', 'v', '-show_streams', '-of', 'json', path],
+            capture_output=True, text=True, timeout=10, check=True
+        ).stdout).get('streams', [])
+    except Exception:
+        return None
+    return any(not stream.get('disposition', {}).get('attached_pic') for stream in streams)
+
+
+class AudioUpload:
+    """
+    Writable sink that validates an audio upload while it is received
+
+    Used as the file stream for multipart uploads: nothing touches disk until
+    the first SNIFF_BYTES identify a supported audio format, the size and
+    duration caps are enforced on every write, and the content is hashed as
+    it streams through. The temporary file is deleted on rejection and when
+    the upload is closed at the end of the request.
+    """
+
+    def __init__(self, directory, max_bytes=None, max_duration_seconds=None):
+        """
+        Initialize the sink
+
+        Args:
+            directory: Directory the accepted upload is written to
+            max_bytes: Largest accepted upload size
+            max_duration_seconds: Longest accepted audio duration
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_duration_seconds = max_duration_seconds
+        self.path = None
+        self.format = None
+        self.size = 0
+        self.duration = None
+        self._hash = hashlib.sha256()
+        self._head = b''
+        self._file = None
+        self._finished = False
+
+    @property
+    def sha256(self):
+        """Hex digest of the bytes received so far, usable as a cache key once the upload is complete"""
+        return self._hash.hexdigest()
+
+    def _reject(self, message, status):
+        self.close()
+        logger.warning("Rejected upload after %s bytes: %s", self.size, message)
+        raise UploadRejected(message, status)
+
+    def _open(self):
+        self.format = sniff_audio(self._head)
+        if self.format is None:
+            self._reject("Unsupported or non-audio upload", 415)
+        self.path = os.path.join(self.directory, f"{uuid.uuid4()}{self.format['extension']}")
+        self._file = open(self.path, 'wb')
+        self._file.write(self._head)
+        self._head = b''
+
+    def _duration_lower_bound(self):
+        """Seconds the bytes so far hold at least, or None if the codec puts no bound on its bitrate"""
+        byte_rate = self.format["byte_rate"]
+        if byte_rate:
+            return self.size / byte_rate
+        if self.format["codec"] in LOSSY_CODECS:
+            return self.size * 8 / MAX_COMPRESSED_BITRATE_BPS
+        return None
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            self._reject(f"Upload exceeds {self.max_bytes} bytes", 413)
+        self._hash.update(data)
+
+        if self._file is None:
+            self._head += data
+            if len(self._head) < SNIFF_BYTES:
+                return len(data)
+            self._open()
+        else:
+            self._file.write(data)
+
+        lower_bound = self._duration_lower_bound() if self.max_duration_seconds is not None else None
+        if lower_bound is not None and lower_bound > self.max_duration_seconds:
+            self._reject(f"Audio longer than {self.max_duration_seconds} seconds", 413)
+        return len(data)
+
+    def finish(self):
+        """Complete the upload: validate what is left and check the duration from the container header"""
+        if self._finished:
+            return
+        self._finished = True
+        if self._file is None:
+            if not self._head:
+                self._reject("Empty upload", 400)
+            self._open()
+        self._file.close()
+
+        if self.format["container"] == 'mp4' and self.format["codec"] is None and probe_has_video(self.path):
+            self._reject("Unsupported or non-audio upload", 415)
+        if self.format["byte_rate"]:
+            self.duration = self._duration_lower_bound()
+        else:
+            self.duration = probe_duration(self.path)
+        if self.max_duration_seconds is not None and self.duration and self.duration > self.max_duration_seconds:
+            self._reject(f"Audio longer than {self.max_duration_seconds} seconds", 413)
+        self._file = open(self.path, 'rb')
+
+    def seek(self, offset, whence=0):
+        # The form parser rewinds the stream once the part is complete
+        self.finish()
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell() if self._file else self.size
+
+    def read(self, size=-1):
+        self.finish()
+        return self._file.read(size)
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return not self._finished
+
+    def seekable(self):
+        return True
+
+    def flush(self):
+        if self._file is not None and not self._file.closed:
+            self._file.flush()
+
+    def close(self):
+        """Close and delete the temporary file"""
+        self._finished = True
+        if self._file is not None:
+            self._file.close()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    @property
+    def closed(self):
+        return self._finished and (self._file is None or self._file.closed)
+
+
+def receive_upload(stream, directory, max_bytes=None, max_duration_seconds=None, chunk_size=64 * 1024):
+    """
+    Copy an already-parsed upload stream through an AudioUpload
+
+    Args:
+        stream: Readable file object holding the upload
+        directory: Directory the accepted upload is written to
+
+    Returns:
+        AudioUpload: The finished upload
+
+    Raises:
+        UploadRejected: The upload is not acceptable audio
+    """
+    upload = AudioUpload(directory, max_bytes=max_bytes, max_duration_seconds=max_duration_seconds)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        upload.write(chunk)
+    upload.finish()
+    return upload
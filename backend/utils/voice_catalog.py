@@ -0,0 +1,255 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class VoiceCatalog:
+    """Disk-backed, indexed voice catalog for all TTS providers, refreshed in the background"""
+
+    def __init__(self, text_services, cache_path=None, ttl_seconds=86400, refresh_interval_seconds=300):
+        """
+        Initialize the catalog from the on-disk copy, without calling any provider
+
+        Args:
+            text_services: Dict of provider name -> text service with fetch_voices()
+            cache_path: JSON file the catalog is persisted to and loaded from
+            ttl_seconds: Age after which a provider's voice list is refetched
+            refresh_interval_seconds: How often the background thread checks ages
+        """
+        self.text_services = text_services
+        self.cache_path = cache_path
+        self.ttl_seconds = ttl_seconds
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.retry_seconds = 60
+        self._lock = threading.Lock()
+        self._catalogs = {}  # provider -> {"fetched_at", "voices", "version", indexes}
+        self._failed_at = {}  # provider -> time of last failed fetch
+        self._fetching = {}  # provider -> Event set when its fetch in progress ends
+        self._loaded_mtime = None  # mtime of the cache file when last read or written
+        self._refresher_pid = None
+        self._stopped = threading.Event()
+        self._reload()
+
+    def _reload(self):
+        """
+        Adopt voice lists from the cache file if it changed since it was last read
+
+        Other workers persist their refreshes to the same file; whatever they
+        fetched more recently replaces this worker's copy.
+        """
+        if not self.cache_path:
+            return
+        try:
+            mtime = os.stat(self.cache_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+        try:
+            with open(self.cache_path) as f:
+                stored = json.load(f)
+            loaded = {provider: self._build(entry["voices"], entry["fetched_at"])
+                      for provider, entry in stored.items() if provider in self.text_services}
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable voice catalog %s: %s", self.cache_path, e)
+            return
+        with self._lock:
+            self._loaded_mtime = mtime
+            newer = [provider for provider, catalog in loaded.items()
+                     if provider not in self._catalogs or catalog["fetched_at"] > self._catalogs[provider]["fetched_at"]]
+            for provider in newer:
+                self._catalogs[provider] = loaded[provider]
+        if newer:
+            logger.info("Loaded voice catalog for %s from %s", sorted(newer), self.cache_path)
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        # Keep what other workers wrote since this one last read the file
+        self._reload()
+        with self._lock:
+            stored = {provider: {"fetched_at": c["fetched_at"], "voices": c["voices"]}
+                      for provider, c in self._catalogs.items()}
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.cache_path)), suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(stored, f)
+            # Atomic, so other workers never read a half-written catalog
+            os.replace(tmp_path, self.cache_path)
+            self._loaded_mtime = os.stat(self.cache_path).st_mtime_ns
+        except OSError as e:
+            logger.warning("Could not persist voice catalog to %s: %s", self.cache_path, e)
+
+    @staticmethod
+    def _build(voices, fetched_at):
+        """Index a provider's voice list by name, locale, language and gender"""
+        by_locale, by_language, by_gender = {}, {}, {}
+        for i, voice in enumerate(voices):
+            for code in voice.get("language_codes", []):
+                by_locale.setdefault(code.lower(), set()).add(i)
+                by_language.setdefault(code.split('-')[0].lower(), set()).add(i)
+            by_gender.setdefault(voice.get("gender", "").upper(), set()).add(i)
+        version = hashlib.sha1(json.dumps(voices, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        return {
+            "fetched_at": fetched_at,
+            "voices": voices,
+            "version": version,
+            "names": {voice["name"] for voice in voices},
+            "by_locale": by_locale,
+            "by_language": by_language,
+            "by_gender": by_gender,
+        }
+
+    def refresh(self, provider):
+        """
+        Refetch one provider's voice list and persist the catalog
+
+        A failed fetch keeps the previous list, so a provider outage never
+        empties the catalog. The fetch runs without holding any lock; a
+        caller that finds one already in progress for the provider waits for
+        it instead of fetching again.
+
+        Returns:
+            bool: Whether the refresh succeeded
+        """
+        with self._lock:
+            in_progress = self._fetching.get(provider)
+            if in_progress is None:
+                self._fetching[provider] = threading.Event()
+        if in_progress is not None:
+            in_progress.wait()
+            return provider in self._catalogs
+
+        try:
+            service = self.text_services[provider]
+            try:
+                # Plugin providers may only implement the TextProvider protocol's get_available_voices()
+                fetch = getattr(service, 'fetch_voices', None) or service.get_available_voices
+                voices = fetch()
+            except Exception as e:
+                logger.error("Error refreshing %s voices: %s", provider, e)
+                voices = None
+            if not voices:
+                self._failed_at[provider] = time.monotonic()
+                return False
+            catalog = self._build(voices, time.time())
+            with self._lock:
+                self._catalogs[provider] = catalog
+            logger.info("Refreshed %s %s voices (version %s)", len(voices), provider, catalog['version'])
+            self._save()
+            return True
+        finally:
+            with self._lock:
+                self._fetching.pop(provider).set()
+
+    def _stale(self, provider):
+        catalog = self._catalogs.get(provider)
+        return catalog is None or time.time() - catalog["fetched_at"] > self.ttl_seconds
+
+    def _refresh_loop(self):
+        while not self._stopped.is_set():
+            # A list another worker refreshed is picked up from disk instead of fetched again
+            self._reload()
+            for provider in self.text_services:
+                if self._stale(provider) and not self._stopped.is_set():
+                    self.refresh(provider)
+            self._stopped.wait(self.refresh_interval_seconds)
+
+    def close(self, timeout=10):
+        """Stop background refreshes; refreshes in progress get `timeout` seconds to finish and be persisted"""
+        self._stopped.set()
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            in_progress = list(self._fetching.values())
+        for event in in_progress:
+            event.wait(max(0, deadline - time.monotonic()))
+
+    def _ensure_refresher(self):
+        # Started lazily in the process that serves requests, since threads do not survive fork
+        if self._refresher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._refresher_pid == os.getpid():
+                return
+            self._refresher_pid = os.getpid()
+        threading.Thread(target=self._refresh_loop, name="voice-catalog", daemon=True).start()
+
+    def _catalog(self, provider):
+        self._ensure_refresher()
+        catalog = self._catalogs.get(provider)
+        if catalog is None:
+            # Cold start with nothing on disk: one fetch, concurrent callers and the refresher wait for it
+            # A provider that just failed is not refetched on every request; the refresher retries it
+            failed_at = self._failed_at.get(provider)
+            if failed_at is not None and time.monotonic() - failed_at < self.retry_seconds:
+                return None
+            # Another worker may have fetched it since this one started
+            self._reload()
+            if provider not in self._catalogs:
+                self.refresh(provider)
+            catalog = self._catalogs.get(provider)
+        return catalog
+
+    def voices(self, provider, language=None, gender=None):
+        """
+        Voices for a provider, filtered from the index
+
+        Args:
+            provider: Provider name
+            language: Optional locale ("en-US") or language ("en") code
+            gender: Optional SSML gender, e.g. "FEMALE"
+
+        Returns:
+            tuple: (list of voices, ETag for this provider version and filter)
+        """
+        catalog = self._catalog(provider)
+        if catalog is None:
+            return [], None
+
+        matches = None
+        if language:
+            key = language.lower()
+            matches = catalog["by_locale"].get(key, catalog["by_language"].get(key, set()))
+        if gender:
+            by_gender = catalog["by_gender"].get(gender.upper(), set())
+            matches = by_gender if matches is None else matches & by_gender
+
+        voices = catalog["voices"] if matches is None else [catalog["voices"][i] for i in sorted(matches)]
+        etag = hashlib.sha1(
+            f"{provider}:{catalog['version']}:{(language or '').lower()}:{(gender or '').upper()}".encode('utf-8')
+        ).hexdigest()[:20]
+        return voices, etag
+
+    def validate(self, provider, voice_name):
+        """
+        Check a voice name against the provider's catalog
+
+        Unknown catalogs accept any name, so a provider whose voice list
+        could not be fetched still gets a chance to synthesize.
+
+        Returns:
+            str or None: Error message if the voice is unknown
+        """
+        if not voice_name:
+            return None
+        catalog = self._catalog(provider)
+        if catalog is None or voice_name in catalog["names"]:
+            return None
+        return f"Unknown voice '{voice_name}' for provider {provider}"
+
+    def status(self):
+        with self._lock:
+            return {
+                provider: {
+                    "voices": len(c["voices"]),
+                    "version": c["version"],
+                    "age_seconds": round(time.time() - c["fetched_at"], 1)
+                }
+                for provider, c in self._catalogs.items()
+            }
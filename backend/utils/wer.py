@@ -0,0 +1,160 @@
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+# Gaps between matched runs larger than this many cells are not aligned cell by cell
+MAX_GAP_CELLS = 250_000
+# Matched runs shorter than this are left to the gap alignment, so chance matches don't anchor it
+MIN_ANCHOR = 3
+
+# Punctuation is dropped for scoring, except apostrophes inside words ("don't")
+_PUNCTUATION = re.compile(r"[^\w\s']|(?<!\w)'|'(?!\w)")
+
+
+def normalize_text(text):
+    """Lowercase, strip punctuation and collapse whitespace, so WER counts words rather than formatting"""
+    text = unicodedata.normalize('NFKC', text or '').lower().replace('’', "'")
+    return ' '.join(_PUNCTUATION.sub(' ', text).split())
+
+
+def edit_distance(reference, hypothesis):
+    """
+    Levenshtein distance between two sequences
+
+    Bit-parallel (Myers/Hyyrö): each column of the edit-distance table is a
+    pair of bit vectors held in Python ints, so the cost is one pass over
+    the hypothesis with a few integer operations per element, instead of
+    one operation per cell.
+
+    Args:
+        reference: Sequence of hashable items (words or characters)
+        hypothesis: Sequence to compare against it
+
+    Returns:
+        int: Substitutions + deletions + insertions
+    """
+    m = len(reference)
+    if not m:
+        return len(hypothesis)
+    if not hypothesis:
+        return m
+
+    # Bit i of positions[item] is set where reference[i] == item
+    positions = {}
+    for i, item in enumerate(reference):
+        positions[item] = positions.get(item, 0) | (1 << i)
+
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    vp, vn, score = full, 0, m
+    for item in hypothesis:
+        eq = positions.get(item, 0)
+        xv = eq | vn
+        xh = ((((eq & vp) + vp) & full) ^ vp) | eq
+        hp = (vn | ~(xh | vp)) & full
+        hn = vp & xh
+        if hp & last:
+            score += 1
+        elif hn & last:
+            score -= 1
+        hp = ((hp << 1) | 1) & full
+        hn = (hn << 1) & full
+        vp = (hn | ~(xv | hp)) & full
+        vn = hp & xv
+    return score
+
+
+def error_counts(reference, hypothesis):
+    """
+    Substitutions, deletions and insertions of a minimum edit alignment
+
+    Plain dynamic programming, O(len(reference) * len(hypothesis)); meant
+    for word sequences, use edit_distance for long character sequences.
+
+    Returns:
+        tuple: (substitutions, deletions, insertions)
+    """
+    # Each cell holds (errors, substitutions, deletions, insertions)
+    previous = [(j, 0, 0, j) for j in range(len(hypothesis) + 1)]
+    for i, ref_item in enumerate(reference, 1):
+        current = [(i, 0, i, 0)]
+        for j, hyp_item in enumerate(hypothesis, 1):
+            diagonal = previous[j - 1]
+            if ref_item == hyp_item:
+                best = diagonal
+            else:
+                up, left = previous[j], current[j - 1]
+                best = min(
+                    (diagonal[0] + 1, diagonal[1] + 1, diagonal[2], diagonal[3]),
+                    (up[0] + 1, up[1], up[2] + 1, up[3]),
+                    (left[0] + 1, left[1], left[2], left[3] + 1)
+                )
+            current.append(best)
+        previous = current
+    return previous[-1][1:]
+
+
+def aligned_error_counts(reference, hypothesis):
+    """
+    Substitutions, deletions and insertions of a diff-anchored alignment
+
+    Runs of at least MIN_ANCHOR items that difflib matches between the
+    sequences are taken as aligned, and only the gaps between them go
+    through error_counts, so the cost follows the size of the disagreements
+    rather than the length of the transcripts. A gap over MAX_GAP_CELLS is counted as substitutions of
+    its shorter side plus deletions or insertions of the rest. The total
+    can exceed the minimum edit distance when an anchor is not part of an
+    optimal alignment; use edit_distance for the exact count.
+
+    Returns:
+        tuple: (substitutions, deletions, insertions)
+    """
+    substitutions = deletions = insertions = 0
+    i = j = 0
+    matcher = SequenceMatcher(None, reference, hypothesis, autojunk=False)
+    for ref_start, hyp_start, size in matcher.get_matching_blocks():
+        if size < MIN_ANCHOR and ref_start < len(reference):
+            continue
+        ref_gap, hyp_gap = reference[i:ref_start], hypothesis[j:hyp_start]
+        if len(ref_gap) * len(hyp_gap) > MAX_GAP_CELLS:
+            gap = (min(len(ref_gap), len(hyp_gap)),
+                   max(len(ref_gap) - len(hyp_gap), 0),
+                   max(len(hyp_gap) - len(ref_gap), 0))
+        else:
+            gap = error_counts(ref_gap, hyp_gap)
+        substitutions += gap[0]
+        deletions += gap[1]
+        insertions += gap[2]
+        i, j = ref_start + size, hyp_start + size
+    return substitutions, deletions, insertions
+
+
+def score_transcript(reference, hypothesis):
+    """
+    Word and character errors of a hypothesis against a reference transcript
+
+    Both are normalized first. Rates are errors over reference length;
+    corpus-level rates should be computed from the summed counts. Word and
+    char errors are exact edit distances; the substitution/deletion/insertion
+    breakdown comes from aligned_error_counts.
+
+    Returns:
+        dict: Reference word/char counts, word errors with their breakdown,
+              char errors, wer and cer
+    """
+    reference, hypothesis = normalize_text(reference), normalize_text(hypothesis)
+    ref_words, hyp_words = reference.split(), hypothesis.split()
+    word_errors = edit_distance(ref_words, hyp_words)
+    substitutions, deletions, insertions = aligned_error_counts(ref_words, hyp_words)
+    char_errors = edit_distance(reference, hypothesis)
+    return {
+        "ref_words": len(ref_words),
+        "word_errors": word_errors,
+        "substitutions": substitutions,
+        "deletions": deletions,
+        "insertions": insertions,
+        "ref_chars": len(reference),
+        "char_errors": char_errors,
+        "wer": word_errors / len(ref_words) if ref_words else float(bool(hyp_words)),
+        "cer": char_errors / len(reference) if reference else float(bool(hypothesis))
+    }
@@ -36,10 +36,15 @@ export const fetchResultById = async (resultId) => {
 };
 
 // Convert speech to text
-export const convertSpeechToText = async (audioBlob, provider = "google") => {
+export const convertSpeechToText = async (
+  audioBlob,
+  provider = "google",
+  wordTimestamps = false
+) => {
   const formData = new FormData();
   formData.append("audio", audioBlob);
   formData.append("provider", provider);
+  formData.append("word_timestamps", wordTimestamps ? "true" : "false");
 
   const response = await fetch(`${API_BASE_URL}/speech-to-text`, {
     method: "POST",